@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+import time
+
+from database import db_read, get_connection
+
+# ---------------------------------------------------------------------------
+# Admin cache
+# Every admin callback and most user menus check admin rights, and every
+# notification fans out to get_admin_ids(). The admins table is a handful of
+# rows, so it is held in memory as {user_id: role}. The add/remove-admin
+# handlers call reload_admins() after writing; as a safety net for edits made
+# outside this process watch_admins() re-reads the set off the loop every
+# RELOAD_INTERVAL seconds. main loads it before the first update, so a check
+# never queries SQLite on the event loop.
+# ---------------------------------------------------------------------------
+try:
+    RELOAD_INTERVAL = float(os.getenv('JURISLAW_ADMIN_CACHE_TTL', '300'))
+except Exception:
+    RELOAD_INTERVAL = 300.0
+
+_roles = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def reload_admins(conn=None):
+    """Re-read the admins table into memory. Accepts a connection so it can run via db_read()."""
+    global _roles, _loaded_at
+    own = conn is None
+    if own:
+        conn = get_connection()
+    try:
+        c = conn.cursor()
+        c.execute("SELECT user_id, role FROM admins")
+        roles = {uid: (role or 'admin') for uid, role in c.fetchall()}
+    finally:
+        if own:
+            conn.close()
+    with _lock:
+        _roles = roles
+        _loaded_at = time.monotonic()
+    return roles
+
+
+def _current():
+    roles = _roles
+    if roles is None:
+        # only outside the bot (scripts, benchmarks), where nothing preloaded it
+        roles = reload_admins()
+    return roles
+
+
+async def watch_admins():
+    """Pick up admins changed by other processes; run as a background task."""
+    while True:
+        await asyncio.sleep(max(0.0, _loaded_at + RELOAD_INTERVAL - time.monotonic()))
+        if time.monotonic() - _loaded_at < RELOAD_INTERVAL:
+            continue
+        try:
+            await db_read(reload_admins)
+        except Exception:
+            await asyncio.sleep(RELOAD_INTERVAL)
+
+
+def is_cached_admin(user_id):
+    return user_id in _current()
+
+
+def get_admin_role(user_id):
+    """Return 'owner' / 'admin' / ... for admins, None otherwise."""
+    return _current().get(user_id)
+
+
+def has_role(user_id, *roles):
+    return _current().get(user_id) in roles
+
+
+def cached_admin_ids():
+    return list(_current())
@@ -1,189 +1,74 @@
-try:
-    from docx import Document
-    DOCX_AVAILABLE = True
-except Exception:
-    Document = None
-    DOCX_AVAILABLE = False
-import tempfile
-from telethon import events, Button
-import importlib
-import platform
+from telethon import Button
+from router import get_router
+from callback_codec import cb
 from utils import (
     CANCEL_BUTTON, BACK_BUTTON, paginate_buttons,
     set_user_state, get_user_state, get_user_data, clear_user_state,
     is_admin as utils_is_admin, CHANNEL_USERNAME, get_setting, set_setting, is_safe_upload_path
 )
-from database import DB_NAME, OWNER_ID
-import sqlite3
-try:
-    import pandas as pd
-    PD_AVAILABLE = True
-except Exception:
-    pd = None
-    PD_AVAILABLE = False
-try:
-    import xlsxwriter  # type: ignore[reportMissingImports]
-except Exception:
-    xlsxwriter = None
-from io import BytesIO
+from database import DB_NAME, OWNER_ID, fetch_one, fetch_all, fetch_page, execute, db_read, db_write
+from admin_cache import reload_admins
+from media_cache import send_media
+from media_ingest import submit_download
+from upload_store import collect_all, expire_now
+from gc_manager import discard_files, report_files, run_gc
+from event_manager import schedule_event_deadline
+from reminder_manager import refresh_event_reminders
+from export_engine import DATASETS, KIND_LABELS, send_export
 import json
 import os
 import time
 import random
 import asyncio
 
-from io import BytesIO as _BytesIO
+# export buttons -> (export_engine dataset, output)
+EXPORT_CALLBACKS = {
+    "admin_export_members_excel": ("members", "xlsx"),
+    "admin_export_ideas_excel": ("ideas", "xlsx"),
+    "admin_export_collabs_excel": ("collabs", "xlsx"),
+    "admin_export_donations_excel": ("donations", "xlsx"),
+    "admin_export_tickets_excel": ("tickets", "xlsx"),
+    "admin_export_ideas_word": ("ideas", "docx"),
+    "admin_export_collabs_word": ("collabs", "docx"),
+    "admin_export_donations_word": ("donations", "docx"),
+    "admin_export_tickets_word": ("tickets", "docx"),
+}
+
+# maintenance buttons -> gc_manager phases; removing orphan rows releases their blobs too
+GC_BUTTONS = {
+    "maint_clear_orphan_resources": ("orphan_resources", "files"),
+    "maint_clear_orphan_receipts": ("orphan_receipts", "files"),
+    "maint_clear_stray_files": ("files",),
+}
+
+
+def _event_upload_paths(c, event_id):
+    """Stored files referenced by an event: poster, receipts, certificates, resources."""
+    c.execute("""
+        SELECT poster_file_id FROM events WHERE id = ?
+        UNION SELECT payment_receipt_file_id FROM registrations WHERE event_id = ?
+        UNION SELECT file_id FROM certificates WHERE event_id = ?
+        UNION SELECT file_path FROM resources WHERE event_id = ?
+    """, (event_id,) * 4)
+    return [p for (p,) in c.fetchall() if p]
 
 
-def apply_persian_xlsx_style(buf: _BytesIO) -> _BytesIO:
-    """If openpyxl is available, load the workbook from BytesIO, set right-to-left,
-    set font to 'B Nazanin' and right alignment for cells, adjust column widths,
-    and return a new BytesIO. If anything fails, return original buffer.
-    """
-    try:
-        buf.seek(0)
-        from openpyxl import load_workbook
-        from openpyxl.styles import Font, Alignment
-        from openpyxl.utils import get_column_letter, column_index_from_string
-    except Exception:
-        try:
-            buf.seek(0)
-        except Exception:
-            pass
-        return buf
-
-    try:
-        # load workbook from BytesIO and apply RTL/font/alignment/widths
-        wb = load_workbook(filename=buf)
-        nazanin = Font(name='B Nazanin')
-        align_r = Alignment(horizontal='right', vertical='top', wrap_text=True)
-        for ws in wb.worksheets:
-            try:
-                ws.sheet_view.rightToLeft = True
-            except Exception:
-                pass
-            # apply font & alignment to all cells and compute column widths
-            max_widths = {}
-            for row in ws.iter_rows():
-                for cell in row:
-                    try:
-                        if cell.value is not None:
-                            s = str(cell.value)
-                        else:
-                            s = ''
-                        cell.font = nazanin
-                        cell.alignment = align_r
-                        col = cell.column
-                        # openpyxl column might be int or string; normalize
-                        try:
-                            idx = int(col)
-                        except Exception:
-                            try:
-                                idx = column_index_from_string(col)
-                            except Exception:
-                                continue
-                        prev = max_widths.get(idx, 0)
-                        if len(s) > prev:
-                            max_widths[idx] = len(s)
-                    except Exception:
-                        continue
-            # set widths
-            for idx, width in max_widths.items():
-                try:
-                    letter = get_column_letter(idx)
-                    ws.column_dimensions[letter].width = min(50, max(10, int(width * 1.2)))
-                except Exception:
-                    pass
-
-        out = _BytesIO()
-        wb.save(out)
-        out.seek(0)
-        return out
-    except Exception:
-        try:
-            buf.seek(0)
-        except Exception:
-            pass
-        return buf
-
-
-def apply_persian_docx_style(doc):
-    """Apply right-to-left alignment and B Nazanin font to a python-docx Document.
-    This attempts to set paragraph alignment to RIGHT and apply font name to runs.
-    It is best-effort and will silently continue on failure.
-    """
-    try:
-        from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-        from docx.oxml.ns import qn
-    except Exception:
-        return doc
-    try:
-        # Paragraph-level
-        for paragraph in list(doc.paragraphs):
-            try:
-                paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-            except Exception:
-                pass
-            for run in paragraph.runs:
-                try:
-                    run.font.name = 'B Nazanin'
-                    # also set eastAsia font for some Word renderers
-                    try:
-                        run._element.rPr.rFonts.set(qn('w:eastAsia'), 'B Nazanin')
-                    except Exception:
-                        pass
-                except Exception:
-                    pass
-
-        # Table cells
-        for table in list(doc.tables):
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        try:
-                            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-                        except Exception:
-                            pass
-                        for run in paragraph.runs:
-                            try:
-                                run.font.name = 'B Nazanin'
-                                try:
-                                    run._element.rPr.rFonts.set(qn('w:eastAsia'), 'B Nazanin')
-                                except Exception:
-                                    pass
-                            except Exception:
-                                pass
-    except Exception:
-        return doc
-    return doc
-
-
-def safe_df_from_rows(rows, headers):
-    """Create a pandas DataFrame from rows and headers in a tolerant way.
-    If rows have different lengths, pad them with None/empty strings.
-    """
-    try:
-        import pandas as _pd
-    except Exception:
-        return None
-    norm = []
-    for r in rows:
-        if not isinstance(r, (list, tuple)):
-            r = [r]
-        # pad or truncate to headers length
-        row = list(r)[:len(headers)] + [None] * max(0, len(headers) - len(r))
-        norm.append(row)
-    try:
-        return _pd.DataFrame(norm, columns=headers)
-    except Exception:
-        try:
-            return _pd.DataFrame(norm)
-        except Exception:
-            return None
-
 def setup_admin_handlers(client, user_states):
-    @client.on(events.CallbackQuery)
-    async def admin_callback_handler(event):
+    router = get_router(client, user_states)
+
+    def admin_op(name, legacy=()):
+        # binary callback (callback_codec) owned by an admin-only handler
+        def decorator(fn):
+            async def guarded(event, *args):
+                if utils_is_admin(DB_NAME, event.sender_id):
+                    await fn(event, *args)
+            guarded.__name__ = fn.__name__
+            router.op(name, legacy)(guarded)
+            return fn
+        return decorator
+
+    @router.callback(prefixes=("admin_message_members_",))
+    async def admin_members_callback_handler(event):
         data = event.data.decode('utf-8')
         user_id = event.sender_id
 
@@ -200,7 +85,11 @@ def setup_admin_handlers(client, user_states):
             await event.edit("✏️ لطفاً پیام مورد نظر را بنویسید و ارسال کنید:", buttons=CANCEL_BUTTON)
             return
 
-    @client.on(events.NewMessage)
+    @router.message(
+        "admin_waiting_members_message", "admin_waiting_membership_desc",
+        "admin_waiting_send_to_id_content", "admin_waiting_target_id",
+        "admin_waiting_user_help_text",
+    )
     async def admin_message_handler(event):
         user_id = event.sender_id
         state = get_user_state(user_states, user_id)
@@ -209,7 +98,7 @@ def setup_admin_handlers(client, user_states):
             if not text.strip():
                 await event.reply("❌ متن راهنما نمی‌تواند خالی باشد. لطفاً دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
-            set_setting('user_help_text', text.strip())
+            await set_setting('user_help_text', text.strip())
             clear_user_state(user_states, user_id)
             await event.reply("✅ متن راهنمای ربات با موفقیت ذخیره شد.", buttons=get_admin_main_menu())
             return
@@ -218,7 +107,7 @@ def setup_admin_handlers(client, user_states):
             if not text.strip():
                 await event.reply("❌ متن توضیحات عضویت نمی‌تواند خالی باشد. لطفاً دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
-            set_setting('membership_description', text.strip())
+            await set_setting('membership_description', text.strip())
             clear_user_state(user_states, user_id)
             await event.reply("✅ متن توضیحات عضویت با موفقیت ذخیره شد.", buttons=get_admin_main_menu())
             return
@@ -228,14 +117,15 @@ def setup_admin_handlers(client, user_states):
                 await event.reply("❌ پیام نمی‌تواند خالی باشد. لطفاً دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
             target_status = get_user_data(user_states, user_id).get("target_status")
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            if target_status:
-                c.execute("SELECT user_id FROM memberships WHERE status=?", (target_status,))
-            else:
-                c.execute("SELECT user_id FROM memberships")
-            user_ids = [row[0] for row in c.fetchall()]
-            conn.close()
+            def _load(conn):
+                c = conn.cursor()
+                if target_status:
+                    c.execute("SELECT user_id FROM memberships WHERE status=?", (target_status,))
+                else:
+                    c.execute("SELECT user_id FROM memberships")
+                user_ids = [row[0] for row in c.fetchall()]
+                return user_ids
+            user_ids = await db_read(_load)
             clear_user_state(user_states, user_id)
             await event.reply(f"⏳ ارسال پیام به {len(user_ids)} کاربر در حال انجام است...", buttons=get_admin_main_menu())
             sent, failed = 0, 0
@@ -305,7 +195,35 @@ def setup_admin_handlers(client, user_states):
                 await event.reply(f"❌ ارسال به {target_id} ناموفق بود.", buttons=get_admin_main_menu())
             return
 
-    @client.on(events.CallbackQuery)
+    @router.callback(
+        "admin_add_admin", "admin_add_faq", "admin_broadcast", "admin_collaborations",
+        "admin_donations", "admin_edit_membership_desc", "admin_edit_menu", "admin_edit_user_help",
+        "admin_events", "admin_export_collabs_excel", "admin_export_collabs_word",
+        "admin_export_donations_excel", "admin_export_donations_word", "admin_export_excel",
+        "admin_export_ideas_excel", "admin_export_ideas_word", "admin_export_members_excel",
+        "admin_export_tickets_excel", "admin_export_tickets_word", "admin_faq", "admin_ideas",
+        "admin_maintenance", "admin_manage_admins", "admin_manage_main_events",
+        "admin_membership_requests", "admin_message_members", "admin_new_event_step1",
+        "admin_send_to_id", "admin_set_donation_card", "admin_set_donation_desc",
+        "admin_set_donation_holder", "admin_settings", "admin_tickets", "broadcast_by_event",
+        "cert_diff_no", "cert_diff_yes", "cert_no", "cert_yes", "cost_fixed", "cost_free",
+        "cost_variable", "maint_clear_closed_tickets", "maint_clear_orphan_receipts",
+        "maint_clear_orphan_resources", "maint_clear_pending_regs", "maint_clear_stray_files",
+        "maint_purge_event_files_select", "maint_purge_event_select", "toggle_notify_collabs",
+        "toggle_notify_donations", "toggle_notify_ideas", "toggle_notify_membership",
+        "toggle_notify_reg", "toggle_notify_ticket", "toggle_single_reg",
+        prefixes=(
+            "admin_approve_", "admin_approve_collab_", "admin_approve_idea_", "admin_approve_reg_",
+            "admin_clear_reports_", "admin_confirm_donation_", "admin_del_faq_",
+            "admin_delete_reg_", "admin_edit_faq_", "admin_mark_idea_", "admin_reject_",
+            "admin_reject_collab_", "admin_reject_donation_", "admin_reject_idea_",
+            "admin_reject_reg_", "admin_remove_admin_", "admin_toggle_main_", "admin_view_collab_",
+            "admin_view_donation_", "admin_view_idea_", "admin_view_reg_", "admin_view_reports_",
+            "approve_membership_", "broadcast_", "broadcast_event_", "export_excel_event_",
+            "maint_purge_event_", "maint_purge_event_files_", "reject_membership_", "ticket_reply_",
+            "view_membership_",
+        ),
+    )
     async def admin_callback_handler(event):
         data = event.data.decode('utf-8')
         user_id = event.sender_id
@@ -327,22 +245,9 @@ def setup_admin_handlers(client, user_states):
         if not utils_is_admin(DB_NAME, user_id):
             return
 
-        if data == "cancel":
-            clear_user_state(user_states, user_id)
-            try:
-                await event.edit("✅ عملیات لغو شد.", buttons=get_admin_main_menu())
-            except:
-                await event.respond("✅ عملیات لغو شد.", buttons=get_admin_main_menu())
-            return
-
-        if data == "main_menu":
-            clear_user_state(user_states, user_id)
-            await event.edit("منوی اصلی ادمین:", buttons=get_admin_main_menu())
-            return
-
         if data == "admin_events":
             buttons = [
-                [Button.inline("➕ ثبت رویداد جدید", b"admin_new_event_step1"), Button.inline("⚙️ مدیریت رویدادها", b"admin_manage_events_0")],
+                [Button.inline("➕ ثبت رویداد جدید", b"admin_new_event_step1"), Button.inline("⚙️ مدیریت رویدادها", cb("manage_events"))],
                 [Button.inline("🔙 بازگشت", b"main_menu")]
             ]
             await event.edit("📅 بخش مدیریت رویدادها:", buttons=buttons)
@@ -449,11 +354,7 @@ def setup_admin_handlers(client, user_states):
             ]
             await event.edit("🧹 بخش نگهداری و پاکسازی:", buttons=buttons)
         elif data == "maint_purge_event_select":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events ORDER BY id DESC")
-            evs = c.fetchall()
-            conn.close()
+            evs = await fetch_all("SELECT id, title FROM events ORDER BY id DESC")
             if not evs:
                 await event.answer("رویدادی وجود ندارد.", alert=True)
                 return
@@ -464,11 +365,7 @@ def setup_admin_handlers(client, user_states):
             await event.edit("لطفاً رویداد موردنظر برای حذف کامل داده‌ها را انتخاب کنید:", buttons=buttons)
 
         elif data == "maint_purge_event_files_select":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events ORDER BY id DESC")
-            evs = c.fetchall()
-            conn.close()
+            evs = await fetch_all("SELECT id, title FROM events ORDER BY id DESC")
             if not evs:
                 await event.answer("رویدادی وجود ندارد.", alert=True)
                 return
@@ -530,654 +427,16 @@ def setup_admin_handlers(client, user_states):
                 [Button.inline("🔙 بازگشت", b"main_menu")]
             ]
             await event.edit("✏️ منوی ویرایش:", buttons=buttons)
-        elif data == "admin_export_members_excel":
-            await event.edit("⏳ در حال تهیه فایل اکسل عضویت...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, full_name, major, entry_year, student_number, national_id, phone, telegram_username, student_card_file, status, created_at FROM memberships ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            headers = ["شماره", "آیدی کاربر", "نام و نام خانوادگی", "رشته", "سال ورود", "شماره دانشجویی", "کد ملی", "تلفن", "آیدی تلگرام", "فایل کارت دانشجویی", "وضعیت", "تاریخ"]
-            # Prefer pandas -> xlsx. If pandas missing, try openpyxl or xlsxwriter. Otherwise CSV fallback.
-            if PD_AVAILABLE:
-                try:
-                    df = safe_df_from_rows(rows, headers)
-                    bio = BytesIO()
-                    df.to_excel(bio, index=False, engine='openpyxl')
-                    bio.seek(0)
-                    bio = apply_persian_xlsx_style(bio)
-                    try:
-                        bio.name = 'members.xlsx'
-                    except Exception:
-                        pass
-                    await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل عضویت", force_document=True)
-                    await event.edit("✅ فایل اکسل عضویت ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception as e:
-                    try:
-                        from log_helper import console_log
-                        import traceback as _tb
-                        console_log(f"export_members_excel pandas error: {_tb.format_exc()}")
-                    except Exception:
-                        import traceback as _tb
-                        print("export_members_excel pandas error:")
-                        print(_tb.format_exc())
-
-            # Try openpyxl directly
-            try:
-                from openpyxl import Workbook
-                wb = Workbook()
-                ws = wb.active
-                ws.append(headers)
-                for r in rows:
-                    ws.append(list(r))
-                bio = BytesIO()
-                wb.save(bio)
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'members.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل عضویت", force_document=True)
-                await event.edit("✅ فایل اکسل عضویت ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception as e:
-                try:
-                    from log_helper import console_log
-                    import traceback as _tb
-                    console_log(f"export_members_excel openpyxl error: {_tb.format_exc()}")
-                except Exception:
-                    import traceback as _tb
-                    print("export_members_excel openpyxl error:")
-                    print(_tb.format_exc())
-
-            # Try xlsxwriter
-            try:
-                import xlsxwriter as _xlsxwriter
-                bio = BytesIO()
-                workbook = _xlsxwriter.Workbook(bio)
-                ws = workbook.add_worksheet()
-                for c_idx, h in enumerate(headers):
-                    ws.write(0, c_idx, h)
-                for r_idx, r in enumerate(rows, start=1):
-                    for c_idx, val in enumerate(r):
-                        ws.write(r_idx, c_idx, val)
-                workbook.close()
-                bio.seek(0)
-                # xlsxwriter output is a valid xlsx; attempt to style via openpyxl
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'members.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل عضویت", force_document=True)
-                await event.edit("✅ فایل اکسل عضویت ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception as e:
-                try:
-                    from log_helper import console_log
-                    import traceback as _tb
-                    console_log(f"export_members_excel xlsxwriter error: {_tb.format_exc()}")
-                except Exception:
-                    import traceback as _tb
-                    print("export_members_excel xlsxwriter error:")
-                    print(_tb.format_exc())
-
-            # CSV fallback
-            try:
-                import csv
-                with tempfile.NamedTemporaryFile(suffix='.csv', mode='w', delete=False, encoding='utf-8', newline='') as tmp:
-                    writer = csv.writer(tmp)
-                    writer.writerow(headers)
-                    for r in rows:
-                        writer.writerow(r)
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📥 فایل CSV عضویت (fallback)", force_document=True)
-                await event.edit("✅ فایل CSV عضویت ارسال شد (fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-        elif data == "admin_export_ideas_word":
-            await event.edit("⏳ در حال تهیه فایل خروجی ایده‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, title, description, status, created_at FROM ideas ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            # Prefer docx, otherwise fallback to plain text
-            if DOCX_AVAILABLE:
-                try:
-                    doc = Document()
-                    doc.add_heading("ایده‌های ثبت شده", 0)
-                    table = doc.add_table(rows=1, cols=6)
-                    hdr_cells = table.rows[0].cells
-                    hdr_cells[0].text = 'شماره'
-                    hdr_cells[1].text = 'کاربر'
-                    hdr_cells[2].text = 'عنوان'
-                    hdr_cells[3].text = 'توضیحات'
-                    hdr_cells[4].text = 'وضعیت'
-                    hdr_cells[5].text = 'تاریخ'
-                    for r in rows:
-                        row_cells = table.add_row().cells
-                        row_cells[0].text = str(r[0])
-                        row_cells[1].text = str(r[1])
-                        row_cells[2].text = str(r[2] or '')
-                        row_cells[3].text = str(r[3] or '')
-                        row_cells[4].text = str(r[4] or '')
-                        row_cells[5].text = str(r[5] or '')
-                    try:
-                        doc = apply_persian_docx_style(doc)
-                    except Exception:
-                        pass
-                    with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-                        doc.save(tmp.name)
-                        tmp.flush()
-                        await client.send_file(event.chat_id, tmp.name, caption="📄 فایل ورد ایده‌ها", force_document=True)
-                    await event.edit("✅ فایل ورد ایده‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            # TXT fallback
-            try:
-                with tempfile.NamedTemporaryFile(suffix='.txt', mode='w', delete=False, encoding='utf-8') as tmp:
-                    for row in rows:
-                        tmp.write(f"شماره: {row[0]}\n")
-                        tmp.write(f"کاربر: {row[1]}\n")
-                        tmp.write(f"عنوان: {row[2]}\n")
-                        tmp.write(f"توضیحات: {row[3]}\n")
-                        tmp.write(f"وضعیت: {row[4]}\n")
-                        tmp.write(f"تاریخ: {row[5]}\n")
-                        tmp.write("-\n")
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📄 خروجی ایده‌ها (TXT fallback)", force_document=True)
-                await event.edit("✅ خروجی ایده‌ها ارسال شد (TXT fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-        elif data == "admin_export_collabs_word":
-            await event.edit("⏳ در حال تهیه فایل خروجی همکاری‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, full_name, organization, proposal, status, created_at FROM collaborations ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            if DOCX_AVAILABLE:
-                try:
-                    doc = Document()
-                    doc.add_heading("درخواست‌های همکاری", 0)
-                    table = doc.add_table(rows=1, cols=7)
-                    hdr = table.rows[0].cells
-                    hdr[0].text = 'شماره'
-                    hdr[1].text = 'کاربر'
-                    hdr[2].text = 'نام'
-                    hdr[3].text = 'سازمان'
-                    hdr[4].text = 'پیشنهاد'
-                    hdr[5].text = 'وضعیت'
-                    hdr[6].text = 'تاریخ'
-                    for r in rows:
-                        cells = table.add_row().cells
-                        cells[0].text = str(r[0])
-                        cells[1].text = str(r[1])
-                        cells[2].text = str(r[2] or '')
-                        cells[3].text = str(r[3] or '')
-                        cells[4].text = str(r[4] or '')
-                        cells[5].text = str(r[5] or '')
-                        cells[6].text = str(r[6] or '')
-                    try:
-                        doc = apply_persian_docx_style(doc)
-                    except Exception:
-                        pass
-                    with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-                        doc.save(tmp.name)
-                        tmp.flush()
-                        await client.send_file(event.chat_id, tmp.name, caption="📄 فایل ورد همکاری‌ها", force_document=True)
-                    await event.edit("✅ فایل ورد همکاری‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                with tempfile.NamedTemporaryFile(suffix='.txt', mode='w', delete=False, encoding='utf-8') as tmp:
-                    for row in rows:
-                        tmp.write(f"شماره: {row[0]}\n")
-                        tmp.write(f"کاربر: {row[1]}\n")
-                        tmp.write(f"نام: {row[2]}\n")
-                        tmp.write(f"سازمان: {row[3]}\n")
-                        tmp.write(f"پیشنهاد: {row[4]}\n")
-                        tmp.write(f"وضعیت: {row[5]}\n")
-                        tmp.write(f"تاریخ: {row[6]}\n")
-                        tmp.write("-\n")
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📄 خروجی همکاری‌ها (TXT fallback)", force_document=True)
-                await event.edit("✅ خروجی همکاری‌ها ارسال شد (TXT fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-        elif data == "admin_export_donations_word":
-            await event.edit("⏳ در حال تهیه فایل خروجی حمایت‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, amount, currency, status, created_at FROM donations ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            if DOCX_AVAILABLE:
-                try:
-                    doc = Document()
-                    doc.add_heading("حمایت‌های ثبت شده", 0)
-                    table = doc.add_table(rows=1, cols=6)
-                    hdr = table.rows[0].cells
-                    hdr[0].text = 'شماره'
-                    hdr[1].text = 'کاربر'
-                    hdr[2].text = 'مبلغ'
-                    hdr[3].text = 'واحد'
-                    hdr[4].text = 'وضعیت'
-                    hdr[5].text = 'تاریخ'
-                    for r in rows:
-                        cells = table.add_row().cells
-                        cells[0].text = str(r[0])
-                        cells[1].text = str(r[1])
-                        cells[2].text = str(r[2])
-                        cells[3].text = str(r[3])
-                        cells[4].text = str(r[4] or '')
-                        cells[5].text = str(r[5] or '')
-                    try:
-                        doc = apply_persian_docx_style(doc)
-                    except Exception:
-                        pass
-                    with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-                        doc.save(tmp.name)
-                        tmp.flush()
-                        await client.send_file(event.chat_id, tmp.name, caption="📄 فایل ورد حمایت‌ها", force_document=True)
-                    await event.edit("✅ فایل ورد حمایت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                with tempfile.NamedTemporaryFile(suffix='.txt', mode='w', delete=False, encoding='utf-8') as tmp:
-                    for row in rows:
-                        tmp.write(f"شماره: {row[0]}\n")
-                        tmp.write(f"کاربر: {row[1]}\n")
-                        tmp.write(f"مبلغ: {row[2]} {row[3]}\n")
-                        tmp.write(f"وضعیت: {row[4]}\n")
-                        tmp.write(f"تاریخ: {row[5]}\n")
-                        tmp.write("-\n")
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📄 خروجی حمایت‌ها (TXT fallback)", force_document=True)
-                await event.edit("✅ خروجی حمایت‌ها ارسال شد (TXT fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-
-        elif data == "admin_export_tickets_word":
-            await event.edit("⏳ در حال تهیه فایل خروجی تیکت‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, message, status, created_at FROM tickets ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            if DOCX_AVAILABLE:
-                try:
-                    doc = Document()
-                    doc.add_heading("تیکت‌های پشتیبانی", 0)
-                    table = doc.add_table(rows=1, cols=5)
-                    hdr = table.rows[0].cells
-                    hdr[0].text = 'شماره'
-                    hdr[1].text = 'کاربر'
-                    hdr[2].text = 'پیام'
-                    hdr[3].text = 'وضعیت'
-                    hdr[4].text = 'تاریخ'
-                    for r in rows:
-                        cells = table.add_row().cells
-                        cells[0].text = str(r[0])
-                        cells[1].text = str(r[1])
-                        cells[2].text = str(r[2] or '')
-                        cells[3].text = str(r[3] or '')
-                        cells[4].text = str(r[4] or '')
-                    try:
-                        doc = apply_persian_docx_style(doc)
-                    except Exception:
-                        pass
-                    with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-                        doc.save(tmp.name)
-                        tmp.flush()
-                        await client.send_file(event.chat_id, tmp.name, caption="📄 فایل ورد تیکت‌ها", force_document=True)
-                    await event.edit("✅ فایل ورد تیکت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                with tempfile.NamedTemporaryFile(suffix='.txt', mode='w', delete=False, encoding='utf-8') as tmp:
-                    for row in rows:
-                        tmp.write(f"شماره: {row[0]}\n")
-                        tmp.write(f"کاربر: {row[1]}\n")
-                        tmp.write(f"پیام: {row[2]}\n")
-                        tmp.write(f"وضعیت: {row[3]}\n")
-                        tmp.write(f"تاریخ: {row[4]}\n")
-                        tmp.write("-\n")
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📄 خروجی تیکت‌ها (TXT fallback)", force_document=True)
-                await event.edit("✅ خروجی تیکت‌ها ارسال شد (TXT fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-
-        elif data == "admin_export_ideas_excel":
-            await event.edit("⏳ در حال تهیه فایل اکسل ایده‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, title, description, status, created_at FROM ideas ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            headers = ["شماره", "کاربر", "عنوان", "توضیحات", "وضعیت", "تاریخ"]
-            # Prefer pandas
-            if PD_AVAILABLE:
-                try:
-                    df = safe_df_from_rows(rows, headers)
-                    bio = BytesIO()
-                    df.to_excel(bio, index=False, engine='openpyxl')
-                    bio.seek(0)
-                    bio = apply_persian_xlsx_style(bio)
-                    try:
-                        bio.name = 'ideas.xlsx'
-                    except Exception:
-                        pass
-                    await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل ایده‌ها", force_document=True)
-                    await event.edit("✅ فایل اکسل ایده‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                from openpyxl import Workbook
-                wb = Workbook()
-                ws = wb.active
-                ws.append(headers)
-                for r in rows:
-                    ws.append(list(r))
-                bio = BytesIO()
-                wb.save(bio)
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'ideas.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل ایده‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل ایده‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import xlsxwriter as _xlsxwriter
-                bio = BytesIO()
-                workbook = _xlsxwriter.Workbook(bio)
-                ws = workbook.add_worksheet()
-                for c_idx, h in enumerate(headers):
-                    ws.write(0, c_idx, h)
-                for r_idx, r in enumerate(rows, start=1):
-                    for c_idx, val in enumerate(r):
-                        ws.write(r_idx, c_idx, val)
-                workbook.close()
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'ideas.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل ایده‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل ایده‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import csv
-                with tempfile.NamedTemporaryFile(suffix='.csv', mode='w', delete=False, encoding='utf-8', newline='') as tmp:
-                    writer = csv.writer(tmp)
-                    writer.writerow(headers)
-                    for r in rows:
-                        writer.writerow(r)
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📥 فایل CSV ایده‌ها (fallback)", force_document=True)
-                await event.edit("✅ فایل CSV ایده‌ها ارسال شد (fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-
-        elif data == "admin_export_collabs_excel":
-            await event.edit("⏳ در حال تهیه فایل اکسل همکاری‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, full_name, organization, proposal, status, created_at FROM collaborations ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            headers = ["شماره", "کاربر", "نام", "سازمان", "پیشنهاد", "وضعیت", "تاریخ"]
-            if PD_AVAILABLE:
-                try:
-                    df = safe_df_from_rows(rows, headers)
-                    bio = BytesIO()
-                    df.to_excel(bio, index=False, engine='openpyxl')
-                    bio.seek(0)
-                    bio = apply_persian_xlsx_style(bio)
-                    try:
-                        bio.name = 'collabs.xlsx'
-                    except Exception:
-                        pass
-                    await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل همکاری‌ها", force_document=True)
-                    await event.edit("✅ فایل اکسل همکاری‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                from openpyxl import Workbook
-                wb = Workbook()
-                ws = wb.active
-                ws.append(headers)
-                for r in rows:
-                    ws.append(list(r))
-                bio = BytesIO()
-                wb.save(bio)
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'collabs.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل همکاری‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل همکاری‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import xlsxwriter as _xlsxwriter
-                bio = BytesIO()
-                workbook = _xlsxwriter.Workbook(bio)
-                ws = workbook.add_worksheet()
-                for c_idx, h in enumerate(headers):
-                    ws.write(0, c_idx, h)
-                for r_idx, r in enumerate(rows, start=1):
-                    for c_idx, val in enumerate(r):
-                        ws.write(r_idx, c_idx, val)
-                workbook.close()
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'collabs.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل همکاری‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل همکاری‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import csv
-                with tempfile.NamedTemporaryFile(suffix='.csv', mode='w', delete=False, encoding='utf-8', newline='') as tmp:
-                    writer = csv.writer(tmp)
-                    writer.writerow(headers)
-                    for r in rows:
-                        writer.writerow(r)
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📥 فایل CSV همکاری‌ها (fallback)", force_document=True)
-                await event.edit("✅ فایل CSV همکاری‌ها ارسال شد (fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
-
-        elif data == "admin_export_donations_excel":
-            await event.edit("⏳ در حال تهیه فایل اکسل حمایت‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, amount, currency, status, created_at FROM donations ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            headers = ["شماره", "کاربر", "مبلغ", "واحد", "وضعیت", "تاریخ"]
-            if PD_AVAILABLE:
-                try:
-                    df = safe_df_from_rows(rows, headers)
-                    bio = BytesIO()
-                    df.to_excel(bio, index=False, engine='openpyxl')
-                    bio.seek(0)
-                    bio = apply_persian_xlsx_style(bio)
-                    try:
-                        bio.name = 'donations.xlsx'
-                    except Exception:
-                        pass
-                    await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل حمایت‌ها", force_document=True)
-                    await event.edit("✅ فایل اکسل حمایت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                from openpyxl import Workbook
-                wb = Workbook()
-                ws = wb.active
-                ws.append(headers)
-                for r in rows:
-                    ws.append(list(r))
-                bio = BytesIO()
-                wb.save(bio)
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'donations.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل حمایت‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل حمایت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import xlsxwriter as _xlsxwriter
-                bio = BytesIO()
-                workbook = _xlsxwriter.Workbook(bio)
-                ws = workbook.add_worksheet()
-                for c_idx, h in enumerate(headers):
-                    ws.write(0, c_idx, h)
-                for r_idx, r in enumerate(rows, start=1):
-                    for c_idx, val in enumerate(r):
-                        ws.write(r_idx, c_idx, val)
-                workbook.close()
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'donations.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل حمایت‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل حمایت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import csv
-                with tempfile.NamedTemporaryFile(suffix='.csv', mode='w', delete=False, encoding='utf-8', newline='') as tmp:
-                    writer = csv.writer(tmp)
-                    writer.writerow(headers)
-                    for r in rows:
-                        writer.writerow(r)
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📥 فایل CSV حمایت‌ها (fallback)", force_document=True)
-                await event.edit("✅ فایل CSV حمایت‌ها ارسال شد (fallback).", buttons=get_admin_main_menu())
-            except Exception as e:
-                await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
-            return
+        elif data in EXPORT_CALLBACKS:
+            name, output = EXPORT_CALLBACKS[data]
+            title = DATASETS[name].title
+            await event.edit(f"⏳ در حال تهیه فایل خروجی {title}...", buttons=CANCEL_BUTTON)
 
-        elif data == "admin_export_tickets_excel":
-            await event.edit("⏳ در حال تهیه فایل اکسل تیکت‌ها...", buttons=CANCEL_BUTTON)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, message, status, created_at FROM tickets ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
-            headers = ["شماره", "کاربر", "پیام", "وضعیت", "تاریخ"]
-            if PD_AVAILABLE:
-                try:
-                    df = safe_df_from_rows(rows, headers)
-                    bio = BytesIO()
-                    df.to_excel(bio, index=False, engine='openpyxl')
-                    bio.seek(0)
-                    bio = apply_persian_xlsx_style(bio)
-                    try:
-                        bio.name = 'tickets.xlsx'
-                    except Exception:
-                        pass
-                    await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل تیکت‌ها", force_document=True)
-                    await event.edit("✅ فایل اکسل تیکت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                    return
-                except Exception:
-                    pass
-            try:
-                from openpyxl import Workbook
-                wb = Workbook()
-                ws = wb.active
-                ws.append(headers)
-                for r in rows:
-                    ws.append(list(r))
-                bio = BytesIO()
-                wb.save(bio)
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'tickets.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل تیکت‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل تیکت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
-            try:
-                import xlsxwriter as _xlsxwriter
-                bio = BytesIO()
-                workbook = _xlsxwriter.Workbook(bio)
-                ws = workbook.add_worksheet()
-                for c_idx, h in enumerate(headers):
-                    ws.write(0, c_idx, h)
-                for r_idx, r in enumerate(rows, start=1):
-                    for c_idx, val in enumerate(r):
-                        ws.write(r_idx, c_idx, val)
-                workbook.close()
-                bio.seek(0)
-                bio = apply_persian_xlsx_style(bio)
-                try:
-                    bio.name = 'tickets.xlsx'
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, bio, caption="📥 فایل اکسل تیکت‌ها", force_document=True)
-                await event.edit("✅ فایل اکسل تیکت‌ها ارسال شد.", buttons=get_admin_main_menu())
-                return
-            except Exception:
-                pass
+            async def show_progress(done, total):
+                await event.edit(f"⏳ در حال تهیه فایل خروجی {title}... ({done} از {total} ردیف)", buttons=CANCEL_BUTTON)
             try:
-                import csv
-                with tempfile.NamedTemporaryFile(suffix='.csv', mode='w', delete=False, encoding='utf-8', newline='') as tmp:
-                    writer = csv.writer(tmp)
-                    writer.writerow(headers)
-                    for r in rows:
-                        writer.writerow(r)
-                    tmp.flush()
-                    await client.send_file(event.chat_id, tmp.name, caption="📥 فایل CSV تیکت‌ها (fallback)", force_document=True)
-                await event.edit("✅ فایل CSV تیکت‌ها ارسال شد (fallback).", buttons=get_admin_main_menu())
+                kind = await send_export(client, event.chat_id, name, output, progress=show_progress)
+                await event.edit(f"✅ {KIND_LABELS[kind]} {title} ارسال شد.", buttons=get_admin_main_menu())
             except Exception as e:
                 await event.edit(f"❌ خطا در تولید فایل: {e}", buttons=get_admin_main_menu())
             return
@@ -1214,7 +473,7 @@ def setup_admin_handlers(client, user_states):
                 return
             cur = get_setting('single_registration_per_user', '1')
             new = '0' if cur == '1' else '1'
-            set_setting('single_registration_per_user', new)
+            await set_setting('single_registration_per_user', new)
             label = "✅ روشن" if new == '1' else '❌ خاموش'
             try:
                 await event.answer(f"🔄 محدودیت یک ثبت‌نام/کاربر: {label}", alert=True)
@@ -1248,7 +507,7 @@ def setup_admin_handlers(client, user_states):
                 await event.answer("❌ دسترسی ندارید!", alert=True)
                 return
             cur = get_setting("notify_new_registration","1")
-            set_setting("notify_new_registration", "0" if cur == "1" else "1")
+            await set_setting("notify_new_registration", "0" if cur == "1" else "1")
             
             nreg = "✅ روشن" if get_setting("notify_new_registration","1") == "1" else "❌ خاموش"
             ntick = "✅ روشن" if get_setting("notify_new_ticket","1") == "1" else "❌ خاموش"
@@ -1265,7 +524,7 @@ def setup_admin_handlers(client, user_states):
                 await event.answer("❌ دسترسی ندارید!", alert=True)
                 return
             cur = get_setting("notify_new_membership","1")
-            set_setting("notify_new_membership", "0" if cur == "1" else "1")
+            await set_setting("notify_new_membership", "0" if cur == "1" else "1")
             # refresh
             nreg = "✅ روشن" if get_setting("notify_new_registration","1") == "1" else "❌ خاموش"
             ntick = "✅ روشن" if get_setting("notify_new_ticket","1") == "1" else "❌ خاموش"
@@ -1292,7 +551,7 @@ def setup_admin_handlers(client, user_states):
                 await event.answer("❌ دسترسی ندارید!", alert=True)
                 return
             cur = get_setting("notify_new_idea","1")
-            set_setting("notify_new_idea", "0" if cur == "1" else "1")
+            await set_setting("notify_new_idea", "0" if cur == "1" else "1")
             await event.edit("تنظیم ذخیره شد.", buttons=get_admin_main_menu())
 
         elif data == "toggle_notify_collabs":
@@ -1300,7 +559,7 @@ def setup_admin_handlers(client, user_states):
                 await event.answer("❌ دسترسی ندارید!", alert=True)
                 return
             cur = get_setting("notify_new_collab","1")
-            set_setting("notify_new_collab", "0" if cur == "1" else "1")
+            await set_setting("notify_new_collab", "0" if cur == "1" else "1")
             await event.edit("تنظیم ذخیره شد.", buttons=get_admin_main_menu())
 
         elif data == "toggle_notify_donations":
@@ -1308,7 +567,7 @@ def setup_admin_handlers(client, user_states):
                 await event.answer("❌ دسترسی ندارید!", alert=True)
                 return
             cur = get_setting("notify_new_donation","1")
-            set_setting("notify_new_donation", "0" if cur == "1" else "1")
+            await set_setting("notify_new_donation", "0" if cur == "1" else "1")
             await event.edit("تنظیم ذخیره شد.", buttons=get_admin_main_menu())
 
         elif data == "toggle_notify_ticket":
@@ -1317,7 +576,7 @@ def setup_admin_handlers(client, user_states):
                 await event.answer("❌ دسترسی ندارید!", alert=True)
                 return
             cur = get_setting("notify_new_ticket","1")
-            set_setting("notify_new_ticket", "0" if cur == "1" else "1")
+            await set_setting("notify_new_ticket", "0" if cur == "1" else "1")
             
             nreg = "✅ روشن" if get_setting("notify_new_registration","1") == "1" else "❌ خاموش"
             ntick = "✅ روشن" if get_setting("notify_new_ticket","1") == "1" else "❌ خاموش"
@@ -1355,11 +614,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data == "admin_manage_main_events":
             
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events ORDER BY id DESC LIMIT 200")
-            evs = c.fetchall()
-            conn.close()
+            evs = await fetch_all("SELECT id, title FROM events ORDER BY id DESC LIMIT 200")
             
             raw = get_setting('main_events', '')
             selected = [int(x) for x in raw.split(',') if x.strip().isdigit()]
@@ -1381,7 +636,7 @@ def setup_admin_handlers(client, user_states):
                     await event.answer("❌ حداکثر 3 میانبر مجاز است.", alert=True)
                     return
                 selected.append(eid)
-            set_setting('main_events', ','.join(map(str, selected)))
+            await set_setting('main_events', ','.join(map(str, selected)))
             
             try:
                 mtext = getattr(event.message, 'message', '') or ''
@@ -1389,11 +644,7 @@ def setup_admin_handlers(client, user_states):
                 mtext = ''
             
             if '⭐ مدیریت میانبرهای اصلی' in mtext:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT id, title FROM events ORDER BY id DESC LIMIT 200")
-                evs = c.fetchall()
-                conn.close()
+                evs = await fetch_all("SELECT id, title FROM events ORDER BY id DESC LIMIT 200")
                 raw2 = get_setting('main_events', '')
                 selected2 = [int(x) for x in raw2.split(',') if x.strip().isdigit()]
                 buttons = []
@@ -1406,11 +657,7 @@ def setup_admin_handlers(client, user_states):
             
             if 'لطفا بخش مورد نظر برای ویرایش' in mtext:
                 
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT title, description, cost_type, card_number, is_active FROM events WHERE id = ?", (eid,))
-                result = c.fetchone()
-                conn.close()
+                result = await fetch_one("SELECT title, description, cost_type, card_number, is_active FROM events WHERE id = ?", (eid,))
                 title = result[0] if result else f"رویداد #{eid}"
                 is_active = result[4] if result and len(result) > 4 else 0
                 status_text = "✅ فعال" if is_active else "❌ غیرفعال"
@@ -1419,25 +666,21 @@ def setup_admin_handlers(client, user_states):
                 main_label = "⭐ میانبر (فعال)" if eid in selected3 else "⭐ میانبر (غیر فعال)"
                 buttons = [
                     [Button.inline(main_label, f"admin_toggle_main_{eid}")],
-                    [Button.inline("✏️ ویرایش عنوان", f"edit_title_{eid}"), Button.inline("📝 ویرایش توضیحات", f"edit_desc_{eid}")],
-                    [Button.inline("💰 ویرایش هزینه", f"edit_cost_{eid}"), Button.inline("💳 ویرایش شماره کارت", f"edit_card_{eid}")],
-                    [Button.inline("🖼️ ویرایش پوستر", f"edit_poster_{eid}"), Button.inline("🎯 تنظیم ظرفیت", f"admin_set_capacity_{eid}")],
-                    [Button.inline(f"🔄 وضعیت ({status_text})", f"admin_toggle_event_{eid}"), Button.inline("⏱️ تنظیم مهلت (شمسی)", f"admin_set_deadline_{eid}")],
-                    [Button.inline("📑 تنظیم گزارش کار", f"admin_set_report_{eid}"), Button.inline("🗂️ مدیریت گزارش‌ها", f"admin_manage_reports_{eid}")],
-                    [Button.inline("🗑️ حذف کامل رویداد", f"admin_delete_event_{eid}")],
-                    [Button.inline("✅ تایید گروهی در انتظار", f"admin_bulk_approve_{eid}"), Button.inline("🔔 یادآوری به تاییدشدگان", f"admin_remind_{eid}")],
-                    [Button.inline("✉️ پیام به تاییدشدگان", f"admin_message_approved_{eid}"), Button.inline("✉️ پیام به ردشدگان", f"admin_message_rejected_{eid}")],
-                    [Button.inline("🔙 بازگشت", b"admin_manage_events_0"), Button.inline("🏠 منو", b"main_menu")]
+                    [Button.inline("✏️ ویرایش عنوان", cb("edit_title", eid)), Button.inline("📝 ویرایش توضیحات", cb("edit_desc", eid))],
+                    [Button.inline("💰 ویرایش هزینه", cb("edit_cost", eid)), Button.inline("💳 ویرایش شماره کارت", cb("edit_card", eid))],
+                    [Button.inline("🖼️ ویرایش پوستر", cb("edit_poster", eid)), Button.inline("🎯 تنظیم ظرفیت", cb("set_capacity", eid))],
+                    [Button.inline(f"🔄 وضعیت ({status_text})", cb("toggle_event", eid)), Button.inline("⏱️ تنظیم مهلت (شمسی)", cb("set_deadline", eid))],
+                    [Button.inline("📑 تنظیم گزارش کار", cb("set_report", eid)), Button.inline("🗂️ مدیریت گزارش‌ها", cb("manage_reports", eid))],
+                    [Button.inline("🗑️ حذف کامل رویداد", cb("delete_event", eid))],
+                    [Button.inline("✅ تایید گروهی در انتظار", cb("bulk_approve", eid)), Button.inline("🔔 یادآوری به تاییدشدگان", cb("remind", eid))],
+                    [Button.inline("✉️ پیام به تاییدشدگان", cb("message_approved", eid)), Button.inline("✉️ پیام به ردشدگان", cb("message_rejected", eid))],
+                    [Button.inline("🔙 بازگشت", cb("manage_events")), Button.inline("🏠 منو", b"main_menu")]
                 ]
                 await event.edit("لطفا بخش مورد نظر برای ویرایش را انتخاب کنید:", buttons=buttons)
                 return
             
             await event.answer("✅ تغییر ذخیره شد.", alert=True)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events ORDER BY id DESC LIMIT 200")
-            evs = c.fetchall()
-            conn.close()
+            evs = await fetch_all("SELECT id, title FROM events ORDER BY id DESC LIMIT 200")
             raw2 = get_setting('main_events', '')
             selected2 = [int(x) for x in raw2.split(',') if x.strip().isdigit()]
             buttons = []
@@ -1447,602 +690,77 @@ def setup_admin_handlers(client, user_states):
             buttons.append([Button.inline("🔙 بازگشت", b"admin_settings")])
             await event.edit("⭐ مدیریت میانبرهای اصلی (تا 3 رویداد):\nبرای فعال/غیرفعال کردن روی عنوان کلیک کنید.", buttons=buttons)
 
-        elif data.startswith("admin_toggle_main_edit_"):
-            
-            eid = int(data.split("_")[-1])
-            raw = get_setting('main_events', '')
-            selected = [int(x) for x in raw.split(',') if x.strip().isdigit()]
-            if eid in selected:
-                selected.remove(eid)
-            else:
-                if len(selected) >= 3:
-                    await event.answer("❌ حداکثر 3 میانبر مجاز است.", alert=True)
-                    return
-                selected.append(eid)
-            set_setting('main_events', ','.join(map(str, selected)))
-            
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT title, description, cost_type, card_number, is_active, poster_file_id FROM events WHERE id = ?", (eid,))
-            result = c.fetchone()
-            conn.close()
-            if not result:
-                await event.answer("❌ رویداد یافت نشد!", alert=True)
-                return
-            title, desc, cost_type, card, is_active, poster_path = result
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT fixed_cost, student_cost, non_student_cost, capacity, end_at_ts FROM events WHERE id = ?", (eid,))
-            extra = c.fetchone()
-            conn.close()
-            fixed_cost = extra[0] if extra else 0
-            student_cost = extra[1] if extra else 0
-            non_student_cost = extra[2] if extra else 0
-            capacity = extra[3] if extra else None
-            end_at_ts = extra[4] if extra else None
-            cost_display = "رایگان"
-            if cost_type == "fixed":
-                cost_display = f"{fixed_cost:,} تومان"
-            elif cost_type == "variable":
-                cost_display = f"دانشجو: {student_cost:,} — غیر دانشجو: {non_student_cost:,} تومان"
-            status_text = "✅ فعال" if is_active else "❌ غیرفعال"
-            cap_txt = "بدون محدودیت" if (capacity is None or capacity == -1) else str(capacity)
-            deadline_txt = "—"
-            if end_at_ts:
-                try:
-                    from utils import epoch_to_jalali_str
-                    deadline_txt = epoch_to_jalali_str(end_at_ts) + " (ساعت رسمی ایران)"
-                except Exception:
-                    deadline_txt = str(end_at_ts)
-            preview = f"""
-📌 {title}
-{desc or '—'}
-
-وضعیت: {status_text}
-ظرفیت: {cap_txt}
-هزینه: {cost_display}
-کارت: {card or '—'}
-مهلت: {deadline_txt}
-""".strip()
-            try:
-                if poster_path and is_safe_upload_path(poster_path):
-                    await client.send_file(event.chat_id, poster_path, caption=preview)
-                else:
-                    await client.send_message(event.chat_id, preview)
-            except Exception:
-                pass
-            raw_main = get_setting('main_events', '')
-            selected_main = [int(x) for x in raw_main.split(',') if x.strip().isdigit()]
-            main_label = "⭐ میانبر (فعال)" if eid in selected_main else "⭐ میانبر (غیر فعال)"
-            buttons = [
-                [Button.inline(main_label, f"admin_toggle_main_edit_{eid}")],
-                [Button.inline("✏️ ویرایش عنوان", f"edit_title_{eid}"), Button.inline("📝 ویرایش توضیحات", f"edit_desc_{eid}")],
-                [Button.inline("💰 ویرایش هزینه", f"edit_cost_{eid}"), Button.inline("💳 ویرایش شماره کارت", f"edit_card_{eid}")],
-                [Button.inline("🖼️ ویرایش پوستر", f"edit_poster_{eid}"), Button.inline("🎯 تنظیم ظرفیت", f"admin_set_capacity_{eid}")],
-                [Button.inline(f"🔄 وضعیت ({status_text})", f"admin_toggle_event_{eid}"), Button.inline("⏱️ تنظیم مهلت (شمسی)", f"admin_set_deadline_{eid}")],
-                [Button.inline("📑 تنظیم گزارش کار", f"admin_set_report_{eid}"), Button.inline("🗂️ مدیریت گزارش‌ها", f"admin_manage_reports_{eid}")],
-                [Button.inline("🗑️ حذف کامل رویداد", f"admin_delete_event_{eid}")],
-                [Button.inline("✅ تایید گروهی در انتظار", f"admin_bulk_approve_{eid}"), Button.inline("🔔 یادآوری به تاییدشدگان", f"admin_remind_{eid}")],
-                [Button.inline("✉️ پیام به تاییدشدگان", f"admin_message_approved_{eid}"), Button.inline("✉️ پیام به ردشدگان", f"admin_message_rejected_{eid}")],
-                [Button.inline("🔙 بازگشت", b"admin_manage_events_0"), Button.inline("🏠 منو", b"main_menu")]
-            ]
-            await event.edit("لطفا بخش مورد نظر برای ویرایش را انتخاب کنید:", buttons=buttons)
-
         elif data == "maint_clear_pending_regs":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("DELETE FROM registrations WHERE status = 'pending'")
-            deleted = c.rowcount
-            conn.commit()
-            conn.close()
+            deleted = await execute("DELETE FROM registrations WHERE status = 'pending'")
             await event.answer(f"✅ {deleted} ثبت‌نام در انتظار حذف شد.", alert=True)
 
-        elif data.startswith("maint_purge_event_"):
+        elif data.startswith("maint_purge_event_") and not data.startswith("maint_purge_event_files_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT poster_file_id, report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            poster_path = row[0] if row else None
-            payloads = row[1] if row else None
-            try:
-                if poster_path and is_safe_upload_path(poster_path):
-                    os.remove(poster_path)
-            except Exception:
-                pass
-            if payloads:
-                try:
-                    import json as _json
-                    for p in _json.loads(payloads):
-                        if p.get("type") == "file":
-                            pth = p.get("path")
-                            if pth and is_safe_upload_path(pth):
-                                try:
-                                    os.remove(pth)
-                                except Exception:
-                                    pass
-                except Exception:
-                    pass
-            c.execute("DELETE FROM certificates WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM registrations WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM resources WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM attendance WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM events WHERE id = ?", (event_id,))
-            conn.commit()
-            conn.close()
+            def _apply(conn):
+                c = conn.cursor()
+                # poster, receipt and certificate files are released by the blobs triggers;
+                # report files are removed after the transaction, off the writer thread
+                c.execute("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
+                row = c.fetchone()
+                report_paths = report_files(row[0] if row else None)
+                released = _event_upload_paths(c, event_id)
+                c.execute("DELETE FROM certificates WHERE event_id = ?", (event_id,))
+                c.execute("DELETE FROM registrations WHERE event_id = ?", (event_id,))
+                c.execute("DELETE FROM resources WHERE event_id = ?", (event_id,))
+                c.execute("DELETE FROM attendance WHERE event_id = ?", (event_id,))
+                c.execute("DELETE FROM reminders_sent WHERE event_id = ?", (event_id,))
+                c.execute("DELETE FROM events WHERE id = ?", (event_id,))
+                # an explicit purge doesn't wait out the grace period of recent uploads
+                expire_now(conn, released)
+                return report_paths
+            await discard_files(await db_write(_apply))
+            await collect_all()
             await event.answer("🧹 داده‌های رویداد حذف شد.", alert=True)
 
         elif data.startswith("maint_purge_event_files_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT poster_file_id, report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            poster_path = row[0] if row else None
-            payloads = row[1] if row else None
-            try:
-                if poster_path and is_safe_upload_path(poster_path):
-                    os.remove(poster_path)
-            except Exception:
-                pass
-            if payloads:
-                try:
-                    import json as _json
-                    for p in _json.loads(payloads):
-                        if p.get("type") == "file":
-                            pth = p.get("path")
-                            if pth and is_safe_upload_path(pth):
-                                try:
-                                    os.remove(pth)
-                                except Exception:
-                                    pass
-                except Exception:
-                    pass
-            c.execute("SELECT file_id FROM certificates WHERE event_id = ?", (event_id,))
-            for (fid,) in c.fetchall():
-                try:
-                    if fid and is_safe_upload_path(fid):
-                        os.remove(fid)
-                except Exception:
-                    pass
-            c.execute("UPDATE events SET poster_file_id = NULL WHERE id = ?", (event_id,))
-            c.execute("UPDATE events SET report_payloads = NULL WHERE id = ?", (event_id,))
-            c.execute("UPDATE registrations SET payment_receipt_file_id = NULL WHERE event_id = ?", (event_id,))
-            c.execute("UPDATE certificates SET file_id = NULL WHERE event_id = ?", (event_id,))
-            conn.commit()
-            conn.close()
-            await event.answer("🧺 فایل‌های رویداد حذف شد و ارجاعات پاک شدند.", alert=True)
+            def _apply(conn):
+                c = conn.cursor()
+                # poster, receipt and certificate files are released by the blobs triggers;
+                # report files are removed after the transaction, off the writer thread
+                c.execute("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
+                row = c.fetchone()
+                report_paths = report_files(row[0] if row else None)
+                released = _event_upload_paths(c, event_id)
+                c.execute("UPDATE events SET poster_file_id = NULL WHERE id = ?", (event_id,))
+                c.execute("UPDATE events SET report_payloads = NULL WHERE id = ?", (event_id,))
+                c.execute("UPDATE registrations SET payment_receipt_file_id = NULL WHERE event_id = ?", (event_id,))
+                # file_id is NOT NULL
+                c.execute("UPDATE certificates SET file_id = '' WHERE event_id = ?", (event_id,))
+                # an explicit purge doesn't wait out the grace period of recent uploads
+                expire_now(conn, released)
+                return report_paths
+            removed, _ = await discard_files(await db_write(_apply))
+            removed += (await collect_all())[0]
+            await event.answer(f"🧺 فایل‌های رویداد حذف شد ({removed} فایل) و ارجاعات پاک شدند.", alert=True)
 
         elif data == "maint_clear_closed_tickets":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("DELETE FROM tickets WHERE status = 'closed'")
-            deleted = c.rowcount
-            conn.commit()
-            conn.close()
+            deleted = await execute("DELETE FROM tickets WHERE status = 'closed'")
             await event.answer(f"✅ {deleted} تیکت بسته حذف شد.", alert=True)
 
-        elif data == "maint_clear_orphan_resources":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, file_path FROM resources")
-            rows = c.fetchall()
-            removed = 0
-            for rid, path in rows:
-                if not os.path.exists(path or ""):
-                    c.execute("DELETE FROM resources WHERE id = ?", (rid,))
-                    removed += 1
-            conn.commit()
-            conn.close()
-            await event.answer(f"✅ {removed} منبع یتیم حذف شد.", alert=True)
-
-        elif data == "maint_clear_orphan_receipts":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, payment_receipt_file_id FROM registrations WHERE payment_receipt_file_id IS NOT NULL")
-            rows = c.fetchall()
-            removed = 0
-            for rid, path in rows:
-                if path and not os.path.exists(path):
-                    c.execute("DELETE FROM registrations WHERE id = ?", (rid,))
-                    removed += 1
-            conn.commit()
-            conn.close()
-            await event.answer(f"✅ {removed} رسید یتیم/ناقص حذف شد.", alert=True)
-
-        elif data == "maint_clear_stray_files":
-            base = os.getcwd()
-            safe_dirs = {os.path.join(base, "uploads")}
-            safe_exts = {".db", ".log"}
-            protected_roots = {base}
-            removed = 0
-            errors = 0
-            for root, dirs, files in os.walk(base):
-                rel = os.path.relpath(root, base)
-                if rel.startswith('.') or rel.startswith(".git"):
-                    continue
-                for f in files:
-                    path = os.path.join(root, f)
-                    if path.startswith(os.path.join(base, "uploads")):
-                        try:
-                            os.remove(path)
-                            removed += 1
-                        except Exception:
-                            errors += 1
-                        continue
-                    if os.path.splitext(path)[1].lower() in safe_exts:
-                        continue
-                    if path.endswith('.py'):
-                        continue
-                    try:
-                        os.remove(path)
-                        removed += 1
-                    except Exception:
-                        errors += 1
-            await event.answer(f"🧹 حذف فایل‌ها به پایان رسید. حذف: {removed} | خطا: {errors}", alert=True)
-
-        elif data == "admin_capacity":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title, COALESCE(capacity, -1) FROM events ORDER BY id DESC")
-            events_list = c.fetchall()
-            conn.close()
-            if not events_list:
-                await event.edit("📭 هیچ رویدادی وجود ندارد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-                return
-            buttons = []
-            for eid, title, cap in events_list:
-                cap_txt = "بدون محدودیت" if cap is None or cap == -1 else str(cap)
-                buttons.append([Button.inline(f"{title} — ظرفیت: {cap_txt}", f"admin_set_capacity_{eid}")])
-            buttons.append([Button.inline("🏠 منوی اصلی", b"main_menu")])
-            await event.edit("🎯 انتخاب رویداد برای تنظیم ظرفیت:", buttons=buttons)
+        elif data in GC_BUTTONS:
+            def describe(report):
+                return (f"بررسی‌شده: {report.checked} | ردیف حذف‌شده: {report.rows}\n"
+                        f"فایل حذف‌شده: {report.files} | فضای آزادشده: {report.reclaimed / 1048576:.1f}MB")
+            async def show_progress(report):
+                await event.edit(f"⏳ پاکسازی در حال انجام...\n{describe(report)}")
+            await event.edit("⏳ پاکسازی در حال انجام...")
+            report = await run_gc(GC_BUTTONS[data], progress=show_progress)
+            await event.edit(f"✅ پاکسازی به پایان رسید.\n{describe(report)}",
+                             buttons=[[Button.inline("🔙 بازگشت", b"admin_maintenance")]])
 
         elif data == "admin_new_event_step1":
             await event.edit("📌 لطفا عنوان رویداد را ارسال کنید:", buttons=CANCEL_BUTTON)
             set_user_state(user_states, user_id, "admin_new_event_title")
 
-        elif data == "admin_stats":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events ORDER BY id DESC")
-            events_list = c.fetchall()
-            conn.close()
-            buttons = []
-            for eid, title in events_list:
-                buttons.append([Button.inline(f"📊 {title}", f"stats_event_{eid}")])
-            buttons.append([Button.inline("🏠 بازگشت به منو", b"main_menu")])
-            await event.edit("📈 آمار بر اساس رویداد:", buttons=buttons)
-
-        elif data.startswith("stats_event_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
-                SELECT 
-                    SUM(CASE WHEN r.status='approved' THEN 1 ELSE 0 END) AS approved_cnt,
-                    SUM(CASE WHEN r.status='rejected' THEN 1 ELSE 0 END) AS rejected_cnt,
-                    SUM(CASE WHEN r.status='pending' THEN 1 ELSE 0 END) AS pending_cnt
-                FROM registrations r
-                WHERE r.event_id = ?
-            """, (event_id,))
-            row = c.fetchone()
-            approved_cnt, rejected_cnt, pending_cnt = row if row else (0, 0, 0)
-            c.execute("SELECT title FROM events WHERE id = ?", (event_id,))
-            title_row = c.fetchone()
-            conn.close()
-            title = title_row[0] if title_row else str(event_id)
-            msg = f"""
-📊 آمار رویداد: {title}
-
-✅ تایید شده: {approved_cnt or 0}
-❌ رد شده: {rejected_cnt or 0}
-⏳ در انتظار: {pending_cnt or 0}
-            """.strip()
-            await event.edit(msg, buttons=[
-                [Button.inline("🔙 بازگشت", b"admin_stats")],
-                [Button.inline("🏠 منوی اصلی", b"main_menu")]
-            ])
-
-        elif data.startswith("admin_manage_events_"):
-            page = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title, is_active FROM events ORDER BY id DESC")
-            events_list = c.fetchall()
-            conn.close()
-            if not events_list:
-                await event.edit("📭 هیچ رویدادی وجود ندارد.", buttons=[[Button.inline("➕ ثبت جدید", b"admin_new_event_step1")], [Button.inline("🏠 منو", b"main_menu")]])
-                return
-            per_page = 5
-            total = len(events_list)
-            start = page * per_page
-            end = start + per_page
-            slice_events = events_list[start:end]
-            buttons = []
-            for eid, title, is_active in slice_events:
-                status = "✅ فعال" if is_active else "❌ غیرفعال"
-                buttons.append([Button.inline(f"{title} — {status}", f"admin_edit_event_{eid}")])
-            nav = []
-            if page > 0:
-                nav.append(Button.inline("⬅️ قبلی", f"admin_manage_events_{page-1}"))
-            if end < total:
-                nav.append(Button.inline("➡️ بعدی", f"admin_manage_events_{page+1}"))
-            if nav:
-                buttons.append(nav)
-            buttons.append([Button.inline("🏠 بازگشت به منو", b"main_menu")])
-            await event.edit("⚙️ رویدادهای ثبت شده:", buttons=buttons)
-
-        elif data.startswith("admin_toggle_single_reg_event_"):
-            event_id = int(data.split("_")[-1])
-            if not utils_is_admin(DB_NAME, user_id):
-                await event.answer("❌ دسترسی ندارید!", alert=True)
-                return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT single_registration FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            current = 1 if row and row[0] else 0
-            new = 0 if current == 1 else 1
-            c.execute("UPDATE events SET single_registration = ? WHERE id = ?", (new, event_id))
-            conn.commit()
-            conn.close()
-            await event.answer("🔄 تنظیمات بروزرسانی شد.", alert=True)
-            try:
-                # refresh the edit view for the event
-                await admin_callback_handler(event)
-            except Exception:
-                pass
-
-        elif data.startswith("admin_edit_event_"):
-            event_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT title, description, cost_type, card_number, is_active, poster_file_id FROM events WHERE id = ?", (event_id,))
-            result = c.fetchone()
-            conn.close()
-            if not result:
-                await event.answer("❌ رویداد یافت نشد!", alert=True)
-                return
-            title, desc, cost_type, card, is_active, poster_path = result
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT fixed_cost, student_cost, non_student_cost, capacity, end_at_ts FROM events WHERE id = ?", (event_id,))
-            extra = c.fetchone()
-            conn.close()
-            fixed_cost = extra[0] if extra else 0
-            student_cost = extra[1] if extra else 0
-            non_student_cost = extra[2] if extra else 0
-            capacity = extra[3] if extra else None
-            end_at_ts = extra[4] if extra else None
-            cost_display = "رایگان"
-            if cost_type == "fixed":
-                cost_display = f"{fixed_cost:,} تومان"
-            elif cost_type == "variable":
-                cost_display = f"دانشجو: {student_cost:,} — غیر دانشجو: {non_student_cost:,} تومان"
-            status_text = "✅ فعال" if is_active else "❌ غیرفعال"
-            cap_txt = "بدون محدودیت" if (capacity is None or capacity == -1) else str(capacity)
-            deadline_txt = "—"
-            if end_at_ts:
-                try:
-                    import datetime
-                    deadline_txt = datetime.datetime.utcfromtimestamp(int(end_at_ts)).strftime("%Y-%m-%d %H:%M UTC")
-                except Exception:
-                    deadline_txt = str(end_at_ts)
-            preview = f"""
-📌 {title}
-{desc or '—'}
-
-وضعیت: {status_text}
-ظرفیت: {cap_txt}
-هزینه: {cost_display}
-کارت: {card or '—'}
-مهلت: {deadline_txt}
-""".strip()
-            try:
-                if poster_path and is_safe_upload_path(poster_path):
-                    await client.send_file(event.chat_id, poster_path, caption=preview)
-                else:
-                    await client.send_message(event.chat_id, preview)
-            except Exception:
-                pass
-            status_text = "✅ فعال" if is_active else "❌ غیرفعال"
-            try:
-                raw_main = get_setting('main_events', '')
-                selected_main = [int(x) for x in raw_main.split(',') if x.strip().isdigit()]
-            except Exception:
-                selected_main = []
-            main_label = "⭐ میانبر (فعال)" if event_id in selected_main else "⭐ افزودن به میانبرها"
-            try:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT reminders_enabled FROM events WHERE id = ?", (event_id,))
-                rrow = c.fetchone()
-                conn.close()
-                reminders_enabled = bool(rrow[0]) if rrow and rrow[0] else False
-            except Exception:
-                reminders_enabled = False
-            # read per-event single-registration flag
-            try:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT single_registration FROM events WHERE id = ?", (event_id,))
-                sr_row = c.fetchone()
-                conn.close()
-                single_registration = True if sr_row and sr_row[0] else False
-            except Exception:
-                single_registration = True
-
-            single_label = "🔒 یک ثبت‌نام/کاربر (رویداد): ✅" if single_registration else "🔓 یک ثبت‌نام/کاربر (رویداد): ❌"
-
-            buttons = [
-                [Button.inline(main_label, f"admin_toggle_main_edit_{event_id}")],
-                [Button.inline("✏️ ویرایش عنوان", f"edit_title_{event_id}"), Button.inline("📝 ویرایش توضیحات", f"edit_desc_{event_id}")],
-                [Button.inline("💰 ویرایش هزینه", f"edit_cost_{event_id}"), Button.inline("💳 ویرایش شماره کارت", f"edit_card_{event_id}")],
-                [Button.inline("🖼️ ویرایش پوستر", f"edit_poster_{event_id}"), Button.inline("🎯 تنظیم ظرفیت", f"admin_set_capacity_{event_id}")],
-                [Button.inline(f"🔄 وضعیت ({status_text})", f"admin_toggle_event_{event_id}"), Button.inline("⏱️ تنظیم مهلت (شمسی)", f"admin_set_deadline_{event_id}")],
-                [Button.inline("📑 تنظیم گزارش کار", f"admin_set_report_{event_id}"), Button.inline("🗂️ مدیریت گزارش‌ها", f"admin_manage_reports_{event_id}")],
-                [Button.inline("🗂 مدیریت ثبت‌نام‌ها", f"admin_manage_event_regs_{event_id}")],
-                [Button.inline(single_label, f"admin_toggle_single_reg_event_{event_id}")],
-                [Button.inline("🗑️ حذف کامل رویداد", f"admin_delete_event_{event_id}"), Button.inline("🗑️ حذف مهلت", f"admin_confirm_clear_deadline_{event_id}")],
-                [Button.inline("✅ تایید گروهی در انتظار", f"admin_bulk_approve_{event_id}"), Button.inline("🔔 یادآوری به تاییدشدگان", f"admin_remind_{event_id}")],
-                [Button.inline("✉️ پیام به تاییدشدگان", f"admin_message_approved_{event_id}"), Button.inline("✉️ پیام به ردشدگان", f"admin_message_rejected_{event_id}" )],
-                [Button.inline("🔙 بازگشت", b"admin_manage_events_0"), Button.inline("🏠 منو", b"main_menu")]
-            ]
-            await event.edit("لطفا بخش مورد نظر برای ویرایش را انتخاب کنید:", buttons=buttons)
-        elif data.startswith("admin_delete_event_"):
-            event_id = int(data.split("_")[-1])
-            buttons = [
-                [Button.inline("❌ لغو", b"main_menu"), Button.inline("🗑️ تأیید حذف", f"confirm_delete_event_{event_id}")]
-            ]
-            await event.edit("⚠️ آیا مطمئن هستید که می‌خواهید این رویداد و همه داده‌های مرتبط را حذف کنید؟ این عمل غیرقابل بازگشت است.", buttons=buttons)
-
-        elif data.startswith("confirm_delete_event_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT poster_file_id, report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            poster_path = row[0] if row else None
-            payloads = row[1] if row else None
-            try:
-                if poster_path and is_safe_upload_path(poster_path):
-                    os.remove(poster_path)
-            except Exception:
-                pass
-            if payloads:
-                try:
-                    import json as _json
-                    for p in _json.loads(payloads):
-                        if p.get("type") == "file":
-                            pth = p.get("path")
-                            if pth and is_safe_upload_path(pth):
-                                try:
-                                    os.remove(pth)
-                                except Exception:
-                                    pass
-                except Exception:
-                    pass
-            c.execute("DELETE FROM certificates WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM registrations WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM resources WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM attendance WHERE event_id = ?", (event_id,))
-            c.execute("DELETE FROM events WHERE id = ?", (event_id,))
-            conn.commit()
-            conn.close()
-            try:
-                await event.answer("🗑️ رویداد و همه داده‌های مرتبط حذف شد.", alert=True)
-            except:
-                pass
-            await event.edit("⚙️ رویدادهای ثبت شده:", buttons=[[Button.inline("🔙 بازگشت", b"admin_manage_events_0")],[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-        elif data.startswith("admin_confirm_clear_deadline_"):
-            event_id = int(data.split("_")[-1])
-            buttons = [[Button.inline("❌ لغو", b"main_menu"), Button.inline("🗑️ تأیید حذف مهلت", f"admin_clear_deadline_{event_id}")]]
-            await event.edit("⚠️ آیا مطمئن هستید که می‌خواهید مهلت این رویداد را پاک کنید؟ این عمل قابل برگشت نیست.", buttons=buttons)
-
-        elif data.startswith("admin_clear_deadline_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE events SET end_at_ts = NULL, end_set_by = NULL WHERE id = ?", (event_id,))
-            conn.commit()
-            conn.close()
-            try:
-                await event.answer("✅ مهلت رویداد پاک شد.", alert=True)
-            except:
-                pass
-            try:
-                await event.edit("مهلت حذف شد.", buttons=[[Button.inline("🔙 بازگشت", f"admin_edit_event_{event_id}")]])
-            except Exception:
-                pass
-        elif data.startswith("edit_poster_"):
-            event_id = int(data.split("_")[2])
-            await event.edit("🖼️ لطفاً پوستر جدید را ارسال کنید (عکس)", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_new_poster", {"event_id": event_id})
-        elif data.startswith("admin_set_deadline_"):
-            event_id = int(data.split("_")[-1])
-            await event.edit("⏱️ لطفا مهلت را به فرمت شمسی و به وقت رسمی ایران (مثال: 1403/07/01 18:30) ارسال کنید. ارقام فارسی پذیرفته می‌شوند.", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_deadline", {"event_id": event_id})
-
-        elif data.startswith("edit_title_"):
-            event_id = int(data.split("_")[2])
-            await event.edit("📌 لطفا عنوان جدید را ارسال کنید:", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "edit_event_title", {"event_id": event_id})
-
-        elif data.startswith("edit_desc_"):
-            event_id = int(data.split("_")[2])
-            await event.edit("📝 لطفا توضیحات جدید را ارسال کنید:", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "edit_event_desc", {"event_id": event_id})
-
-        elif data.startswith("edit_cost_"):
-            event_id = int(data.split("_")[2])
-            buttons = [
-                [Button.inline("رایگان", b"edit_cost_free")],
-                [Button.inline("هزینه ثابت", b"edit_cost_fixed")],
-                [Button.inline("هزینه متغیر", b"edit_cost_variable")],
-                [Button.inline("🔙 بازگشت", f"admin_edit_event_{event_id}")]
-            ]
-            await event.edit("💰 نوع هزینه جدید را انتخاب کنید:", buttons=buttons)
-            set_user_state(user_states, user_id, "edit_event_cost_type", {"event_id": event_id})
-
-        elif data.startswith("edit_card_"):
-            event_id = int(data.split("_")[2])
-            await event.edit("💳 لطفا شماره کارت جدید را ارسال کنید:", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "edit_event_card", {"event_id": event_id})
-
-        elif data.startswith("admin_toggle_event_"):
-            event_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE events SET is_active = 1 - is_active WHERE id = ?", (event_id,))
-            conn.commit()
-            conn.close()
-            try:
-                await event.answer("✅ وضعیت رویداد تغییر کرد.", alert=True)
-            except:
-                pass
-
-
-        elif data.startswith("admin_set_report_"):
-            event_id = int(data.split("_")[3])
-            await event.edit("لطفا پیام‌های گزارش کار را از کانال فوروارد کنید (یک یا چند پیام). پس از اتمام، /done را ارسال کنید.", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_reports", {"event_id": event_id, "message_ids": [], "payloads": []})
-
-        elif data.startswith("admin_manage_reports_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT report_message_ids, report_payloads, title FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            conn.close()
-            msg_ids = row[0] if row else None
-            payloads_json = row[1] if row else None
-            title = row[2] if row and len(row) > 2 else f"رویداد #{event_id}"
-            buttons = []
-            if msg_ids or payloads_json:
-                buttons.append([Button.inline("🧾 مشاهده آیتم‌های گزارش", f"admin_view_reports_{event_id}")])
-                buttons.append([Button.inline("🗑️ پاک کردن گزارش‌ها", f"admin_clear_reports_{event_id}")])
-            else:
-                buttons.append([Button.inline("🏠 منو", b"main_menu")])
-            summary = f"📌 مدیریت گزارش‌ها — {title}\n\n"
-            if msg_ids:
-                summary += f"🔢 آیدی پیام‌ها (نسخه پشتیبان): {msg_ids}\n"
-            if payloads_json:
-                try:
-                    pl = json.loads(payloads_json)
-                    summary += f"📦 تعداد آیتم‌ها: {len(pl)}\n"
-                except Exception:
-                    summary += "📦 آیتم‌ها: نامشخص\n"
-            if not msg_ids and not payloads_json:
-                summary += "📭 گزارشی تنظیم نشده است."
-            await event.edit(summary, buttons=buttons)
-
         elif data.startswith("admin_view_reports_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
             payloads_json = row[0] if row else None
             if not payloads_json:
                 await event.answer("📭 گزارشی برای این رویداد وجود ندارد.", alert=True)
@@ -2084,7 +802,7 @@ def setup_admin_handlers(client, user_states):
                         pass
                     try:
                         if path and is_safe_upload_path(path) and os.path.exists(path):
-                            await client.send_file(user_id, path, caption=f"📁 فایل گزارش #{idx+1}: {os.path.basename(path)}")
+                            await send_media(client, user_id, path, caption=f"📁 فایل گزارش #{idx+1}: {os.path.basename(path)}")
                     except Exception:
                         pass
                 elif ptype == 'text':
@@ -2097,36 +815,20 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_clear_reports_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            payloads_json = row[0] if row else None
-            if payloads_json:
-                try:
-                    pls = json.loads(payloads_json)
-                    for p in pls:
-                        if p.get('type') == 'file':
-                            pth = p.get('path')
-                            if pth and is_safe_upload_path(pth) and os.path.exists(pth):
-                                try:
-                                    os.remove(pth)
-                                except Exception:
-                                    pass
-                except Exception:
-                    pass
-            c.execute("UPDATE events SET report_message_ids = NULL, report_payloads = NULL WHERE id = ?", (event_id,))
-            conn.commit()
-            conn.close()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
+                row = c.fetchone()
+                payloads_json = row[0] if row else None
+                c.execute("UPDATE events SET report_message_ids = NULL, report_payloads = NULL WHERE id = ?", (event_id,))
+                return row, payloads_json
+            row, payloads_json = await db_write(_apply)
+            await discard_files(report_files(payloads_json))
             try:
                 await event.answer("🧹 گزارش‌ها پاک شد.", alert=True)
             except Exception:
                 pass
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT report_message_ids, report_payloads, title FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT report_message_ids, report_payloads, title FROM events WHERE id = ?", (event_id,))
             msg_ids = row[0] if row else None
             payloads_json = row[1] if row else None
             title = row[2] if row and len(row) > 2 else f"رویداد #{event_id}"
@@ -2149,156 +851,9 @@ def setup_admin_handlers(client, user_states):
                 summary += "📭 گزارشی تنظیم نشده است."
             await event.edit(summary, buttons=buttons)
 
-        elif data == "admin_pending_regs":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
-                SELECT r.id, u.full_name, u.student_id, u.is_student, r.payment_receipt_file_id, e.title
-                FROM registrations r
-                JOIN users u ON r.user_id = u.user_id
-                JOIN events e ON r.event_id = e.id
-                WHERE r.status = 'pending'
-            """)
-            regs = c.fetchall()
-            conn.close()
-            if not regs:
-                await event.edit("📭 هیچ ثبت‌نام در انتظاری وجود ندارد.", buttons=[[Button.inline("🏠 منو", b"main_menu")]])
-                return
-            buttons = []
-            for reg_id, name, std_id, is_std, receipt, event_title in regs:
-                student_type = "دانشجو" if is_std else "غیر دانشجو"
-                buttons.append([Button.inline(f"{name} — {event_title}", f"admin_view_reg_{reg_id}")])
-            buttons.append([Button.inline("🏠 بازگشت به منو", b"main_menu")])
-            await event.edit("⏳ ثبت‌نام‌های در انتظار:", buttons=buttons)
-
-        elif data.startswith("admin_set_capacity_"):
-            event_id = int(data.split("_")[-1])
-            await event.edit("🎯 لطفا ظرفیت رویداد را وارد کنید (عدد یا -1 برای بدون محدودیت):", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_capacity", {"event_id": event_id})
-
-        elif data.startswith("admin_bulk_approve_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE registrations SET status='approved' WHERE event_id = ? AND status='pending'", (event_id,))
-            updated = c.rowcount
-            c.execute("UPDATE users SET status='approved' WHERE user_id IN (SELECT user_id FROM registrations WHERE event_id = ?)", (event_id,))
-            conn.commit()
-            conn.close()
-            await event.answer(f"✅ {updated} ثبت‌نام تایید شد.", alert=True)
-
-        elif data.startswith("admin_remind_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
-                SELECT DISTINCT r.user_id
-                FROM registrations r
-                WHERE LOWER(TRIM(r.status)) = 'approved' AND r.event_id = ?
-            """, (event_id,))
-            recipients = [row[0] for row in c.fetchall()]
-            title_row = c.execute("SELECT title FROM events WHERE id = ?", (event_id,)).fetchone()
-            title = title_row[0] if title_row else "رویداد"
-            sample = []
-            if recipients:
-                placeholders = ','.join(['?'] * len(recipients))
-                try:
-                    q = f"SELECT user_id, full_name FROM users WHERE user_id IN ({placeholders}) LIMIT 6"
-                    rows = c.execute(q, tuple(recipients)).fetchall()
-                    sample = [f"{r[1] or 'کاربر'} ({r[0]})" for r in rows]
-                except Exception:
-                    sample = []
-            conn.close()
-            if not recipients:
-                await event.answer("📭 کاربری برای یادآوری وجود ندارد.", alert=True)
-                return
-            sample_text = '\n'.join(sample) if sample else '—'
-            body = f"⚠️ این پیام یادآوری برای رویداد '{title}' به {len(recipients)} کاربر ارسال خواهد شد.\n\nنمونه دریافت‌کنندگان:\n{sample_text}\n\nآیا ادامه می‌دهید؟"
-            buttons = [[Button.inline("❌ لغو", b"main_menu"), Button.inline("🟢 ارسال یادآوری به تاییدشدگان", f"admin_remind_confirm_{event_id}")]]
-            await event.edit(body, buttons=buttons)
-            return
-
-        elif data.startswith("admin_remind_confirm_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
-                SELECT DISTINCT r.user_id
-                FROM registrations r
-                WHERE LOWER(TRIM(r.status)) = 'approved' AND r.event_id = ?
-            """, (event_id,))
-            recipients = [row[0] for row in c.fetchall()]
-            title_row = c.execute("SELECT title FROM events WHERE id = ?", (event_id,)).fetchone()
-            title = title_row[0] if title_row else "رویداد"
-            conn.close()
-            if not recipients:
-                await event.answer("📭 کاربری برای یادآوری وجود ندارد.", alert=True)
-                return
-            msg = f"🔔 یادآوری: رویداد '{title}' نزدیک است. لطفاً اطلاعیه‌های کانال را دنبال کنید."
-            sent = 0
-            failed = 0
-            from telethon import Button as TButton
-            try:
-                aconn = sqlite3.connect(DB_NAME)
-                ac = aconn.cursor()
-                ac.execute('''CREATE TABLE IF NOT EXISTS admin_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    admin_id INTEGER NOT NULL,
-                    action TEXT NOT NULL,
-                    target_event INTEGER,
-                    created_at TEXT DEFAULT (datetime('now','localtime'))
-                )''')
-                ac.execute('INSERT INTO admin_actions (admin_id, action, target_event) VALUES (?, ?, ?)', (user_id, 'send_reminder_to_approved', event_id))
-                aconn.commit()
-                aconn.close()
-            except Exception:
-                pass
-
-            from utils import send_with_rate_limit
-            import asyncio
-            for uid in recipients:
-                try:
-                    btn = TButton.inline("مشاهده رویداد", f"event_{event_id}")
-                    res = await send_with_rate_limit(client, uid, text=msg, buttons=[btn], delay_between=0.18)
-                    if res:
-                        sent += 1
-                    else:
-                        failed += 1
-                        try:
-                            lconn = sqlite3.connect(DB_NAME)
-                            lc = lconn.cursor()
-                            lc.execute('''CREATE TABLE IF NOT EXISTS send_errors (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                event_id INTEGER,
-                                user_id INTEGER,
-                                error TEXT,
-                                created_at TEXT DEFAULT (datetime('now','localtime'))
-                            )''')
-                            lc.execute('INSERT INTO send_errors (event_id, user_id, error) VALUES (?, ?, ?)', (event_id, uid, 'send_failed'))
-                            lconn.commit()
-                            lconn.close()
-                        except Exception:
-                            pass
-                except Exception:
-                    failed += 1
-                await asyncio.sleep(0.12)
-            await event.answer(f"🔔 یادآوری برای {sent} نفر ارسال شد. ({failed} خطا)", alert=True)
-
-        elif data.startswith("admin_message_approved_"):
-            event_id = int(data.split("_")[-1])
-            await event.edit("لطفا پیام، عکس یا ویدیوی خود را ارسال کنید (در انتهای پیام #پین برای پین کردن اضافه کنید):", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_broadcast_content", {"target": "approved_event", "event_id": event_id})
-
-        elif data.startswith("admin_message_rejected_"):
-            event_id = int(data.split("_")[-1])
-            await event.edit("لطفا پیام، عکس یا ویدیوی خود را ارسال کنید (در انتهای پیام #پین برای پین کردن اضافه کنید):", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_broadcast_content", {"target": "rejected_event", "event_id": event_id})
-
         elif data.startswith("admin_view_reg_"):
             reg_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
+            result = await fetch_one("""
                 SELECT r.user_id, u.full_name, u.national_id, u.phone, u.is_student, u.student_id,
                        r.payment_receipt_file_id, e.title, e.cost_type, e.fixed_cost, e.student_cost, e.non_student_cost
                 FROM registrations r
@@ -2306,8 +861,6 @@ def setup_admin_handlers(client, user_states):
                 JOIN events e ON r.event_id = e.id
                 WHERE r.id = ?
             """, (reg_id,))
-            result = c.fetchone()
-            conn.close()
             if not result:
                 await event.answer("❌ ثبت‌نام یافت نشد!", alert=True)
                 return
@@ -2329,27 +882,27 @@ def setup_admin_handlers(client, user_states):
             buttons = [
                 [Button.inline("✅ تایید", f"admin_approve_reg_{reg_id}")],
                 [Button.inline("❌ رد", f"admin_reject_reg_{reg_id}")],
-                [Button.inline("🔙 بازگشت", b"admin_pending_regs")],
+                [Button.inline("🔙 بازگشت", cb("pending_regs"))],
                 [Button.inline("🏠 منو", b"main_menu")]
             ]
             if receipt and os.path.exists(receipt) and receipt.startswith("uploads" + os.sep):
                 try:
-                    await client.send_file(event.chat_id, receipt, caption="💳 رسید پرداخت:")
+                    await send_media(client, event.chat_id, receipt, caption="💳 رسید پرداخت:")
                 except:
                     msg += "\n\n⚠️ رسید: [ارسال نشد — خطای فایل]"
             await event.edit(msg, buttons=buttons)
 
         elif data.startswith("admin_approve_reg_"):
             reg_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE registrations SET status = 'approved' WHERE id = ?", (reg_id,))
-            c.execute("SELECT user_id FROM registrations WHERE id = ?", (reg_id,))
-            user_id = c.fetchone()[0]
-            c.execute("INSERT OR IGNORE INTO users (user_id, status) VALUES (?, 'approved')", (user_id,))
-            c.execute("UPDATE users SET status = 'approved' WHERE user_id = ?", (user_id,))
-            conn.commit()
-            conn.close()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("UPDATE registrations SET status = 'approved' WHERE id = ?", (reg_id,))
+                c.execute("SELECT user_id FROM registrations WHERE id = ?", (reg_id,))
+                user_id = c.fetchone()[0]
+                c.execute("INSERT OR IGNORE INTO users (user_id, status) VALUES (?, 'approved')", (user_id,))
+                c.execute("UPDATE users SET status = 'approved' WHERE user_id = ?", (user_id,))
+                return user_id
+            user_id = await db_write(_apply)
             try:
                 await client.send_message(user_id, "✅ ثبت‌نام شما تایید شد! می‌توانید از بخش 'گواهی‌های من' پس از برگزاری رویداد، گواهی خود را دریافت کنید.")
             except:
@@ -2368,11 +921,7 @@ def setup_admin_handlers(client, user_states):
             if user_id != OWNER_ID:
                 await event.answer("❌ فقط ادمین اصلی می‌تواند مدیریت کند!", alert=True)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT a.user_id, u.full_name FROM admins a LEFT JOIN users u ON a.user_id = u.user_id")
-            admins = c.fetchall()
-            conn.close()
+            admins = await fetch_all("SELECT a.user_id, u.full_name FROM admins a LEFT JOIN users u ON a.user_id = u.user_id")
             buttons = [[Button.inline(f"➕ افزودن ادمین جدید", b"admin_add_admin")]]
             for admin_id, name in admins:
                 if admin_id == OWNER_ID:
@@ -2386,11 +935,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data == "admin_membership_requests":
             # show pending membership requests (first page)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, full_name, status FROM memberships ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
+            rows = await fetch_all("SELECT id, full_name, status FROM memberships ORDER BY id DESC")
             if not rows:
                 # No membership requests right now — still offer the Excel export button
                 buttons = []
@@ -2410,11 +955,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("view_membership_"):
             mid = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, full_name, major, entry_year, student_number, national_id, phone, telegram_username, student_card_file, status FROM memberships WHERE id = ?", (mid,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT user_id, full_name, major, entry_year, student_number, national_id, phone, telegram_username, student_card_file, status FROM memberships WHERE id = ?", (mid,))
             if not row:
                 await event.answer("❌ درخواست یافت نشد!", alert=True)
                 return
@@ -2426,7 +967,7 @@ def setup_admin_handlers(client, user_states):
             ]
             try:
                 if card_file and is_safe_upload_path(card_file) and os.path.exists(card_file):
-                    await client.send_file(event.chat_id, card_file, caption=msg, buttons=buttons)
+                    await send_media(client, event.chat_id, card_file, caption=msg, buttons=buttons)
                 else:
                     await event.edit(msg, buttons=buttons)
             except Exception:
@@ -2434,20 +975,22 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("approve_membership_"):
             mid = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id FROM memberships WHERE id = ?", (mid,))
-            row = c.fetchone()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT user_id FROM memberships WHERE id = ?", (mid,))
+                row = c.fetchone()
+                if not row:
+                    return None
+                uid = row[0]
+                c.execute("UPDATE memberships SET status = 'approved' WHERE id = ?", (mid,))
+                c.execute("INSERT OR IGNORE INTO users (user_id, status) VALUES (?, 'approved')", (uid,))
+                c.execute("UPDATE users SET status = 'approved' WHERE user_id = ?", (uid,))
+                return row
+            row = await db_write(_apply)
             if not row:
-                conn.close()
                 await event.answer("❌ درخواست یافت نشد!", alert=True)
                 return
             uid = row[0]
-            c.execute("UPDATE memberships SET status = 'approved' WHERE id = ?", (mid,))
-            c.execute("INSERT OR IGNORE INTO users (user_id, status) VALUES (?, 'approved')", (uid,))
-            c.execute("UPDATE users SET status = 'approved' WHERE user_id = ?", (uid,))
-            conn.commit()
-            conn.close()
             try:
                 await client.send_message(uid, "✅ درخواست عضویت شما تایید شد!")
             except Exception:
@@ -2457,19 +1000,21 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("reject_membership_"):
             mid = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id FROM memberships WHERE id = ?", (mid,))
-            row = c.fetchone()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT user_id FROM memberships WHERE id = ?", (mid,))
+                row = c.fetchone()
+                if not row:
+                    return None
+                uid = row[0]
+                c.execute("UPDATE memberships SET status = 'rejected' WHERE id = ?", (mid,))
+                c.execute("UPDATE users SET status = 'rejected' WHERE user_id = ?", (uid,))
+                return row
+            row = await db_write(_apply)
             if not row:
-                conn.close()
                 await event.answer("❌ درخواست یافت نشد!", alert=True)
                 return
             uid = row[0]
-            c.execute("UPDATE memberships SET status = 'rejected' WHERE id = ?", (mid,))
-            c.execute("UPDATE users SET status = 'rejected' WHERE user_id = ?", (uid,))
-            conn.commit()
-            conn.close()
             try:
                 await client.send_message(uid, "❌ متأسفانه درخواست عضویت شما رد شد.")
             except Exception:
@@ -2492,11 +1037,8 @@ def setup_admin_handlers(client, user_states):
             if target_id == OWNER_ID:
                 await event.answer("❌ نمی‌توان ادمین اصلی را حذف کرد!", alert=True)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("DELETE FROM admins WHERE user_id = ?", (target_id,))
-            conn.commit()
-            conn.close()
+            await execute("DELETE FROM admins WHERE user_id = ?", (target_id,))
+            await db_read(reload_admins)
             await event.answer("✅ ادمین حذف شد.", alert=True)
 
         elif data == "admin_broadcast":
@@ -2513,11 +1055,7 @@ def setup_admin_handlers(client, user_states):
         elif data.startswith("broadcast_"):
             target = data.split("_")[1]
             if target == "approved":
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT id, title FROM events ORDER BY id DESC")
-                events_list = c.fetchall()
-                conn.close()
+                events_list = await fetch_all("SELECT id, title FROM events ORDER BY id DESC")
                 if not events_list:
                     await event.edit("📭 هیچ رویدادی موجود نیست.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                     return
@@ -2536,11 +1074,7 @@ def setup_admin_handlers(client, user_states):
             set_user_state(user_states, user_id, "admin_waiting_broadcast_content", {"target": "approved_event", "event_id": event_id})
 
         elif data == "admin_faq":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, question FROM faqs")
-            faqs = c.fetchall()
-            conn.close()
+            faqs = await fetch_all("SELECT id, question FROM faqs")
             buttons = [[Button.inline("➕ افزودن سوال جدید", b"admin_add_faq")]]
             for faq_id, question in faqs:
                 buttons.append([Button.inline(f"✏️ {question[:30]}...", f"admin_edit_faq_{faq_id}")])
@@ -2554,11 +1088,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_edit_faq_"):
             faq_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT question, answer FROM faqs WHERE id = ?", (faq_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT question, answer FROM faqs WHERE id = ?", (faq_id,))
             if not row:
                 await event.answer("❌ سوال یافت نشد!", alert=True)
                 return
@@ -2569,20 +1099,12 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_del_faq_"):
             faq_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("DELETE FROM faqs WHERE id = ?", (faq_id,))
-            conn.commit()
-            conn.close()
+            await execute("DELETE FROM faqs WHERE id = ?", (faq_id,))
             await event.answer("✅ سوال حذف شد.", alert=True)
             await admin_callback_handler(event)
 
         elif data == "admin_export_excel":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events WHERE is_active = 1 ORDER BY id DESC")
-            events_list = c.fetchall()
-            conn.close()
+            events_list = await fetch_all("SELECT id, title FROM events WHERE is_active = 1 ORDER BY id DESC")
             if not events_list:
                 await event.edit("📭 هیچ رویداد فعالی موجود نیست.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 return
@@ -2594,232 +1116,23 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("export_excel_event_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT title FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            event_title = row[0] if row else "event"
-            df = None
-            if pd is not None:
-                df = pd.read_sql_query("""
-                SELECT 
-                    TRIM(u.full_name) AS 'نام و نام خانوادگی',
-                    TRIM(u.national_id) AS 'کد ملی',
-                    TRIM(u.phone) AS 'شماره تماس'
-                FROM registrations r
-                JOIN users u ON u.user_id = r.user_id
-                WHERE r.status = 'approved' AND r.event_id = ?
-                GROUP BY u.full_name, u.national_id, u.phone
-                ORDER BY u.full_name COLLATE NOCASE ASC
-                """, conn, params=(event_id,))
-            else:
-                c2 = conn.cursor()
-                c2.execute("""
-                    SELECT TRIM(u.full_name), TRIM(u.national_id), TRIM(u.phone)
-                    FROM registrations r
-                    JOIN users u ON u.user_id = r.user_id
-                    WHERE r.status = 'approved' AND r.event_id = ?
-                    GROUP BY u.full_name, u.national_id, u.phone
-                    ORDER BY u.full_name COLLATE NOCASE ASC
-                """, (event_id,))
-                rows = c2.fetchall()
-            conn.close()
-            if pd is not None:
-                if df.empty:
-                    df = pd.DataFrame(columns=['نام و نام خانوادگی', 'کد ملی', 'شماره تماس'])
-            output = BytesIO()
-            wrote = False
-            if pd is not None:
-                try:
-                    df.to_excel(output, index=False, engine='openpyxl')
-                    wrote = True
-                except Exception:
-                    pass
-                if not wrote:
-                    try:
-                        df.to_excel(output, index=False, engine='xlsxwriter')
-                        wrote = True
-                    except Exception:
-                        pass
-            if not wrote:
-                # Pure-Python fallback using openpyxl or xlsxwriter
-                headers = ['نام و نام خانوادگی', 'کد ملی', 'شماره تماس']
-                try:
-                    from openpyxl import Workbook
-                    wb = Workbook()
-                    ws = wb.active
-                    ws.title = "approved"
-                    ws.append(headers)
-                    if pd is not None:
-                        for _, row in df.iterrows():
-                            ws.append([row.get('نام و نام خانوادگی', ''), row.get('کد ملی', ''), row.get('شماره تماس', '')])
-                    else:
-                        for r in rows:
-                            ws.append([r[0] or '', r[1] or '', r[2] or ''])
-                    wb.save(output)
-                    wrote = True
-                except Exception:
-                    pass
-            if not wrote:
-                try:
-                    try:
-                        import xlsxwriter as _xlsxwriter  # type: ignore[reportMissingImports]
-                    except Exception:
-                        _xlsxwriter = None
-                    if not _xlsxwriter:
-                        raise ImportError('xlsxwriter not available')
-                    workbook = _xlsxwriter.Workbook(output)
-                    worksheet = workbook.add_worksheet('approved')
-                    headers = ['نام و نام خانوادگی', 'کد ملی', 'شماره تماس']
-                    for col, header in enumerate(headers):
-                        worksheet.write(0, col, header)
-                    if pd is not None:
-                        for r, (_, row) in enumerate(df.iterrows(), start=1):
-                            worksheet.write(r, 0, row.get('نام و نام خانوادگی', ''))
-                            worksheet.write(r, 1, row.get('کد ملی', ''))
-                            worksheet.write(r, 2, row.get('شماره تماس', ''))
-                    else:
-                        for r, row in enumerate(rows, start=1):
-                            worksheet.write(r, 0, row[0] or '')
-                            worksheet.write(r, 1, row[1] or '')
-                            worksheet.write(r, 2, row[2] or '')
-                    workbook.close()
-                    wrote = True
-                except Exception as e4:
-                    try:
-                        await event.answer(f"❌ خطا در تهیه فایل اکسل (xlsx): {str(e4)}", alert=True)
-                    except Exception:
-                        pass
-                    return
-                    wrote = True
-                except Exception as e4:
-                    await event.answer(f"❌ خطا در تهیه فایل اکسل (xlsx): {str(e4)}", alert=True)
-                    return
-            output.seek(0)
-            try:
-                from openpyxl import load_workbook
-                from openpyxl.utils import get_column_letter
-                wb = load_workbook(filename=output)
-                for ws in wb.worksheets:
-                    try:
-                        ws.sheet_view.rightToLeft = True
-                    except Exception:
-                        pass
-                    try:
-                        cols = list(ws.columns)
-                        for i, col in enumerate(cols, start=1):
-                            max_len = 0
-                            for cell in col:
-                                try:
-                                    val = cell.value
-                                    if val is None:
-                                        continue
-                                    s = str(val)
-                                except Exception:
-                                    s = ''
-                                if len(s) > max_len:
-                                    max_len = len(s)
-                            width = min(50, max(10, int(max_len * 1.2)))
-                            col_letter = get_column_letter(i)
-                            try:
-                                ws.column_dimensions[col_letter].width = width
-                            except Exception:
-                                pass
-                    except Exception:
-                        pass
-                new_buf = BytesIO()
-                wb.save(new_buf)
-                new_buf.seek(0)
-                output = new_buf
-            except Exception:
-                # If post-processing fails, continue with original buffer
-                output.seek(0)
-            try:
-                unsafe = ['\\', '/', ':', '*', '?', '"', '<', '>', '|']
-                safe_title = event_title
-                for ch in unsafe:
-                    safe_title = safe_title.replace(ch, ' ')
-                safe_title = safe_title.strip()
-                file_name = f"approved_{safe_title}.xlsx" if safe_title else "approved_event_users.xlsx"
-                try:
-                    output.name = file_name
-                except Exception:
-                    pass
-                await client.send_file(event.chat_id, output, caption="📊 لیست تاییدشدگان رویداد", force_document=True)
-                await event.answer("✅ فایل اکسل ارسال شد.", alert=True)
+            title_row = await fetch_one("SELECT title FROM events WHERE id = ?", (event_id,))
+            unsafe = ['\\', '/', ':', '*', '?', '"', '<', '>', '|']
+            safe_title = title_row[0] if title_row else "event"
+            for ch in unsafe:
+                safe_title = safe_title.replace(ch, ' ')
+            safe_title = safe_title.strip()
+            file_name = f"approved_{safe_title}" if safe_title else None
+            try:
+                kind = await send_export(client, event.chat_id, 'event_approved', 'xlsx', (event_id,),
+                                         file_name=file_name, caption="📊 لیست تاییدشدگان رویداد")
+                await event.answer(f"✅ {KIND_LABELS[kind]} ارسال شد.", alert=True)
             except Exception as e:
-                await event.answer(f"❌ خطایی در ارسال فایل اکسل رخ داد: {str(e)}", alert=True)
-
-        elif data == "admin_send_cert":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events WHERE is_active = 0")
-            events_list = c.fetchall()
-            conn.close()
-            if not events_list:
-                await event.edit("📭 هیچ رویداد آرشیو شده‌ای برای ارسال گواهی وجود ندارد.", buttons=[[Button.inline("🏠 منو", b"main_menu")]])
-                return
-            buttons = paginate_buttons(events_list, "cert_event", 0, 5)
-            await event.edit("📜 لطفا رویداد را انتخاب کنید:", buttons=buttons)
-
-        elif data.startswith("cert_event_"):
-            parts = data.split("_")
-            if parts[2] == "page":
-                page = int(parts[3])
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT id, title FROM events WHERE is_active = 0")
-                events_list = c.fetchall()
-                conn.close()
-                buttons = paginate_buttons(events_list, "cert_event", page, 5)
-                await event.edit("📜 لطفا رویداد را انتخاب کنید:", buttons=buttons)
-                return
-            event_id = int(parts[2])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
-                SELECT u.user_id, u.full_name
-                FROM registrations r
-                JOIN users u ON r.user_id = u.user_id
-                WHERE r.event_id = ? AND r.status = 'approved'
-            """, (event_id,))
-            users = c.fetchall()
-            conn.close()
-            if not users:
-                await event.edit("📭 هیچ کاربر تایید شده‌ای برای این رویداد وجود ندارد.", buttons=[[Button.inline("🔙 بازگشت", b"admin_send_cert")], [Button.inline("🏠 منو", b"main_menu")]])
-                return
-            buttons = []
-            for uid, name in users:
-                buttons.append([Button.inline(f"📄 {name}", f"send_cert_to_{uid}_{event_id}")])
-            buttons.append([Button.inline("🔙 بازگشت", b"admin_send_cert")])
-            buttons.append([Button.inline("🏠 منو", b"main_menu")])
-            await event.edit("👤 لطفا کاربر را برای ارسال گواهی انتخاب کنید:", buttons=buttons)
-
-        elif data.startswith("admin_manage_event_regs_"):
-            event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT r.id, r.user_id, COALESCE(u.full_name, '') as full_name, r.status FROM registrations r LEFT JOIN users u ON r.user_id = u.user_id WHERE r.event_id = ? ORDER BY r.id DESC", (event_id,))
-            regs = c.fetchall()
-            conn.close()
-            if not regs:
-                await event.edit("📭 هیچ ثبت‌نامی برای این رویداد وجود ندارد.", buttons=[[Button.inline("🔙 بازگشت", f"admin_edit_event_{event_id}")],[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-                return
-            buttons = []
-            for reg_id, uid, full_name, status in regs:
-                label = f"#{reg_id} — {full_name or uid} — {status}"
-                buttons.append([Button.inline(label, f"admin_view_reg_{reg_id}")])
-            buttons.append([Button.inline("🔙 بازگشت", f"admin_edit_event_{event_id}")])
-            buttons.append([Button.inline("🏠 منوی اصلی", b"main_menu")])
-            await event.edit(f"📋 ثبت‌نام‌های رویداد #{event_id}:", buttons=buttons)
+                await event.answer(f"❌ خطا در تهیه فایل اکسل: {str(e)}", alert=True)
 
         elif data.startswith("admin_view_reg_"):
             reg_id = int(data.split("_")[3])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT r.user_id, r.event_id, u.full_name, u.national_id, u.phone, u.is_student, u.student_id, r.payment_receipt_file_id, e.title, r.status FROM registrations r JOIN users u ON r.user_id = u.user_id JOIN events e ON r.event_id = e.id WHERE r.id = ?", (reg_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT r.user_id, r.event_id, u.full_name, u.national_id, u.phone, u.is_student, u.student_id, r.payment_receipt_file_id, e.title, r.status FROM registrations r JOIN users u ON r.user_id = u.user_id JOIN events e ON r.event_id = e.id WHERE r.id = ?", (reg_id,))
             if not row:
                 await event.answer("❌ ثبت‌نام یافت نشد!", alert=True)
                 return
@@ -2829,29 +1142,31 @@ def setup_admin_handlers(client, user_states):
             buttons = [
                 [Button.inline("✅ تایید", f"admin_approve_reg_{reg_id}"), Button.inline("❌ رد", f"admin_reject_reg_{reg_id}")],
                 [Button.inline("🗑️ حذف ثبت‌نام", f"admin_delete_reg_{reg_id}" )],
-                [Button.inline("🔙 بازگشت", f"admin_manage_event_regs_{event_id}"), Button.inline("🏠 منو", b"main_menu")]
+                [Button.inline("🔙 بازگشت", cb("manage_event_regs", event_id)), Button.inline("🏠 منو", b"main_menu")]
             ]
             if receipt and os.path.exists(receipt) and receipt.startswith("uploads" + os.sep):
                 try:
-                    await client.send_file(event.chat_id, receipt, caption="💳 رسید پرداخت:")
+                    await send_media(client, event.chat_id, receipt, caption="💳 رسید پرداخت:")
                 except Exception:
                     msg += "\n\n⚠️ رسید: [ارسال نشد — خطای فایل]"
             await event.edit(msg, buttons=buttons)
 
         elif data.startswith("admin_delete_reg_"):
             reg_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, event_id FROM registrations WHERE id = ?", (reg_id,))
-            row = c.fetchone()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT user_id, event_id FROM registrations WHERE id = ?", (reg_id,))
+                row = c.fetchone()
+                if not row:
+                    return None
+                user_id_target, event_id = row
+                c.execute("DELETE FROM registrations WHERE id = ?", (reg_id,))
+                return row
+            row = await db_write(_apply)
             if not row:
-                conn.close()
                 await event.answer("❌ ثبت‌نام یافت نشد!", alert=True)
                 return
             user_id_target, event_id = row
-            c.execute("DELETE FROM registrations WHERE id = ?", (reg_id,))
-            conn.commit()
-            conn.close()
             try:
                 await client.send_message(user_id_target, f"✅ ثبت‌نام شما برای رویداد #{event_id} حذف شد. اکنون می‌توانید دوباره ثبت‌نام کنید.")
             except Exception:
@@ -2865,18 +1180,20 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_approve_reg_"):
             reg_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, event_id FROM registrations WHERE id = ?", (reg_id,))
-            row = c.fetchone()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT user_id, event_id FROM registrations WHERE id = ?", (reg_id,))
+                row = c.fetchone()
+                if not row:
+                    return None
+                user_id_target, event_id = row
+                c.execute("UPDATE registrations SET status = 'approved' WHERE id = ?", (reg_id,))
+                return row
+            row = await db_write(_apply)
             if not row:
-                conn.close()
                 await event.answer("❌ ثبت‌نام یافت نشد!", alert=True)
                 return
             user_id_target, event_id = row
-            c.execute("UPDATE registrations SET status = 'approved' WHERE id = ?", (reg_id,))
-            conn.commit()
-            conn.close()
             try:
                 await client.send_message(user_id_target, f"✅ ثبت‌نام شما برای رویداد #{event_id} تایید شد. تبریک!")
             except Exception:
@@ -2889,18 +1206,20 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_reject_reg_"):
             reg_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, event_id FROM registrations WHERE id = ?", (reg_id,))
-            row = c.fetchone()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT user_id, event_id FROM registrations WHERE id = ?", (reg_id,))
+                row = c.fetchone()
+                if not row:
+                    return None
+                user_id_target, event_id = row
+                c.execute("UPDATE registrations SET status = 'rejected' WHERE id = ?", (reg_id,))
+                return row
+            row = await db_write(_apply)
             if not row:
-                conn.close()
                 await event.answer("❌ ثبت‌نام یافت نشد!", alert=True)
                 return
             user_id_target, event_id = row
-            c.execute("UPDATE registrations SET status = 'rejected' WHERE id = ?", (reg_id,))
-            conn.commit()
-            conn.close()
             try:
                 await client.send_message(user_id_target, f"❌ ثبت‌نام شما برای رویداد #{event_id} رد شد. در صورت تمایل می‌توانید دوباره ثبت‌نام کنید.")
             except Exception:
@@ -2911,21 +1230,15 @@ def setup_admin_handlers(client, user_states):
             except Exception:
                 pass
 
-        elif data.startswith("send_cert_to_"):
-            parts = data.split("_")
-            target_user_id = int(parts[3])
-            event_id = int(parts[4])
-            await event.edit("لطفا فایل PDF گواهی را ارسال کنید:", buttons=CANCEL_BUTTON)
-            set_user_state(user_states, user_id, "admin_waiting_cert_file", {"target_user_id": target_user_id, "event_id": event_id})
-
         # ---- New admin handlers: ideas / collaborations / donations ----
         elif data == "admin_ideas":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            # show only pending ideas so processed ones disappear from the list
-            c.execute("SELECT id, user_id, title, status, created_at FROM ideas WHERE LOWER(TRIM(status)) = 'pending' ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
+            def _load(conn):
+                c = conn.cursor()
+                # show only pending ideas so processed ones disappear from the list
+                c.execute("SELECT id, user_id, title, status, created_at FROM ideas WHERE status = 'pending' ORDER BY id DESC")
+                rows = c.fetchall()
+                return rows
+            rows = await db_read(_load)
             buttons = []
             if not rows:
                 # No ideas yet — show a friendly message but still offer the export button
@@ -2943,11 +1256,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_view_idea_"):
             iid = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, title, description, file_path, status, created_at, admin_note, processed_by, processed_at FROM ideas WHERE id = ?", (iid,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT user_id, title, description, file_path, status, created_at, admin_note, processed_by, processed_at FROM ideas WHERE id = ?", (iid,))
             if not row:
                 await event.answer("❌ ایده یافت نشد!", alert=True)
                 return
@@ -2964,7 +1273,7 @@ def setup_admin_handlers(client, user_states):
             ]
             try:
                 if fpath and is_safe_upload_path(fpath) and os.path.exists(fpath):
-                    await client.send_file(event.chat_id, fpath, caption=msg, buttons=buttons)
+                    await send_media(client, event.chat_id, fpath, caption=msg, buttons=buttons)
                 else:
                     await event.edit(msg, buttons=buttons)
             except Exception:
@@ -2978,12 +1287,13 @@ def setup_admin_handlers(client, user_states):
             await event.edit("🔎 لطفا توضیحی که می‌خواهید برای کاربر ارسال شود را بنویسید (این پیام تنها یک‌بار ارسال می‌شود):", buttons=CANCEL_BUTTON)
 
         elif data == "admin_collaborations":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            # show only pending collaboration requests
-            c.execute("SELECT id, user_id, full_name, organization, status, created_at FROM collaborations WHERE LOWER(TRIM(status)) = 'pending' ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
+            def _load(conn):
+                c = conn.cursor()
+                # show only pending collaboration requests
+                c.execute("SELECT id, user_id, full_name, organization, status, created_at FROM collaborations WHERE status = 'pending' ORDER BY id DESC")
+                rows = c.fetchall()
+                return rows
+            rows = await db_read(_load)
             buttons = []
             if not rows:
                 # No collaborations yet — still allow export (will produce header-only file)
@@ -3000,11 +1310,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_view_collab_"):
             cid = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, full_name, organization, proposal, file_path, status, created_at, admin_note, processed_by, processed_at FROM collaborations WHERE id = ?", (cid,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT user_id, full_name, organization, proposal, file_path, status, created_at, admin_note, processed_by, processed_at FROM collaborations WHERE id = ?", (cid,))
             if not row:
                 await event.answer("❌ درخواست یافت نشد!", alert=True)
                 return
@@ -3020,7 +1326,7 @@ def setup_admin_handlers(client, user_states):
             ]
             try:
                 if fpath and is_safe_upload_path(fpath) and os.path.exists(fpath):
-                    await client.send_file(event.chat_id, fpath, caption=msg, buttons=buttons)
+                    await send_media(client, event.chat_id, fpath, caption=msg, buttons=buttons)
                 else:
                     await event.edit(msg, buttons=buttons)
             except Exception:
@@ -3033,12 +1339,13 @@ def setup_admin_handlers(client, user_states):
             await event.edit("🔎 لطفا توضیحی که می‌خواهید برای کاربر ارسال شود را بنویسید (این پیام تنها یک‌بار ارسال می‌شود):", buttons=CANCEL_BUTTON)
 
         elif data == "admin_donations":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            # show only pending donations for review
-            c.execute("SELECT id, user_id, amount, currency, status, created_at FROM donations WHERE LOWER(TRIM(status)) = 'pending' ORDER BY id DESC")
-            rows = c.fetchall()
-            conn.close()
+            def _load(conn):
+                c = conn.cursor()
+                # show only pending donations for review
+                c.execute("SELECT id, user_id, amount, currency, status, created_at FROM donations WHERE status = 'pending' ORDER BY id DESC")
+                rows = c.fetchall()
+                return rows
+            rows = await db_read(_load)
             buttons = []
             if not rows:
                 # No donations yet — keep export available
@@ -3054,11 +1361,7 @@ def setup_admin_handlers(client, user_states):
 
         elif data.startswith("admin_view_donation_"):
             did = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id, amount, currency, receipt_file, status, created_at, admin_note, processed_by, processed_at FROM donations WHERE id = ?", (did,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT user_id, amount, currency, receipt_file, status, created_at, admin_note, processed_by, processed_at FROM donations WHERE id = ?", (did,))
             if not row:
                 await event.answer("❌ مورد یافت نشد!", alert=True)
                 return
@@ -3074,7 +1377,7 @@ def setup_admin_handlers(client, user_states):
             ]
             try:
                 if receipt and is_safe_upload_path(receipt) and os.path.exists(receipt):
-                    await client.send_file(event.chat_id, receipt, caption=msg, buttons=buttons)
+                    await send_media(client, event.chat_id, receipt, caption=msg, buttons=buttons)
                 else:
                     await event.edit(msg, buttons=buttons)
             except Exception:
@@ -3087,11 +1390,7 @@ def setup_admin_handlers(client, user_states):
             await event.edit("🔎 لطفا توضیحی که می‌خواهید برای کاربر ارسال شود را بنویسید (این پیام تنها یک‌بار ارسال می‌شود):", buttons=CANCEL_BUTTON)
 
         elif data == "admin_tickets":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, message, created_at FROM tickets WHERE status = 'open'")
-            tickets = c.fetchall()
-            conn.close()
+            tickets = await fetch_all("SELECT id, user_id, message, created_at FROM tickets WHERE status = 'open'")
             buttons = []
             if not tickets:
                 # No open tickets — still provide export buttons
@@ -3112,7 +1411,545 @@ def setup_admin_handlers(client, user_states):
             await event.edit("لطفا پاسخ خود را ارسال کنید:", buttons=CANCEL_BUTTON)
             set_user_state(user_states, user_id, "admin_waiting_ticket_reply", {"ticket_id": ticket_id})
 
-    @client.on(events.NewMessage)
+    # ---- Event management, paged lists and certificates: binary callbacks, one handler per opcode ----
+    @admin_op("manage_events", legacy=("admin_manage_events_",))
+    async def manage_events_handler(event, cursor):
+        events_page = await fetch_page("SELECT id, title, is_active FROM events", cursor=cursor)
+        if not events_page.rows:
+            await event.edit("📭 هیچ رویدادی وجود ندارد.", buttons=[[Button.inline("➕ ثبت جدید", b"admin_new_event_step1")], [Button.inline("🏠 منو", b"main_menu")]])
+            return
+        def _event_button(row):
+            eid, title, is_active = row
+            status = "✅ فعال" if is_active else "❌ غیرفعال"
+            return Button.inline(f"{title} — {status}", cb("edit_event", eid))
+        buttons = paginate_buttons(events_page, "admin_manage_events", render=_event_button,
+                                   nav=lambda c: cb("manage_events", c))
+        await event.edit("⚙️ رویدادهای ثبت شده:", buttons=buttons)
+
+    @admin_op("edit_event", legacy=("admin_edit_event_",))
+    async def edit_event_handler(event, event_id):
+        result = await fetch_one("SELECT title, description, cost_type, card_number, is_active, poster_file_id FROM events WHERE id = ?", (event_id,))
+        if not result:
+            await event.answer("❌ رویداد یافت نشد!", alert=True)
+            return
+        title, desc, cost_type, card, is_active, poster_path = result
+        extra = await fetch_one("SELECT fixed_cost, student_cost, non_student_cost, capacity, end_at_ts FROM events WHERE id = ?", (event_id,))
+        fixed_cost = extra[0] if extra else 0
+        student_cost = extra[1] if extra else 0
+        non_student_cost = extra[2] if extra else 0
+        capacity = extra[3] if extra else None
+        end_at_ts = extra[4] if extra else None
+        cost_display = "رایگان"
+        if cost_type == "fixed":
+            cost_display = f"{fixed_cost:,} تومان"
+        elif cost_type == "variable":
+            cost_display = f"دانشجو: {student_cost:,} — غیر دانشجو: {non_student_cost:,} تومان"
+        status_text = "✅ فعال" if is_active else "❌ غیرفعال"
+        cap_txt = "بدون محدودیت" if (capacity is None or capacity == -1) else str(capacity)
+        deadline_txt = "—"
+        if end_at_ts:
+            try:
+                import datetime
+                deadline_txt = datetime.datetime.utcfromtimestamp(int(end_at_ts)).strftime("%Y-%m-%d %H:%M UTC")
+            except Exception:
+                deadline_txt = str(end_at_ts)
+        preview = f"""
+📌 {title}
+{desc or '—'}
+
+وضعیت: {status_text}
+ظرفیت: {cap_txt}
+هزینه: {cost_display}
+کارت: {card or '—'}
+مهلت: {deadline_txt}
+""".strip()
+        try:
+            if poster_path and is_safe_upload_path(poster_path):
+                await send_media(client, event.chat_id, poster_path, caption=preview)
+            else:
+                await client.send_message(event.chat_id, preview)
+        except Exception:
+            pass
+        status_text = "✅ فعال" if is_active else "❌ غیرفعال"
+        try:
+            raw_main = get_setting('main_events', '')
+            selected_main = [int(x) for x in raw_main.split(',') if x.strip().isdigit()]
+        except Exception:
+            selected_main = []
+        main_label = "⭐ میانبر (فعال)" if event_id in selected_main else "⭐ افزودن به میانبرها"
+        try:
+            rrow = await fetch_one("SELECT reminders_enabled FROM events WHERE id = ?", (event_id,))
+            reminders_enabled = bool(rrow[0]) if rrow and rrow[0] else False
+        except Exception:
+            reminders_enabled = False
+        # read per-event single-registration flag
+        try:
+            sr_row = await fetch_one("SELECT single_registration FROM events WHERE id = ?", (event_id,))
+            single_registration = True if sr_row and sr_row[0] else False
+        except Exception:
+            single_registration = True
+
+        single_label = "🔒 یک ثبت‌نام/کاربر (رویداد): ✅" if single_registration else "🔓 یک ثبت‌نام/کاربر (رویداد): ❌"
+
+        buttons = [
+            [Button.inline(main_label, cb("toggle_main_edit", event_id))],
+            [Button.inline("✏️ ویرایش عنوان", cb("edit_title", event_id)), Button.inline("📝 ویرایش توضیحات", cb("edit_desc", event_id))],
+            [Button.inline("💰 ویرایش هزینه", cb("edit_cost", event_id)), Button.inline("💳 ویرایش شماره کارت", cb("edit_card", event_id))],
+            [Button.inline("🖼️ ویرایش پوستر", cb("edit_poster", event_id)), Button.inline("🎯 تنظیم ظرفیت", cb("set_capacity", event_id))],
+            [Button.inline(f"🔄 وضعیت ({status_text})", cb("toggle_event", event_id)), Button.inline("⏱️ تنظیم مهلت (شمسی)", cb("set_deadline", event_id))],
+            [Button.inline("📑 تنظیم گزارش کار", cb("set_report", event_id)), Button.inline("🗂️ مدیریت گزارش‌ها", cb("manage_reports", event_id))],
+            [Button.inline("🗂 مدیریت ثبت‌نام‌ها", cb("manage_event_regs", event_id))],
+            [Button.inline(single_label, cb("toggle_single_reg_event", event_id))],
+            [Button.inline("🔔 یادآوری خودکار: ✅" if reminders_enabled else "🔕 یادآوری خودکار: ❌", cb("toggle_reminders", event_id))],
+            [Button.inline("🗑️ حذف کامل رویداد", cb("delete_event", event_id)), Button.inline("🗑️ حذف مهلت", cb("confirm_clear_deadline", event_id))],
+            [Button.inline("✅ تایید گروهی در انتظار", cb("bulk_approve", event_id)), Button.inline("🔔 یادآوری به تاییدشدگان", cb("remind", event_id))],
+            [Button.inline("✉️ پیام به تاییدشدگان", cb("message_approved", event_id)), Button.inline("✉️ پیام به ردشدگان", cb("message_rejected", event_id))],
+            [Button.inline("🔙 بازگشت", cb("manage_events")), Button.inline("🏠 منو", b"main_menu")]
+        ]
+        await event.edit("لطفا بخش مورد نظر برای ویرایش را انتخاب کنید:", buttons=buttons)
+
+    @admin_op("toggle_main_edit", legacy=("admin_toggle_main_edit_",))
+    async def toggle_main_edit_handler(event, eid):
+        raw = get_setting('main_events', '')
+        selected = [int(x) for x in raw.split(',') if x.strip().isdigit()]
+        if eid in selected:
+            selected.remove(eid)
+        else:
+            if len(selected) >= 3:
+                await event.answer("❌ حداکثر 3 میانبر مجاز است.", alert=True)
+                return
+            selected.append(eid)
+        await set_setting('main_events', ','.join(map(str, selected)))
+        await edit_event_handler(event, eid)
+
+    @admin_op("edit_title", legacy=("edit_title_",))
+    async def edit_title_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("📌 لطفا عنوان جدید را ارسال کنید:", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "edit_event_title", {"event_id": event_id})
+
+    @admin_op("edit_desc", legacy=("edit_desc_",))
+    async def edit_desc_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("📝 لطفا توضیحات جدید را ارسال کنید:", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "edit_event_desc", {"event_id": event_id})
+
+    @admin_op("edit_cost", legacy=("edit_cost_",))
+    async def edit_cost_handler(event, event_id):
+        user_id = event.sender_id
+        buttons = [
+            [Button.inline("رایگان", b"edit_cost_free")],
+            [Button.inline("هزینه ثابت", b"edit_cost_fixed")],
+            [Button.inline("هزینه متغیر", b"edit_cost_variable")],
+            [Button.inline("🔙 بازگشت", cb("edit_event", event_id))]
+        ]
+        await event.edit("💰 نوع هزینه جدید را انتخاب کنید:", buttons=buttons)
+        set_user_state(user_states, user_id, "edit_event_cost_type", {"event_id": event_id})
+
+    @admin_op("edit_card", legacy=("edit_card_",))
+    async def edit_card_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("💳 لطفا شماره کارت جدید را ارسال کنید:", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "edit_event_card", {"event_id": event_id})
+
+    @admin_op("edit_poster", legacy=("edit_poster_",))
+    async def edit_poster_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("🖼️ لطفاً پوستر جدید را ارسال کنید (عکس)", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_new_poster", {"event_id": event_id})
+
+    @admin_op("set_capacity", legacy=("admin_set_capacity_",))
+    async def set_capacity_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("🎯 لطفا ظرفیت رویداد را وارد کنید (عدد یا -1 برای بدون محدودیت):", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_capacity", {"event_id": event_id})
+
+    @admin_op("toggle_event", legacy=("admin_toggle_event_",))
+    async def toggle_event_handler(event, event_id):
+        await execute("UPDATE events SET is_active = 1 - is_active WHERE id = ?", (event_id,))
+        row = await fetch_one("SELECT is_active, end_at_ts FROM events WHERE id = ?", (event_id,))
+        # a reactivated event with a passed deadline goes straight back to the archive, as before
+        schedule_event_deadline(event_id, row[1] if row and row[0] else None)
+        try:
+            await event.answer("✅ وضعیت رویداد تغییر کرد.", alert=True)
+        except:
+            pass
+
+    @admin_op("set_deadline", legacy=("admin_set_deadline_",))
+    async def set_deadline_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("⏱️ لطفا مهلت را به فرمت شمسی و به وقت رسمی ایران (مثال: 1403/07/01 18:30) ارسال کنید. ارقام فارسی پذیرفته می‌شوند.", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_deadline", {"event_id": event_id})
+
+    @admin_op("confirm_clear_deadline", legacy=("admin_confirm_clear_deadline_",))
+    async def confirm_clear_deadline_handler(event, event_id):
+        buttons = [[Button.inline("❌ لغو", b"main_menu"), Button.inline("🗑️ تأیید حذف مهلت", cb("clear_deadline", event_id))]]
+        await event.edit("⚠️ آیا مطمئن هستید که می‌خواهید مهلت این رویداد را پاک کنید؟ این عمل قابل برگشت نیست.", buttons=buttons)
+
+    @admin_op("clear_deadline", legacy=("admin_clear_deadline_",))
+    async def clear_deadline_handler(event, event_id):
+        await execute("UPDATE events SET end_at_ts = NULL, end_set_by = NULL WHERE id = ?", (event_id,))
+        schedule_event_deadline(event_id, None)
+        try:
+            await event.answer("✅ مهلت رویداد پاک شد.", alert=True)
+        except:
+            pass
+        try:
+            await event.edit("مهلت حذف شد.", buttons=[[Button.inline("🔙 بازگشت", cb("edit_event", event_id))]])
+        except Exception:
+            pass
+
+    @admin_op("set_report", legacy=("admin_set_report_",))
+    async def set_report_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("لطفا پیام‌های گزارش کار را از کانال فوروارد کنید (یک یا چند پیام). پس از اتمام، /done را ارسال کنید.", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_reports", {"event_id": event_id, "message_ids": [], "payloads": []})
+
+    @admin_op("manage_reports", legacy=("admin_manage_reports_",))
+    async def manage_reports_handler(event, event_id):
+        row = await fetch_one("SELECT report_message_ids, report_payloads, title FROM events WHERE id = ?", (event_id,))
+        msg_ids = row[0] if row else None
+        payloads_json = row[1] if row else None
+        title = row[2] if row and len(row) > 2 else f"رویداد #{event_id}"
+        buttons = []
+        if msg_ids or payloads_json:
+            buttons.append([Button.inline("🧾 مشاهده آیتم‌های گزارش", f"admin_view_reports_{event_id}")])
+            buttons.append([Button.inline("🗑️ پاک کردن گزارش‌ها", f"admin_clear_reports_{event_id}")])
+        else:
+            buttons.append([Button.inline("🏠 منو", b"main_menu")])
+        summary = f"📌 مدیریت گزارش‌ها — {title}\n\n"
+        if msg_ids:
+            summary += f"🔢 آیدی پیام‌ها (نسخه پشتیبان): {msg_ids}\n"
+        if payloads_json:
+            try:
+                pl = json.loads(payloads_json)
+                summary += f"📦 تعداد آیتم‌ها: {len(pl)}\n"
+            except Exception:
+                summary += "📦 آیتم‌ها: نامشخص\n"
+        if not msg_ids and not payloads_json:
+            summary += "📭 گزارشی تنظیم نشده است."
+        await event.edit(summary, buttons=buttons)
+
+    @admin_op("manage_event_regs", legacy=("admin_manage_event_regs_",))
+    async def manage_event_regs_handler(event, event_id, cursor=None):
+        regs = await fetch_page(
+            "SELECT r.id, r.user_id, COALESCE(u.full_name, '') as full_name, r.status FROM registrations r LEFT JOIN users u ON r.user_id = u.user_id",
+            "r.event_id = ?", (event_id,), cursor=cursor, per_page=10, key="r.id")
+        if not regs.rows:
+            await event.edit("📭 هیچ ثبت‌نامی برای این رویداد وجود ندارد.", buttons=[[Button.inline("🔙 بازگشت", cb("edit_event", event_id))],[Button.inline("🏠 منوی اصلی", b"main_menu")]])
+            return
+        buttons = paginate_buttons(
+            regs, "admin_manage_event_regs",
+            render=lambda row: Button.inline(f"#{row[0]} — {row[2] or row[1]} — {row[3]}", f"admin_view_reg_{row[0]}"),
+            nav=lambda c: cb("manage_event_regs", event_id, c),
+            footer=[[Button.inline("🔙 بازگشت", cb("edit_event", event_id))], [Button.inline("🏠 منوی اصلی", b"main_menu")]],
+        )
+        await event.edit(f"📋 ثبت‌نام‌های رویداد #{event_id}:", buttons=buttons)
+
+    @admin_op("toggle_single_reg_event", legacy=("admin_toggle_single_reg_event_",))
+    async def toggle_single_reg_event_handler(event, event_id):
+        def _apply(conn):
+            c = conn.cursor()
+            c.execute("SELECT single_registration FROM events WHERE id = ?", (event_id,))
+            row = c.fetchone()
+            current = 1 if row and row[0] else 0
+            new = 0 if current == 1 else 1
+            c.execute("UPDATE events SET single_registration = ? WHERE id = ?", (new, event_id))
+        await db_write(_apply)
+        await event.answer("🔄 تنظیمات بروزرسانی شد.", alert=True)
+        try:
+            # refresh the edit view for the event
+            await edit_event_handler(event, event_id)
+        except Exception:
+            pass
+
+    @admin_op("toggle_reminders", legacy=("admin_toggle_reminders_",))
+    async def toggle_reminders_handler(event, event_id):
+        def _apply(conn):
+            c = conn.cursor()
+            c.execute("UPDATE events SET reminders_enabled = 1 - COALESCE(reminders_enabled, 0) WHERE id = ?", (event_id,))
+            row = c.execute("SELECT reminders_enabled, end_at_ts FROM events WHERE id = ?", (event_id,)).fetchone()
+            return row
+        row = await db_write(_apply)
+        if not row:
+            await event.answer("❌ رویداد یافت نشد!", alert=True)
+            return
+        refresh_event_reminders(event_id)
+        if row[0]:
+            note = "🔔 یادآوری خودکار روشن شد." if row[1] else "🔔 یادآوری خودکار روشن شد؛ برای ارسال، مهلت رویداد را تنظیم کنید."
+        else:
+            note = "🔕 یادآوری خودکار خاموش شد."
+        await event.answer(note, alert=True)
+
+    @admin_op("delete_event", legacy=("admin_delete_event_",))
+    async def delete_event_handler(event, event_id):
+        buttons = [
+            [Button.inline("❌ لغو", b"main_menu"), Button.inline("🗑️ تأیید حذف", cb("confirm_delete_event", event_id))]
+        ]
+        await event.edit("⚠️ آیا مطمئن هستید که می‌خواهید این رویداد و همه داده‌های مرتبط را حذف کنید؟ این عمل غیرقابل بازگشت است.", buttons=buttons)
+
+    @admin_op("confirm_delete_event", legacy=("confirm_delete_event_",))
+    async def confirm_delete_event_handler(event, event_id):
+        def _apply(conn):
+            c = conn.cursor()
+            # poster, receipt and certificate files are released by the blobs triggers;
+            # report files are removed after the transaction, off the writer thread
+            c.execute("SELECT report_payloads FROM events WHERE id = ?", (event_id,))
+            row = c.fetchone()
+            report_paths = report_files(row[0] if row else None)
+            released = _event_upload_paths(c, event_id)
+            c.execute("DELETE FROM certificates WHERE event_id = ?", (event_id,))
+            c.execute("DELETE FROM registrations WHERE event_id = ?", (event_id,))
+            c.execute("DELETE FROM resources WHERE event_id = ?", (event_id,))
+            c.execute("DELETE FROM attendance WHERE event_id = ?", (event_id,))
+            c.execute("DELETE FROM reminders_sent WHERE event_id = ?", (event_id,))
+            c.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            expire_now(conn, released)
+            return report_paths
+        await discard_files(await db_write(_apply))
+        await collect_all()
+        try:
+            await event.answer("🗑️ رویداد و همه داده‌های مرتبط حذف شد.", alert=True)
+        except:
+            pass
+        await event.edit("⚙️ رویدادهای ثبت شده:", buttons=[[Button.inline("🔙 بازگشت", cb("manage_events"))],[Button.inline("🏠 منوی اصلی", b"main_menu")]])
+
+    @admin_op("bulk_approve", legacy=("admin_bulk_approve_",))
+    async def bulk_approve_handler(event, event_id):
+        def _apply(conn):
+            c = conn.cursor()
+            c.execute("UPDATE registrations SET status='approved' WHERE event_id = ? AND status='pending'", (event_id,))
+            updated = c.rowcount
+            c.execute("UPDATE users SET status='approved' WHERE user_id IN (SELECT user_id FROM registrations WHERE event_id = ?)", (event_id,))
+            return updated
+        updated = await db_write(_apply)
+        await event.answer(f"✅ {updated} ثبت‌نام تایید شد.", alert=True)
+
+    @admin_op("remind", legacy=("admin_remind_",))
+    async def remind_handler(event, event_id):
+        def _load(conn):
+            c = conn.cursor()
+            c.execute("""
+                SELECT DISTINCT r.user_id
+                FROM registrations r
+                WHERE r.status = 'approved' AND r.event_id = ?
+            """, (event_id,))
+            recipients = [row[0] for row in c.fetchall()]
+            title_row = c.execute("SELECT title FROM events WHERE id = ?", (event_id,)).fetchone()
+            title = title_row[0] if title_row else "رویداد"
+            sample = []
+            if recipients:
+                placeholders = ','.join(['?'] * len(recipients))
+                try:
+                    q = f"SELECT user_id, full_name FROM users WHERE user_id IN ({placeholders}) LIMIT 6"
+                    rows = c.execute(q, tuple(recipients)).fetchall()
+                    sample = [f"{r[1] or 'کاربر'} ({r[0]})" for r in rows]
+                except Exception:
+                    sample = []
+            return recipients, title, sample
+        recipients, title, sample = await db_read(_load)
+        if not recipients:
+            await event.answer("📭 کاربری برای یادآوری وجود ندارد.", alert=True)
+            return
+        sample_text = '\n'.join(sample) if sample else '—'
+        body = f"⚠️ این پیام یادآوری برای رویداد '{title}' به {len(recipients)} کاربر ارسال خواهد شد.\n\nنمونه دریافت‌کنندگان:\n{sample_text}\n\nآیا ادامه می‌دهید؟"
+        buttons = [[Button.inline("❌ لغو", b"main_menu"), Button.inline("🟢 ارسال یادآوری به تاییدشدگان", cb("remind_confirm", event_id))]]
+        await event.edit(body, buttons=buttons)
+
+    @admin_op("remind_confirm", legacy=("admin_remind_confirm_",))
+    async def remind_confirm_handler(event, event_id):
+        user_id = event.sender_id
+        def _load(conn):
+            c = conn.cursor()
+            c.execute("""
+                SELECT DISTINCT r.user_id
+                FROM registrations r
+                WHERE r.status = 'approved' AND r.event_id = ?
+            """, (event_id,))
+            recipients = [row[0] for row in c.fetchall()]
+            title_row = c.execute("SELECT title FROM events WHERE id = ?", (event_id,)).fetchone()
+            title = title_row[0] if title_row else "رویداد"
+            return recipients, title
+        recipients, title = await db_read(_load)
+        if not recipients:
+            await event.answer("📭 کاربری برای یادآوری وجود ندارد.", alert=True)
+            return
+        msg = f"🔔 یادآوری: رویداد '{title}' نزدیک است. لطفاً اطلاعیه‌های کانال را دنبال کنید."
+        sent = 0
+        failed = 0
+        from telethon import Button as TButton
+        try:
+            def _log_action(aconn):
+                ac = aconn.cursor()
+                ac.execute('''CREATE TABLE IF NOT EXISTS admin_actions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    admin_id INTEGER NOT NULL,
+                    action TEXT NOT NULL,
+                    target_event INTEGER,
+                    created_at TEXT DEFAULT (datetime('now','localtime'))
+                )''')
+                ac.execute('INSERT INTO admin_actions (admin_id, action, target_event) VALUES (?, ?, ?)', (user_id, 'send_reminder_to_approved', event_id))
+            await db_write(_log_action)
+        except Exception:
+            pass
+
+        from utils import send_with_rate_limit
+        import asyncio
+        for uid in recipients:
+            try:
+                btn = TButton.inline("مشاهده رویداد", f"event_{event_id}")
+                res = await send_with_rate_limit(client, uid, text=msg, buttons=[btn], delay_between=0.18)
+                if res:
+                    sent += 1
+                else:
+                    failed += 1
+                    try:
+                        def _log_send_error(lconn):
+                            lc = lconn.cursor()
+                            lc.execute('''CREATE TABLE IF NOT EXISTS send_errors (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                event_id INTEGER,
+                                user_id INTEGER,
+                                error TEXT,
+                                created_at TEXT DEFAULT (datetime('now','localtime'))
+                            )''')
+                            lc.execute('INSERT INTO send_errors (event_id, user_id, error) VALUES (?, ?, ?)', (event_id, uid, 'send_failed'))
+                        await db_write(_log_send_error)
+                    except Exception:
+                        pass
+            except Exception:
+                failed += 1
+            await asyncio.sleep(0.12)
+        await event.answer(f"🔔 یادآوری برای {sent} نفر ارسال شد. ({failed} خطا)", alert=True)
+
+    @admin_op("message_approved", legacy=("admin_message_approved_",))
+    async def message_approved_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("لطفا پیام، عکس یا ویدیوی خود را ارسال کنید (در انتهای پیام #پین برای پین کردن اضافه کنید):", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_broadcast_content", {"target": "approved_event", "event_id": event_id})
+
+    @admin_op("message_rejected", legacy=("admin_message_rejected_",))
+    async def message_rejected_handler(event, event_id):
+        user_id = event.sender_id
+        await event.edit("لطفا پیام، عکس یا ویدیوی خود را ارسال کنید (در انتهای پیام #پین برای پین کردن اضافه کنید):", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_broadcast_content", {"target": "rejected_event", "event_id": event_id})
+
+    @admin_op("capacity", legacy=("admin_capacity", "admin_capacity_page_"))
+    async def capacity_handler(event, cursor=None):
+        events_page = await fetch_page("SELECT id, title, COALESCE(capacity, -1) FROM events", cursor=cursor, per_page=10)
+        if not events_page.rows:
+            await event.edit("📭 هیچ رویدادی وجود ندارد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
+            return
+        def _capacity_button(row):
+            eid, title, cap = row
+            cap_txt = "بدون محدودیت" if cap is None or cap == -1 else str(cap)
+            return Button.inline(f"{title} — ظرفیت: {cap_txt}", cb("set_capacity", eid))
+        buttons = paginate_buttons(events_page, "admin_capacity", render=_capacity_button, nav=lambda c: cb("capacity", c),
+                                   footer=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
+        await event.edit("🎯 انتخاب رویداد برای تنظیم ظرفیت:", buttons=buttons)
+
+    @admin_op("stats", legacy=("admin_stats", "admin_stats_page_"))
+    async def stats_handler(event, cursor=None):
+        events_page = await fetch_page("SELECT id, title FROM events", cursor=cursor, per_page=10)
+        buttons = paginate_buttons(events_page, "admin_stats", nav=lambda c: cb("stats", c),
+                                   render=lambda row: Button.inline(f"📊 {row[1]}", cb("stats_event", row[0])))
+        await event.edit("📈 آمار بر اساس رویداد:", buttons=buttons)
+
+    @admin_op("stats_event", legacy=("stats_event_",))
+    async def stats_event_handler(event, event_id):
+        def _load(conn):
+            c = conn.cursor()
+            c.execute("""
+                SELECT 
+                    SUM(CASE WHEN r.status='approved' THEN 1 ELSE 0 END) AS approved_cnt,
+                    SUM(CASE WHEN r.status='rejected' THEN 1 ELSE 0 END) AS rejected_cnt,
+                    SUM(CASE WHEN r.status='pending' THEN 1 ELSE 0 END) AS pending_cnt
+                FROM registrations r
+                WHERE r.event_id = ?
+            """, (event_id,))
+            row = c.fetchone()
+            approved_cnt, rejected_cnt, pending_cnt = row if row else (0, 0, 0)
+            c.execute("SELECT title FROM events WHERE id = ?", (event_id,))
+            title_row = c.fetchone()
+            return approved_cnt, rejected_cnt, pending_cnt, title_row
+        approved_cnt, rejected_cnt, pending_cnt, title_row = await db_read(_load)
+        title = title_row[0] if title_row else str(event_id)
+        msg = f"""
+📊 آمار رویداد: {title}
+
+✅ تایید شده: {approved_cnt or 0}
+❌ رد شده: {rejected_cnt or 0}
+⏳ در انتظار: {pending_cnt or 0}
+        """.strip()
+        await event.edit(msg, buttons=[
+            [Button.inline("🔙 بازگشت", cb("stats"))],
+            [Button.inline("🏠 منوی اصلی", b"main_menu")]
+        ])
+
+    @admin_op("pending_regs", legacy=("admin_pending_regs", "admin_pending_regs_page_"))
+    async def pending_regs_handler(event, cursor=None):
+        regs = await fetch_page("""
+            SELECT r.id, u.full_name, e.title
+            FROM registrations r
+            JOIN users u ON r.user_id = u.user_id
+            JOIN events e ON r.event_id = e.id
+        """, "r.status = 'pending'", cursor=cursor, per_page=10, key="r.id")
+        if not regs.rows:
+            await event.edit("📭 هیچ ثبت‌نام در انتظاری وجود ندارد.", buttons=[[Button.inline("🏠 منو", b"main_menu")]])
+            return
+        buttons = paginate_buttons(regs, "admin_pending_regs", nav=lambda c: cb("pending_regs", c),
+                                   render=lambda row: Button.inline(f"{row[1]} — {row[2]}", f"admin_view_reg_{row[0]}"))
+        await event.edit("⏳ ثبت‌نام‌های در انتظار:", buttons=buttons)
+
+    @admin_op("cert_events", legacy=("admin_send_cert", "cert_event_page_"))
+    async def cert_events_handler(event, cursor=None):
+        events_page = await fetch_page("SELECT id, title FROM events", "is_active = 0", cursor=cursor)
+        if not events_page.rows:
+            await event.edit("📭 هیچ رویداد آرشیو شده‌ای برای ارسال گواهی وجود ندارد.", buttons=[[Button.inline("🏠 منو", b"main_menu")]])
+            return
+        buttons = paginate_buttons(events_page, "cert_event", nav=lambda c: cb("cert_events", c),
+                                   render=lambda row: Button.inline(f"• {row[1]}", cb("cert_event_users", row[0])))
+        await event.edit("📜 لطفا رویداد را انتخاب کنید:", buttons=buttons)
+
+    @admin_op("cert_event_users", legacy=("cert_event_",))
+    async def cert_event_users_handler(event, event_id, cursor=None):
+        # pages through the approved users
+        users = await fetch_page("""
+            SELECT r.id, u.user_id, u.full_name
+            FROM registrations r
+            JOIN users u ON r.user_id = u.user_id
+        """, "r.event_id = ? AND r.status = 'approved'", (event_id,),
+            cursor=cursor, per_page=10, key="r.id")
+        if not users.rows:
+            await event.edit("📭 هیچ کاربر تایید شده‌ای برای این رویداد وجود ندارد.", buttons=[[Button.inline("🔙 بازگشت", cb("cert_events"))], [Button.inline("🏠 منو", b"main_menu")]])
+            return
+        buttons = paginate_buttons(
+            users, "cert_event",
+            render=lambda row: Button.inline(f"📄 {row[2]}", cb("send_cert_to", row[1], event_id)),
+            nav=lambda c: cb("cert_event_users", event_id, c),
+            footer=[[Button.inline("🔙 بازگشت", cb("cert_events"))], [Button.inline("🏠 منو", b"main_menu")]],
+        )
+        await event.edit("👤 لطفا کاربر را برای ارسال گواهی انتخاب کنید:", buttons=buttons)
+
+    @admin_op("send_cert_to", legacy=("send_cert_to_",))
+    async def send_cert_to_handler(event, target_user_id, event_id):
+        user_id = event.sender_id
+        await event.edit("لطفا فایل PDF گواهی را ارسال کنید:", buttons=CANCEL_BUTTON)
+        set_user_state(user_states, user_id, "admin_waiting_cert_file", {"target_user_id": target_user_id, "event_id": event_id})
+
+    @router.message(
+        "admin_explain_action", "admin_new_event_card", "admin_new_event_cert_card",
+        "admin_new_event_cert_card_holder", "admin_new_event_cert_fee",
+        "admin_new_event_cert_fee_non_student", "admin_new_event_cert_fee_student",
+        "admin_new_event_cost_amount", "admin_new_event_desc", "admin_new_event_non_student_cost",
+        "admin_new_event_poster", "admin_new_event_title", "admin_waiting_broadcast_content",
+        "admin_waiting_cert_file", "admin_waiting_deadline", "admin_waiting_donation_card",
+        "admin_waiting_donation_desc", "admin_waiting_donation_holder", "admin_waiting_faq_answer",
+        "admin_waiting_faq_edit_answer", "admin_waiting_faq_edit_question",
+        "admin_waiting_faq_question", "admin_waiting_new_poster", "admin_waiting_reject_reason",
+        "admin_waiting_reports", "admin_waiting_resource", "admin_waiting_ticket_reply",
+        "admin_waiting_user_id_to_add", "edit_event_card", "edit_event_desc", "edit_event_title",
+    )
     async def admin_registration_flow_handler(event):
         user_id = event.sender_id
         state = get_user_state(user_states, user_id)
@@ -3248,11 +2085,6 @@ def setup_admin_handlers(client, user_states):
                 await event.reply("❌ حجم تصویر پوستر نباید بیش از 5MB باشد.", buttons=CANCEL_BUTTON)
                 return
             data = get_user_data(user_states, user_id)
-            file_ext = "jpg"
-            unique_name = f"poster_{user_id}_{int(time.time())}_{random.randint(1000,9999)}.{file_ext}"
-            temp_path = os.path.join("uploads", unique_name)
-            await event.message.download_media(file=temp_path)
-            data["poster_path"] = temp_path
             title = data["title"]
             desc = data["description"]
             cost_type = data["cost_type"]
@@ -3288,14 +2120,29 @@ def setup_admin_handlers(client, user_states):
                 [Button.inline("✏️ ویرایش", b"admin_edit_event")],
                 [Button.inline("❌ لغو", b"cancel")]
             ]
-            await client.send_file(
-                event.chat_id,
-                file=temp_path,
-                caption=msg,
-                buttons=buttons,
-                parse_mode="markdown"
-            )
-            set_user_state(user_states, user_id, "admin_preview_event", data)
+
+            # the preview goes out once the poster is on disk
+            async def poster_saved(path):
+                if get_user_state(user_states, user_id) != "admin_new_event_poster":
+                    # cancelled, or another poster was sent meanwhile; the unreferenced file is collected later
+                    return
+                set_user_state(user_states, user_id, "admin_preview_event", {"poster_path": path})
+                await send_media(
+                    client,
+                    event.chat_id,
+                    path,
+                    caption=msg,
+                    buttons=buttons,
+                    parse_mode="markdown"
+                )
+
+            async def poster_failed(error):
+                await event.reply("❌ دریافت پوستر ناموفق بود. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
+
+            if not submit_download(event.message, "jpg", poster_saved, poster_failed, max_bytes=5 * 1024 * 1024):
+                await event.reply("⏳ سرور مشغول است؛ لطفا چند لحظه دیگر پوستر را دوباره ارسال کنید.", buttons=CANCEL_BUTTON)
+                return
+            await event.reply("📥 پوستر دریافت شد؛ پیش‌نمایش رویداد تا لحظاتی دیگر ارسال می‌شود...")
         elif state == "admin_waiting_new_poster":
             if not event.message.photo:
                 await event.reply("❌ لطفا یک عکس ارسال کنید:", buttons=CANCEL_BUTTON)
@@ -3307,39 +2154,35 @@ def setup_admin_handlers(client, user_states):
                 return
             data = get_user_data(user_states, user_id)
             event_id = data["event_id"]
-            file_ext = "jpg"
-            unique_name = f"poster_{user_id}_{int(time.time())}_{random.randint(1000,9999)}.{file_ext}"
-            temp_path = os.path.join("uploads", unique_name)
-            await event.message.download_media(file=temp_path)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT poster_file_id FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            old_path = row[0] if row else None
-            try:
-                if old_path and is_safe_upload_path(old_path):
-                    os.remove(old_path)
-            except Exception:
-                pass
-            c.execute("UPDATE events SET poster_file_id = ? WHERE id = ?", (temp_path, event_id))
-            conn.commit()
-            conn.close()
+
+            async def poster_saved(path):
+                # the old poster's file is released by the blobs trigger and collected later
+                await execute("UPDATE events SET poster_file_id = ? WHERE id = ?", (path, event_id))
+                await event.reply("✅ پوستر رویداد به‌روزرسانی شد.", buttons=get_admin_main_menu())
+
+            async def poster_failed(error):
+                set_user_state(user_states, user_id, "admin_waiting_new_poster", {"event_id": event_id})
+                await event.reply("❌ دریافت پوستر ناموفق بود. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
+
+            if not submit_download(event.message, "jpg", poster_saved, poster_failed, max_bytes=5 * 1024 * 1024):
+                await event.reply("⏳ سرور مشغول است؛ لطفا چند لحظه دیگر پوستر را دوباره ارسال کنید.", buttons=CANCEL_BUTTON)
+                return
             clear_user_state(user_states, user_id)
-            await event.reply("✅ پوستر رویداد به‌روزرسانی شد.", buttons=get_admin_main_menu())
+            await event.reply("📥 پوستر دریافت شد و پس از ذخیره جایگزین پوستر فعلی می‌شود...")
 
         elif state == "admin_waiting_reject_reason":
             reason = event.message.text.strip()
             data = get_user_data(user_states, user_id)
             reg_id = data["reg_id"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE registrations SET status = 'rejected' WHERE id = ?", (reg_id,))
-            c.execute("SELECT user_id FROM registrations WHERE id = ?", (reg_id,))
-            user_id_target = c.fetchone()[0]
-            c.execute("UPDATE users SET reason_if_rejected = ? WHERE user_id = ?", (reason, user_id_target))
-            c.execute("UPDATE users SET status = 'rejected' WHERE user_id = ?", (user_id_target,))
-            conn.commit()
-            conn.close()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("UPDATE registrations SET status = 'rejected' WHERE id = ?", (reg_id,))
+                c.execute("SELECT user_id FROM registrations WHERE id = ?", (reg_id,))
+                user_id_target = c.fetchone()[0]
+                c.execute("UPDATE users SET reason_if_rejected = ? WHERE user_id = ?", (reason, user_id_target))
+                c.execute("UPDATE users SET status = 'rejected' WHERE user_id = ?", (user_id_target,))
+                return user_id_target
+            user_id_target = await db_write(_apply)
             await client.send_message(user_id_target, f"❌ ثبت‌نام شما رد شد.\nدلیل: {reason}")
             clear_user_state(user_states, user_id)
             await event.reply("✅ ثبت‌نام رد شد و دلیل برای کاربر ارسال شد.", buttons=get_admin_main_menu())
@@ -3347,11 +2190,8 @@ def setup_admin_handlers(client, user_states):
         elif state == "admin_waiting_user_id_to_add":
             try:
                 target_id = int(event.message.text.strip())
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("INSERT OR IGNORE INTO admins (user_id, added_by) VALUES (?, ?)", (target_id, user_id))
-                conn.commit()
-                conn.close()
+                await execute("INSERT OR IGNORE INTO admins (user_id, added_by) VALUES (?, ?)", (target_id, user_id))
+                await db_read(reload_admins)
                 clear_user_state(user_states, user_id)
                 await event.reply("✅ کاربر به عنوان ادمین اضافه شد.", buttons=get_admin_main_menu())
             except ValueError:
@@ -3360,39 +2200,40 @@ def setup_admin_handlers(client, user_states):
         elif state == "admin_waiting_broadcast_content":
             data = get_user_data(user_states, user_id)
             target = data["target"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            if target == "all":
-                c.execute("SELECT user_id FROM users")
-            elif target == "approved":
-                c.execute("""
-                    SELECT DISTINCT r.user_id
-                    FROM registrations r
-                    WHERE r.status = 'approved'
-                """)
-            elif target == "rejected":
-                c.execute("""
-                    SELECT DISTINCT u.user_id
-                    FROM users u
-                    JOIN registrations r ON r.user_id = u.user_id
-                    WHERE r.status = 'rejected'
-                """)
-            elif target == "approved_event":
-                event_id = int(data.get("event_id"))
-                c.execute("""
-                    SELECT DISTINCT r.user_id
-                    FROM registrations r
-                    WHERE LOWER(TRIM(r.status)) = 'approved' AND r.event_id = ?
-                """, (event_id,))
-            elif target == "rejected_event":
-                event_id = int(data.get("event_id"))
-                c.execute("""
-                    SELECT DISTINCT r.user_id
-                    FROM registrations r
-                    WHERE LOWER(TRIM(r.status)) = 'rejected' AND r.event_id = ?
-                """, (event_id,))
-            recipients = [row[0] for row in c.fetchall()]
-            conn.close()
+            def _load(conn):
+                c = conn.cursor()
+                if target == "all":
+                    c.execute("SELECT user_id FROM users")
+                elif target == "approved":
+                    c.execute("""
+                        SELECT DISTINCT r.user_id
+                        FROM registrations r
+                        WHERE r.status = 'approved'
+                    """)
+                elif target == "rejected":
+                    c.execute("""
+                        SELECT DISTINCT u.user_id
+                        FROM users u
+                        JOIN registrations r ON r.user_id = u.user_id
+                        WHERE r.status = 'rejected'
+                    """)
+                elif target == "approved_event":
+                    event_id = int(data.get("event_id"))
+                    c.execute("""
+                        SELECT DISTINCT r.user_id
+                        FROM registrations r
+                        WHERE r.status = 'approved' AND r.event_id = ?
+                    """, (event_id,))
+                elif target == "rejected_event":
+                    event_id = int(data.get("event_id"))
+                    c.execute("""
+                        SELECT DISTINCT r.user_id
+                        FROM registrations r
+                        WHERE r.status = 'rejected' AND r.event_id = ?
+                    """, (event_id,))
+                recipients = [row[0] for row in c.fetchall()]
+                return recipients
+            recipients = await db_read(_load)
             if not recipients:
                 await event.reply("📭 هیچ کاربری در این گروه وجود ندارد. اگر هدف 'تاییدشدگان یک رویداد' است، ابتدا از منوی 'ارسال همگانی' رویداد را انتخاب کنید یا وضعیت ثبت‌نام‌ها را بررسی کنید.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 clear_user_state(user_states, user_id)
@@ -3403,39 +2244,15 @@ def setup_admin_handlers(client, user_states):
                 should_pin = True
                 text = text[:-4].strip()
             total = len(recipients)
-            sent_count = 0
-            failed_count = 0
             status_msg = await event.reply(f"📤 در حال ارسال به {total} کاربر...")
-            from utils import send_with_rate_limit
-            for i, uid in enumerate(recipients, 1):
-                try:
-                    if event.message.file:
-                        res = await send_with_rate_limit(client, uid, text=text or None, file=event.message.file)
-                    else:
-                        res = await send_with_rate_limit(client, uid, text=text)
-                    if should_pin and res:
-                        try:
-                            await client.pin_message(uid, res, notify=False)
-                        except Exception:
-                            pass
-                    if res:
-                        sent_count += 1
-                    else:
-                        failed_count += 1
-                except Exception as e:
-                    failed_count += 1
-                if i % 10 == 0 or i == total:
-                    try:
-                        await status_msg.edit(f"📤 ارسال به {total} کاربر...\n✅ ارسال شده: {sent_count}\n❌ خطا: {failed_count}")
-                    except:
-                        pass
-                await asyncio.sleep(0.12)
+            # sending happens in the background job engine; progress is edited into status_msg
+            from broadcast_manager import get_engine
+            await get_engine(client).submit(
+                user_id, target, recipients, text,
+                source_message=event.message if event.message.file else None,
+                pin=should_pin, status_message=status_msg,
+            )
             clear_user_state(user_states, user_id)
-            summary = f"✅ ارسال همگانی به پایان رسید.\n\n📬 کل کاربران: {total}\n✅ دریافت کردند: {sent_count}\n❌ ارسال نشد: {failed_count}"
-            try:
-                await status_msg.edit(summary, buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-            except:
-                pass
 
         elif state == "admin_waiting_faq_question":
             question = event.message.text.strip()
@@ -3446,11 +2263,7 @@ def setup_admin_handlers(client, user_states):
             answer = event.message.text.strip()
             data = get_user_data(user_states, user_id)
             question = data["question"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT INTO faqs (question, answer) VALUES (?, ?)", (question, answer))
-            conn.commit()
-            conn.close()
+            await execute("INSERT INTO faqs (question, answer) VALUES (?, ?)", (question, answer))
             clear_user_state(user_states, user_id)
             await event.reply("✅ سوال متداول اضافه شد.", buttons=get_admin_main_menu())
 
@@ -3466,11 +2279,7 @@ def setup_admin_handlers(client, user_states):
             data = get_user_data(user_states, user_id)
             faq_id = data["faq_id"]
             new_question = data["question"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE faqs SET question = ?, answer = ? WHERE id = ?", (new_question, new_answer, faq_id))
-            conn.commit()
-            conn.close()
+            await execute("UPDATE faqs SET question = ?, answer = ? WHERE id = ?", (new_question, new_answer, faq_id))
             clear_user_state(user_states, user_id)
             await event.reply("✅ سوال ویرایش شد.", buttons=get_admin_main_menu())
 
@@ -3483,11 +2292,8 @@ def setup_admin_handlers(client, user_states):
             if not ts:
                 await event.reply("❌ فرمت نادرست است. نمونه معتبر: 1403/07/01 18:30", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE events SET end_at_ts = ?, end_set_by = ? WHERE id = ?", (int(ts), user_id, event_id))
-            conn.commit()
-            conn.close()
+            await execute("UPDATE events SET end_at_ts = ?, end_set_by = ? WHERE id = ?", (int(ts), user_id, event_id))
+            schedule_event_deadline(event_id, int(ts))
             clear_user_state(user_states, user_id)
             await event.reply("✅ مهلت ثبت‌نام تنظیم شد.", buttons=get_admin_main_menu())
 
@@ -3504,22 +2310,26 @@ def setup_admin_handlers(client, user_states):
             data = get_user_data(user_states, user_id)
             target_user_id = data["target_user_id"]
             event_id = data["event_id"]
-            file_ext = event.message.file.ext or "pdf"
-            unique_name = f"cert_{target_user_id}_{event_id}_{int(time.time())}_{random.randint(1000,9999)}.{file_ext}"
-            file_path = os.path.join("uploads", unique_name)
-            await event.message.download_media(file=file_path)
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT INTO certificates (user_id, event_id, file_id, sent_by_admin) VALUES (?, ?, ?, ?)",
-                      (target_user_id, event_id, file_path, user_id))
-            conn.commit()
-            conn.close()
-            try:
-                await client.send_file(target_user_id, file_path, caption="📜 گواهی شما آماده است!")
-                await event.reply("✅ گواهی برای کاربر ارسال شد و در سیستم ثبت گردید.", buttons=get_admin_main_menu())
-            except:
-                await event.reply("⚠️ گواهی در سیستم ثبت شد اما ارسال به کاربر با خطا مواجه شد.", buttons=get_admin_main_menu())
+
+            # registered and sent to the user once the file is on disk
+            async def cert_saved(path):
+                await execute("INSERT INTO certificates (user_id, event_id, file_id, sent_by_admin) VALUES (?, ?, ?, ?)",
+                          (target_user_id, event_id, path, user_id))
+                try:
+                    await send_media(client, target_user_id, path, caption="📜 گواهی شما آماده است!")
+                    await event.reply("✅ گواهی برای کاربر ارسال شد و در سیستم ثبت گردید.", buttons=get_admin_main_menu())
+                except:
+                    await event.reply("⚠️ گواهی در سیستم ثبت شد اما ارسال به کاربر با خطا مواجه شد.", buttons=get_admin_main_menu())
+
+            async def cert_failed(error):
+                set_user_state(user_states, user_id, "admin_waiting_cert_file", {"target_user_id": target_user_id, "event_id": event_id})
+                await event.reply("❌ دریافت فایل گواهی ناموفق بود. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
+
+            if not submit_download(event.message, "pdf", cert_saved, cert_failed, max_bytes=30 * 1024 * 1024):
+                await event.reply("⏳ سرور مشغول است؛ لطفا چند لحظه دیگر فایل را دوباره ارسال کنید.", buttons=CANCEL_BUTTON)
+                return
             clear_user_state(user_states, user_id)
+            await event.reply("📥 فایل گواهی دریافت شد؛ پس از ذخیره برای کاربر ارسال می‌شود...")
 
         elif state == "admin_waiting_donation_card":
             card_text = (event.message.text or "").strip()
@@ -3530,7 +2340,7 @@ def setup_admin_handlers(client, user_states):
                 return
             try:
                 # save card number temporarily and ask for holder name
-                set_setting('donation_card_number', cleaned)
+                await set_setting('donation_card_number', cleaned)
             except Exception:
                 pass
             # ask for card holder name
@@ -3540,7 +2350,7 @@ def setup_admin_handlers(client, user_states):
         elif state == "admin_waiting_donation_desc":
             desc = event.message.text or ''
             try:
-                set_setting('donation_description', desc)
+                await set_setting('donation_description', desc)
             except Exception:
                 pass
             clear_user_state(user_states, user_id)
@@ -3552,7 +2362,7 @@ def setup_admin_handlers(client, user_states):
                 await event.reply("❌ نام صاحب کارت معتبر نیست. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
             try:
-                set_setting('donation_card_holder', holder)
+                await set_setting('donation_card_holder', holder)
             except Exception:
                 pass
             clear_user_state(user_states, user_id)
@@ -3562,13 +2372,13 @@ def setup_admin_handlers(client, user_states):
             reply_text = event.message.text.strip()
             data = get_user_data(user_states, user_id)
             ticket_id = data["ticket_id"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT user_id FROM tickets WHERE id = ?", (ticket_id,))
-            user_id_target = c.fetchone()[0]
-            c.execute("UPDATE tickets SET status = 'closed', admin_reply = ?, replied_at = datetime('now', 'localtime') WHERE id = ?", (reply_text, ticket_id))
-            conn.commit()
-            conn.close()
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("SELECT user_id FROM tickets WHERE id = ?", (ticket_id,))
+                user_id_target = c.fetchone()[0]
+                c.execute("UPDATE tickets SET status = 'closed', admin_reply = ?, replied_at = datetime('now', 'localtime') WHERE id = ?", (reply_text, ticket_id))
+                return user_id_target
+            user_id_target = await db_write(_apply)
             await client.send_message(user_id_target, f"📬 پاسخ ادمین به تیکت شما:\n\n{reply_text}")
             clear_user_state(user_states, user_id)
             await event.reply("✅ پاسخ ارسال شد و تیکت بسته شد.", buttons=get_admin_main_menu())
@@ -3587,9 +2397,8 @@ def setup_admin_handlers(client, user_states):
                 await event.reply("❌ خطا: اطلاعات عملیات پیدا نشد. دوباره تلاش کنید.", buttons=get_admin_main_menu())
                 return
 
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            try:
+            def _apply(conn):
+                c = conn.cursor()
                 # fetch target user and current status
                 if target_table == 'ideas':
                     c.execute("SELECT user_id, LOWER(TRIM(status)) FROM ideas WHERE id = ?", (target_id,))
@@ -3605,10 +2414,7 @@ def setup_admin_handlers(client, user_states):
 
                 # only update if still pending to avoid double-processing
                 if current_status and current_status != 'pending':
-                    conn.close()
-                    clear_user_state(user_states, user_id)
-                    await event.reply(f"⚠️ این مورد قبلاً پردازش شده (وضعیت فعلی: {current_status}). عملیات لغو شد.", buttons=get_admin_main_menu())
-                    return
+                    return target_uid, current_status
 
                 # update status and admin metadata in DB
                 if target_table in ('ideas', 'collaborations', 'donations'):
@@ -3629,15 +2435,18 @@ def setup_admin_handlers(client, user_states):
                               (user_id, f'set_status_{new_status}', target_table, target_id, msg_text[:2000] if msg_text else None))
                 except Exception:
                     pass
+                return target_uid, current_status
 
-                conn.commit()
+            try:
+                target_uid, current_status = await db_write(_apply)
             except Exception:
-                conn.rollback()
-                conn.close()
                 clear_user_state(user_states, user_id)
                 await event.reply("❌ خطا در به‌روزرسانی دیتابیس.", buttons=get_admin_main_menu())
                 return
-            conn.close()
+            if current_status and current_status != 'pending':
+                clear_user_state(user_states, user_id)
+                await event.reply(f"⚠️ این مورد قبلاً پردازش شده (وضعیت فعلی: {current_status}). عملیات لغو شد.", buttons=get_admin_main_menu())
+                return
 
             sent_ok = False
             if target_uid:
@@ -3701,11 +2510,7 @@ def setup_admin_handlers(client, user_states):
             new_title = event.message.text.strip()
             data = get_user_data(user_states, user_id)
             event_id = data["event_id"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE events SET title = ? WHERE id = ?", (new_title, event_id))
-            conn.commit()
-            conn.close()
+            await execute("UPDATE events SET title = ? WHERE id = ?", (new_title, event_id))
             clear_user_state(user_states, user_id)
             await event.reply("✅ عنوان با موفقیت ویرایش شد.", buttons=get_admin_main_menu())
 
@@ -3713,11 +2518,7 @@ def setup_admin_handlers(client, user_states):
             new_desc = event.message.text.strip()
             data = get_user_data(user_states, user_id)
             event_id = data["event_id"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE events SET description = ? WHERE id = ?", (new_desc, event_id))
-            conn.commit()
-            conn.close()
+            await execute("UPDATE events SET description = ? WHERE id = ?", (new_desc, event_id))
             clear_user_state(user_states, user_id)
             await event.reply("✅ توضیحات با موفقیت ویرایش شد.", buttons=get_admin_main_menu())
 
@@ -3725,11 +2526,7 @@ def setup_admin_handlers(client, user_states):
             new_card = event.message.text.strip()
             data = get_user_data(user_states, user_id)
             event_id = data["event_id"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("UPDATE events SET card_number = ? WHERE id = ?", (new_card, event_id))
-            conn.commit()
-            conn.close()
+            await execute("UPDATE events SET card_number = ? WHERE id = ?", (new_card, event_id))
             clear_user_state(user_states, user_id)
             await event.reply("✅ شماره کارت با موفقیت ویرایش شد.", buttons=get_admin_main_menu())
 
@@ -3741,15 +2538,14 @@ def setup_admin_handlers(client, user_states):
                 msg_ids = ",".join(map(str, data.get("message_ids", [])))
                 payloads = data.get("payloads", [])
                 payloads_json = json.dumps(payloads, ensure_ascii=False)
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                try:
-                    c.execute("ALTER TABLE events ADD COLUMN report_payloads TEXT")
-                except Exception:
-                    pass
-                c.execute("UPDATE events SET report_message_ids = ?, report_payloads = ? WHERE id = ?", (msg_ids, payloads_json, event_id))
-                conn.commit()
-                conn.close()
+                def _apply(conn):
+                    c = conn.cursor()
+                    try:
+                        c.execute("ALTER TABLE events ADD COLUMN report_payloads TEXT")
+                    except Exception:
+                        pass
+                    c.execute("UPDATE events SET report_message_ids = ?, report_payloads = ? WHERE id = ?", (msg_ids, payloads_json, event_id))
+                await db_write(_apply)
                 clear_user_state(user_states, user_id)
                 await event.reply("✅ گزارش کار تنظیم شد.", buttons=get_admin_main_menu())
             else:
@@ -3797,25 +2593,7 @@ def setup_admin_handlers(client, user_states):
                 await event.reply("✅ پیام گزارش افزوده شد. اگر تمام شد، /done را بفرستید.")
 
 
-    @client.on(events.CallbackQuery(pattern=b"cost_(free|fixed|variable)"))
-    async def cost_type_handler(event):
-        user_id = event.sender_id
-        if not utils_is_admin(DB_NAME, user_id):
-            return
-        cost_type = event.data.decode('utf-8').split("_")[1]
-        # Only handle fixed/variable here. "free" is handled in the main callback handler
-        if cost_type == "free":
-            # Do nothing here; the primary handler will present certificate options
-            return
-        data = get_user_data(user_states, user_id) or {}
-        data["cost_type"] = cost_type
-        set_user_state(user_states, user_id, "admin_new_event_cost_amount", data)
-        if cost_type == "fixed":
-            await event.edit("💰 لطفا مبلغ ثابت (به تومان) را ارسال کنید:", buttons=CANCEL_BUTTON)
-        elif cost_type == "variable":
-            await event.edit("🎓 لطفا هزینه برای دانشجو (به تومان) را ارسال کنید:", buttons=CANCEL_BUTTON)
-
-    @client.on(events.CallbackQuery(data=b"admin_confirm_event"))
+    @router.callback("admin_confirm_event")
     async def confirm_event_handler(event):
         user_id = event.sender_id
         if not utils_is_admin(DB_NAME, user_id):
@@ -3826,22 +2604,21 @@ def setup_admin_handlers(client, user_states):
             return
         poster_path = data["poster_path"]
         poster_file_id = poster_path
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        # store certificate-related fields if provided
-        c.execute("""
-            INSERT INTO events (
-                title, description, cost_type, fixed_cost, student_cost, non_student_cost,
-                card_number, poster_file_id, created_by, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data["title"], data["description"], data["cost_type"],
-            data.get("fixed_cost", 0), data.get("student_cost", 0), data.get("non_student_cost", 0),
-            data.get("card_number"), poster_file_id, user_id,
-            data.get("cert_fee"), data.get("cert_fee_student"), data.get("cert_fee_non_student"), data.get("cert_card_number"), data.get("cert_card_holder")
-        ))
-        conn.commit()
-        conn.close()
+        def _apply(conn):
+            c = conn.cursor()
+            # store certificate-related fields if provided
+            c.execute("""
+                INSERT INTO events (
+                    title, description, cost_type, fixed_cost, student_cost, non_student_cost,
+                    card_number, poster_file_id, created_by, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data["title"], data["description"], data["cost_type"],
+                data.get("fixed_cost", 0), data.get("student_cost", 0), data.get("non_student_cost", 0),
+                data.get("card_number"), poster_file_id, user_id,
+                data.get("cert_fee"), data.get("cert_fee_student"), data.get("cert_fee_non_student"), data.get("cert_card_number"), data.get("cert_card_holder")
+            ))
+        await db_write(_apply)
         clear_user_state(user_states, user_id)
         await event.edit("✅ رویداد با موفقیت ثبت شد!", buttons=get_admin_main_menu())
 
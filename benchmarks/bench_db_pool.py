@@ -0,0 +1,89 @@
+"""Before/after benchmark for the pooled SQLite access layer.
+
+Replays the queries of a typical callback (the user-side event details screen)
+against a throwaway database, once with a fresh sqlite3.connect() per query
+block (the old pattern) and once with a single pooled borrow.
+
+    python benchmarks/bench_db_pool.py [iterations]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+EVENT_SQL = """
+    SELECT title, description, cost_type, fixed_cost, student_cost, non_student_cost, card_number,
+           poster_file_id, is_active, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder,
+           report_message_ids, report_payloads, reminders_enabled
+    FROM events WHERE id = ?
+"""
+APPROVED_SQL = "SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? AND status = 'approved'"
+OPT_IN_SQL = "SELECT reminder_opt_in FROM registrations WHERE user_id = ? AND event_id = ?"
+
+
+def seed(db_path, events=200, users=2000):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.executemany("INSERT INTO events (title, description, cost_type, is_active) VALUES (?, ?, 'free', 1)",
+                  [(f"event {i}", "desc " * 20) for i in range(events)])
+    c.executemany("INSERT OR IGNORE INTO registrations (user_id, event_id, status) VALUES (?, ?, ?)",
+                  [(u, (u % events) + 1, 'approved' if u % 3 else 'pending') for u in range(users)])
+    conn.commit()
+    conn.close()
+
+
+def callback_per_call_connect(db_path, user_id, event_id):
+    # old pattern: one connection per query block, four per callback
+    for sql, args in ((EVENT_SQL, (event_id,)), (APPROVED_SQL, (user_id, event_id)),
+                      ("SELECT reminders_enabled FROM events WHERE id = ?", (event_id,)),
+                      (OPT_IN_SQL, (user_id, event_id))):
+        conn = sqlite3.connect(db_path)
+        c = conn.cursor()
+        c.execute(sql, args)
+        c.fetchone()
+        conn.close()
+
+
+def callback_pooled(get_connection, user_id, event_id):
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(EVENT_SQL, (event_id,))
+        c.fetchone()
+        c.execute(APPROVED_SQL, (user_id, event_id))
+        c.fetchone()
+        c.execute(OPT_IN_SQL, (user_id, event_id))
+        c.fetchone()
+
+
+def run(label, fn, iterations):
+    samples = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i % 2000, (i % 200) + 1)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{label:<22} mean {mean * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+    return mean
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        os.environ['JURISLAW_DB'] = db_path
+        import database
+        database.init_db(db_path)
+        seed(db_path)
+        before = run("per-call connect", lambda u, e: callback_per_call_connect(db_path, u, e), iterations)
+        after = run("pooled borrow", lambda u, e: callback_pooled(lambda: database.get_connection(db_path), u, e), iterations)
+        print(f"speedup: {before / after:.1f}x")
+        database.close_all_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Dispatch cost per update: catch-all handler fan-out vs. the update router.
+
+The handler key sets (callback data compared with == / startswith, user states
+compared with ==) are read from the bot modules with ast, so both sides model
+the real tree. The "fan-out" side runs every registered handler for every
+update, each decoding event.data and walking its if/elif chain; the router
+side resolves the single owner with a dict/trie lookup and runs only it.
+Only dispatch is measured; the per-handler membership checks and state reads
+the fan-out also repeated come on top of this.
+
+    python benchmarks/bench_dispatch.py [updates]
+"""
+import ast
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from router import UpdateRouter  # noqa: E402
+
+MODULES = ('user_panel.py', 'admin_panel.py', 'event_manager.py', 'registration_flow.py', 'membership_flow.py')
+
+
+def handler_keys():
+    """Yield (name, kind, exact, prefixes, states) for each routed handler."""
+    for mod in MODULES:
+        with open(os.path.join(ROOT, mod), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for fn in ast.walk(tree):
+            if not isinstance(fn, ast.AsyncFunctionDef) or not fn.decorator_list:
+                continue
+            deco = fn.decorator_list[0]
+            kind = getattr(getattr(deco, 'func', None), 'attr', None)
+            if kind not in ('callback', 'message'):
+                continue
+            keys = [a.value for a in deco.args]
+            prefixes = []
+            for kw in deco.keywords:
+                if kw.arg == 'prefixes':
+                    prefixes = [e.value for e in kw.value.elts]
+            exact, states = (keys, []) if kind == 'callback' else ([], keys)
+            yield f"{mod}:{fn.name}", kind, exact, prefixes, states
+
+
+def make_chain(exact, prefixes):
+    # the old handlers test their branches in source order; approximate with exact keys first
+    async def handler(event):
+        data = event.data.decode('utf-8')
+        for key in exact:
+            if data == key:
+                return
+        for prefix in prefixes:
+            if data.startswith(prefix):
+                return
+    return handler
+
+
+def make_state_chain(states, user_states):
+    async def handler(event):
+        state = user_states.get(event.sender_id, {}).get('state', None)
+        for key in states:
+            if state == key:
+                return
+    return handler
+
+
+async def noop(event):
+    return None
+
+
+class FakeEvent:
+    __slots__ = ('data', 'sender_id', 'message')
+
+    def __init__(self, data=None, sender_id=1, message=None):
+        self.data = data
+        self.sender_id = sender_id
+        self.message = message
+
+
+class FakeMessage:
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def drive(coro):
+    try:
+        coro.send(None)
+    except StopIteration:
+        pass
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    handlers = list(handler_keys())
+    user_states = {}
+    router = UpdateRouter(lambda uid: user_states.get(uid, {}).get('state', None))
+    fanout_cb, fanout_msg = [], []
+    samples_cb, samples_state = [], []
+    for name, kind, exact, prefixes, states in handlers:
+        if kind == 'callback':
+            fanout_cb.append(make_chain(exact, prefixes))
+            router.callback(*exact, prefixes=prefixes)(noop)
+            samples_cb += exact + [p + '7' for p in prefixes]
+        else:
+            fanout_msg.append(make_state_chain(states, user_states))
+            router.message(*states)(noop)
+            samples_state += states
+    # the fan-out side does no real work in its handlers either, so both sides only pay for dispatch
+    cb_events = [FakeEvent(s.encode('utf-8')) for s in samples_cb]
+    msg_events = []
+    for i, state in enumerate(samples_state):
+        user_states[i] = {'state': state}
+        msg_events.append(FakeEvent(sender_id=i, message=FakeMessage("text")))
+
+    def bench(label, events, fn):
+        t0 = time.perf_counter()
+        i = 0
+        while i < n:
+            for ev in events:
+                fn(ev)
+            i += len(events)
+        dt = time.perf_counter() - t0
+        per = dt / i * 1e6
+        print(f"{label:32s} {per:8.2f} us/update")
+        return per
+
+    print(f"{len(fanout_cb)} callback handlers, {len(fanout_msg)} state handlers, "
+          f"{len(samples_cb)} callback keys, {len(samples_state)} states")
+    old_cb = bench("callback fan-out", cb_events, lambda ev: [drive(h(ev)) for h in fanout_cb])
+    new_cb = bench("callback router", cb_events, lambda ev: drive(router.on_callback(ev)))
+    old_msg = bench("message fan-out", msg_events, lambda ev: [drive(h(ev)) for h in fanout_msg])
+    new_msg = bench("message router", msg_events, lambda ev: drive(router.on_message(ev)))
+    print(f"callback speedup x{old_cb / new_cb:.1f}, message speedup x{old_msg / new_msg:.1f}")
+
+
+if __name__ == '__main__':
+    main()
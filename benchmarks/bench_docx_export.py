@@ -0,0 +1,128 @@
+"""Time and peak memory of the Word exports: python-docx vs. streaming lxml.
+
+"python-docx" is what the ideas/collaborations/donations/tickets Word
+exports did before: a python-docx Document with one table row added per
+record, then a second pass over every paragraph and run to set right
+alignment and the B Nazanin font (restyle() below, the old
+apply_persian_docx_style), then Document.save. "streaming" is
+export_engine.stream_docx: styles.xml declares the RTL layout and font
+once, and document.xml is written row by row with lxml.etree.xmlfile into
+the zip entry. Each mode runs in its own process on the same synthetic
+database (N ideas with multi-line descriptions), and reports wall time, peak
+RSS and peak RSS above the process's footprint after imports.
+
+    python benchmarks/bench_docx_export.py [rows]
+"""
+import contextlib
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def build(path, rows):
+    import database
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db(path)
+    conn = database.sqlite3.connect(path)
+    rnd = random.Random(1)
+    words = ['حقوق', 'دانشجو', 'همایش', 'کارگاه', 'قانون', 'پژوهش', 'دادگاه', 'مقاله']
+    conn.executemany("INSERT INTO ideas (user_id, title, description, status) VALUES (?, ?, ?, ?)",
+                     ((uid, ' '.join(rnd.choices(words, k=3)),
+                       ' '.join(rnd.choices(words, k=20)) + '\n' + ' '.join(rnd.choices(words, k=10)),
+                       rnd.choice(['pending', 'approved', 'rejected'])) for uid in range(1, rows + 1)))
+    conn.commit()
+    conn.close()
+
+
+def restyle(doc):
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+    from docx.oxml.ns import qn
+
+    def style(paragraph):
+        paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
+        for run in paragraph.runs:
+            run.font.name = 'B Nazanin'
+            run._element.rPr.rFonts.set(qn('w:eastAsia'), 'B Nazanin')
+    for paragraph in doc.paragraphs:
+        style(paragraph)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.paragraphs:
+                    style(paragraph)
+
+
+def python_docx(conn, out):
+    from docx import Document
+    from export_engine import DATASETS
+    ds = DATASETS['ideas']
+    doc = Document()
+    doc.add_heading(ds.heading, 0)
+    table = doc.add_table(rows=1, cols=len(ds.headers))
+    for cell, header in zip(table.rows[0].cells, ds.headers):
+        cell.text = header
+    for r in conn.execute(ds.sql):
+        for cell, value in zip(table.add_row().cells, r):
+            cell.text = '' if value is None else str(value)
+    restyle(doc)
+    doc.save(out)
+
+
+def streaming(conn, out):
+    from export_engine import DATASETS, stream_docx
+    ds = DATASETS['ideas']
+    stream_docx(conn.execute(ds.sql), out, ds)
+
+
+def child(mode, path, out):
+    import sqlite3
+    fn = {'python-docx': python_docx, 'streaming': streaming}[mode]
+    if mode == 'python-docx':
+        import docx  # noqa: F401  (import cost is not part of the export)
+    import lxml.etree  # noqa: F401
+    import export_engine  # noqa: F401
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn = sqlite3.connect(path)
+    t0 = time.perf_counter()
+    fn(conn, out)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed:.3f} {peak} {peak - base} {os.path.getsize(out)}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(*sys.argv[2:5])
+        return
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build(path, rows)
+        print(f"{rows} ideas")
+        results = {}
+        for mode in ('python-docx', 'streaming'):
+            out = os.path.join(tmp, f'{mode}.docx')
+            res = subprocess.run([sys.executable, __file__, '--child', mode, path, out],
+                                 capture_output=True, text=True)
+            if res.returncode != 0:
+                print(f"{mode:<11} failed: {res.stderr.strip().splitlines()[-1] if res.stderr.strip() else res.returncode}")
+                continue
+            elapsed, peak, delta, size = res.stdout.split()
+            results[mode] = (float(elapsed), int(peak), int(delta))
+            print(f"{mode:<11} {float(elapsed):7.2f} s   peak RSS {int(peak) / 1024:7.1f} MB"
+                  f"   (+{int(delta) / 1024:6.1f} MB)   file {int(size) / 1024:7.0f} KB")
+        if len(results) == 2:
+            (t_old, m_old, d_old), (t_new, m_new, d_new) = results['python-docx'], results['streaming']
+            print(f"streaming: {t_old / t_new:.1f}x faster, {m_old / m_new:.1f}x lower peak RSS"
+                  f" ({d_old / max(d_new, 1):.0f}x less memory above imports)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Startup cost of init_db: replaying the whole schema vs. versioned migrations.
+
+"replay" is what init_db used to do on every start: run the baseline schema
+step (every CREATE ... IF NOT EXISTS, column check, trigger, index and
+settings default) against a database that already has it. "versioned" is the
+current init_db against an up-to-date file, which only reads PRAGMA
+user_version. A cold run (new file, all migrations) is shown for reference.
+Statement counts come from sqlite3's trace callback.
+
+    python benchmarks/bench_init_db.py [iterations]
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database  # noqa: E402
+
+_statements = []
+_connect = sqlite3.connect
+
+
+def _traced_connect(*args, **kwargs):
+    conn = _connect(*args, **kwargs)
+    conn.set_trace_callback(_statements.append)
+    return conn
+
+
+def replay_schema(path):
+    conn = _traced_connect(path, isolation_level=None)
+    try:
+        database._schema_v1(conn.cursor())
+    finally:
+        conn.close()
+
+
+def versioned(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db(path)
+
+
+def run(label, fn, path, iterations):
+    samples = []
+    for _ in range(iterations):
+        del _statements[:]
+        t0 = time.perf_counter()
+        fn(path)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    median = samples[len(samples) // 2]
+    print(f"{label:<10} median {median * 1e3:8.3f} ms   statements {len(_statements):4d}")
+    return median
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    database.sqlite3.connect = _traced_connect
+    with tempfile.TemporaryDirectory() as tmp:
+        def cold(_):
+            fresh = os.path.join(tmp, f'cold_{time.perf_counter_ns()}.db')
+            versioned(fresh)
+        run('cold', cold, None, min(iterations, 20))
+        path = os.path.join(tmp, 'warm.db')
+        versioned(path)
+        old = run('replay', replay_schema, path, iterations)
+        new = run('versioned', versioned, path, iterations)
+        print(f"warm start speedup: {old / new:.1f}x (schema version {database.SCHEMA_VERSION})")
+
+
+if __name__ == '__main__':
+    main()
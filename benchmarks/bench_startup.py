@@ -0,0 +1,163 @@
+"""Bot startup cost: import time per module and time to the first handled update.
+
+Two child processes, each a fresh interpreter with bytecode caching on (a
+warm-up run writes the .pyc files first):
+
+  * "imports" runs `python -X importtime` over main and the handler modules
+    and prints each of the bot's own modules (self / cumulative) plus the
+    heaviest third-party packages they pull in.
+  * "first update" replays main(): init_db, state store, settings and admin
+    caches, import + setup of every handler module against a stand-in
+    client, then one callback update pushed through the router. Telegram
+    connect time is not included; everything after it is.
+
+Exits 1 if a library that is only needed for exports or encryption is
+imported at startup (they must load lazily, on first use), or if the bot's
+own modules take more than the budget (self time, default 60 ms).
+
+    python benchmarks/bench_startup.py [budget_ms]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HANDLER_MODULES = ('user_panel', 'admin_panel', 'event_manager', 'registration_flow', 'membership_flow')
+LAZY_ONLY = ('pandas', 'docx', 'openpyxl', 'xlsxwriter', 'lxml', 'cryptography', 'pytz')
+OWN_MODULES = {name[:-3] for name in os.listdir(ROOT) if name.endswith('.py')}
+
+FIRST_UPDATE = '''
+import asyncio, sys, time
+t0 = time.perf_counter()
+phases = []
+def mark(name):
+    phases.append((name, time.perf_counter()))
+
+import main
+from telethon import events
+mark('import main + telethon')
+from database import init_db
+init_db()
+mark('init_db')
+from state_store import create_state_store
+user_states = create_state_store()
+from settings_cache import load_settings
+load_settings()
+from admin_cache import reload_admins
+reload_admins()
+mark('state store + caches')
+
+class Client:
+    def __init__(self):
+        self.handlers = []
+    def add_event_handler(self, fn, kind):
+        self.handlers.append((fn, kind))
+
+class Event:
+    data = b"user_help"
+    sender_id = chat_id = 1
+    async def edit(self, *args, **kwargs):
+        pass
+    async def answer(self, *args, **kwargs):
+        pass
+
+client = Client()
+from user_panel import setup_user_handlers
+from admin_panel import setup_admin_handlers
+from event_manager import setup_event_handlers
+from registration_flow import setup_registration_handlers
+from membership_flow import setup_membership_handlers
+mark('import handler modules')
+for setup in (setup_user_handlers, setup_admin_handlers, setup_event_handlers,
+              setup_registration_handlers, setup_membership_handlers):
+    setup(client, user_states)
+mark('setup handlers')
+on_callback = next(fn for fn, kind in client.handlers if kind is events.CallbackQuery)
+asyncio.run(on_callback(Event()))
+mark('first update handled')
+prev = t0
+for name, t in phases:
+    print(f"{name}|{(t - prev) * 1e3:.1f}")
+    prev = t
+print(f"total|{(prev - t0) * 1e3:.1f}")
+print("modules|" + ",".join(sorted(sys.modules)))
+'''
+
+
+def child_env(tmp):
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env['JURISLAW_DB'] = os.path.join(tmp, 'startup.db')
+    return env
+
+
+def run(args, tmp):
+    # cwd is the temp dir so main's uploads/ and the session files land there
+    return subprocess.run([sys.executable, *args], cwd=tmp, env=child_env(tmp), capture_output=True, text=True)
+
+
+def import_times(tmp):
+    res = run(['-X', 'importtime', '-c', 'import main, ' + ', '.join(HANDLER_MODULES)], tmp)
+    rows = []
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cum_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cum_us)))
+    return rows
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    with tempfile.TemporaryDirectory() as tmp:
+        res = run(['-c', FIRST_UPDATE], tmp)  # warm-up: writes .pyc files, creates the db
+        if res.returncode != 0:
+            print(res.stderr.strip())
+            sys.exit(1)
+        rows = import_times(tmp)
+        started = time.perf_counter()
+        res = run(['-c', FIRST_UPDATE], tmp)
+        wall = (time.perf_counter() - started) * 1e3
+
+    own = [r for r in rows if r[0] in OWN_MODULES]
+    own_self = sum(r[2] for r in own) / 1e3
+    print("bot modules                         self ms   cumulative ms")
+    for name, _, self_us, cum_us in sorted(own, key=lambda r: -r[3]):
+        print(f"  {name:<32} {self_us / 1e3:8.1f}   {cum_us / 1e3:10.1f}")
+    print(f"  {'(sum of self)':<32} {own_self:8.1f}")
+    third = {}
+    for name, _, _, cum_us in rows:
+        top = name.split('.')[0]
+        if top not in OWN_MODULES and name == top:
+            third[top] = max(third.get(top, 0), cum_us)
+    print("heaviest other packages             cumulative ms")
+    for name, cum_us in sorted(third.items(), key=lambda kv: -kv[1])[:8]:
+        print(f"  {name:<32} {cum_us / 1e3:10.1f}")
+
+    modules = set()
+    print("time to first update (fresh process)")
+    for line in res.stdout.splitlines():
+        key, _, value = line.partition('|')
+        if key == 'modules':
+            modules = set(value.split(','))
+        elif value:
+            print(f"  {key:<32} {float(value):8.1f} ms")
+    print(f"  {'wall, incl. interpreter start':<32} {wall:8.1f} ms")
+
+    eager = sorted(m for m in LAZY_ONLY if m in modules)
+    problems = 0
+    if eager:
+        problems += 1
+        print(f"FAIL: imported at startup but only needed lazily: {', '.join(eager)}")
+    if own_self > budget_ms:
+        problems += 1
+        print(f"FAIL: bot modules take {own_self:.1f} ms to import (budget {budget_ms:.0f} ms)")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
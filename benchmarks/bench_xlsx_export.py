@@ -0,0 +1,131 @@
+"""Time and peak memory of the per-event Excel export: DataFrame path vs. streaming.
+
+"dataframe" is what export_excel_event_ did before: pandas.read_sql_query,
+DataFrame.to_excel through openpyxl into a BytesIO, then
+an openpyxl pass re-reading the workbook to set RTL, font and widths
+(restyle() below, the old apply_persian_xlsx_style). "streaming" is
+export_engine.stream_xlsx: cursor -> xlsxwriter in constant_memory mode
+with formats set up front. Each mode runs in its own
+process on the same synthetic database (one event, N approved
+registrations), and reports wall time, peak RSS and peak RSS above the
+process's footprint after imports.
+
+    python benchmarks/bench_xlsx_export.py [rows]
+"""
+import contextlib
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+
+def build(path, rows):
+    import database
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db(path)
+    conn = database.sqlite3.connect(path)
+    rnd = random.Random(1)
+    names = ['علی', 'زهرا', 'محمد', 'فاطمه', 'حسین', 'مریم', 'رضا', 'سارا']
+    conn.execute("INSERT INTO events (id, title) VALUES (1, 'bench')")
+    conn.executemany("INSERT INTO users (user_id, full_name, national_id, phone) VALUES (?, ?, ?, ?)",
+                     ((uid, f"{rnd.choice(names)} {rnd.choice(names)}ی {uid}", f"{rnd.randrange(10**10):010d}",
+                       f"9{rnd.randrange(10**9):09d}") for uid in range(1, rows + 1)))
+    conn.executemany("INSERT INTO registrations (user_id, event_id, status) VALUES (?, 1, 'approved')",
+                     ((uid,) for uid in range(1, rows + 1)))
+    conn.commit()
+    conn.close()
+
+
+def restyle(buf):
+    from openpyxl import load_workbook
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+    wb = load_workbook(filename=buf)
+    font = Font(name='B Nazanin')
+    align = Alignment(horizontal='right', vertical='top', wrap_text=True)
+    for ws in wb.worksheets:
+        ws.sheet_view.rightToLeft = True
+        widths = {}
+        for row in ws.iter_rows():
+            for cell in row:
+                cell.font = font
+                cell.alignment = align
+                widths[cell.column] = max(widths.get(cell.column, 0), len(str(cell.value or '')))
+        for idx, width in widths.items():
+            ws.column_dimensions[get_column_letter(idx)].width = min(50, max(10, int(width * 1.2)))
+    out = io.BytesIO()
+    wb.save(out)
+    return out
+
+
+def dataframe(conn, out):
+    import pandas as pd
+    from export_engine import DATASETS
+    ds = DATASETS['event_approved']
+    df = pd.read_sql_query(ds.sql, conn, params=(1,))
+    df.columns = ds.headers
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, engine='openpyxl')
+    buf.seek(0)
+    buf = restyle(buf)
+    with open(out, 'wb') as f:
+        f.write(buf.getvalue())
+
+
+def streaming(conn, out):
+    from export_engine import DATASETS, stream_xlsx
+    ds = DATASETS['event_approved']
+    stream_xlsx(conn.execute(ds.sql, (1,)), out, ds)
+
+
+def child(mode, path, out):
+    import sqlite3
+    fn = {'dataframe': dataframe, 'streaming': streaming}[mode]
+    if mode == 'dataframe':
+        import pandas  # noqa: F401  (import cost is not part of the export)
+        import openpyxl  # noqa: F401
+    import export_engine  # noqa: F401
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn = sqlite3.connect(path)
+    t0 = time.perf_counter()
+    fn(conn, out)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed:.3f} {peak} {peak - base} {os.path.getsize(out)}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(*sys.argv[2:5])
+        return
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build(path, rows)
+        print(f"{rows} approved registrations")
+        results = {}
+        for mode in ('dataframe', 'streaming'):
+            out = os.path.join(tmp, f'{mode}.xlsx')
+            res = subprocess.run([sys.executable, __file__, '--child', mode, path, out],
+                                 capture_output=True, text=True)
+            if res.returncode != 0:
+                print(f"{mode:<10} failed: {res.stderr.strip().splitlines()[-1] if res.stderr.strip() else res.returncode}")
+                continue
+            elapsed, peak, delta, size = res.stdout.split()
+            results[mode] = (float(elapsed), int(peak))
+            print(f"{mode:<10} {float(elapsed):7.2f} s   peak RSS {int(peak) / 1024:7.1f} MB"
+                  f"   (+{int(delta) / 1024:6.1f} MB)   file {int(size) / 1024:7.0f} KB")
+        if len(results) == 2:
+            (t_old, m_old), (t_new, m_new) = results['dataframe'], results['streaming']
+            print(f"streaming: {t_old / t_new:.1f}x faster, {m_old / m_new:.1f}x lower peak RSS")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""EXPLAIN QUERY PLAN regression check for every SQL literal in the bot.
+
+Every string constant in the bot modules that starts with SELECT / UPDATE /
+DELETE / INSERT / WITH is planned against a freshly initialised database
+(init_db on a temp file, so all migrations and indexes are in place). A query
+with a WHERE clause whose plan still contains a bare "SCAN <table>" -- a full
+table walk with no index -- is reported and the script exits 1. f-strings are planned with their {...} parts replaced by a
+single placeholder where that yields valid SQL, and skipped otherwise.
+database.fetch_page() calls with literal arguments are planned as the keyset
+query they run (select + where + key < ? ORDER BY key DESC LIMIT ?); those
+must also walk an index in key order rather than sort ("USE TEMP B-TREE FOR
+ORDER BY"), or a page would cost as much as the whole list.
+
+Queries that scan on purpose go in ALLOWED_SCANS with the reason.
+
+    python benchmarks/check_query_plans.py [-v]
+"""
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+MODULES = (
+    'main.py', 'utils.py', 'user_panel.py', 'admin_panel.py', 'event_manager.py',
+    'registration_flow.py', 'membership_flow.py', 'broadcast_manager.py',
+    'state_store.py', 'settings_cache.py', 'admin_cache.py', 'media_cache.py', 'menu_cache.py', 'scheduler.py', 'reminder_manager.py', 'export_engine.py', 'media_ingest.py', 'upload_store.py', 'gc_manager.py',
+    'log_helper.py',
+)
+SQL_START = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT|WITH)\b', re.I)
+BARE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+KEYSET_QUERIES = set()
+
+# (table, substring of the query) -> why a full scan is expected
+ALLOWED_SCANS = {
+    ('events', 'report_payloads IS NOT NULL'): 'gc_manager lists every report file once per run',
+}
+
+
+def sql_literals():
+    """Yield (module, line, sql) for every SQL string literal in the bot modules."""
+    for mod in MODULES:
+        path = os.path.join(ROOT, mod)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        fstring_parts = {id(v) for n in ast.walk(tree) if isinstance(n, ast.JoinedStr) for v in n.values}
+        fstring_parts.update(id(a) for n in ast.walk(tree)
+                             if isinstance(n, ast.Call) and getattr(n.func, 'id', None) == 'fetch_page'
+                             for a in list(n.args) + [k.value for k in n.keywords])
+        for node in ast.walk(tree):
+            if id(node) in fstring_parts:
+                continue
+            if isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'fetch_page':
+                sql = _keyset_sql(node)
+                if sql:
+                    yield mod, node.lineno, sql
+                continue
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                sql = node.value
+            elif isinstance(node, ast.JoinedStr):
+                parts = []
+                for v in node.values:
+                    if isinstance(v, ast.Constant):
+                        parts.append(v.value)
+                    else:
+                        parts.append('\0')
+                sql = ''.join(parts)
+            else:
+                continue
+            if SQL_START.match(sql):
+                yield mod, node.lineno, sql
+
+
+def _keyset_sql(call):
+    """The query a literal fetch_page(select, where, ..., key=...) call runs for a 'next page' cursor."""
+    args = {'where': '', 'key': 'id'}
+    names = ('select', 'where')
+    for name, arg in zip(names, call.args):
+        args[name] = arg
+    for kw in call.keywords:
+        args[kw.arg] = kw.value
+    values = {}
+    for name in ('select', 'where', 'key'):
+        v = args.get(name)
+        if isinstance(v, ast.Constant) and isinstance(v.value, str):
+            values[name] = v.value
+        elif isinstance(v, str):
+            values[name] = v
+        else:
+            return None
+    clauses = ([f"({values['where']})"] if values['where'] else []) + [f"{values['key']} < ?"]
+    sql = f"{values['select']} WHERE {' AND '.join(clauses)} ORDER BY {values['key']} DESC LIMIT ?"
+    KEYSET_QUERIES.add(sql)
+    return sql
+
+
+def _variants(sql):
+    """Concrete SQL to plan: f-string holes become a placeholder, a table or an IN list."""
+    if '\0' not in sql:
+        return [sql]
+    return [sql.replace('\0', '?'), sql.replace('\0', 'ideas')]
+
+
+def plan(conn, sql):
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * sql.count('?')).fetchall()
+    return [r[3] for r in rows]
+
+
+def bare_scans(sql, details):
+    if not re.search(r'\bWHERE\b', sql, re.I):
+        return []
+    out = []
+    for d in details:
+        m = BARE_SCAN.match(d.strip())
+        if not m:
+            continue
+        table = m.group(1)
+        if any(t == table and frag in sql for (t, frag) in ALLOWED_SCANS):
+            continue
+        out.append(f'SCAN {table}')
+    return out
+
+
+def main():
+    verbose = '-v' in sys.argv
+    tmp = tempfile.mkdtemp(prefix='qplan_')
+    db = os.path.join(tmp, 'plan.db')
+    os.environ['JURISLAW_DB'] = db
+    import database
+    database.init_db(db)
+    conn = sqlite3.connect(db)
+
+    checked = skipped = 0
+    problems = []
+    for mod, line, raw in sql_literals():
+        for sql in _variants(raw):
+            try:
+                details = plan(conn, sql)
+            except sqlite3.Error:
+                continue
+            break
+        else:
+            skipped += 1
+            if verbose:
+                print(f'skip {mod}:{line}: {" ".join(raw.replace(chr(0), "{...}").split())[:80]}')
+            continue
+        checked += 1
+        scans = bare_scans(sql, details)
+        if sql in KEYSET_QUERIES and any(d.startswith('USE TEMP B-TREE FOR ORDER BY') for d in details):
+            scans.append('keyset page sorted instead of index-ordered')
+        if verbose or scans:
+            print(f'{mod}:{line}: {" ".join(sql.split())[:100]}')
+            for d in details:
+                print(f'    {d}')
+        if scans:
+            problems.append((mod, line, scans))
+
+    print(f'\nplanned {checked} queries, skipped {skipped}, {len(problems)} with unindexed scans or sorts')
+    for mod, line, scans in problems:
+        print(f'  {mod}:{line}: {", ".join(scans)}')
+    conn.close()
+    database.close_all_connections()
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
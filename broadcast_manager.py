@@ -1,79 +1,339 @@
+import asyncio
+import os
+import time
 
-from telethon import events, Button
-from utils import set_user_state, get_user_state, get_user_data, clear_user_state, rate_limit_check, sanitize_text
-from database import DB_NAME
-import sqlite3
+from database import db_read, db_write, fetch_all
 
-def setup_broadcast_handlers(client, user_states):
+# ---------------------------------------------------------------------------
+# Broadcast jobs
+# A broadcast is persisted as a broadcast_jobs row plus one broadcast_recipients
+# row per user, then sent by a small pool of workers that share one token
+# bucket (JURISLAW_BROADCAST_RATE messages/second across all jobs). A FloodWait
+# on any worker pauses the whole bucket for the requested time. Per-recipient
+# results are written back in batches, so after a crash or deploy resume()
+# continues with the recipients still marked pending (a message sent in the
+# last second before a crash may be sent twice).
+#
+# Media is not copied: the job remembers the admin's original message and
+# re-fetches it when (re)started, sending its media by reference.
+# ---------------------------------------------------------------------------
+try:
+    BROADCAST_RATE = float(os.getenv('JURISLAW_BROADCAST_RATE', '25'))
+except Exception:
+    BROADCAST_RATE = 25.0
+try:
+    BROADCAST_WORKERS = max(1, int(os.getenv('JURISLAW_BROADCAST_WORKERS', '8')))
+except Exception:
+    BROADCAST_WORKERS = 8
 
-    @client.on(events.NewMessage)
-    async def broadcast_message_handler(event):
-        user_id = event.sender_id
-        state = get_user_state(user_states, user_id)
+MAX_ATTEMPTS = 3
+MAX_FLOOD_RETRIES = 5
+FLUSH_INTERVAL = 1.0
+PROGRESS_INTERVAL = 3.0
+BATCH_SIZE = 500
 
-        if state == "admin_waiting_broadcast_content":
-            # basic admin rate limit for starting broadcast
-            if not rate_limit_check(user_id, limit=2, window=300):
+# errors that will not go away by retrying this recipient
+PERMANENT_ERRORS = {
+    'UserIsBlockedError', 'InputUserDeactivatedError', 'UserDeactivatedError',
+    'UserDeactivatedBanError', 'PeerIdInvalidError', 'ChatWriteForbiddenError',
+}
+
+
+class TokenBucket:
+    """Async token bucket shared by all broadcast workers."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (FloodWait backoff)."""
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+            self._last = until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+def _flood_wait_seconds(exc):
+    if type(exc).__name__.startswith('FloodWait'):
+        return getattr(exc, 'seconds', None) or 30
+    return None
+
+
+def _create_job(conn, created_by, target, recipients, text, source_chat_id, source_msg_id, pin, status_chat_id, status_msg_id):
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO broadcast_jobs (created_by, target, text, source_chat_id, source_msg_id, pin,
+                                    status, total, status_chat_id, status_msg_id)
+        VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)
+    """, (created_by, target, text, source_chat_id, source_msg_id, 1 if pin else 0,
+          len(recipients), status_chat_id, status_msg_id))
+    job_id = c.lastrowid
+    c.executemany("INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id) VALUES (?, ?)",
+                  ((job_id, uid) for uid in recipients))
+    return job_id
+
+
+def _load_job(conn, job_id):
+    row = conn.execute("""
+        SELECT id, text, source_chat_id, source_msg_id, pin, status, total, sent, failed,
+               status_chat_id, status_msg_id, started_at
+        FROM broadcast_jobs WHERE id = ?
+    """, (job_id,)).fetchone()
+    if row is None:
+        return None
+    keys = ('id', 'text', 'source_chat_id', 'source_msg_id', 'pin', 'status', 'total', 'sent', 'failed',
+            'status_chat_id', 'status_msg_id', 'started_at')
+    return dict(zip(keys, row))
+
+
+def _pending_batch(conn, job_id, after_user_id, limit):
+    return [r[0] for r in conn.execute("""
+        SELECT user_id FROM broadcast_recipients
+        WHERE job_id = ? AND status = 'pending' AND user_id > ?
+        ORDER BY user_id LIMIT ?
+    """, (job_id, after_user_id, limit)).fetchall()]
+
+
+def _write_results(conn, job_id, results):
+    c = conn.cursor()
+    c.executemany("""
+        UPDATE broadcast_recipients SET status = ?, error = ?, attempts = ?, sent_at = ?
+        WHERE job_id = ? AND user_id = ?
+    """, [(status, error, attempts, sent_at, job_id, uid) for uid, status, error, attempts, sent_at in results])
+    sent = sum(1 for r in results if r[1] == 'sent')
+    c.execute("UPDATE broadcast_jobs SET sent = sent + ?, failed = failed + ? WHERE id = ?",
+              (sent, len(results) - sent, job_id))
+
+
+def _set_job_status(conn, job_id, status):
+    if status == 'running':
+        conn.execute("UPDATE broadcast_jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+                     (int(time.time()), job_id))
+    else:
+        conn.execute("UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ?",
+                     (status, int(time.time()), job_id))
+
+
+def job_stats(conn, job_id):
+    """Counts and throughput for one job (usable with db_read)."""
+    job = _load_job(conn, job_id)
+    if job is None:
+        return None
+    pending = conn.execute("SELECT COUNT(*) FROM broadcast_recipients WHERE job_id = ? AND status = 'pending'",
+                           (job_id,)).fetchone()[0]
+    finished = conn.execute("SELECT finished_at FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    elapsed = max(0, (finished or int(time.time())) - (job['started_at'] or int(time.time())))
+    done = job['sent'] + job['failed']
+    return {
+        'status': job['status'], 'total': job['total'], 'sent': job['sent'], 'failed': job['failed'],
+        'pending': pending, 'elapsed_s': elapsed, 'per_second': round(done / elapsed, 2) if elapsed else None,
+    }
+
+
+class BroadcastEngine:
+    def __init__(self, client, workers=BROADCAST_WORKERS, rate=BROADCAST_RATE):
+        self.client = client
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self._running = {}
+
+    async def submit(self, created_by, target, recipients, text, source_message=None, pin=False, status_message=None):
+        """Persist a job for `recipients` and start sending it; returns the job id."""
+        source_chat_id = getattr(source_message, 'chat_id', None) if source_message is not None else None
+        source_msg_id = getattr(source_message, 'id', None) if source_message is not None else None
+        status_chat_id = getattr(status_message, 'chat_id', None) if status_message is not None else None
+        status_msg_id = getattr(status_message, 'id', None) if status_message is not None else None
+        job_id = await db_write(_create_job, created_by, target, list(dict.fromkeys(recipients)), text,
+                                source_chat_id, source_msg_id, pin, status_chat_id, status_msg_id)
+        self.start(job_id)
+        return job_id
+
+    def start(self, job_id):
+        task = self._running.get(job_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._run(job_id))
+            self._running[job_id] = task
+        return task
+
+    async def resume(self):
+        """Restart jobs left queued/running by a previous process."""
+        rows = await fetch_all("SELECT id FROM broadcast_jobs WHERE status IN ('queued', 'running') ORDER BY id")
+        for (job_id,) in rows:
+            self.start(job_id)
+        return len(rows)
+
+    async def _send_one(self, uid, text, media, pin):
+        attempts = 0
+        flood_retries = 0
+        while True:
+            attempts += 1
+            await self.bucket.acquire()
+            try:
+                if media is not None:
+                    sent = await self.client.send_file(uid, media, caption=text or None)
+                else:
+                    sent = await self.client.send_message(uid, text)
+                if pin and sent:
+                    await self.bucket.acquire()
+                    try:
+                        await self.client.pin_message(uid, sent, notify=False)
+                    except Exception:
+                        pass
+                return 'sent', None, attempts
+            except Exception as e:
+                wait = _flood_wait_seconds(e)
+                if wait is not None:
+                    self.bucket.pause(wait + 1)
+                    flood_retries += 1
+                    attempts -= 1
+                    if flood_retries <= MAX_FLOOD_RETRIES:
+                        continue
+                elif attempts < MAX_ATTEMPTS and type(e).__name__ not in PERMANENT_ERRORS:
+                    await asyncio.sleep(attempts)
+                    continue
+                return 'failed', f"{type(e).__name__}: {e}"[:200], attempts
+
+    async def _edit_status(self, job, text, final=False):
+        if not job.get('status_chat_id') or not job.get('status_msg_id'):
+            return
+        try:
+            from telethon import Button
+            buttons = [[Button.inline("🏠 منوی اصلی", b"main_menu")]] if final else None
+            await self.client.edit_message(job['status_chat_id'], job['status_msg_id'], text, buttons=buttons)
+        except Exception:
+            pass
+
+    async def _run(self, job_id):
+        job = await db_read(_load_job, job_id)
+        if job is None or job['status'] in ('done', 'failed'):
+            return
+        media = None
+        if job['source_chat_id'] and job['source_msg_id']:
+            try:
+                msg = await self.client.get_messages(job['source_chat_id'], ids=job['source_msg_id'])
+                media = getattr(msg, 'media', None)
+            except Exception:
+                media = None
+        text = job['text'] or ''
+        if media is None and not text.strip():
+            await db_write(_set_job_status, job_id, 'failed')
+            await self._edit_status(job, "❌ ارسال همگانی لغو شد: محتوای پیام در دسترس نیست.", final=True)
+            return
+        await db_write(_set_job_status, job_id, 'running')
+
+        total = job['total']
+        counts = {'sent': job['sent'], 'failed': job['failed']}
+        results = []
+        queue = asyncio.Queue(maxsize=self.workers * 4)
+        started = time.monotonic()
+        done_before = counts['sent'] + counts['failed']
+
+        async def produce():
+            after = 0
+            try:
+                while True:
+                    batch = await db_read(_pending_batch, job_id, after, BATCH_SIZE)
+                    if not batch:
+                        break
+                    for uid in batch:
+                        await queue.put(uid)
+                    after = batch[-1]
+            finally:
+                for _ in range(self.workers):
+                    await queue.put(None)
+
+        async def work():
+            while True:
+                uid = await queue.get()
+                if uid is None:
+                    return
+                status, error, attempts = await self._send_one(uid, text, media, job['pin'])
+                counts[status] += 1
+                results.append((uid, status, error, attempts, int(time.time()) if status == 'sent' else None))
+
+        def progress_text():
+            rate = (counts['sent'] + counts['failed'] - done_before) / max(0.001, time.monotonic() - started)
+            return (f"📤 ارسال به {total} کاربر...\n✅ ارسال شده: {counts['sent']}\n❌ خطا: {counts['failed']}\n"
+                    f"⚡ {rate:.1f} پیام/ثانیه")
+
+        async def flush():
+            if results:
+                batch = results[:]
+                del results[:len(batch)]
+                await db_write(_write_results, job_id, batch)
+
+        async def report():
+            last_progress = 0.0
+            while True:
+                await asyncio.sleep(FLUSH_INTERVAL)
                 try:
-                    await event.reply("❌ امکان ارسال پیام همگانی در این لحظه وجود ندارد. لطفاً بعداً تلاش کنید.")
-                except:
+                    await flush()
+                except Exception:
                     pass
-                return
-            data = get_user_data(user_states, user_id)
-            target = data["target"]
-
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            if target == "all":
-                c.execute("SELECT user_id FROM users")
-            elif target == "approved":
-                c.execute("SELECT user_id FROM users WHERE status = 'approved'")
-            elif target == "rejected":
-                c.execute("SELECT user_id FROM users WHERE status = 'rejected'")
-            recipients = [row[0] for row in c.fetchall()]
-            conn.close()
-
-            if not recipients:
-                await event.reply("📭 هیچ کاربری در این گروه وجود ندارد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-                clear_user_state(user_states, user_id)
-                return
-
-            should_pin = False
-            text = sanitize_text(event.message.text or "")
-            if text.endswith("#پین"):
-                should_pin = True
-                text = text[:-4].strip()
-
-            total = len(recipients)
-            sent_count = 0
-            failed_count = 0
-
-            status_msg = await event.reply(f"📤 در حال ارسال به {total} کاربر...")
-
-            for i, uid in enumerate(recipients, 1):
-                try:
-                    if event.message.file:
-                        sent_msg = await client.send_file(uid, event.message.file, caption=text or None)
-                    else:
-                        sent_msg = await client.send_message(uid, text)
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    await self._edit_status(job, progress_text())
 
-                    if should_pin:
-                        await client.pin_message(uid, sent_msg, notify=False)
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(self.workers)))
+        except Exception as e:
+            # leave the job 'running'; resume() picks up what is still pending
+            try:
+                from log_helper import console_log
+                console_log(f"broadcast job #{job_id} interrupted: {e}", f"ارسال همگانی #{job_id} متوقف شد: {e}")
+            except Exception:
+                pass
+            return
+        finally:
+            reporter.cancel()
+            try:
+                await flush()
+            except Exception:
+                pass
+            self._running.pop(job_id, None)
+        await db_write(_set_job_status, job_id, 'done')
 
-                    sent_count += 1
+        elapsed = time.monotonic() - started
+        rate = (counts['sent'] + counts['failed'] - done_before) / elapsed if elapsed > 0 else 0.0
+        summary = (f"✅ ارسال همگانی به پایان رسید.\n\n📬 کل کاربران: {total}\n"
+                   f"✅ دریافت کردند: {counts['sent']}\n❌ ارسال نشد: {counts['failed']}\n"
+                   f"⏱️ {int(elapsed)} ثانیه — {rate:.1f} پیام/ثانیه")
+        await self._edit_status(job, summary, final=True)
+        try:
+            from log_helper import console_log
+            console_log(f"broadcast job #{job_id} done: sent={counts['sent']} failed={counts['failed']} in {elapsed:.1f}s ({rate:.1f}/s)",
+                        f"ارسال همگانی #{job_id} تمام شد: موفق={counts['sent']} ناموفق={counts['failed']} در {elapsed:.1f} ثانیه ({rate:.1f}/ثانیه)")
+        except Exception:
+            pass
 
-                    if i % 10 == 0 or i == total:
-                        await status_msg.edit(f"📤 ارسال به {total} کاربر...\n✅ ارسال شده: {sent_count}\n❌ خطا: {failed_count}")
 
-                except Exception as e:
-                    failed_count += 1
-                    print(f"Failed to send to {uid}: {str(e)}")
-                    continue
+_engines = {}
 
-            clear_user_state(user_states, user_id)
-            summary = f"✅ ارسال همگانی به پایان رسید.\n\n" \
-                      f"📬 کل کاربران: {total}\n" \
-                      f"✅ دریافت کردند: {sent_count}\n" \
-                      f"❌ ارسال نشد: {failed_count}"
 
-            await status_msg.edit(summary, buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
\ No newline at end of file
+def get_engine(client):
+    engine = _engines.get(id(client))
+    if engine is None:
+        engine = BroadcastEngine(client)
+        _engines[id(client)] = engine
+    return engine
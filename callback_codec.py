@@ -0,0 +1,154 @@
+# ---------------------------------------------------------------------------
+# Binary callback data
+# Callback data used to be text like "admin_toggle_single_reg_event_123",
+# found by a chain of startswith() tests and then taken apart with
+# split("_"). Buttons built with cb() carry
+#
+#     0xFF <opcode> <arg> <arg> ...
+#
+# instead. 0xFF never starts UTF-8 text, so binary data can't be mistaken for
+# the text callbacks that remain. The opcode byte picks the handler from the
+# router's table (router.op) and OPS lists the argument kinds, so decoding and
+# dispatch are a few dictionary lookups whatever the number of callbacks.
+# Every argument is one varint:
+#   'i'  integer, zigzag-encoded so a negative value stays short
+#   'c'  database.fetch_page cursor ('a<key>', 'b<key>', or None for page one)
+# An id below 2**20 takes 3 bytes, so there is plenty of room under Telegram's
+# 64-byte limit for several arguments.
+#
+# Opcodes live on in keyboards that were already sent: never renumber or reuse
+# one, only append.
+# ---------------------------------------------------------------------------
+MARK = 0xFF
+MAX_DATA = 64  # Telegram's limit for callback data
+
+# name -> (opcode, argument kinds)
+OPS = {
+    # events list and the per-event editor
+    'manage_events': (0x01, 'c'),
+    'edit_event': (0x02, 'i'),
+    'toggle_main_edit': (0x03, 'i'),
+    'edit_title': (0x04, 'i'),
+    'edit_desc': (0x05, 'i'),
+    'edit_cost': (0x06, 'i'),
+    'edit_card': (0x07, 'i'),
+    'edit_poster': (0x08, 'i'),
+    'set_capacity': (0x09, 'i'),
+    'toggle_event': (0x0A, 'i'),
+    'set_deadline': (0x0B, 'i'),
+    'confirm_clear_deadline': (0x0C, 'i'),
+    'clear_deadline': (0x0D, 'i'),
+    'set_report': (0x0E, 'i'),
+    'manage_reports': (0x0F, 'i'),
+    'manage_event_regs': (0x10, 'ic'),
+    'toggle_single_reg_event': (0x11, 'i'),
+    'toggle_reminders': (0x12, 'i'),
+    'delete_event': (0x13, 'i'),
+    'confirm_delete_event': (0x14, 'i'),
+    'bulk_approve': (0x15, 'i'),
+    'remind': (0x16, 'i'),
+    'remind_confirm': (0x17, 'i'),
+    'message_approved': (0x18, 'i'),
+    'message_rejected': (0x19, 'i'),
+    # paged admin lists
+    'capacity': (0x1A, 'c'),
+    'stats': (0x1B, 'c'),
+    'stats_event': (0x1C, 'i'),
+    'pending_regs': (0x1D, 'c'),
+    # certificates
+    'cert_events': (0x1E, 'c'),
+    'cert_event_users': (0x1F, 'ic'),
+    'send_cert_to': (0x20, 'ii'),
+}
+
+_KINDS = {}
+for _name, (_code, _kinds) in OPS.items():
+    if _code in _KINDS or not 0 <= _code <= 0xFF:
+        raise ValueError(f"opcode {_code:#x} of {_name!r} is invalid or already used")
+    _KINDS[_code] = _kinds
+
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _unzigzag(z):
+    return z >> 1 if not z & 1 else -((z + 1) >> 1)
+
+
+def _pack_cursor(cursor):
+    cursor = str(cursor or '')
+    if len(cursor) > 1 and cursor[0] in 'ab' and cursor[1:].lstrip('-').isdigit():
+        return 1 + (_zigzag(int(cursor[1:])) << 1) + (cursor[0] == 'b')
+    return 0  # first page, like database._parse_cursor
+
+
+def _unpack_cursor(v):
+    if v == 0:
+        return None
+    v -= 1
+    return f"{'b' if v & 1 else 'a'}{_unzigzag(v >> 1)}"
+
+
+def cb(name, *args):
+    """Callback data for op `name`; trailing cursors may be left out (first page)."""
+    code, kinds = OPS[name]
+    if len(args) > len(kinds) or any(k != 'c' for k in kinds[len(args):]):
+        raise TypeError(f"{name} takes arguments {kinds!r}, got {len(args)}")
+    out = bytearray((MARK, code))
+    for i, kind in enumerate(kinds):
+        v = _pack_cursor(args[i] if i < len(args) else None) if kind == 'c' else _zigzag(int(args[i]))
+        while v > 0x7F:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    if len(out) > MAX_DATA:
+        raise ValueError(f"callback data for {name} is {len(out)} bytes, over Telegram's {MAX_DATA}")
+    return bytes(out)
+
+
+def decode(data):
+    """(opcode, args) for binary callback data; None for text or malformed data."""
+    if len(data) < 2 or data[0] != MARK:
+        return None
+    kinds = _KINDS.get(data[1])
+    if kinds is None:
+        return None
+    args = []
+    pos = 2
+    for kind in kinds:
+        v = shift = 0
+        while True:
+            if pos >= len(data) or shift > 63:
+                return None
+            b = data[pos]
+            pos += 1
+            v |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        args.append(_unpack_cursor(v) if kind == 'c' else _unzigzag(v))
+    if pos != len(data):
+        return None
+    return data[1], args
+
+
+def parse_text(kinds, text):
+    """Arguments from the '_'-separated tail of a text callback; None if it doesn't fit `kinds`.
+
+    Trailing cursors may be missing, as in "admin_manage_event_regs_12".
+    """
+    parts = text.split('_') if text else []
+    if len(parts) > len(kinds) or any(k != 'c' for k in kinds[len(parts):]):
+        return None
+    args = []
+    for kind, part in zip(kinds, parts):
+        if kind == 'c':
+            args.append(part or None)
+            continue
+        try:
+            args.append(int(part))
+        except ValueError:
+            return None
+    args.extend(None for _ in kinds[len(parts):])
+    return args
@@ -1,6 +1,11 @@
 
 import sqlite3
 import os
+import threading
+import asyncio
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 DB_NAME = os.getenv('JURISLAW_DB', "jurislaw_bot.db")
 try:
     OWNER_ID = int(os.getenv('OWNER_ID', '7702648742'))
@@ -9,7 +14,8 @@ except Exception:
 
 def init_db(db_path=None):
     """Initialize the database. Use db_path to override default DB file.
-    This sets safer pragmas and creates audit tables for admin actions and send errors.
+    Only migrations newer than the file's PRAGMA user_version are applied, all
+    in one transaction, so starting against an up-to-date database is a single read.
     """
     if db_path:
         path = db_path
@@ -21,14 +27,65 @@ def init_db(db_path=None):
     except Exception:
         pass
     conn = sqlite3.connect(path, isolation_level=None)
-    c = conn.cursor()
     try:
-        c.execute("PRAGMA journal_mode=WAL")
-        c.execute("PRAGMA synchronous=NORMAL")
-        c.execute("PRAGMA foreign_keys=ON")
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        if current < SCHEMA_VERSION:
+            migrate(conn)
+    finally:
+        conn.close()
+    try:
+        os.chmod(path, 0o600)
     except Exception:
         pass
 
+    try:
+        from log_helper import console_log
+        console_log(f"✅ database '{path}' successfully created.", f"✅ دیتابیس '{path}' با موفقیت ساخته شد.")
+    except Exception:
+        print(f"✅ database '{path}' successfully created.")
+
+
+# ---------------------------------------------------------------------------
+# Schema migrations
+# MIGRATIONS is an ordered list of (version, fn(cursor)). init_db compares the
+# highest version with PRAGMA user_version and, if the file is behind, runs
+# the missing steps and bumps user_version inside one transaction -- a crash
+# half way leaves the previous schema intact. Schema changes go in a new step
+# at the end; never edit a step that has shipped.
+# ---------------------------------------------------------------------------
+def _add_column(c, table, column, decl):
+    cols = [r[1] for r in c.execute(f"PRAGMA table_info({table})")]
+    if column not in cols:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# tables whose status column is compared in WHERE clauses; values are stored
+# lower-cased and trimmed so `status = 'pending'` matches and can use an index
+STATUS_TABLES = ('registrations', 'memberships', 'ideas', 'collaborations', 'donations', 'tickets')
+
+SECONDARY_INDEXES = (
+    # capacity checks, per-event lists/exports, pending queue, bulk approve
+    "CREATE INDEX IF NOT EXISTS idx_registrations_event_status ON registrations(event_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_registrations_status ON registrations(status)",
+    # active/archived menus (rowid order serves ORDER BY id DESC)
+    "CREATE INDEX IF NOT EXISTS idx_events_active ON events(is_active)",
+    # deadline watcher: range over open events' deadlines; archived/undated rows aren't indexed
+    "CREATE INDEX IF NOT EXISTS idx_events_deadline ON events(is_active, end_at_ts) WHERE end_at_ts IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_memberships_status ON memberships(status)",
+    "CREATE INDEX IF NOT EXISTS idx_ideas_status ON ideas(status)",
+    "CREATE INDEX IF NOT EXISTS idx_collaborations_status ON collaborations(status)",
+    "CREATE INDEX IF NOT EXISTS idx_donations_status ON donations(status)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_certificates_user ON certificates(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_certificates_event ON certificates(event_id)",
+    "CREATE INDEX IF NOT EXISTS idx_resources_event ON resources(event_id)",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_event ON attendance(event_id)",
+)
+
+
+def _schema_v1(c):
+    """Baseline: every table, column, trigger and index init_db used to (re)create on each start."""
     c.execute('''CREATE TABLE IF NOT EXISTS users (
         user_id INTEGER PRIMARY KEY,
         full_name TEXT,
@@ -117,6 +174,69 @@ def init_db(db_path=None):
         value TEXT
     )''')
 
+    # broadcast jobs and their per-recipient delivery status (broadcast_manager.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_by INTEGER,
+        target TEXT,
+        text TEXT,
+        source_chat_id INTEGER,
+        source_msg_id INTEGER,
+        pin INTEGER DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        total INTEGER DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        status_chat_id INTEGER,
+        status_msg_id INTEGER,
+        created_at INTEGER DEFAULT (strftime('%s','now')),
+        started_at INTEGER,
+        finished_at INTEGER
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS broadcast_recipients (
+        job_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        error TEXT,
+        sent_at INTEGER,
+        PRIMARY KEY (job_id, user_id)
+    ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)")
+
+    # Telegram handles of already-uploaded files, by content hash (media_cache.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS media_handles (
+        content_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        media_id INTEGER NOT NULL,
+        access_hash INTEGER NOT NULL,
+        file_reference BLOB,
+        created_at INTEGER DEFAULT (strftime('%s','now'))
+    )''')
+
+    # conversation state per user (state_store.SQLiteStateStore); data is JSON
+    c.execute('''CREATE TABLE IF NOT EXISTS user_states (
+        user_id INTEGER PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at INTEGER NOT NULL
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_states_updated ON user_states(updated_at)")
+
+    # bumped by triggers on every settings change so cached copies (settings_cache.py)
+    # in any process can tell they are stale with a single-row read
+    c.execute('''CREATE TABLE IF NOT EXISTS settings_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute("INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)")
+    for op in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS settings_version_{op.lower()}
+            AFTER {op} ON settings
+            BEGIN
+                UPDATE settings_version SET version = version + 1 WHERE id = 1;
+            END''')
+
     c.execute('''CREATE TABLE IF NOT EXISTS attendance (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         event_id INTEGER NOT NULL,
@@ -124,75 +244,27 @@ def init_db(db_path=None):
         checked_at TEXT DEFAULT (datetime('now', 'localtime'))
     )''')
 
-    try:
-        c.execute("ALTER TABLE admins ADD COLUMN role TEXT DEFAULT 'admin'")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'fa'")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN capacity INTEGER")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN reminders_enabled INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN end_at_ts INTEGER")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN end_set_by INTEGER")
-    except Exception:
-        pass
+    _add_column(c, 'admins', 'role', "TEXT DEFAULT 'admin'")
+    _add_column(c, 'users', 'language', "TEXT DEFAULT 'fa'")
+    _add_column(c, 'events', 'capacity', "INTEGER")
+    _add_column(c, 'events', 'reminders_enabled', "INTEGER DEFAULT 0")
+    _add_column(c, 'events', 'end_at_ts', "INTEGER")
+    _add_column(c, 'events', 'end_set_by', "INTEGER")
     # certificate issuance fields for free events
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN cert_fee INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN cert_card_number TEXT")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN cert_card_holder TEXT")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN cert_fee_student INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN cert_fee_non_student INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN single_registration INTEGER DEFAULT 1")
-    except Exception:
-        pass
+    _add_column(c, 'events', 'cert_fee', "INTEGER DEFAULT 0")
+    _add_column(c, 'events', 'cert_card_number', "TEXT")
+    _add_column(c, 'events', 'cert_card_holder', "TEXT")
+    _add_column(c, 'events', 'cert_fee_student', "INTEGER DEFAULT 0")
+    _add_column(c, 'events', 'cert_fee_non_student', "INTEGER DEFAULT 0")
+    _add_column(c, 'events', 'single_registration', "INTEGER DEFAULT 1")
     try:
         c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reg_unique ON registrations(user_id, event_id)")
     except Exception:
         pass
-    try:
-        c.execute("ALTER TABLE registrations ADD COLUMN reminder_opt_in INTEGER DEFAULT 1")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE registrations ADD COLUMN reminder_intervals TEXT")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN reminder_recipients TEXT DEFAULT 'pending,approved'")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE events ADD COLUMN reminder_intervals TEXT DEFAULT '24h,2h'")
-    except Exception:
-        pass
+    _add_column(c, 'registrations', 'reminder_opt_in', "INTEGER DEFAULT 1")
+    _add_column(c, 'registrations', 'reminder_intervals', "TEXT")
+    _add_column(c, 'events', 'reminder_recipients', "TEXT DEFAULT 'pending,approved'")
+    _add_column(c, 'events', 'reminder_intervals', "TEXT DEFAULT '24h,2h'")
     try:
         c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_att_unique ON attendance(user_id, event_id)")
     except Exception:
@@ -209,20 +281,7 @@ def init_db(db_path=None):
     except Exception:
         pass
 
-    try:
-        c.execute("PRAGMA table_info(admins)")
-        cols = [r[1] for r in c.fetchall()]
-        if 'role' not in cols:
-            try:
-                c.execute("ALTER TABLE admins ADD COLUMN role TEXT DEFAULT 'admin'")
-            except Exception:
-                pass
-        c.execute("INSERT OR IGNORE INTO admins (user_id, added_by, role) VALUES (?, ?, 'owner')", (OWNER_ID, OWNER_ID))
-    except Exception:
-        try:
-            c.execute("INSERT OR IGNORE INTO admins (user_id, added_by) VALUES (?, ?)", (OWNER_ID, OWNER_ID))
-        except Exception:
-            pass
+    c.execute("INSERT OR IGNORE INTO admins (user_id, added_by, role) VALUES (?, ?, 'owner')", (OWNER_ID, OWNER_ID))
 
     # Membership requests table
     try:
@@ -284,44 +343,17 @@ def init_db(db_path=None):
     except Exception:
         pass
     # Ensure admin metadata columns exist on submission tables
-    try:
-        c.execute("ALTER TABLE ideas ADD COLUMN admin_note TEXT")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE ideas ADD COLUMN processed_by INTEGER")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE ideas ADD COLUMN processed_at TEXT")
-    except Exception:
-        pass
+    _add_column(c, 'ideas', 'admin_note', "TEXT")
+    _add_column(c, 'ideas', 'processed_by', "INTEGER")
+    _add_column(c, 'ideas', 'processed_at', "TEXT")
 
-    try:
-        c.execute("ALTER TABLE collaborations ADD COLUMN admin_note TEXT")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE collaborations ADD COLUMN processed_by INTEGER")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE collaborations ADD COLUMN processed_at TEXT")
-    except Exception:
-        pass
+    _add_column(c, 'collaborations', 'admin_note', "TEXT")
+    _add_column(c, 'collaborations', 'processed_by', "INTEGER")
+    _add_column(c, 'collaborations', 'processed_at', "TEXT")
 
-    try:
-        c.execute("ALTER TABLE donations ADD COLUMN admin_note TEXT")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE donations ADD COLUMN processed_by INTEGER")
-    except Exception:
-        pass
-    try:
-        c.execute("ALTER TABLE donations ADD COLUMN processed_at TEXT")
-    except Exception:
-        pass
+    _add_column(c, 'donations', 'admin_note', "TEXT")
+    _add_column(c, 'donations', 'processed_by', "INTEGER")
+    _add_column(c, 'donations', 'processed_at', "TEXT")
 
     # central admin actions audit table
     try:
@@ -336,21 +368,561 @@ def init_db(db_path=None):
         )''')
     except Exception:
         pass
-    conn.commit()
-    try:
-        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('notify_new_registration','1')")
-        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('notify_new_ticket','1')")
-        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('notify_new_membership','1')")
-    except Exception:
-        pass
-    conn.close()
-    try:
-        os.chmod(path, 0o600)
-    except Exception:
-        pass
 
-    try:
-        from log_helper import console_log
-        console_log(f"✅ database '{path}' successfully created.", f"✅ دیتابیس '{path}' با موفقیت ساخته شد.")
+    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('notify_new_registration','1')")
+    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('notify_new_ticket','1')")
+    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('notify_new_membership','1')")
+
+    for table in STATUS_TABLES:
+        c.execute(f"UPDATE {table} SET status = LOWER(TRIM(status)) WHERE status IS NOT LOWER(TRIM(status))")
+        for op, when in (('INSERT', 'INSERT'), ('UPDATE', 'UPDATE OF status')):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_status_normalize_{op.lower()}
+                AFTER {when} ON {table}
+                WHEN NEW.status IS NOT LOWER(TRIM(NEW.status))
+                BEGIN
+                    UPDATE {table} SET status = LOWER(TRIM(NEW.status)) WHERE id = NEW.id;
+                END''')
+    for sql in SECONDARY_INDEXES:
+        c.execute(sql)
+
+
+# admin menu badges: counter name -> (table, status counted)
+BADGE_COUNTERS = (
+    ('registrations_pending', 'registrations', 'pending'),
+    ('memberships_pending', 'memberships', 'pending'),
+    ('ideas_pending', 'ideas', 'pending'),
+    ('collaborations_pending', 'collaborations', 'pending'),
+    ('donations_pending', 'donations', 'pending'),
+    ('tickets_open', 'tickets', 'open'),
+)
+
+
+def _schema_v2(c):
+    """Badge counters kept current by triggers, so the admin menu reads one small table instead of six COUNT(*)s."""
+    c.execute('''CREATE TABLE IF NOT EXISTS badge_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    for name, table, status in BADGE_COUNTERS:
+        c.execute(f"INSERT OR REPLACE INTO badge_counters (name, value) SELECT ?, COUNT(*) FROM {table} WHERE status = ?",
+                  (name, status))
+        # status normalisation happens in a nested UPDATE, which the update trigger sees
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table}
+            WHEN NEW.status IS '{status}'
+            BEGIN
+                UPDATE badge_counters SET value = value + 1 WHERE name = '{name}';
+            END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table}
+            WHEN OLD.status IS '{status}'
+            BEGIN
+                UPDATE badge_counters SET value = value - 1 WHERE name = '{name}';
+            END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF status ON {table}
+            WHEN (OLD.status IS '{status}') != (NEW.status IS '{status}')
+            BEGIN
+                UPDATE badge_counters SET value = value + (NEW.status IS '{status}') - (OLD.status IS '{status}')
+                WHERE name = '{name}';
+            END''')
+
+
+# table -> row events that bump its table_versions entry (menu_cache.py keys rendered keyboards on these)
+VERSIONED_TABLES = (
+    ('events', ('INSERT', 'DELETE', 'UPDATE OF title, is_active')),
+    ('faqs', ('INSERT', 'DELETE')),
+    ('certificates', ('INSERT', 'DELETE')),
+)
+
+
+def _schema_v3(c):
+    """Per-table change counters, bumped by triggers, for caches derived from table contents."""
+    c.execute('''CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    for table, ops in VERSIONED_TABLES:
+        c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+        for op in ops:
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{op.split()[0].lower()}
+                AFTER {op} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END''')
+
+
+def _schema_v4(c):
+    """Per-event registration lists are paged by id; (event_id) keeps them in rowid order."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_registrations_event ON registrations(event_id)")
+
+
+def _schema_v5(c):
+    """reminders_sent is the reminder engine's idempotency record: one row per (event, user, interval)."""
+    c.execute('''DELETE FROM reminders_sent WHERE id NOT IN (
+        SELECT MIN(id) FROM reminders_sent GROUP BY event_id, user_id, reminder_type)''')
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_sent_unique ON reminders_sent(event_id, user_id, reminder_type)")
+
+
+# tables read by admin exports (export_engine.DATASETS.depends); a sent export
+# file is re-used until one of these counters moves
+EXPORT_VERSIONED_TABLES = (
+    ('memberships', ('INSERT', 'DELETE', 'UPDATE')),
+    ('ideas', ('INSERT', 'DELETE', 'UPDATE')),
+    ('collaborations', ('INSERT', 'DELETE', 'UPDATE')),
+    ('donations', ('INSERT', 'DELETE', 'UPDATE')),
+    ('tickets', ('INSERT', 'DELETE', 'UPDATE')),
+    ('registrations', ('INSERT', 'DELETE', 'UPDATE OF event_id, user_id, status')),
+    ('users', ('INSERT', 'DELETE', 'UPDATE OF full_name, national_id, phone')),
+)
+
+
+def _schema_v6(c):
+    """Change counters for the exported tables, and the Telegram handle of the last file sent per export."""
+    for table, ops in EXPORT_VERSIONED_TABLES:
+        c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+        for op in ops:
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{op.split()[0].lower()}
+                AFTER {op} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END''')
+    c.execute('''CREATE TABLE IF NOT EXISTS export_files (
+        cache_key TEXT PRIMARY KEY,
+        versions TEXT NOT NULL,
+        file_kind TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        media_id INTEGER NOT NULL,
+        access_hash INTEGER NOT NULL,
+        file_reference BLOB,
+        created_at INTEGER DEFAULT (strftime('%s','now'))
+    )''')
+
+
+# table -> column holding an upload path; triggers keep blobs.refcount in step with them (upload_store.py)
+BLOB_REFERENCES = (
+    ('registrations', 'payment_receipt_file_id'),
+    ('memberships', 'student_card_file'),
+    ('certificates', 'file_id'),
+    ('resources', 'file_path'),
+    ('events', 'poster_file_id'),
+    ('ideas', 'file_path'),
+    ('collaborations', 'file_path'),
+    ('donations', 'receipt_file'),
+)
+
+
+def _schema_v7(c):
+    """Upload store index: one row per stored file, reference-counted by triggers on the columns above."""
+    c.execute('''CREATE TABLE IF NOT EXISTS blobs (
+        path TEXT PRIMARY KEY,
+        digest TEXT,
+        size INTEGER,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        collect_after INTEGER,
+        created_at INTEGER DEFAULT (strftime('%s','now'))
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_blobs_collectable ON blobs(collect_after) WHERE refcount <= 0")
+    # files uploaded before the store keep their flat names; index those still on disk so
+    # they are counted and collected like the rest
+    uploads = os.path.abspath('uploads') + os.sep
+    for table, column in BLOB_REFERENCES:
+        for (path,) in c.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL").fetchall():
+            if os.path.abspath(str(path)).startswith(uploads) and os.path.isfile(path):
+                c.execute("INSERT OR IGNORE INTO blobs (path, size) VALUES (?, ?)", (path, os.path.getsize(path)))
+    for table, column in BLOB_REFERENCES:
+        c.execute(f"UPDATE blobs SET refcount = refcount + (SELECT COUNT(*) FROM {table} WHERE {column} = blobs.path)")
+    _create_blob_triggers(c)
+
+
+def _create_blob_triggers(c):
+    # collect_after only matters once refcount is back at 0. A count dropping to 0
+    # keeps a later deadline already set, i.e. the grace period upload_store gave a
+    # fresh put of the same content that nothing references yet.
+    for table, column in BLOB_REFERENCES:
+        for event in ('insert', 'delete', 'update'):
+            c.execute(f"DROP TRIGGER IF EXISTS {table}_blob_{event}")
+        c.execute(f'''CREATE TRIGGER {table}_blob_insert AFTER INSERT ON {table}
+            WHEN NEW.{column} IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE path = NEW.{column};
+            END''')
+        c.execute(f'''CREATE TRIGGER {table}_blob_delete AFTER DELETE ON {table}
+            WHEN OLD.{column} IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1,
+                    collect_after = CASE WHEN refcount <= 1 THEN MAX(COALESCE(collect_after, 0), CAST(strftime('%s','now') AS INTEGER)) END
+                WHERE path = OLD.{column};
+            END''')
+        c.execute(f'''CREATE TRIGGER {table}_blob_update AFTER UPDATE OF {column} ON {table}
+            WHEN OLD.{column} IS NOT NEW.{column}
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1,
+                    collect_after = CASE WHEN refcount <= 1 THEN MAX(COALESCE(collect_after, 0), CAST(strftime('%s','now') AS INTEGER)) END
+                WHERE path = OLD.{column};
+                UPDATE blobs SET refcount = refcount + 1 WHERE path = NEW.{column};
+            END''')
+
+
+def _schema_v8(c):
+    """Blob triggers that keep a pending grace period when a refcount drops to 0."""
+    _create_blob_triggers(c)
+
+MIGRATIONS = [
+    (1, _schema_v1),
+    (2, _schema_v2),
+    (3, _schema_v3),
+    (4, _schema_v4),
+    (5, _schema_v5),
+    (6, _schema_v6),
+    (7, _schema_v7),
+    (8, _schema_v8),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn):
+    """Apply pending migrations to an open autocommit connection; returns the new version."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # re-read under the write lock in case another process just migrated
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        c = conn.cursor()
+        for version, step in MIGRATIONS:
+            if version > current:
+                step(c)
+                current = version
+        c.execute(f"PRAGMA user_version = {current}")
+        conn.execute("COMMIT")
+    except Exception as e:
+        conn.execute("ROLLBACK")
+        try:
+            from log_helper import console_log
+            console_log(f"❌ schema migration failed: {e}", f"❌ مهاجرت ساختار دیتابیس ناموفق بود: {e}")
+        except Exception:
+            print(f"❌ schema migration failed: {e}")
+        raise
+    return current
+
+
+# ---------------------------------------------------------------------------
+# Shared connection pool
+# Handlers used to open a fresh sqlite3 connection for every query; instead we
+# keep a few long-lived, pragma-configured connections per database file and
+# lend them out. get_connection() returns a proxy whose close() hands the
+# connection back to the pool, so it can be used both as a drop-in replacement
+# for sqlite3.connect(DB_NAME) and as a context manager:
+#
+#     with get_connection() as conn:
+#         conn.execute(...)
+#
+# Leaving the with-block commits (or rolls back on error) and releases it.
+# ---------------------------------------------------------------------------
+try:
+    POOL_SIZE = max(1, int(os.getenv('JURISLAW_DB_POOL_SIZE', '4')))
+except Exception:
+    POOL_SIZE = 4
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=67108864",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    c = conn.cursor()
+    for pragma in CONNECTION_PRAGMAS:
+        try:
+            c.execute(pragma)
+        except Exception:
+            pass
+    c.close()
+    return conn
+
+
+class ConnectionPool:
+    """A small LIFO pool of sqlite3 connections for one database file.
+    When the pool is empty a new connection is opened (never blocks); on release
+    connections beyond `size` are closed instead of kept.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _open_connection(self.path)
+
+    def release(self, conn):
+        try:
+            # same semantics as closing a plain connection: uncommitted work is dropped
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class PooledConnection:
+    """Proxy around a borrowed connection; close() returns it to its pool."""
+
+    __slots__ = ('_conn', '_pool')
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        if name in PooledConnection.__slots__:
+            raise AttributeError(name)
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+        return False
+
+    def __del__(self):
+        # connections leaked on an exception path still find their way back
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=None):
+    path = db_path or DB_NAME
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path)
+                _pools[path] = pool
+    return pool
+
+
+def get_connection(db_path=None):
+    """Borrow a pooled connection (see the pool notes above)."""
+    pool = get_pool(db_path)
+    return PooledConnection(pool.acquire(), pool)
+
+
+def close_all_connections():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+# ---------------------------------------------------------------------------
+# Async facade
+# Handlers must not run SQLite (or other blocking) work on the event loop.
+# Writes go through a single dedicated writer thread, so they are serialized
+# and never fight each other for the WAL lock; reads are spread over a small
+# reader pool. fn receives a pooled connection:
+#
+#     rows = await db_read(lambda conn: conn.execute(sql, args).fetchall())
+#     await db_write(_approve, reg_id)      # committed after fn returns
+#
+# fetch_one/fetch_all/execute/insert cover the common single-statement cases
+# and run_blocking() is for file-system or CPU work (exports, os.walk...).
+# In-memory caches that must follow the bot's own writes register an on_write()
+# hook; it runs on the writer thread right after each commit.
+# ---------------------------------------------------------------------------
+try:
+    DB_READ_WORKERS = max(1, int(os.getenv('JURISLAW_DB_READERS', '4')))
+except Exception:
+    DB_READ_WORKERS = 4
+
+_executors = {}
+_executors_lock = threading.Lock()
+_write_hooks = []
+
+
+def on_write(hook):
+    """Register hook(conn) to run on the writer thread after every committed db_write."""
+    _write_hooks.append(hook)
+    return hook
+
+
+def _get_executor(kind):
+    ex = _executors.get(kind)
+    if ex is None:
+        with _executors_lock:
+            ex = _executors.get(kind)
+            if ex is None:
+                if kind == 'write':
+                    ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+                elif kind == 'read':
+                    ex = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix='db-reader')
+                else:
+                    ex = ThreadPoolExecutor(max_workers=2, thread_name_prefix='blocking')
+                _executors[kind] = ex
+    return ex
+
+
+def _call_with_connection(fn, args, kwargs, write):
+    conn = get_connection()
+    try:
+        result = fn(conn, *args, **kwargs)
+        if write:
+            conn.commit()
+            for hook in _write_hooks:
+                try:
+                    hook(conn)
+                except Exception:
+                    pass
+        return result
     except Exception:
-        print(f"✅ database '{path}' successfully created.")
\ No newline at end of file
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        conn.close()
+
+
+async def db_read(fn, *args, **kwargs):
+    """Run fn(conn, *args, **kwargs) on a reader thread and return its result."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_call_with_connection, fn, args, kwargs, False)
+    return await loop.run_in_executor(_get_executor('read'), call)
+
+
+async def db_write(fn, *args, **kwargs):
+    """Run fn(conn, *args, **kwargs) on the writer thread and commit."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_call_with_connection, fn, args, kwargs, True)
+    return await loop.run_in_executor(_get_executor('write'), call)
+
+
+async def fetch_one(sql, params=()):
+    return await db_read(lambda conn: conn.execute(sql, params).fetchone())
+
+
+async def fetch_all(sql, params=()):
+    return await db_read(lambda conn: conn.execute(sql, params).fetchall())
+
+
+Page = namedtuple('Page', 'rows prev next')
+
+
+def _parse_cursor(cursor):
+    cursor = str(cursor or '')
+    if len(cursor) > 1 and cursor[0] in 'ab' and cursor[1:].lstrip('-').isdigit():
+        return cursor[0], int(cursor[1:])
+    # first page; also covers the old numeric page numbers in already-sent keyboards
+    return None, None
+
+
+def _fetch_page(conn, select, where, params, cursor, per_page, key):
+    direction, boundary = _parse_cursor(cursor)
+    clauses = [f"({where})"] if where else []
+    args = list(params)
+    if direction == 'a':
+        clauses.append(f"{key} < ?")
+        args.append(boundary)
+    elif direction == 'b':
+        clauses.append(f"{key} > ?")
+        args.append(boundary)
+    order = 'ASC' if direction == 'b' else 'DESC'
+    sql = select + (" WHERE " + " AND ".join(clauses) if clauses else "") + f" ORDER BY {key} {order} LIMIT ?"
+    rows = conn.execute(sql, args + [per_page + 1]).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'b':
+        rows.reverse()
+    if not rows:
+        return Page(rows, None, None)
+    first, last = rows[0][0], rows[-1][0]
+    if direction == 'b':
+        return Page(rows, f"b{first}" if more else None, f"a{last}")
+    return Page(rows, f"b{first}" if direction else None, f"a{last}" if more else None)
+
+
+async def fetch_page(select, where='', params=(), cursor=None, per_page=5, key='id'):
+    """Keyset-paginated read, highest key first.
+
+    select is the query up to (not including) WHERE, and its first column must
+    be the unique key. Returns Page(rows, prev, next); prev/next are short
+    cursors ('b<key>' / 'a<key>', None at either end) meant for callback data,
+    so a page costs one LIMIT per_page+1 index range read however large the
+    table is.
+    """
+    return await db_read(_fetch_page, select, where, tuple(params), cursor, per_page, key)
+
+
+async def execute(sql, params=()):
+    """Run one write statement; returns the affected row count."""
+    return await db_write(lambda conn: conn.execute(sql, params).rowcount)
+
+
+async def insert(sql, params=()):
+    """Run one INSERT; returns lastrowid."""
+    return await db_write(lambda conn: conn.execute(sql, params).lastrowid)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a non-DB blocking callable (file system, export rendering) off the loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor('blocking'), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_executors(wait=True):
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for ex in executors:
+        try:
+            ex.shutdown(wait=wait)
+        except Exception:
+            pass
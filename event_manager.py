@@ -1,45 +1,35 @@
-from telethon import events
-from utils import paginate_buttons, CHANNEL_USERNAME
+from router import get_router
+from utils import paginate_buttons, CHANNEL_USERNAME, get_admin_ids
+import asyncio
 import json
-from database import DB_NAME
-import sqlite3
+import time
+from database import fetch_one, fetch_all, fetch_page, db_write
 
 
 def setup_event_handlers(client, user_states):
+    router = get_router(client, user_states)
 
-    @client.on(events.CallbackQuery)
+    @router.callback(
+        prefixes=("archive_event_page_", "event_page_", "forward_reports_"),
+    )
     async def event_manager_callback(event):
         data = event.data.decode('utf-8')
 
         # Pagination for active events (user side)
         if data.startswith("event_page_"):
-            page = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events WHERE is_active = 1 ORDER BY id DESC")
-            events_list = c.fetchall()
-            conn.close()
-            buttons = paginate_buttons(events_list, "event", page, per_page=5)
+            page = await fetch_page("SELECT id, title FROM events", "is_active = 1", cursor=data.split("_")[-1])
+            buttons = paginate_buttons(page, "event")
             await event.edit("📅 رویدادهای فعال:", buttons=buttons)
 
 
         elif data.startswith("archive_event_page_"):
-            page = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events WHERE is_active = 0 ORDER BY id DESC")
-            events_list = c.fetchall()
-            conn.close()
-            buttons = paginate_buttons(events_list, "archive_event", page, per_page=5)
+            page = await fetch_page("SELECT id, title FROM events", "is_active = 0", cursor=data.split("_")[-1])
+            buttons = paginate_buttons(page, "archive_event")
             await event.edit("🗃 آرشیو رویدادها:", buttons=buttons)
 
         elif data.startswith("forward_reports_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT report_message_ids, report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT report_message_ids, report_payloads FROM events WHERE id = ?", (event_id,))
             msg_ids = row[0] if row else None
             payloads_json = row[1] if row else None
             sent_any = False
@@ -104,3 +94,72 @@ def setup_event_handlers(client, user_states):
                             print(f"Error forwarding report {mid}: {e}")
             if not sent_any:
                 await client.send_message(event.chat_id, "📭 گزارشی برای این رویداد در دسترس نیست.")
+
+
+# ---------------------------------------------------------------------------
+# Registration deadlines
+# Every active event with an end_at_ts has a job in the scheduler, loaded from
+# the idx_events_deadline index at startup and kept current by the admin
+# deadline handlers. Deadlines that fall due together are archived with one
+# UPDATE and reported to each admin in one message.
+# ---------------------------------------------------------------------------
+_deadline_client = None
+
+
+def schedule_event_deadline(event_id, end_at_ts):
+    """(Re)schedule archival of an event at end_at_ts; None cancels it."""
+    from scheduler import get_scheduler
+    from reminder_manager import refresh_event_reminders
+    key = ('event_deadline', int(event_id))
+    if end_at_ts is None:
+        get_scheduler().cancel(key)
+    else:
+        get_scheduler().schedule(key, int(end_at_ts), archive_due_events, int(event_id))
+    # reminders are counted back from the same deadline
+    refresh_event_reminders(event_id)
+
+
+async def load_event_deadlines(client):
+    """Schedule every open event deadline; client is None in dry-run mode. Returns the number scheduled."""
+    global _deadline_client
+    _deadline_client = client
+    rows = await fetch_all("SELECT id, end_at_ts FROM events WHERE is_active = 1 AND end_at_ts IS NOT NULL")
+    for event_id, end_at_ts in rows:
+        schedule_event_deadline(event_id, end_at_ts)
+    return len(rows)
+
+
+def _archive_expired(conn, event_ids, now):
+    marks = ','.join('?' * len(event_ids))
+    # re-check in SQL: the deadline may have been moved or the event archived by hand meanwhile
+    rows = conn.execute(
+        f"SELECT id, title FROM events WHERE id IN ({marks}) AND is_active = 1 AND end_at_ts IS NOT NULL AND end_at_ts <= ?",
+        (*event_ids, now)).fetchall()
+    if rows:
+        conn.execute(f"UPDATE events SET is_active = 0 WHERE id IN ({','.join('?' * len(rows))})", [r[0] for r in rows])
+    return rows
+
+
+async def archive_due_events(event_ids):
+    """Scheduler handler: archive the given events whose deadline has passed and tell the admins."""
+    rows = await db_write(_archive_expired, sorted(set(event_ids)), int(time.time()))
+    if not rows:
+        return
+    titles = [title for _, title in rows]
+    client = _deadline_client
+    if client is None:
+        try:
+            from log_helper import console_log
+            console_log(f"[dry-run] deadline_watcher: archived events: {titles}",
+                        f"[dry-run] deadline_watcher: رویدادهای بایگانی‌شده: {titles}")
+        except Exception:
+            print(f"[dry-run] deadline_watcher: archived events: {titles}")
+        return
+    msg = "\n".join(f"⏱️ مهلت ثبت‌نام رویداد '{title}' تمام شد و به آرشیو منتقل شد." for title in titles)
+
+    async def _notify(aid):
+        try:
+            await client.send_message(aid, msg)
+        except Exception:
+            pass
+    await asyncio.gather(*(_notify(aid) for aid in get_admin_ids()))
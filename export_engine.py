@@ -0,0 +1,545 @@
+import asyncio
+import csv
+import importlib.util
+import itertools
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import BrokenExecutor
+
+import database
+from database import db_read, db_write, fetch_one, get_connection
+from media_cache import STALE_HANDLE_ERRORS, handle_of, input_media
+
+# ---------------------------------------------------------------------------
+# Export engine
+# Every admin export is a Dataset: one SELECT plus the header of each column
+# it returns. export() runs the query on a reader thread and hands the open
+# cursor to the writer for the requested output, so rows stream from SQLite
+# into the file without building the table in memory first.
+#
+# The writer behind each output is picked once, at import, from what is
+# installed: xlsx via xlsxwriter (constant_memory), else openpyxl's
+# write-only workbook, else CSV; docx streamed with lxml, else plain text.
+# Formats, RTL and column widths are set while writing, never by re-reading
+# the finished file.
+#
+# depends lists the tables the query reads; their table_versions counters
+# (database.EXPORT_VERSIONED_TABLES) decide when a sent file is out of date.
+# ---------------------------------------------------------------------------
+Dataset = namedtuple('Dataset', 'title heading file sql headers sheet depends')
+
+DATASETS = {
+    'members': Dataset(
+        'عضویت', 'درخواست‌های عضویت', 'members',
+        "SELECT id, user_id, full_name, major, entry_year, student_number, national_id, phone, telegram_username, student_card_file, status, created_at FROM memberships ORDER BY id DESC",
+        ("شماره", "آیدی کاربر", "نام و نام خانوادگی", "رشته", "سال ورود", "شماره دانشجویی", "کد ملی", "تلفن", "آیدی تلگرام", "فایل کارت دانشجویی", "وضعیت", "تاریخ"),
+        None, ('memberships',)),
+    'ideas': Dataset(
+        'ایده‌ها', 'ایده‌های ثبت شده', 'ideas',
+        "SELECT id, user_id, title, description, status, created_at FROM ideas ORDER BY id DESC",
+        ("شماره", "کاربر", "عنوان", "توضیحات", "وضعیت", "تاریخ"),
+        None, ('ideas',)),
+    'collabs': Dataset(
+        'همکاری‌ها', 'درخواست‌های همکاری', 'collabs',
+        "SELECT id, user_id, full_name, organization, proposal, status, created_at FROM collaborations ORDER BY id DESC",
+        ("شماره", "کاربر", "نام", "سازمان", "پیشنهاد", "وضعیت", "تاریخ"),
+        None, ('collaborations',)),
+    'donations': Dataset(
+        'حمایت‌ها', 'حمایت‌های ثبت شده', 'donations',
+        "SELECT id, user_id, amount, currency, status, created_at FROM donations ORDER BY id DESC",
+        ("شماره", "کاربر", "مبلغ", "واحد", "وضعیت", "تاریخ"),
+        None, ('donations',)),
+    'tickets': Dataset(
+        'تیکت‌ها', 'تیکت‌های پشتیبانی', 'tickets',
+        "SELECT id, user_id, message, status, created_at FROM tickets ORDER BY id DESC",
+        ("شماره", "کاربر", "پیام", "وضعیت", "تاریخ"),
+        None, ('tickets',)),
+    # params: (event_id,)
+    'event_approved': Dataset(
+        'تاییدشدگان رویداد', 'لیست تاییدشدگان رویداد', 'approved_event_users',
+        """SELECT TRIM(u.full_name), TRIM(u.national_id), TRIM(u.phone)
+        FROM registrations r
+        JOIN users u ON u.user_id = r.user_id
+        WHERE r.status = 'approved' AND r.event_id = ?
+        GROUP BY u.full_name, u.national_id, u.phone
+        ORDER BY u.full_name COLLATE NOCASE ASC""",
+        ('نام و نام خانوادگی', 'کد ملی', 'شماره تماس'),
+        'approved', ('registrations', 'users', 'events')),
+}
+
+# rows used to size columns before anything is written, and the cursor fetch size
+SAMPLE_ROWS = 200
+FONT_NAME = 'B Nazanin'
+
+# file kind -> how it is named in captions and replies
+KIND_LABELS = {'xlsx': 'فایل اکسل', 'csv': 'فایل CSV', 'docx': 'فایل ورد', 'txt': 'فایل متنی'}
+
+
+def _installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except Exception:
+        return False
+
+
+def _column_widths(headers, sample):
+    widths = []
+    for col, header in enumerate(headers):
+        longest = max([len(str(header))] + [len(str(r[col])) for r in sample if r[col] is not None])
+        widths.append(min(50, max(10, int(longest * 1.2))))
+    return widths
+
+
+def _rows(cur, first=()):
+    yield from first
+    while True:
+        batch = cur.fetchmany(SAMPLE_ROWS)
+        if not batch:
+            return
+        yield from batch
+
+
+def stream_xlsx(cur, path, ds):
+    """xlsxwriter in constant_memory mode: each row is flushed to disk once the next one starts."""
+    import xlsxwriter
+    sample = cur.fetchmany(SAMPLE_ROWS)
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        cell = workbook.add_format({'font_name': FONT_NAME, 'align': 'right', 'valign': 'top', 'text_wrap': True})
+        ws = workbook.add_worksheet(ds.sheet)
+        ws.right_to_left()
+        for col, width in enumerate(_column_widths(ds.headers, sample)):
+            ws.set_column(col, col, width, cell)
+        ws.write_row(0, 0, ds.headers, cell)
+        for i, r in enumerate(_rows(cur, sample), start=1):
+            ws.write_row(i, 0, r, cell)
+    finally:
+        workbook.close()
+
+
+def _write_xlsx_openpyxl(cur, path, ds):
+    """openpyxl write-only workbook: rows are serialised as they are appended."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+    sample = cur.fetchmany(SAMPLE_ROWS)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(ds.sheet)
+    ws.sheet_view.rightToLeft = True
+    for col, width in enumerate(_column_widths(ds.headers, sample), start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    font = Font(name=FONT_NAME)
+    align = Alignment(horizontal='right', vertical='top', wrap_text=True)
+
+    def styled(values):
+        cells = []
+        for value in values:
+            c = WriteOnlyCell(ws, value=value)
+            c.font = font
+            c.alignment = align
+            cells.append(c)
+        return cells
+    ws.append(styled(ds.headers))
+    for r in _rows(cur, sample):
+        ws.append(styled(r))
+    wb.save(path)
+
+
+def _write_csv(cur, path, ds):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ds.headers)
+        writer.writerows(_rows(cur))
+
+
+def _write_txt(cur, path, ds):
+    with open(path, 'w', encoding='utf-8') as f:
+        for r in _rows(cur):
+            for header, value in zip(ds.headers, r):
+                f.write(f"{header}: {value}\n")
+            f.write("-\n")
+
+
+# Word export: a minimal WordprocessingML package written in one pass.
+# styles.xml carries everything the old per-run restyling set (B Nazanin,
+# right-to-left paragraphs and tables, bold repeated header row), so
+# document.xml only has to reference styles; it is streamed row by row with
+# lxml's incremental writer straight into the zip entry.
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_W = '{%s}' % W_NS
+# A4 with 1" margins, in twentieths of a point
+DOCX_TEXT_WIDTH = 9026
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>')
+DOCX_PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>')
+DOCX_DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>')
+DOCX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:styles xmlns:w="{W_NS}">'
+    '<w:docDefaults>'
+    f'<w:rPrDefault><w:rPr><w:rFonts w:ascii="{FONT_NAME}" w:hAnsi="{FONT_NAME}" w:eastAsia="{FONT_NAME}" w:cs="{FONT_NAME}"/>'
+    '<w:sz w:val="24"/><w:szCs w:val="24"/><w:lang w:val="en-US" w:bidi="fa-IR"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:bidi/><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Title"><w:name w:val="Title"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+    '<w:pPr><w:spacing w:after="240"/></w:pPr><w:rPr><w:b/><w:bCs/><w:sz w:val="36"/><w:szCs w:val="36"/></w:rPr></w:style>'
+    '<w:style w:type="character" w:styleId="TableHeader"><w:name w:val="Table Header"/><w:rPr><w:b/><w:bCs/></w:rPr></w:style>'
+    '<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/>'
+    '<w:tblPr><w:tblInd w:w="0" w:type="dxa"/><w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="108" w:type="dxa"/>'
+    '<w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>'
+    '<w:style w:type="table" w:styleId="TableGrid"><w:name w:val="Table Grid"/><w:basedOn w:val="TableNormal"/>'
+    '<w:tblPr><w:tblBorders><w:top w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:left w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:bottom w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:right w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:insideH w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:insideV w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '</w:tblBorders></w:tblPr></w:style>'
+    '</w:styles>')
+
+# characters XML 1.0 cannot carry; python-docx refused them, here they are dropped
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def _docx_cell(tr, value, width, style=None):
+    from lxml import etree
+    tc = etree.SubElement(tr, _W + 'tc')
+    tc_pr = etree.SubElement(tc, _W + 'tcPr')
+    etree.SubElement(tc_pr, _W + 'tcW', {_W + 'w': str(width), _W + 'type': 'dxa'})
+    p = etree.SubElement(tc, _W + 'p')
+    if value is None:
+        return
+    text = _XML_INVALID.sub('', str(value))
+    if not text:
+        return
+    r = etree.SubElement(p, _W + 'r')
+    if style:
+        etree.SubElement(etree.SubElement(r, _W + 'rPr'), _W + 'rStyle', {_W + 'val': style})
+    for i, line in enumerate(text.split('\n')):
+        if i:
+            etree.SubElement(r, _W + 'br')
+        t = etree.SubElement(r, _W + 't')
+        t.text = line
+        t.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+
+
+def _docx_row(values, widths, header=False):
+    from lxml import etree
+    tr = etree.Element(_W + 'tr', nsmap={'w': W_NS})
+    if header:
+        etree.SubElement(etree.SubElement(tr, _W + 'trPr'), _W + 'tblHeader')
+    for value, width in zip(values, widths):
+        _docx_cell(tr, value, width, 'TableHeader' if header else None)
+    return tr
+
+
+def stream_docx(cur, path, ds):
+    """Stream the dataset into a docx as a right-to-left table under the dataset heading."""
+    from lxml import etree
+    sample = cur.fetchmany(SAMPLE_ROWS)
+    chars = _column_widths(ds.headers, sample)
+    widths = [DOCX_TEXT_WIDTH * c // sum(chars) for c in chars]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', DOCX_CONTENT_TYPES)
+        z.writestr('_rels/.rels', DOCX_PACKAGE_RELS)
+        z.writestr('word/_rels/document.xml.rels', DOCX_DOCUMENT_RELS)
+        z.writestr('word/styles.xml', DOCX_STYLES)
+        with z.open('word/document.xml', 'w', force_zip64=True) as f, etree.xmlfile(f, encoding='UTF-8') as xf:
+            xf.write_declaration(standalone=True)
+            with xf.element(_W + 'document', nsmap={'w': W_NS}), xf.element(_W + 'body'):
+                title = etree.Element(_W + 'p', nsmap={'w': W_NS})
+                etree.SubElement(etree.SubElement(title, _W + 'pPr'), _W + 'pStyle', {_W + 'val': 'Title'})
+                etree.SubElement(etree.SubElement(title, _W + 'r'), _W + 't').text = ds.heading
+                xf.write(title)
+                with xf.element(_W + 'tbl'):
+                    tbl_pr = etree.Element(_W + 'tblPr', nsmap={'w': W_NS})
+                    etree.SubElement(tbl_pr, _W + 'tblStyle', {_W + 'val': 'TableGrid'})
+                    etree.SubElement(tbl_pr, _W + 'bidiVisual')
+                    etree.SubElement(tbl_pr, _W + 'tblW', {_W + 'w': str(sum(widths)), _W + 'type': 'dxa'})
+                    etree.SubElement(tbl_pr, _W + 'tblLayout', {_W + 'type': 'fixed'})
+                    xf.write(tbl_pr)
+                    grid = etree.Element(_W + 'tblGrid', nsmap={'w': W_NS})
+                    for width in widths:
+                        etree.SubElement(grid, _W + 'gridCol', {_W + 'w': str(width)})
+                    xf.write(grid)
+                    xf.write(_docx_row(ds.headers, widths, header=True))
+                    for r in _rows(cur, sample):
+                        xf.write(_docx_row(r, widths))
+                # Word wants a paragraph between a table and the section properties
+                xf.write(etree.Element(_W + 'p', nsmap={'w': W_NS}))
+                sect = etree.Element(_W + 'sectPr', nsmap={'w': W_NS})
+                etree.SubElement(sect, _W + 'pgSz', {_W + 'w': '11906', _W + 'h': '16838'})
+                etree.SubElement(sect, _W + 'pgMar', {_W + k: v for k, v in (
+                    ('top', '1440'), ('right', '1440'), ('bottom', '1440'), ('left', '1440'),
+                    ('header', '708'), ('footer', '708'), ('gutter', '0'))})
+                etree.SubElement(sect, _W + 'bidi')
+                xf.write(sect)
+
+
+# output -> (file kind, writer), fastest installed first
+if _installed('xlsxwriter'):
+    _XLSX = ('xlsx', stream_xlsx)
+elif _installed('openpyxl'):
+    _XLSX = ('xlsx', _write_xlsx_openpyxl)
+else:
+    _XLSX = ('csv', _write_csv)
+WRITERS = {
+    'xlsx': _XLSX,
+    'csv': ('csv', _write_csv),
+    'docx': ('docx', stream_docx) if _installed('lxml') else ('txt', _write_txt),
+}
+
+
+class _CountingCursor:
+    """Passes fetchmany() through and calls report(done, total) every PROGRESS_ROWS rows."""
+
+    def __init__(self, cur, report, total):
+        self._cur = cur
+        self._report = report
+        self.total = total
+        self.done = 0
+        self._reported = 0
+
+    def fetchmany(self, size):
+        batch = self._cur.fetchmany(size)
+        self.done += len(batch)
+        if not batch or self.done - self._reported >= PROGRESS_ROWS:
+            self._reported = self.done
+            self._report(self.done, self.total)
+        return batch
+
+
+def export(conn, name, output, path_base, params=(), report=None):
+    """Write dataset `name` as `output` to path_base + the chosen file extension; returns (path, kind).
+
+    report, if given, is called with (rows written, total rows) as the file grows.
+    """
+    ds = DATASETS[name]
+    kind, writer = WRITERS[output]
+    path = f"{path_base}.{kind}"
+    cur = conn.execute(ds.sql, params)
+    if report is not None:
+        total = conn.execute(f"SELECT COUNT(*) FROM ({ds.sql})", params).fetchone()[0]
+        report(0, total)
+        cur = _CountingCursor(cur, report, total)
+    writer(cur, path, ds)
+    return path, kind
+
+
+# ---------------------------------------------------------------------------
+# Export jobs
+# Files are built in a worker process (ProcessPoolExecutor), not on the bot's
+# loop or its reader threads, so writing a large workbook costs the other
+# users nothing. The worker opens its own connection to the database file and
+# reports rows written through a queue; send_export() drains it every
+# PROGRESS_INTERVAL seconds and hands (done, total) to the caller's progress
+# callback, which edits the admin's message. If the pool cannot be started
+# the file is built on a reader thread as before.
+#
+# The Telegram handle of each sent file is kept in export_files together with
+# the table_versions of the tables its dataset reads. While those counters
+# have not moved, the next request re-sends that document by reference
+# instead of rebuilding it; any insert/update/delete bumps a counter and the
+# next request builds a fresh file. Concurrent requests for the same export
+# wait for one build.
+# ---------------------------------------------------------------------------
+try:
+    EXPORT_WORKERS = max(1, int(os.getenv('JURISLAW_EXPORT_WORKERS', '2')))
+except Exception:
+    EXPORT_WORKERS = 2
+PROGRESS_ROWS = 5000
+PROGRESS_INTERVAL = 3.0
+
+_pool = None
+_queue = None
+_job_ids = itertools.count(1)
+_progress = {}  # job id -> (done, total)
+_building = {}  # cache key -> (future resolved when that build has finished, progress callbacks)
+_worker_queue = None  # progress queue, in worker processes
+
+
+def _init_worker(queue):
+    global _worker_queue
+    _worker_queue = queue
+
+
+def _report(job_id, done, total):
+    try:
+        _worker_queue.put_nowait((job_id, done, total))
+    except Exception:
+        pass
+
+
+def _export_job(db_path, job_id, name, output, path_base, params):
+    """Runs in a worker process."""
+    conn = get_connection(db_path)
+    try:
+        return export(conn, name, output, path_base, params, lambda done, total: _report(job_id, done, total))
+    finally:
+        conn.close()
+
+
+def _get_pool():
+    global _pool, _queue
+    if _pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: workers must not inherit the bot's threads, connections or client
+        ctx = multiprocessing.get_context('spawn')
+        _queue = ctx.Queue()
+        _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=ctx,
+                                    initializer=_init_worker, initargs=(_queue,))
+    return _pool
+
+
+def shutdown_export_pool(wait=True):
+    global _pool, _queue
+    pool, _pool, _queue = _pool, None, None
+    if pool is not None:
+        try:
+            pool.shutdown(wait=wait, cancel_futures=True)
+        except Exception:
+            pass
+
+
+def _drain_progress():
+    while True:
+        try:
+            job_id, done, total = _queue.get_nowait()
+        except Exception:
+            return
+        if job_id in _progress:
+            _progress[job_id] = (done, total)
+
+
+async def _build(name, output, path_base, params, watchers):
+    job_id = next(_job_ids)
+    _progress[job_id] = None
+    try:
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                _get_pool(), _export_job, database.DB_NAME, job_id, name, output, path_base, params)
+        except (OSError, BrokenExecutor, RuntimeError):
+            shutdown_export_pool(wait=False)
+            return await db_read(export, name, output, path_base, params)
+        shown = None
+        while True:
+            finished, _ = await asyncio.wait({future}, timeout=PROGRESS_INTERVAL)
+            if finished:
+                try:
+                    return future.result()
+                except BrokenExecutor:
+                    shutdown_export_pool(wait=False)
+                    return await db_read(export, name, output, path_base, params)
+            _drain_progress()
+            state = _progress.get(job_id)
+            if state is not None and state != shown:
+                shown = state
+                for progress in list(watchers):
+                    try:
+                        await progress(*state)
+                    except Exception:
+                        pass
+    finally:
+        _progress.pop(job_id, None)
+
+
+def _read_versions(conn, tables):
+    placeholders = ','.join('?' * len(tables))
+    rows = conn.execute(f"SELECT name, version FROM table_versions WHERE name IN ({placeholders})", tables).fetchall()
+    if len(rows) != len(tables):
+        return None  # some table is not versioned; never reuse its files
+    return ','.join(f"{n}={v}" for n, v in sorted(rows))
+
+
+async def _load_cached(key, versions):
+    row = await fetch_one("SELECT file_kind, kind, media_id, access_hash, file_reference FROM export_files WHERE cache_key = ? AND versions = ?", (key, versions))
+    if not row:
+        return None
+    return row[0], (row[1], row[2], row[3], bytes(row[4] or b''))
+
+
+async def _remember(key, versions, file_kind, message):
+    handle = handle_of(message)
+    if handle is None:
+        return
+    try:
+        await db_write(lambda conn: conn.execute("""
+            INSERT INTO export_files (cache_key, versions, file_kind, kind, media_id, access_hash, file_reference) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(cache_key) DO UPDATE SET versions=excluded.versions, file_kind=excluded.file_kind, kind=excluded.kind,
+                media_id=excluded.media_id, access_hash=excluded.access_hash, file_reference=excluded.file_reference,
+                created_at=excluded.created_at
+        """, (key, versions, file_kind) + handle))
+    except Exception:
+        pass
+
+
+async def _forget(key):
+    try:
+        await db_write(lambda conn: conn.execute("DELETE FROM export_files WHERE cache_key = ?", (key,)))
+    except Exception:
+        pass
+
+
+async def send_export(client, chat_id, name, output, params=(), file_name=None, caption=None, progress=None):
+    """Send dataset `name` as a document, building it in a worker process unless an up-to-date copy was sent before.
+
+    progress, if given, is awaited with (rows written, total rows) while the file is built.
+    Returns the file kind sent.
+    """
+    ds = DATASETS[name]
+    params = tuple(params)
+    key = f"{name}:{output}:" + ','.join(str(p) for p in params)
+    while True:
+        versions = await db_read(_read_versions, ds.depends)
+        cached = await _load_cached(key, versions) if versions else None
+        if cached is not None:
+            kind, handle = cached
+            try:
+                await client.send_file(chat_id, input_media(handle), caption=caption or f"📥 {KIND_LABELS[kind]} {ds.title}", force_document=True)
+                return kind
+            except Exception as e:
+                if type(e).__name__ not in STALE_HANDLE_ERRORS:
+                    raise
+                await _forget(key)
+        building = _building.get(key)
+        if building is None:
+            break
+        # someone is already building this export; watch it and send theirs once it is done
+        done, watchers = building
+        if progress is not None:
+            watchers.append(progress)
+        await done
+
+    done = asyncio.get_running_loop().create_future()
+    watchers = [progress] if progress is not None else []
+    _building[key] = (done, watchers)
+    tmpdir = tempfile.mkdtemp(prefix='export_')
+    try:
+        path, kind = await _build(name, output, os.path.join(tmpdir, file_name or ds.file), params, watchers)
+        sent = await client.send_file(chat_id, path, caption=caption or f"📥 {KIND_LABELS[kind]} {ds.title}", force_document=True)
+        if versions:
+            await _remember(key, versions, kind, sent)
+        return kind
+    finally:
+        _building.pop(key, None)
+        done.set_result(None)
+        shutil.rmtree(tmpdir, ignore_errors=True)
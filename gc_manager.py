@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import time
+
+from database import BLOB_REFERENCES, db_read, db_write, run_blocking
+from scheduler import get_scheduler
+from upload_store import GRACE_SECONDS, UPLOAD_ROOT, collect_unreferenced
+
+# ---------------------------------------------------------------------------
+# Garbage collection of orphaned rows and files
+# The maintenance buttons used to stat every referenced path in a loop and
+# delete rows one by one, and the stray-file sweep walked the whole upload
+# tree, all while holding the writer connection. run_gc() does the same work
+# in phases and bounded batches instead:
+#   - the upload tree is listed once with os.scandir, and every "does this file
+#     still exist" check is a lookup in that listing;
+#   - rows are read by id a batch at a time on a reader connection, and the
+#     orphans of each batch are removed with one executemany;
+#   - untracked files are removed GC_BATCH at a time on the blocking pool.
+#     Stored blobs are removed by upload_store on the writer thread, also a
+#     bounded batch per transaction, so a put can't race their removal.
+#
+# The listing is older than the rows read after it: a file stored since then
+# is missing from it. An orphan candidate is therefore checked once more with
+# os.path.exists in the transaction that deletes it.
+#
+# Phases:
+#   'orphan_resources'  resources whose file is gone
+#   'orphan_receipts'   registrations whose receipt file is gone
+#   'files'             unreferenced blobs (upload_store), then files under
+#                       uploads/ that nothing knows about: leftovers of the
+#                       old flat layout, report files of deleted events,
+#                       abandoned .incoming downloads
+#
+# Only 'files' runs on its own, every GC_INTERVAL seconds from the scheduler;
+# deleting rows is left to the admin's maintenance buttons. Untracked files are
+# only removed once they are GRACE_SECONDS old, so a download in progress or a
+# report that is still being composed is never touched. Runs are serialized.
+# ---------------------------------------------------------------------------
+GC_BATCH = int(os.getenv('JURISLAW_GC_BATCH', '500'))
+GC_INTERVAL = int(os.getenv('JURISLAW_GC_INTERVAL', str(6 * 3600)))
+GC_FIRST_RUN = 300  # seconds after startup
+PROGRESS_INTERVAL = 2.0  # seconds between progress callbacks
+
+PHASES = ('orphan_resources', 'orphan_receipts', 'files')
+SCHEDULED_PHASES = ('files',)
+
+# phase -> (table, path column, whether a row without a path is an orphan)
+ORPHAN_ROWS = {
+    'orphan_resources': ('resources', 'file_path', True),
+    'orphan_receipts': ('registrations', 'payment_receipt_file_id', False),
+}
+
+_lock = asyncio.Lock()
+
+
+class GcReport:
+    def __init__(self):
+        self.phase = None
+        self.checked = 0    # rows and files looked at
+        self.rows = 0       # orphan rows deleted
+        self.files = 0      # files removed
+        self.reclaimed = 0  # bytes freed
+        self._last_progress = 0.0
+
+
+def _key(path):
+    try:
+        return os.path.relpath(path)
+    except ValueError:
+        return os.path.normpath(path)
+
+
+def _in_uploads(key):
+    return key.startswith(UPLOAD_ROOT + os.sep)
+
+
+def _scan(root=UPLOAD_ROOT):
+    """List the upload tree once: {relative path: (size, mtime)} for every regular file."""
+    files = {}
+    stack = [root]
+    while stack:
+        top = stack.pop()
+        try:
+            entries = os.scandir(top)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files[_key(entry.path)] = (st.st_size, st.st_mtime)
+                except OSError:
+                    pass
+    return files
+
+
+def _remove_files(items):
+    """Remove (path, size) pairs; size may be None. Returns (files removed, bytes freed)."""
+    removed = reclaimed = 0
+    for path, size in items:
+        try:
+            if size is None:
+                size = os.stat(path).st_size
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+        reclaimed += size
+    return removed, reclaimed
+
+
+def report_files(payloads_json):
+    """Paths of the uploaded files listed in an events.report_payloads value."""
+    try:
+        payloads = json.loads(payloads_json) if payloads_json else []
+        return [p['path'] for p in payloads if p.get('type') == 'file' and p.get('path')]
+    except Exception:
+        return []
+
+
+async def discard_files(paths):
+    """Remove files under uploads/ that are not in the upload store, off the writer thread.
+
+    For report files whose rows have just been cleared; stored blobs must be
+    left to collect_unreferenced(). Returns (files removed, bytes freed).
+    """
+    items = [(p, None) for p in paths if _in_uploads(_key(p))]
+    removed = reclaimed = 0
+    for i in range(0, len(items), GC_BATCH):
+        n, size = await run_blocking(_remove_files, items[i:i + GC_BATCH])
+        removed += n
+        reclaimed += size
+    return removed, reclaimed
+
+
+async def _report_progress(report, progress, force=False):
+    if progress is None:
+        return
+    now = time.monotonic()
+    if not force and now - report._last_progress < PROGRESS_INTERVAL:
+        return
+    report._last_progress = now
+    try:
+        await progress(report)
+    except Exception:
+        pass
+
+
+def _rows_after(conn, table, column, last_id, limit):
+    return conn.execute(f"SELECT id, {column} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, limit)).fetchall()
+
+
+def _delete_orphans(conn, table, column, pathless_is_orphan, ids):
+    confirmed = []
+    for (rid,) in ids:
+        row = conn.execute(f"SELECT {column} FROM {table} WHERE id = ?", (rid,)).fetchone()
+        if row is None:
+            continue
+        path = row[0]
+        if (not path and pathless_is_orphan) or (path and not os.path.exists(path)):
+            confirmed.append((rid,))
+    conn.executemany(f"DELETE FROM {table} WHERE id = ?", confirmed)
+    return len(confirmed)
+
+
+async def _collect_orphan_rows(phase, files, report, progress, batch):
+    table, column, pathless_is_orphan = ORPHAN_ROWS[phase]
+
+    def missing(path):
+        if not path:
+            return pathless_is_orphan
+        key = _key(path)
+        if _in_uploads(key):
+            return key not in files
+        return not os.path.exists(path)  # outside the store: rare, check directly
+
+    last_id = 0
+    while True:
+        rows = await db_read(_rows_after, table, column, last_id, batch)
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        orphans = [(rid,) for rid, path in rows if missing(path)]
+        if orphans:
+            report.rows += await db_write(_delete_orphans, table, column, pathless_is_orphan, orphans)
+        report.checked += len(rows)
+        await _report_progress(report, progress)
+        if len(rows) < batch:
+            break
+
+
+def _known_paths(conn):
+    """Every path the database knows about: stored blobs, upload columns, report files."""
+    known = {_key(p) for (p,) in conn.execute("SELECT path FROM blobs")}
+    for table, column in BLOB_REFERENCES:
+        for (path,) in conn.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL AND {column} != ''"):
+            known.add(_key(str(path)))
+    for (payloads,) in conn.execute("SELECT report_payloads FROM events WHERE report_payloads IS NOT NULL"):
+        known.update(_key(p) for p in report_files(payloads))
+    return known
+
+
+async def _collect_files(report, progress, batch):
+    more = True
+    while more:
+        n, size, more = await collect_unreferenced(batch)
+        if not n:
+            # only missing or unremovable files left in this batch; the next run retries them
+            break
+        report.files += n
+        report.reclaimed += size
+        await _report_progress(report, progress)
+    # list the tree after the blobs are gone, and before reading what is known:
+    # anything stored in between is newer than the grace period anyway
+    files = await run_blocking(_scan)
+    known = await db_read(_known_paths)
+    cutoff = time.time() - GRACE_SECONDS
+    stray = [(key, size) for key, (size, mtime) in files.items() if key not in known and mtime <= cutoff]
+    report.checked += len(files)
+    for i in range(0, len(stray), batch):
+        n, size = await run_blocking(_remove_files, stray[i:i + batch])
+        report.files += n
+        report.reclaimed += size
+        await _report_progress(report, progress)
+
+
+async def run_gc(phases=PHASES, progress=None, batch=GC_BATCH):
+    """Run the given phases in order and return a GcReport.
+
+    progress, if given, is awaited with the running report at most every
+    PROGRESS_INTERVAL seconds and once when each phase ends.
+    """
+    report = GcReport()
+    async with _lock:
+        files = None
+        for phase in phases:
+            report.phase = phase
+            if phase == 'files':
+                await _collect_files(report, progress, batch)
+            else:
+                if files is None:
+                    files = await run_blocking(_scan)
+                await _collect_orphan_rows(phase, files, report, progress, batch)
+            await _report_progress(report, progress, force=True)
+    return report
+
+
+async def _scheduled_gc(payloads):
+    try:
+        report = await run_gc(SCHEDULED_PHASES)
+        if report.files:
+            from log_helper import console_log
+            console_log(f"gc: removed {report.files} files, {report.reclaimed / 1048576:.1f}MB reclaimed",
+                        f"پاکسازی: {report.files} فایل حذف شد، {report.reclaimed / 1048576:.1f}MB آزاد شد")
+    finally:
+        schedule_gc()
+
+
+def schedule_gc(delay=GC_INTERVAL):
+    """(Re)schedule the periodic file collection `delay` seconds from now."""
+    get_scheduler().schedule(('gc',), time.time() + delay, _scheduled_gc)
@@ -3,10 +3,6 @@ import asyncio
 import sys
 import os
 from telethon import TelegramClient
-import sqlite3
-import time
-from database import DB_NAME
-from utils import get_admin_ids
 try:
     from dotenv import load_dotenv  # type: ignore[reportMissingImports]
 except Exception:
@@ -68,12 +64,26 @@ if missing_creds:
 else:
     DRY_RUN = False
 
+# conversation state store, kept here so it can be flushed after the loop exits
+_state_store = None
+
 async def main():
     # Create client after config is validated
-    user_states = {}
-
     from database import init_db
     init_db()
+    from state_store import create_state_store
+    user_states = create_state_store()
+    global _state_store
+    _state_store = user_states
+    try:
+        from settings_cache import load_settings
+        load_settings()
+        from admin_cache import reload_admins
+        reload_admins()
+        from menu_cache import reload_menu_inputs
+        reload_menu_inputs()
+    except Exception:
+        pass
     try:
         from log_helper import console_log
         console_log("database checked/initialized.", "دیتابیس بررسی/مقداردهی شد.")
@@ -112,41 +122,66 @@ async def main():
         except Exception:
             print("Running in dry-run mode: Telegram client not started. Handlers are not attached.")
 
-    async def deadline_watcher():
+    async def loop_lag_reporter():
+        # periodic p50/p99 of event-loop lag, so regressions show up in the console
         while True:
+            await asyncio.sleep(600)
             try:
-                now = int(time.time())
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT id, title FROM events WHERE is_active = 1 AND end_at_ts IS NOT NULL AND end_at_ts <= ?", (now,))
-                rows = c.fetchall()
-                for eid, title in rows:
-                    c.execute("UPDATE events SET is_active = 0 WHERE id = ?", (eid,))
-                conn.commit()
-                conn.close()
-                if rows:
-                    if DRY_RUN:
-                        try:
-                            from log_helper import console_log
-                            console_log(f"[dry-run] deadline_watcher: archived events: {[t for (_,t) in rows]}",
-                                        f"[dry-run] deadline_watcher: رویدادهای بایگانی‌شده: {[t for (_,t) in rows]}")
-                        except Exception:
-                            print(f"[dry-run] deadline_watcher: archived events: {[t for (_,t) in rows]}")
-                    else:
-                        admins = get_admin_ids()
-                        for eid, title in rows:
-                            msg = f"⏱️ مهلت ثبت‌نام رویداد '{title}' تمام شد و به آرشیو منتقل شد."
-                            for aid in admins:
-                                try:
-                                    await client.send_message(aid, msg)
-                                except Exception:
-                                    pass
+                from metrics import get_loop_lag_stats
+                st = get_loop_lag_stats()
+                from log_helper import console_log
+                console_log(f"event loop lag: p50={st['p50_ms']}ms p99={st['p99_ms']}ms max={st['max_ms']}ms (n={st['count']})",
+                            f"تاخیر حلقه رویداد: p50={st['p50_ms']}ms p99={st['p99_ms']}ms max={st['max_ms']}ms (n={st['count']})")
+            except Exception:
+                pass
+            try:
+                from media_ingest import get_ingest_stats
+                mi = get_ingest_stats()
+                if mi['submitted']:
+                    from log_helper import console_log
+                    line = (f"queued={mi['queued']} in_flight={mi['in_flight']} done={mi['done']} retried={mi['retried']} "
+                            f"failed={mi['failed']} rejected={mi['rejected']} {mi['mb']}MB at {mi['kb_per_s']}KB/s "
+                            f"avg_wait={mi['avg_wait_ms']}ms")
+                    console_log(f"media downloads: {line}", f"دریافت فایل‌ها: {line}")
             except Exception:
                 pass
-            await asyncio.sleep(60)
 
-    asyncio.create_task(deadline_watcher())
+    from metrics import monitor_loop_lag
+    asyncio.create_task(monitor_loop_lag())
+    asyncio.create_task(loop_lag_reporter())
+    from settings_cache import watch_settings
+    from admin_cache import watch_admins
+    from menu_cache import watch_keyboards
+    asyncio.create_task(watch_settings())
+    asyncio.create_task(watch_admins())
+    asyncio.create_task(watch_keyboards())
+    # registration deadlines (and other timed jobs) fire from the scheduler
+    from scheduler import get_scheduler
+    from event_manager import load_event_deadlines
+    from reminder_manager import load_event_reminders
+    from gc_manager import GC_FIRST_RUN, schedule_gc
+    get_scheduler().start()
+    schedule_gc(GC_FIRST_RUN)
+    try:
+        await load_event_deadlines(client)
+        await load_event_reminders(client)
+    except Exception as e:
+        try:
+            from log_helper import console_log
+            console_log(f"could not load event deadlines: {e}", f"بارگذاری مهلت رویدادها ناموفق بود: {e}")
+        except Exception:
+            print(f"could not load event deadlines: {e}")
+    if hasattr(user_states, 'run_flusher'):
+        asyncio.create_task(user_states.run_flusher())
     if not DRY_RUN:
+        try:
+            from broadcast_manager import get_engine
+            resumed = await get_engine(client).resume()
+            if resumed:
+                from log_helper import console_log
+                console_log(f"resumed {resumed} unfinished broadcast job(s).", f"{resumed} ارسال همگانی نیمه‌تمام از سر گرفته شد.")
+        except Exception:
+            pass
         await client.run_until_disconnected()
     else:
         # In dry-run mode, keep the loop running until KeyboardInterrupt
@@ -164,4 +199,17 @@ if __name__ == '__main__':
             from log_helper import console_log
             console_log("bot stopped by user request.", "بات به درخواست کاربر متوقف شد.")
         except Exception:
-            print("bot stopped by user request.")
\ No newline at end of file
+            print("bot stopped by user request.")
+    finally:
+        # persist conversation states queued since the last periodic flush
+        try:
+            if hasattr(_state_store, 'flush_now'):
+                _state_store.flush_now()
+        except Exception:
+            pass
+        # export worker processes, if any export was built this run
+        try:
+            if 'export_engine' in sys.modules:
+                sys.modules['export_engine'].shutdown_export_pool(wait=False)
+        except Exception:
+            pass
\ No newline at end of file
@@ -0,0 +1,119 @@
+import hashlib
+import os
+
+from database import db_write, fetch_one, run_blocking
+
+# ---------------------------------------------------------------------------
+# Upload-once media
+# Posters, certificates and receipts live under uploads/ and used to be
+# re-uploaded to Telegram on every send. send_media() hashes the file content
+# once, and after the first upload remembers the photo/document handle
+# Telegram returned (media_handles table, keyed by sha256) so later sends of
+# the same content -- to anyone, after restarts -- only reference it. If
+# Telegram rejects a stored handle (expired file reference etc.) the file is
+# uploaded again and the handle replaced.
+#
+# Broadcasts don't need this: they already forward the admin's message media
+# by reference (see broadcast_manager).
+# ---------------------------------------------------------------------------
+STALE_HANDLE_ERRORS = (
+    'FileReferenceExpiredError', 'FileReferenceInvalidError', 'FileReferenceEmptyError',
+    'FileIdInvalidError', 'MediaEmptyError', 'MediaInvalidError', 'PhotoInvalidError',
+)
+
+_digests = {}  # path -> (size, mtime_ns, sha256)
+_handles = {}  # content key -> (kind, media_id, access_hash, file_reference)
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def content_key(path, force_document=False):
+    st = os.stat(path)
+    cached = _digests.get(path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        digest = cached[2]
+    else:
+        digest = await run_blocking(_file_sha256, path)
+        _digests[path] = (st.st_size, st.st_mtime_ns, digest)
+    # the same bytes sent as a photo and as a document are different handles
+    return digest + (':doc' if force_document else '')
+
+
+def handle_of(message):
+    photo = getattr(message, 'photo', None)
+    if photo is not None and getattr(photo, 'access_hash', None) is not None:
+        return ('photo', photo.id, photo.access_hash, bytes(photo.file_reference or b''))
+    document = getattr(message, 'document', None)
+    if document is not None and getattr(document, 'access_hash', None) is not None:
+        return ('document', document.id, document.access_hash, bytes(document.file_reference or b''))
+    return None
+
+
+def input_media(handle):
+    from telethon.tl import types
+    kind, media_id, access_hash, file_reference = handle
+    if kind == 'photo':
+        return types.InputPhoto(id=media_id, access_hash=access_hash, file_reference=file_reference or b'')
+    return types.InputDocument(id=media_id, access_hash=access_hash, file_reference=file_reference or b'')
+
+
+async def _load_handle(key):
+    handle = _handles.get(key)
+    if handle is None:
+        row = await fetch_one("SELECT kind, media_id, access_hash, file_reference FROM media_handles WHERE content_key = ?", (key,))
+        if row:
+            handle = (row[0], row[1], row[2], bytes(row[3] or b''))
+            _handles[key] = handle
+    return handle
+
+
+async def _store_handle(key, message):
+    handle = handle_of(message)
+    if handle is None or _handles.get(key) == handle:
+        return
+    _handles[key] = handle
+    try:
+        await db_write(lambda conn: conn.execute("""
+            INSERT INTO media_handles (content_key, kind, media_id, access_hash, file_reference) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(content_key) DO UPDATE SET kind=excluded.kind, media_id=excluded.media_id,
+                access_hash=excluded.access_hash, file_reference=excluded.file_reference
+        """, (key,) + handle))
+    except Exception:
+        pass
+
+
+async def forget_handle(key):
+    _handles.pop(key, None)
+    try:
+        await db_write(lambda conn: conn.execute("DELETE FROM media_handles WHERE content_key = ?", (key,)))
+    except Exception:
+        pass
+
+
+async def send_media(client, entity, path, **kwargs):
+    """Drop-in for client.send_file(entity, path, **kwargs) that uploads each file content once."""
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return await client.send_file(entity, path, **kwargs)
+    try:
+        key = await content_key(path, kwargs.get('force_document', False))
+        handle = await _load_handle(key)
+    except Exception:
+        return await client.send_file(entity, path, **kwargs)
+    if handle is not None:
+        try:
+            sent = await client.send_file(entity, input_media(handle), **kwargs)
+            await _store_handle(key, sent)
+            return sent
+        except Exception as e:
+            if type(e).__name__ not in STALE_HANDLE_ERRORS:
+                raise
+            await forget_handle(key)
+    sent = await client.send_file(entity, path, **kwargs)
+    await _store_handle(key, sent)
+    return sent
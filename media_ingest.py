@@ -0,0 +1,209 @@
+import asyncio
+import collections
+import itertools
+import os
+import time
+
+from upload_store import incoming_path, put_file
+
+# ---------------------------------------------------------------------------
+# Media ingestion
+# Payment receipts, student cards, certificate PDFs and event posters used to
+# be downloaded inline, so the sender waited for the whole file and a burst of
+# uploads went through one at a time. Handlers now check size and type from
+# the message metadata, acknowledge at once and submit() the download here.
+# A fixed number of workers (JURISLAW_MEDIA_WORKERS) drain the queue, so
+# downloads run concurrently but never unbounded.
+#
+# Each download goes to a temporary file. The worker checks the real size and
+# the leading bytes against the file type, moves it into the upload store
+# (upload_store.put_file) and only then awaits on_done(path) with the stored
+# path, which the flow persists. A failed download is
+# retried through the scheduler with growing delays (FloodWait is honoured).
+# After the last attempt, or when the content is rejected, on_failed(error)
+# runs so the flow can ask for the file again.
+#
+# get_ingest_stats() reports queue depth, downloads in flight, and totals and
+# throughput since start (main.py logs them with the loop lag).
+# ---------------------------------------------------------------------------
+try:
+    INGEST_WORKERS = max(1, int(os.getenv('JURISLAW_MEDIA_WORKERS', '3')))
+except Exception:
+    INGEST_WORKERS = 3
+MAX_QUEUE = 500
+RETRY_DELAYS = (2, 10, 30)  # seconds before the 2nd, 3rd and 4th attempt
+
+# leading bytes each accepted extension must start with
+MAGIC = {
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'pdf': (b'%PDF-',),
+}
+
+
+class RejectedMedia(Exception):
+    """The downloaded file is not what the sender said it was; not retried."""
+
+
+class IngestJob:
+    __slots__ = ('id', 'message', 'ext', 'max_bytes', 'on_done', 'on_failed', 'attempts', 'queued_at')
+
+    def __init__(self, job_id, message, ext, max_bytes, on_done, on_failed):
+        self.id = job_id
+        self.message = message
+        self.ext = (ext or 'dat').lower().lstrip('.')
+        self.max_bytes = max_bytes
+        self.on_done = on_done
+        self.on_failed = on_failed
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+def _check_file(path, ext, max_bytes):
+    size = os.path.getsize(path)
+    if max_bytes and size > max_bytes:
+        raise RejectedMedia(f"file is {size} bytes, limit {max_bytes}")
+    magic = MAGIC.get(ext)
+    if magic:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+        if not any(head.startswith(m) for m in magic):
+            raise RejectedMedia("file content does not match its type")
+    return size
+
+
+class MediaIngest:
+    def __init__(self, workers=INGEST_WORKERS, maxsize=MAX_QUEUE):
+        self.workers = workers
+        self._queue = None
+        self._maxsize = maxsize
+        self._tasks = []
+        self._ids = itertools.count(1)
+        self.in_flight = 0
+        self.stats = collections.Counter()  # submitted, attempts, done, retried, failed, rejected, bytes
+        self.download_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self._maxsize)
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    def submit(self, message, ext, on_done, on_failed=None, max_bytes=None):
+        """Queue message's media (a file of type ext) for download into the store; False if the queue is full."""
+        self._ensure_workers()
+        job = IngestJob(next(self._ids), message, ext, max_bytes, on_done, on_failed)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        self.stats['submitted'] += 1
+        return True
+
+    async def _requeue(self, jobs):
+        for job in jobs:
+            job.queued_at = time.monotonic()
+            await self._queue.put(job)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        self.wait_seconds += time.monotonic() - job.queued_at
+        self.stats['attempts'] += 1
+        job.attempts += 1
+        part = incoming_path(job.ext)
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            await job.message.download_media(file=part)
+            size = _check_file(part, job.ext, job.max_bytes)
+            path = await put_file(part, job.ext)
+        except Exception as e:
+            self.download_seconds += time.monotonic() - started
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            await self._failed(job, e)
+            return
+        finally:
+            self.in_flight -= 1
+        self.download_seconds += time.monotonic() - started
+        self.stats['done'] += 1
+        self.stats['bytes'] += size
+        await self._callback(job.on_done, path)
+
+    async def _failed(self, job, error):
+        if not isinstance(error, RejectedMedia) and job.attempts <= len(RETRY_DELAYS):
+            delay = max(RETRY_DELAYS[job.attempts - 1], getattr(error, 'seconds', 0) or 0)
+            self.stats['retried'] += 1
+            from scheduler import get_scheduler
+            get_scheduler().schedule(('media_ingest', job.id), time.time() + delay, self._requeue, job)
+            return
+        self.stats['rejected' if isinstance(error, RejectedMedia) else 'failed'] += 1
+        try:
+            from log_helper import console_log
+            console_log(f"media download #{job.id} ({job.ext}) failed after {job.attempts} attempt(s): {error}",
+                        f"دریافت فایل #{job.id} ({job.ext}) پس از {job.attempts} تلاش ناموفق بود: {error}")
+        except Exception:
+            pass
+        if job.on_failed is not None:
+            await self._callback(job.on_failed, error)
+
+    async def _callback(self, fn, arg):
+        try:
+            await fn(arg)
+        except Exception as e:
+            try:
+                from log_helper import console_log
+                console_log(f"media ingest callback failed: {e}", f"پردازش فایل دریافت‌شده ناموفق بود: {e}")
+            except Exception:
+                pass
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+
+_ingest = None
+
+
+def get_ingest():
+    global _ingest
+    if _ingest is None:
+        _ingest = MediaIngest()
+    return _ingest
+
+
+def submit_download(message, ext, on_done, on_failed=None, max_bytes=None):
+    """Queue a download on the shared ingest workers; see MediaIngest.submit."""
+    return get_ingest().submit(message, ext, on_done, on_failed, max_bytes)
+
+
+def get_ingest_stats():
+    """Return queue depth, downloads in flight and totals/throughput since start."""
+    ing = get_ingest()
+    st = ing.stats
+    return {
+        'queued': ing.depth(),
+        'in_flight': ing.in_flight,
+        'submitted': st['submitted'],
+        'done': st['done'],
+        'retried': st['retried'],
+        'failed': st['failed'],
+        'rejected': st['rejected'],
+        'mb': round(st['bytes'] / 1048576, 2),
+        # per download, i.e. bytes over the summed download durations
+        'kb_per_s': round(st['bytes'] / 1024 / ing.download_seconds, 1) if ing.download_seconds else 0.0,
+        'avg_wait_ms': round(ing.wait_seconds * 1000 / st['attempts'], 1) if st['attempts'] else 0.0,
+    }
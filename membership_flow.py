@@ -1,19 +1,18 @@
-from telethon import events, Button
+from telethon import Button
+from router import get_router
 from utils import (
     CANCEL_BUTTON,
     set_user_state, get_user_state, get_user_data, clear_user_state,
     is_user_member, get_setting, get_admin_ids,
     rate_limit_check, sanitize_text
 )
-from database import DB_NAME
-import sqlite3
-import os
-import time
-import random
+from database import db_write
+from media_ingest import submit_download
 
 def setup_membership_handlers(client, user_states):
+    router = get_router(client, user_states)
 
-    @client.on(events.CallbackQuery)
+    @router.callback("membership_confirm")
     async def membership_callback_handler(event):
         data = event.data.decode('utf-8')
         user_id = event.sender_id
@@ -42,7 +41,11 @@ def setup_membership_handlers(client, user_states):
                 await event.reply(f"ℹ️ {membership_desc}\n\n👤 لطفاً نام و نام خانوادگی خود را ارسال کنید:", buttons=CANCEL_BUTTON)
             set_user_state(user_states, user_id, "membership_step_fullname", {})
 
-    @client.on(events.NewMessage)
+    @router.message(
+        "membership_step_card_photo", "membership_step_entry_year", "membership_step_fullname",
+        "membership_step_major", "membership_step_national_id", "membership_step_phone",
+        "membership_step_student_number", "membership_step_username",
+    )
     async def membership_message_handler(event):
         user_id = event.sender_id
         # per-user rate limit for messages
@@ -156,70 +159,77 @@ def setup_membership_handlers(client, user_states):
             if file_ext not in allowed:
                 await event.reply("❌ فقط فرمت‌های jpg, jpeg, png, pdf مجاز است.", buttons=CANCEL_BUTTON)
                 return
-            unique_name = f"studentcard_{user_id}_{int(time.time())}_{random.randint(1000,9999)}.{file_ext}"
-            save_path = os.path.join("uploads", unique_name)
-            await event.message.download_media(file=save_path)
-
-            data = get_user_data(user_states, user_id)
-            data["student_card_file"] = save_path
-
-            # persist to DB
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute(
-                """
-                INSERT INTO memberships (
-                    user_id, full_name, major, entry_year, student_number,
-                    national_id, phone, telegram_username, student_card_file, status
-                ) VALUES (?,?,?,?,?,?,?,?,?, 'pending')
-                """,
-                (
-                    user_id,
-                    data.get("full_name"),
-                    data.get("major"),
-                    data.get("entry_year"),
-                    data.get("student_number"),
-                    data.get("national_id"),
-                    data.get("phone"),
-                    data.get("telegram_username"),
-                    data.get("student_card_file"),
-                )
-            )
-            req_id = c.lastrowid
-            # reflect basic info in users table for consistency
-            try:
-                c.execute("""
-                    INSERT OR IGNORE INTO users (user_id, full_name, national_id, student_id, phone, is_student, status)
-                    VALUES (?,?,?,?,?,1,'pending')
-                """, (user_id, data.get("full_name"), data.get("national_id"), data.get("student_number"), data.get("phone")))
-                c.execute("""
-                    UPDATE users SET full_name=?, national_id=?, student_id=?, phone=?, is_student=1 WHERE user_id=?
-                """, (data.get("full_name"), data.get("national_id"), data.get("student_number"), data.get("phone"), user_id))
-            except Exception:
-                pass
-            conn.commit()
-            conn.close()
+            data = dict(get_user_data(user_states, user_id))
+
+            # the request is saved once the card is on disk
+            async def card_saved(path):
+                data["student_card_file"] = path
+
+                # persist to DB
+                def _save(conn):
+                    c = conn.cursor()
+                    c.execute(
+                        """
+                        INSERT INTO memberships (
+                            user_id, full_name, major, entry_year, student_number,
+                            national_id, phone, telegram_username, student_card_file, status
+                        ) VALUES (?,?,?,?,?,?,?,?,?, 'pending')
+                        """,
+                        (
+                            user_id,
+                            data.get("full_name"),
+                            data.get("major"),
+                            data.get("entry_year"),
+                            data.get("student_number"),
+                            data.get("national_id"),
+                            data.get("phone"),
+                            data.get("telegram_username"),
+                            data.get("student_card_file"),
+                        )
+                    )
+                    new_id = c.lastrowid
+                    # reflect basic info in users table for consistency
+                    try:
+                        c.execute("""
+                            INSERT OR IGNORE INTO users (user_id, full_name, national_id, student_id, phone, is_student, status)
+                            VALUES (?,?,?,?,?,1,'pending')
+                        """, (user_id, data.get("full_name"), data.get("national_id"), data.get("student_number"), data.get("phone")))
+                        c.execute("""
+                            UPDATE users SET full_name=?, national_id=?, student_id=?, phone=?, is_student=1 WHERE user_id=?
+                        """, (data.get("full_name"), data.get("national_id"), data.get("student_number"), data.get("phone"), user_id))
+                    except Exception:
+                        pass
+                    return new_id
+                req_id = await db_write(_save)
+
+                # notify admins
+                try:
+                    if get_setting("notify_new_membership", "1") == "1":
+                        admins = get_admin_ids()
+                        note = (
+                            f"🔔 درخواست عضویت جدید\n"
+                            f"کاربر: {data.get('full_name','')} ({user_id})\n"
+                            f"شناسه درخواست: #{req_id}"
+                        )
+                        for aid in admins:
+                            try:
+                                await client.send_message(aid, note)
+                            except Exception:
+                                pass
+                except Exception:
+                    pass
 
-            clear_user_state(user_states, user_id)
+                await event.reply(
+                    "✅ درخواست عضویت شما با موفقیت ثبت شد و در حال بررسی است.",
+                    buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]]
+                )
 
-            # notify admins
-            try:
-                if get_setting("notify_new_membership", "1") == "1":
-                    admins = get_admin_ids()
-                    note = (
-                        f"🔔 درخواست عضویت جدید\n"
-                        f"کاربر: {data.get('full_name','')} ({user_id})\n"
-                        f"شناسه درخواست: #{req_id}"
-                    )
-                    for aid in admins:
-                        try:
-                            await client.send_message(aid, note)
-                        except Exception:
-                            pass
-            except Exception:
-                pass
+            async def card_failed(error):
+                set_user_state(user_states, user_id, "membership_step_card_photo", data)
+                await event.reply("❌ دریافت فایل کارت دانشجویی ناموفق بود. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
 
-            await event.reply(
-                "✅ درخواست عضویت شما با موفقیت ثبت شد و در حال بررسی است.",
-                buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]]
-            )
+            if not submit_download(event.message, file_ext, card_saved, card_failed, max_bytes=10 * 1024 * 1024):
+                await event.reply("⏳ سرور مشغول است؛ لطفا چند لحظه دیگر فایل را دوباره ارسال کنید.", buttons=CANCEL_BUTTON)
+                return
+            clear_user_state(user_states, user_id)
+            await event.reply("📥 کارت دانشجویی دریافت شد؛ درخواست شما در حال ثبت است...")
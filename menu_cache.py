@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+from database import db_read, get_connection, on_write
+from settings_cache import CHECK_INTERVAL
+
+# ---------------------------------------------------------------------------
+# Keyboard render cache
+# The main menus are the same for every user with the same inputs, but used
+# to be rebuilt (two pooled connections, four probes) on every /start,
+# main_menu and cancel. Rendered keyboards are kept here by key -- role plus
+# the few values that change the layout -- and dropped as a whole when any
+# table they are built from changes. Changes are detected through the
+# table_versions rows that triggers bump (see database.VERSIONED_TABLES) and
+# the settings version, so a menu request is a dict lookup. Keyboards are
+# shared; callers must not mutate them.
+#
+# Everything a menu is built from is read off the event loop by
+# reload_menu_inputs(): on the writer thread after each of the bot's own
+# writes, and every CHECK_INTERVAL seconds by watch_keyboards() for writes made
+# elsewhere. That covers the admin menu's pending-item badges (badge_counters,
+# kept by triggers) and the probes behind the user menu (user_menu_inputs()),
+# the latter re-run only when a version moved.
+# ---------------------------------------------------------------------------
+DEPENDS_ON = ('events', 'faqs', 'certificates')
+MAX_KEYBOARDS = 256
+
+_rendered = {}
+_badges = {}
+_user_inputs = None
+_versions = None
+_lock = threading.Lock()
+
+
+def _read_versions(conn):
+    placeholders = ','.join('?' * len(DEPENDS_ON))
+    rows = conn.execute(f"SELECT name, version FROM table_versions WHERE name IN ({placeholders})", DEPENDS_ON).fetchall()
+    settings = conn.execute("SELECT version FROM settings_version WHERE id = 1").fetchone()
+    return tuple(sorted(rows)), settings[0] if settings else 0
+
+
+def _read_user_inputs(conn):
+    row = conn.execute("SELECT value FROM settings WHERE key = 'main_events'").fetchone()
+    main_ids = [int(x) for x in (row[0] if row and row[0] else '').split(',') if x.strip().isdigit()]
+    mains = []
+    if main_ids:
+        q = f"SELECT id, title FROM events WHERE id IN ({','.join(['?']*len(main_ids))}) AND is_active = 1"
+        mains = conn.execute(q, tuple(main_ids)).fetchall()
+    return {
+        'mains': mains,
+        'has_events': conn.execute("SELECT 1 FROM events WHERE is_active = 1 LIMIT 1").fetchone() is not None,
+        'has_faq': conn.execute("SELECT 1 FROM faqs LIMIT 1").fetchone() is not None,
+        'has_any_cert': conn.execute("SELECT 1 FROM certificates LIMIT 1").fetchone() is not None,
+    }
+
+
+def cached_keyboard(key, build):
+    """Return the keyboard rendered for key, calling build() only on a miss."""
+    keyboard = _rendered.get(key)
+    if keyboard is None:
+        keyboard = build()
+        with _lock:
+            if len(_rendered) >= MAX_KEYBOARDS:
+                _rendered.clear()
+            _rendered[key] = keyboard
+    return keyboard
+
+
+@on_write
+def reload_menu_inputs(conn=None):
+    """Re-read badge counts, and the user menu probes if their tables changed.
+
+    Accepts a connection so it can run via db_read().
+    """
+    global _badges, _user_inputs, _versions
+    own = conn is None
+    if own:
+        conn = get_connection()
+    try:
+        _badges = {name: value for name, value in conn.execute("SELECT name, value FROM badge_counters")}
+        versions = _read_versions(conn)
+        if versions == _versions:
+            return
+        user_inputs = _read_user_inputs(conn)
+    finally:
+        if own:
+            conn.close()
+    with _lock:
+        _rendered.clear()
+        _user_inputs = user_inputs
+        _versions = versions
+
+
+def badge_counts():
+    """Pending-item counts for the admin menu badges (see database.BADGE_COUNTERS)."""
+    return _badges
+
+
+def user_menu_inputs():
+    """Main events, has_events, has_faq, has_any_cert for the user menu; None until first loaded."""
+    return _user_inputs
+
+
+async def watch_keyboards():
+    """Pick up changes made outside this process; run as a background task."""
+    while True:
+        await asyncio.sleep(CHECK_INTERVAL)
+        try:
+            await db_read(reload_menu_inputs)
+        except Exception:
+            pass
+
+
+def invalidate_keyboards():
+    """Drop every rendered keyboard; the next reload re-reads all inputs."""
+    global _versions
+    with _lock:
+        _rendered.clear()
+        _versions = None
@@ -0,0 +1,40 @@
+import asyncio
+import collections
+
+# ---------------------------------------------------------------------------
+# Event-loop lag
+# A sampler task sleeps for a fixed interval and records how late it woke up.
+# Anything blocking the loop (sync SQLite, exports, os.walk...) shows up here
+# directly, so p99 of these samples is the latency floor for every callback.
+# ---------------------------------------------------------------------------
+_loop_lag_samples = collections.deque(maxlen=2400)
+
+
+async def monitor_loop_lag(interval=0.25):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        _loop_lag_samples.append(max(0.0, loop.time() - start - interval))
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, max(0, int(round(pct / 100.0 * len(sorted_samples))) - 1))
+    return sorted_samples[idx]
+
+
+def get_loop_lag_stats():
+    """Return {'count', 'p50_ms', 'p99_ms', 'max_ms'} over the recent samples."""
+    samples = sorted(_loop_lag_samples)
+    return {
+        'count': len(samples),
+        'p50_ms': round(_percentile(samples, 50) * 1000, 2),
+        'p99_ms': round(_percentile(samples, 99) * 1000, 2),
+        'max_ms': round((samples[-1] if samples else 0.0) * 1000, 2),
+    }
+
+
+def reset_loop_lag_stats():
+    _loop_lag_samples.clear()
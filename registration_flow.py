@@ -1,20 +1,46 @@
 
-from telethon import events, Button
+from telethon import Button
+from router import get_router
 from utils import (
     CANCEL_BUTTON, BACK_BUTTON,
     set_user_state, get_user_state, get_user_data, clear_user_state,
     is_user_member, get_setting, get_admin_ids,
     rate_limit_check, sanitize_text
 )
-from database import DB_NAME
-import sqlite3
-import os
-import time
-import random
+from database import fetch_one, db_read, db_write
+from media_ingest import submit_download
+
+def registration_block_reason(conn, user_id, event_id):
+    """Return 'duplicate' or 'full' when the user may not register for event_id, else None."""
+    c = conn.cursor()
+    # check per-event single_registration flag (default True)
+    try:
+        c.execute("SELECT single_registration FROM events WHERE id = ?", (event_id,))
+        sr_row = c.fetchone()
+        single_reg = True if sr_row is None or sr_row[0] is None else bool(sr_row[0])
+    except Exception:
+        single_reg = True
+    if single_reg:
+        # block only if user already has an approved or pending registration
+        c.execute("SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? AND status IN ('approved','pending')", (user_id, event_id))
+        if c.fetchone():
+            return "duplicate"
+    c.execute("SELECT capacity FROM events WHERE id = ?", (event_id,))
+    cap_row = c.fetchone()
+    capacity = cap_row[0] if cap_row else None
+    if capacity is not None:
+        c.execute("SELECT COUNT(*) FROM registrations WHERE event_id = ? AND status IN ('approved','pending')", (event_id,))
+        if c.fetchone()[0] >= capacity:
+            return "full"
+    return None
 
 def setup_registration_handlers(client, user_states):
+    router = get_router(client, user_states)
 
-    @client.on(events.NewMessage)
+    @router.message(
+        "register_step_1", "register_step_2", "register_step_3", "register_step_5",
+        "register_step_6", "register_step_7",
+    )
     async def registration_message_handler(event):
         user_id = event.sender_id
         # basic per-user rate limiting (limit requests to reasonable amount)
@@ -64,46 +90,22 @@ def setup_registration_handlers(client, user_states):
             data = get_user_data(user_states, user_id)
             data["phone"] = clean_phone
             event_id = data.get("event_id")
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number FROM events WHERE id = ?", (event_id,))
-            event_info = c.fetchone()
-            conn.close()
+            event_info = await fetch_one("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number FROM events WHERE id = ?", (event_id,))
             if not event_info:
                 await event.reply("❌ خطایی در دریافت اطلاعات رویداد رخ داد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 clear_user_state(user_states, user_id)
                 return
             cost_type, fixed_cost, student_cost, non_student_cost, card_number = event_info
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
             # respect global setting: single registration per user (default on)
-            # check per-event single_registration flag (default True)
-            try:
-                c.execute("SELECT single_registration FROM events WHERE id = ?", (event_id,))
-                sr_row = c.fetchone()
-                single_reg = True if sr_row is None or sr_row[0] is None else bool(sr_row[0])
-            except Exception:
-                single_reg = True
-            if single_reg:
-                # block only if user already has an approved or pending registration
-                c.execute("SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? AND status IN ('approved','pending')", (user_id, event_id))
-                if c.fetchone():
-                    conn.close()
-                    await event.reply("ℹ️ شما قبلاً برای این رویداد ثبت‌نام کرده‌اید.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-                    clear_user_state(user_states, user_id)
-                    return
-            c.execute("SELECT capacity FROM events WHERE id = ?", (event_id,))
-            cap_row = c.fetchone()
-            capacity = cap_row[0] if cap_row else None
-            if capacity is not None:
-                c.execute("SELECT COUNT(*) FROM registrations WHERE event_id = ? AND status IN ('approved','pending')", (event_id,))
-                current_cnt = c.fetchone()[0]
-                if current_cnt >= capacity:
-                    conn.close()
-                    await event.reply("❌ ظرفیت این رویداد تکمیل شده است.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-                    clear_user_state(user_states, user_id)
-                    return
-            conn.close()
+            blocked = await db_read(registration_block_reason, user_id, event_id)
+            if blocked == "duplicate":
+                await event.reply("ℹ️ شما قبلاً برای این رویداد ثبت‌نام کرده‌اید.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
+                clear_user_state(user_states, user_id)
+                return
+            if blocked == "full":
+                await event.reply("❌ ظرفیت این رویداد تکمیل شده است.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
+                clear_user_state(user_states, user_id)
+                return
             data["cost_type"] = cost_type
             set_user_state(user_states, user_id, "register_step_4", data)
 
@@ -126,11 +128,7 @@ def setup_registration_handlers(client, user_states):
             # If event is free, check certificate fees (single or student-specific)
             if data.get("cost_type") == "free":
                 event_id = data.get("event_id")
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder FROM events WHERE id = ?", (event_id,))
-                row = c.fetchone()
-                conn.close()
+                row = await fetch_one("SELECT cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder FROM events WHERE id = ?", (event_id,))
                 cert_fee = cert_fee_student = cert_fee_non_student = cert_card = cert_holder = None
                 if row:
                     cert_fee, cert_fee_student, cert_fee_non_student, cert_card, cert_holder = row
@@ -162,11 +160,7 @@ def setup_registration_handlers(client, user_states):
 
             # non-free events: follow existing amount logic
             event_id = data["event_id"]
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number FROM events WHERE id = ?", (event_id,))
-            event_info = c.fetchone()
-            conn.close()
+            event_info = await fetch_one("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number FROM events WHERE id = ?", (event_id,))
             cost_type, fixed_cost, student_cost, non_student_cost, card_number = event_info
             amount = 0
             if cost_type == "fixed":
@@ -203,16 +197,27 @@ def setup_registration_handlers(client, user_states):
             if file_ext not in allowed:
                 await event.reply("❌ فقط فرمت‌های jpg, jpeg, png, pdf مجاز است.", buttons=CANCEL_BUTTON)
                 return
-            unique_name = f"receipt_{user_id}_{int(time.time())}_{random.randint(1000,9999)}.{file_ext}"
-            temp_path = os.path.join("uploads", unique_name)
-            await event.message.download_media(file=temp_path)
+            data = dict(get_user_data(user_states, user_id))
 
-            data = get_user_data(user_states, user_id)
-            data["payment_receipt_path"] = temp_path
+            # the registration is saved once the receipt is on disk
+            async def receipt_saved(path):
+                data["payment_receipt_path"] = path
+                await finalize_registration(client, event, user_id, data, used_profile=False)
 
-            await finalize_registration(client, event, user_id, data, used_profile=False)
+            async def receipt_failed(error):
+                set_user_state(user_states, user_id, "register_step_7", data)
+                await event.reply("❌ دریافت فیش واریز ناموفق بود. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
 
-    @client.on(events.CallbackQuery)
+            if not submit_download(event.message, file_ext, receipt_saved, receipt_failed, max_bytes=10 * 1024 * 1024):
+                await event.reply("⏳ سرور مشغول است؛ لطفا چند لحظه دیگر فیش را دوباره ارسال کنید.", buttons=CANCEL_BUTTON)
+                return
+            clear_user_state(user_states, user_id)
+            await event.reply("📥 فیش واریز دریافت شد؛ ثبت‌نام شما در حال ثبت است...")
+
+    @router.callback(
+        "payment_done",
+        prefixes=("start_register_manual_", "use_profile_"),
+    )
     async def registration_callback_handler(event):
         data = event.data.decode('utf-8')
         user_id = event.sender_id
@@ -239,11 +244,7 @@ def setup_registration_handlers(client, user_states):
 
         if data.startswith("use_profile_"):
             event_id = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT full_name, national_id, phone, is_student, student_id FROM users WHERE user_id = ?", (user_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT full_name, national_id, phone, is_student, student_id FROM users WHERE user_id = ?", (user_id,))
             if not row:
                 await event.answer("📌 پروفایلی پیدا نشد. لطفا اطلاعات را به صورت دستی وارد کنید.", alert=True)
                 clear_user_state(user_states, user_id)
@@ -280,37 +281,18 @@ def setup_registration_handlers(client, user_states):
                 "is_student": 1 if is_student else 0,
                 "student_id": student_id
             }
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number, capacity FROM events WHERE id = ?", (event_id,))
-            event_info = c.fetchone()
+            event_info = await fetch_one("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number, capacity FROM events WHERE id = ?", (event_id,))
             if not event_info:
-                conn.close()
                 await event.answer("❌ خطا در دریافت اطلاعات رویداد. لطفا دوباره تلاش کنید.", alert=True)
                 return
             cost_type, fixed_cost, student_cost, non_student_cost, card_number, capacity = event_info
-            # check per-event single_registration flag (default True)
-            try:
-                c.execute("SELECT single_registration FROM events WHERE id = ?", (event_id,))
-                sr_row = c.fetchone()
-                single_reg = True if sr_row is None or sr_row[0] is None else bool(sr_row[0])
-            except Exception:
-                single_reg = True
-            if single_reg:
-                # block only if user already has an approved or pending registration
-                c.execute("SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? AND status IN ('approved','pending')", (user_id, event_id))
-                if c.fetchone():
-                    conn.close()
-                    await event.answer("ℹ️ شما قبلاً برای این رویداد ثبت‌نام کرده‌اید.", alert=True)
-                    return
-            if capacity is not None:
-                c.execute("SELECT COUNT(*) FROM registrations WHERE event_id = ? AND status IN ('approved','pending')", (event_id,))
-                current_cnt = c.fetchone()[0]
-                if current_cnt >= capacity:
-                    conn.close()
-                    await event.answer("❌ ظرفیت این رویداد تکمیل شده است.", alert=True)
-                    return
-            conn.close()
+            blocked = await db_read(registration_block_reason, user_id, event_id)
+            if blocked == "duplicate":
+                await event.answer("ℹ️ شما قبلاً برای این رویداد ثبت‌نام کرده‌اید.", alert=True)
+                return
+            if blocked == "full":
+                await event.answer("❌ ظرفیت این رویداد تکمیل شده است.", alert=True)
+                return
             amount = 0
             if cost_type == 'fixed':
                 amount = fixed_cost
@@ -320,11 +302,7 @@ def setup_registration_handlers(client, user_states):
             # if event is free or amount == 0 then check certificate fees
             if cost_type == 'free' or amount == 0:
                 # check cert fees
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder FROM events WHERE id = ?", (event_id,))
-                row = c.fetchone()
-                conn.close()
+                row = await fetch_one("SELECT cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder FROM events WHERE id = ?", (event_id,))
                 cert_fee = cert_fee_student = cert_fee_non_student = cert_card = cert_holder = None
                 if row:
                     cert_fee, cert_fee_student, cert_fee_non_student, cert_card, cert_holder = row
@@ -383,14 +361,7 @@ def setup_registration_handlers(client, user_states):
             except:
                 pass
 
-        elif data == "cancel":
-            clear_user_state(user_states, user_id)
-            try:
-                await event.edit("✅ عملیات لغو شد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
-            except:
-                pass
-
-    @client.on(events.CallbackQuery(pattern=b"student_(yes|no)"))
+    @router.callback("student_no", "student_yes")
     async def student_status_handler(event):
         user_id = event.sender_id
         state = get_user_state(user_states, user_id)
@@ -409,11 +380,7 @@ def setup_registration_handlers(client, user_states):
             event_id = data.get("event_id")
             if cost_type == "free":
                 # check certificate fees for non-students
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder FROM events WHERE id = ?", (event_id,))
-                row = c.fetchone()
-                conn.close()
+                row = await fetch_one("SELECT cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder FROM events WHERE id = ?", (event_id,))
                 cert_fee = cert_fee_student = cert_fee_non_student = cert_card = cert_holder = None
                 if row:
                     cert_fee, cert_fee_student, cert_fee_non_student, cert_card, cert_holder = row
@@ -444,11 +411,7 @@ def setup_registration_handlers(client, user_states):
                     return
             else:
                 event_id = data["event_id"]
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number FROM events WHERE id = ?", (event_id,))
-                event_info = c.fetchone()
-                conn.close()
+                event_info = await fetch_one("SELECT cost_type, fixed_cost, student_cost, non_student_cost, card_number FROM events WHERE id = ?", (event_id,))
                 cost_type, fixed_cost, student_cost, non_student_cost, card_number = event_info
                 amount = 0
                 if cost_type == "fixed":
@@ -466,26 +429,25 @@ def setup_registration_handlers(client, user_states):
                 await event.edit(msg, buttons=buttons, parse_mode="markdown")
 
     async def finalize_registration(client, event_or_callback, user_id, data, used_profile=False):
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO users (user_id, full_name, national_id, student_id, phone, is_student, status) VALUES (?, ?, ?, ?, ?, ?, 'pending')",
-                  (user_id, data["full_name"], data["national_id"], data.get("student_id"), data["phone"], data["is_student"]))
-        c.execute("UPDATE users SET full_name = ?, national_id = ?, student_id = ?, phone = ?, is_student = ? WHERE user_id = ?",
-                  (data["full_name"], data["national_id"], data.get("student_id"), data["phone"], data["is_student"], user_id))
-        try:
-            c.execute("""
-                INSERT INTO registrations (user_id, event_id, payment_receipt_file_id, status)
-                VALUES (?, ?, ?, ?)
-            """, (
-                user_id,
-                data["event_id"],
-                data.get("payment_receipt_path"),
-                "pending"
-            ))
-        except Exception:
-            pass
-        conn.commit()
-        conn.close()
+        def _save(conn):
+            c = conn.cursor()
+            c.execute("INSERT OR IGNORE INTO users (user_id, full_name, national_id, student_id, phone, is_student, status) VALUES (?, ?, ?, ?, ?, ?, 'pending')",
+                      (user_id, data["full_name"], data["national_id"], data.get("student_id"), data["phone"], data["is_student"]))
+            c.execute("UPDATE users SET full_name = ?, national_id = ?, student_id = ?, phone = ?, is_student = ? WHERE user_id = ?",
+                      (data["full_name"], data["national_id"], data.get("student_id"), data["phone"], data["is_student"], user_id))
+            try:
+                c.execute("""
+                    INSERT INTO registrations (user_id, event_id, payment_receipt_file_id, status)
+                    VALUES (?, ?, ?, ?)
+                """, (
+                    user_id,
+                    data["event_id"],
+                    data.get("payment_receipt_path"),
+                    "pending"
+                ))
+            except Exception:
+                pass
+        await db_write(_save)
         clear_user_state(user_states, user_id)
         try:
             if get_setting("notify_new_registration","1") == "1":
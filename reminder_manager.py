@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+
+from database import db_read, db_write, fetch_all
+
+# ---------------------------------------------------------------------------
+# Event reminders
+# An event with reminders_enabled sends each registrant a reminder when its
+# end_at_ts (the only timestamp an event has) is one of its reminder
+# intervals away -- events.reminder_intervals ('24h,2h'), or the
+# registration's own reminder_intervals when set -- to registrations whose
+# status is listed in events.reminder_recipients and that have not opted out.
+#
+# Each event has one scheduler job at its next interval boundary. When it
+# fires, the (event, user, interval) tuples that are due and not yet in
+# reminders_sent come from a single query; if several intervals have passed
+# (e.g. the bot was down) only the most imminent one is sent. Reminders go
+# out through a small pool of workers sharing the broadcast token bucket,
+# and are recorded in batches with INSERT OR IGNORE against the
+# (event_id, user_id, reminder_type) unique index, so a re-run never sends
+# twice (a reminder sent in the last second before a crash may be).
+# ---------------------------------------------------------------------------
+try:
+    REMINDER_WORKERS = max(1, int(os.getenv('JURISLAW_REMINDER_WORKERS', '4')))
+except Exception:
+    REMINDER_WORKERS = 4
+
+DEFAULT_INTERVALS = '24h,2h'
+DEFAULT_RECIPIENTS = 'pending,approved'
+MAX_ATTEMPTS = 3
+FLUSH_SIZE = 200
+
+UNIT_SECONDS = {'m': 60, 'h': 3600, 'd': 86400}
+UNIT_NAMES = {'m': 'دقیقه', 'h': 'ساعت', 'd': 'روز'}
+
+_client = None
+_loaded = False
+_sweep_lock = None
+
+
+def parse_intervals(text):
+    """'24h, 2h,30m' -> [('24h', 86400), ('2h', 7200), ('30m', 1800)]; a bare number means hours."""
+    out = {}
+    for token in (text or '').lower().replace(' ', '').split(','):
+        if not token:
+            continue
+        unit = token[-1] if token[-1] in UNIT_SECONDS else 'h'
+        number = token[:-1] if token[-1] in UNIT_SECONDS else token
+        if number.isdigit() and int(number) > 0:
+            out[token] = int(number) * UNIT_SECONDS[unit]
+    return sorted(out.items(), key=lambda kv: -kv[1])
+
+
+def interval_label(token):
+    unit = token[-1] if token[-1] in UNIT_SECONDS else 'h'
+    number = token[:-1] if token[-1] in UNIT_SECONDS else token
+    return f"{number} {UNIT_NAMES[unit]}"
+
+
+def _load_plans(conn, event_ids):
+    marks = ','.join('?' * len(event_ids))
+    rows = conn.execute(f"""
+        SELECT e.id, e.title, e.end_at_ts, e.reminder_intervals,
+               (SELECT group_concat(DISTINCT r.reminder_intervals) FROM registrations r
+                WHERE r.event_id = e.id AND r.reminder_intervals IS NOT NULL)
+        FROM events e
+        WHERE e.id IN ({marks}) AND e.is_active = 1 AND e.reminders_enabled = 1 AND e.end_at_ts IS NOT NULL
+    """, tuple(event_ids)).fetchall()
+    plans = {}
+    for event_id, title, end_at_ts, intervals, overrides in rows:
+        spec = (intervals or DEFAULT_INTERVALS) + ',' + (overrides or '')
+        plans[event_id] = (title, int(end_at_ts), parse_intervals(spec))
+    return plans
+
+
+def _due_reminders(conn, due):
+    """(event_id, user_id, reminder_type) still to send for the given (event_id, reminder_type, seconds) rows."""
+    values = ','.join(['(?,?,?)'] * len(due))
+    params = [v for row in due for v in row]
+    # per registration, the smallest passed interval that it asked for; bare columns take MIN's row
+    return conn.execute(f"""
+        WITH due(event_id, reminder_type, secs) AS (VALUES {values})
+        SELECT x.event_id, x.user_id, x.reminder_type FROM (
+            SELECT r.event_id, r.user_id, due.reminder_type, MIN(due.secs)
+            FROM due
+            JOIN events e ON e.id = due.event_id
+            JOIN registrations r ON r.event_id = due.event_id
+            WHERE r.reminder_opt_in IS NOT 0
+              AND instr(',' || LOWER(REPLACE(COALESCE(e.reminder_recipients, '{DEFAULT_RECIPIENTS}'), ' ', '')) || ',',
+                        ',' || r.status || ',') > 0
+              AND instr(',' || LOWER(REPLACE(COALESCE(r.reminder_intervals, e.reminder_intervals, '{DEFAULT_INTERVALS}'), ' ', '')) || ',',
+                        ',' || due.reminder_type || ',') > 0
+            GROUP BY r.id
+        ) x
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reminders_sent s
+            WHERE s.event_id = x.event_id AND s.user_id = x.user_id AND s.reminder_type = x.reminder_type
+        )
+        ORDER BY x.event_id, x.user_id
+    """, params).fetchall()
+
+
+def _record_sent(conn, rows):
+    conn.executemany(
+        "INSERT OR IGNORE INTO reminders_sent (event_id, user_id, reminder_type, sent_at) VALUES (?, ?, ?, ?)", rows)
+
+
+def refresh_event_reminders(event_id):
+    """Re-plan an event's reminders after its deadline, status or reminder settings changed."""
+    if not _loaded:
+        return
+    from scheduler import get_scheduler
+    get_scheduler().schedule(('event_reminder', int(event_id)), time.time(), send_due_reminders, int(event_id))
+
+
+async def load_event_reminders(client):
+    """Plan reminders for every open event; client is None in dry-run mode. Returns the number of events."""
+    global _client, _loaded
+    _client = client
+    _loaded = True
+    rows = await fetch_all(
+        "SELECT id FROM events WHERE is_active = 1 AND end_at_ts IS NOT NULL AND reminders_enabled = 1")
+    # all due now, so the scheduler hands them to one send_due_reminders call
+    for (event_id,) in rows:
+        refresh_event_reminders(event_id)
+    return len(rows)
+
+
+async def _send_one(bucket, uid, text, buttons):
+    from broadcast_manager import PERMANENT_ERRORS
+    attempts = 0
+    while True:
+        attempts += 1
+        await bucket.acquire()
+        try:
+            await _client.send_message(uid, text, buttons=buttons)
+            return True
+        except Exception as e:
+            if type(e).__name__.startswith('FloodWait'):
+                bucket.pause((getattr(e, 'seconds', None) or 30) + 1)
+                attempts -= 1
+                continue
+            if attempts < MAX_ATTEMPTS and type(e).__name__ not in PERMANENT_ERRORS:
+                await asyncio.sleep(attempts)
+                continue
+            return False
+
+
+async def _dispatch(tuples, plans):
+    from broadcast_manager import get_engine
+    from telethon import Button
+    bucket = get_engine(_client).bucket
+    queue = asyncio.Queue(maxsize=REMINDER_WORKERS * 4)
+    sent = []
+    counts = {'sent': 0, 'failed': 0}
+    texts = {}
+    for event_id, _, reminder_type in tuples:
+        if (event_id, reminder_type) not in texts:
+            title = plans[event_id][0]
+            texts[(event_id, reminder_type)] = (
+                f"🔔 یادآوری: {interval_label(reminder_type)} تا پایان مهلت رویداد «{title}» باقی مانده است.",
+                [Button.inline("مشاهده رویداد", f"event_{event_id}")])
+
+    async def flush():
+        if sent:
+            batch = sent[:]
+            del sent[:len(batch)]
+            await db_write(_record_sent, batch)
+
+    async def produce():
+        try:
+            for item in tuples:
+                await queue.put(item)
+        finally:
+            for _ in range(REMINDER_WORKERS):
+                await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            event_id, uid, reminder_type = item
+            text, buttons = texts[(event_id, reminder_type)]
+            if await _send_one(bucket, uid, text, buttons):
+                counts['sent'] += 1
+                sent.append((event_id, uid, reminder_type, int(time.time())))
+                if len(sent) >= FLUSH_SIZE:
+                    await flush()
+            else:
+                counts['failed'] += 1
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(REMINDER_WORKERS)))
+    finally:
+        await flush()
+    return counts
+
+
+async def send_due_reminders(payloads):
+    """Scheduler handler: send what is due for the given events and schedule their next boundary."""
+    global _sweep_lock
+    from scheduler import get_scheduler
+    event_ids = set(payloads)
+    if _sweep_lock is None:
+        _sweep_lock = asyncio.Lock()
+    async with _sweep_lock:
+        now = int(time.time())
+        plans = await db_read(_load_plans, sorted(event_ids))
+        due = [(event_id, token, secs)
+               for event_id, (_, end_at_ts, intervals) in plans.items()
+               for token, secs in intervals if end_at_ts - secs <= now < end_at_ts]
+        tuples = await db_read(_due_reminders, due) if due else []
+        if tuples:
+            started = time.monotonic()
+            if _client is None:
+                counts = {'dry-run': len(tuples)}
+            else:
+                counts = await _dispatch(tuples, plans)
+            try:
+                from log_helper import console_log
+                console_log(f"event reminders: {counts} for events {sorted({t[0] for t in tuples})} in {time.monotonic() - started:.1f}s",
+                            f"یادآوری رویدادها: {counts} برای رویدادهای {sorted({t[0] for t in tuples})} در {time.monotonic() - started:.1f} ثانیه")
+            except Exception:
+                pass
+        # events that were archived or had reminders turned off simply get no next job
+        for event_id, (_, end_at_ts, intervals) in plans.items():
+            upcoming = [end_at_ts - secs for _, secs in intervals if end_at_ts - secs > now]
+            if upcoming:
+                get_scheduler().schedule(('event_reminder', event_id), min(upcoming), send_due_reminders, event_id)
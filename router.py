@@ -0,0 +1,192 @@
+# ---------------------------------------------------------------------------
+# Update router
+# Every module used to register its own catch-all NewMessage/CallbackQuery
+# handler, so each update was fanned out to a dozen coroutines that each
+# decoded event.data, looked up the user state and re-checked membership.
+# Instead the client gets exactly one handler per update type; modules declare
+# which callback data / commands / user states they own and the router
+# invokes the single owner:
+#
+#     router = get_router(client, user_states)
+#
+#     @router.callback("user_profile", "main_menu", prefixes=("event_",))
+#     async def callback_handler(event): ...
+#
+#     @router.message("register_step_1", "register_step_2")
+#     async def registration_message_handler(event): ...
+#
+# Callback data is matched exactly first, then by the longest registered
+# prefix (prefixes end in "_" and are stored in a trie of "_"-separated
+# segments, so "event_page_2" goes to the "event_page_" owner, not "event_").
+# Binary callback data from callback_codec.cb() skips both: its opcode indexes
+# the handlers registered with op(), which receive the decoded arguments:
+#
+#     @router.op("edit_event", legacy=("admin_edit_event_",))
+#     async def edit_event(event, event_id): ...
+# Messages go to a registered /command first, then to the owner of the
+# user's current state; users without a state reach the default handler.
+# A callback nobody owns (a stale keyboard, an opcode that no longer exists,
+# arguments that don't parse) is still answered with EXPIRED_NOTICE, so the
+# client doesn't spin until Telegram times the query out.
+# ---------------------------------------------------------------------------
+
+from callback_codec import MARK, OPS, decode, parse_text
+
+_HANDLER = object()  # trie key holding the owner of a prefix
+_BINARY = bytes((MARK,))
+EXPIRED_NOTICE = "⌛ این دکمه منقضی شده است؛ لطفا منو را دوباره باز کنید."
+
+
+async def _answer_expired(event):
+    try:
+        await event.answer(EXPIRED_NOTICE)
+    except Exception:
+        pass
+
+
+class UpdateRouter:
+    def __init__(self, state_of=None):
+        self.state_of = state_of or (lambda user_id: None)
+        self._exact = {}
+        self._prefixes = {}
+        self._ops = {}
+        self._commands = {}
+        self._states = {}
+        self._default_message = None
+
+    # -- registration -------------------------------------------------------
+    @staticmethod
+    def _claim(table, key, fn, kind):
+        owner = table.get(key)
+        if owner is not None and owner is not fn:
+            raise ValueError(f"{kind} {key!r} is already routed to {owner.__name__}")
+        table[key] = fn
+
+    def callback(self, *keys, prefixes=()):
+        def decorator(fn):
+            for key in keys:
+                self._claim(self._exact, key, fn, "callback")
+            for prefix in prefixes:
+                if not prefix.endswith("_"):
+                    raise ValueError(f"callback prefix {prefix!r} must end with '_'")
+                node = self._prefixes
+                for part in prefix[:-1].split("_"):
+                    node = node.setdefault(part, {})
+                self._claim(node, _HANDLER, fn, "callback prefix")
+            return fn
+        return decorator
+
+    def op(self, name, legacy=()):
+        """Own binary callback `name` (callback_codec.OPS); fn(event, *args).
+
+        legacy lists text callback data that reaches the same handler, so
+        keyboards sent before the switch keep working: exact names (no
+        arguments) and '_'-terminated prefixes followed by the arguments as
+        '_'-separated segments.
+        """
+        code, kinds = OPS[name]
+
+        def decorator(fn):
+            self._claim(self._ops, code, fn, "opcode")
+            for text in legacy:
+                skip = len(text) if text.endswith("_") else None
+
+                async def from_text(event, skip=skip):
+                    tail = event.data.decode('utf-8')[skip:] if skip else ""
+                    args = parse_text(kinds, tail)
+                    if args is None:
+                        await _answer_expired(event)
+                        return
+                    await fn(event, *args)
+                from_text.__name__ = fn.__name__
+                if skip:
+                    self.callback(prefixes=(text,))(from_text)
+                else:
+                    self.callback(text)(from_text)
+            return fn
+        return decorator
+
+    def message(self, *states, commands=(), default=False):
+        def decorator(fn):
+            for state in states:
+                self._claim(self._states, state, fn, "state")
+            for command in commands:
+                self._claim(self._commands, command.lower(), fn, "command")
+            if default:
+                if self._default_message is not None and self._default_message is not fn:
+                    raise ValueError(f"default message handler is already {self._default_message.__name__}")
+                self._default_message = fn
+            return fn
+        return decorator
+
+    # -- lookup -------------------------------------------------------------
+    def resolve_callback(self, data):
+        fn = self._exact.get(data)
+        if fn is not None:
+            return fn
+        node = self._prefixes
+        parts = data.split("_")
+        # the last segment is never followed by "_", so it can't complete a prefix
+        for part in parts[:-1]:
+            node = node.get(part)
+            if node is None:
+                break
+            fn = node.get(_HANDLER, fn)
+        return fn
+
+    def resolve_message(self, user_id, text):
+        if text and text[0] == "/":
+            command = text.split(None, 1)[0].split("@", 1)[0].lower()
+            fn = self._commands.get(command)
+            if fn is not None:
+                return fn
+        state = self.state_of(user_id)
+        if state is None:
+            return self._default_message
+        return self._states.get(state)
+
+    # -- telethon entry points ---------------------------------------------
+    async def on_callback(self, event):
+        if event.data[:1] == _BINARY:
+            decoded = decode(event.data)
+            fn = self._ops.get(decoded[0]) if decoded else None
+            if fn is None:
+                await _answer_expired(event)
+                return
+            await fn(event, *decoded[1])
+            return
+        try:
+            data = event.data.decode('utf-8')
+        except Exception:
+            await _answer_expired(event)
+            return
+        fn = self.resolve_callback(data)
+        if fn is None:
+            await _answer_expired(event)
+            return
+        await fn(event)
+
+    async def on_message(self, event):
+        message = getattr(event, 'message', None)
+        fn = self.resolve_message(event.sender_id, getattr(message, 'text', None))
+        if fn is not None:
+            await fn(event)
+
+    def attach(self, client):
+        from telethon import events
+        client.add_event_handler(self.on_callback, events.CallbackQuery)
+        client.add_event_handler(self.on_message, events.NewMessage)
+
+
+_routers = {}
+
+
+def get_router(client, user_states):
+    """Return the router attached to `client`, creating and attaching it on first use."""
+    router = _routers.get(id(client))
+    if router is None:
+        from utils import get_user_state
+        router = UpdateRouter(lambda user_id: get_user_state(user_states, user_id))
+        router.attach(client)
+        _routers[id(client)] = router
+    return router
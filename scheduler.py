@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# ---------------------------------------------------------------------------
+# In-process job scheduler
+# A heap of (due time, key) entries served by one task that sleeps exactly
+# until the earliest entry, instead of periodic polling. Jobs are identified
+# by a key (e.g. ('event_deadline', 12)); scheduling an existing key moves it
+# and cancel() drops it, both without touching the heap (stale heap entries
+# are skipped when they surface). Times are epoch seconds, like the
+# end_at_ts column.
+#
+# Everything that is due at the same moment is handed to its handler in one
+# call -- handler(payloads) -- so e.g. several deadlines expiring together are
+# archived with one statement. Handlers are coroutines and run as separate
+# tasks so a slow one can't delay the next due time.
+# ---------------------------------------------------------------------------
+MAX_SLEEP = 300  # re-check at least this often, so wall clock jumps are noticed
+
+
+class Scheduler:
+    def __init__(self):
+        self._heap = []
+        self._jobs = {}  # key -> (when, seq, handler, payload)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._running = set()
+
+    def schedule(self, key, when, handler, payload=None):
+        """Run handler([payload, ...]) at epoch time `when`; replaces any job with the same key."""
+        seq = next(self._seq)
+        self._jobs[key] = (float(when), seq, handler, payload)
+        heapq.heappush(self._heap, (float(when), seq, key))
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        return self._jobs.pop(key, None) is not None
+
+    def scheduled(self, key):
+        """Due time of the job with this key, or None."""
+        job = self._jobs.get(key)
+        return job[0] if job else None
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _next_due(self):
+        # drop heap entries whose job was cancelled or rescheduled
+        while self._heap:
+            when, seq, key = self._heap[0]
+            job = self._jobs.get(key)
+            if job is not None and job[1] == seq:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now):
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            when, seq, key = heapq.heappop(self._heap)
+            job = self._jobs.get(key)
+            if job is None or job[1] != seq:
+                continue
+            del self._jobs[key]
+            due.setdefault(job[2], []).append(job[3])
+        return due
+
+    async def _run_handler(self, handler, payloads):
+        try:
+            await handler(payloads)
+        except Exception as e:
+            try:
+                from log_helper import console_log
+                console_log(f"scheduled job {getattr(handler, '__name__', handler)} failed: {e}",
+                            f"اجرای کار زمان‌بندی‌شده {getattr(handler, '__name__', handler)} ناموفق بود: {e}")
+            except Exception:
+                pass
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            for handler, payloads in self._pop_due(now).items():
+                task = asyncio.create_task(self._run_handler(handler, payloads))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            nxt = self._next_due()
+            delay = MAX_SLEEP if nxt is None else min(MAX_SLEEP, max(0.0, nxt - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import threading
+
+from database import db_read, db_write, get_connection
+
+# ---------------------------------------------------------------------------
+# Settings cache
+# The settings table is tiny and read on almost every interaction (menus, help
+# texts, notify_* toggles, every console_log line), so it is kept in memory.
+# set_setting() writes through on the writer thread; other processes are
+# detected via the settings_version row, which triggers in init_db bump on
+# every change. watch_settings() re-reads the version off the loop every
+# CHECK_INTERVAL seconds, so a lookup only touches memory.
+# ---------------------------------------------------------------------------
+try:
+    CHECK_INTERVAL = float(os.getenv('JURISLAW_SETTINGS_CHECK_INTERVAL', '2'))
+except Exception:
+    CHECK_INTERVAL = 2.0
+
+_values = {}
+_version = None
+_lock = threading.Lock()
+
+
+def _read_version(c):
+    row = c.execute("SELECT version FROM settings_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def load_settings(conn=None):
+    """(Re)load the settings table into memory and return its version. Accepts a connection for db_read()."""
+    global _values, _version
+    own = conn is None
+    if own:
+        conn = get_connection()
+    try:
+        c = conn.cursor()
+        # read the version first: a write racing with the SELECT only causes one extra reload
+        version = _read_version(c)
+        c.execute("SELECT key, value FROM settings")
+        values = {k: v for k, v in c.fetchall()}
+    finally:
+        if own:
+            conn.close()
+    with _lock:
+        _values = values
+        _version = version
+    return version
+
+
+def _reload_if_changed(conn):
+    if _read_version(conn) != _version:
+        load_settings(conn)
+
+
+async def watch_settings():
+    """Pick up settings changed by other processes; run as a background task."""
+    while True:
+        await asyncio.sleep(CHECK_INTERVAL)
+        try:
+            await db_read(_reload_if_changed)
+        except Exception:
+            pass
+
+
+def get_cached_setting(key, default=None):
+    value = _values.get(key)
+    return default if value is None else value
+
+
+def _write_setting(conn, key, value):
+    c = conn.cursor()
+    c.execute("INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (key, value))
+    return _read_version(c)
+
+
+async def store_setting(key, value):
+    """Write a setting to the DB and update the cache in place."""
+    global _version
+    value = str(value)
+    version = await db_write(_write_setting, key, value)
+    with _lock:
+        _values[key] = value
+        # if someone else wrote in between, _version stays behind and watch_settings reloads
+        if _version is not None and version == _version + 1:
+            _version = version
+
+
+def settings_version():
+    """Version of the cached settings; changes whenever any setting changes."""
+    return _version
@@ -0,0 +1,244 @@
+import asyncio
+import collections
+import json
+import os
+import threading
+import time
+
+# ---------------------------------------------------------------------------
+# User state store
+# Conversation flows keep a per-user {'state': ..., 'data': {...}} entry. It
+# used to be a plain dict in main.py: unbounded, never expiring and lost on
+# every restart. The helpers in utils (set_user_state/get_user_state/...)
+# now delegate to a store:
+#
+#   MemoryStateStore  LRU bounded to `max_entries`, entries expire `ttl`
+#                     seconds after their last update.
+#   SQLiteStateStore  the same in-memory LRU in front of the user_states
+#                     table; changes are queued and flushed in one
+#                     transaction every `flush_interval` seconds, so flows
+#                     survive restarts without a DB write per message.
+#
+# create_state_store() picks one from JURISLAW_STATE_BACKEND (sqlite|memory).
+# ---------------------------------------------------------------------------
+try:
+    STATE_TTL = int(os.getenv('JURISLAW_STATE_TTL', str(24 * 3600)))
+except Exception:
+    STATE_TTL = 24 * 3600
+try:
+    STATE_MAX_ENTRIES = int(os.getenv('JURISLAW_STATE_MAX', '10000'))
+except Exception:
+    STATE_MAX_ENTRIES = 10000
+
+
+class MemoryStateStore:
+    def __init__(self, ttl=STATE_TTL, max_entries=STATE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()  # user_id -> (entry, updated_at)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evicted(self, user_id, entry):
+        """Hook for subclasses; called when an entry is dropped for space."""
+
+    def _put(self, user_id, entry, updated_at):
+        with self._lock:
+            self._entries[user_id] = (entry, updated_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                old_id, (old_entry, _) = self._entries.popitem(last=False)
+                self._evicted(old_id, old_entry)
+
+    def load(self, user_id):
+        """Return the live entry dict for user_id, or None."""
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            entry, updated_at = item
+            if self.ttl and time.time() - updated_at > self.ttl:
+                del self._entries[user_id]
+                self._expired(user_id)
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def _expired(self, user_id):
+        """Hook for subclasses; called when an entry is found expired."""
+
+    def save(self, user_id, state, data=None):
+        with self._lock:
+            entry = self.load(user_id)
+            if entry is None:
+                entry = {}
+            entry['state'] = state
+            if data is not None:
+                entry.setdefault('data', {}).update(data)
+            self._put(user_id, entry, time.time())
+            return entry
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def sweep(self):
+        """Drop expired entries; returns how many were removed."""
+        if not self.ttl:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [uid for uid, (_, ts) in self._entries.items() if ts < cutoff]
+            for uid in stale:
+                del self._entries[uid]
+        return len(stale)
+
+
+class SQLiteStateStore(MemoryStateStore):
+    def __init__(self, ttl=STATE_TTL, max_entries=STATE_MAX_ENTRIES, flush_interval=1.0):
+        super().__init__(ttl, max_entries)
+        self.flush_interval = flush_interval
+        self._dirty = {}          # user_id -> (state, data_json, updated_at) or None for delete
+        # once anything lives only on disk, misses have to look there
+        self._spilled = False
+
+    # -- persistence --------------------------------------------------------
+    def warm(self):
+        """Load unexpired states (most recent first) at startup."""
+        from database import get_connection
+        conn = get_connection()
+        try:
+            c = conn.cursor()
+            cutoff = int(time.time() - self.ttl) if self.ttl else 0
+            c.execute("SELECT COUNT(*) FROM user_states WHERE updated_at >= ?", (cutoff,))
+            total = c.fetchone()[0] or 0
+            c.execute("SELECT user_id, state, data, updated_at FROM user_states WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT ?",
+                      (cutoff, self.max_entries))
+            rows = c.fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            # oldest first so LRU order matches update order
+            for user_id, state, data, updated_at in reversed(rows):
+                self._entries[user_id] = (self._decode(state, data), updated_at)
+            self._spilled = total > len(rows)
+        return len(rows)
+
+    @staticmethod
+    def _decode(state, data):
+        entry = {'state': state}
+        if data:
+            try:
+                entry['data'] = json.loads(data)
+            except Exception:
+                pass
+        return entry
+
+    def _read_through(self, user_id):
+        from database import get_connection
+        conn = get_connection()
+        try:
+            row = conn.execute("SELECT state, data, updated_at FROM user_states WHERE user_id = ?", (user_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or (self.ttl and time.time() - row[2] > self.ttl):
+            return None
+        entry = self._decode(row[0], row[1])
+        MemoryStateStore._put(self, user_id, entry, row[2])
+        return entry
+
+    def _mark(self, user_id, entry, updated_at):
+        if entry is None:
+            self._dirty[user_id] = None
+        else:
+            self._dirty[user_id] = (entry.get('state'), json.dumps(entry.get('data') or {}, ensure_ascii=False, default=str), int(updated_at))
+
+    # -- store API ----------------------------------------------------------
+    def _evicted(self, user_id, entry):
+        # still on disk (or about to be); later misses must check there
+        self._spilled = True
+
+    def _expired(self, user_id):
+        self._dirty[user_id] = None
+
+    def load(self, user_id):
+        with self._lock:
+            entry = super().load(user_id)
+            if entry is None and self._spilled and self._dirty.get(user_id, 0) is not None:
+                try:
+                    entry = self._read_through(user_id)
+                except Exception:
+                    entry = None
+            return entry
+
+    def save(self, user_id, state, data=None):
+        with self._lock:
+            entry = super().save(user_id, state, data)
+            self._mark(user_id, entry, time.time())
+            return entry
+
+    def delete(self, user_id):
+        with self._lock:
+            super().delete(user_id)
+            self._dirty[user_id] = None
+
+    def flush(self, conn):
+        """Write queued changes in one transaction (run via db_write)."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        upserts = [(uid, v[0], v[1], v[2]) for uid, v in dirty.items() if v is not None]
+        deletes = [(uid,) for uid, v in dirty.items() if v is None]
+        c = conn.cursor()
+        try:
+            if upserts:
+                c.executemany("""INSERT INTO user_states (user_id, state, data, updated_at) VALUES (?, ?, ?, ?)
+                                 ON CONFLICT(user_id) DO UPDATE SET state=excluded.state, data=excluded.data, updated_at=excluded.updated_at""", upserts)
+            if deletes:
+                c.executemany("DELETE FROM user_states WHERE user_id = ?", deletes)
+        except Exception:
+            # put them back (newer changes win) so the next flush retries
+            with self._lock:
+                for uid, v in dirty.items():
+                    self._dirty.setdefault(uid, v)
+            raise
+        return len(dirty)
+
+    def purge_expired(self, conn):
+        if not self.ttl:
+            return 0
+        return conn.execute("DELETE FROM user_states WHERE updated_at < ?", (int(time.time() - self.ttl),)).rowcount
+
+    def flush_now(self):
+        from database import get_connection
+        with get_connection() as conn:
+            return self.flush(conn)
+
+    async def run_flusher(self):
+        from database import db_write
+        last_purge = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await db_write(self.flush)
+                if time.time() - last_purge > 600:
+                    last_purge = time.time()
+                    self.sweep()
+                    await db_write(self.purge_expired)
+            except Exception:
+                pass
+
+
+def create_state_store(backend=None):
+    backend = (backend or os.getenv('JURISLAW_STATE_BACKEND', 'sqlite')).lower()
+    if backend == 'memory':
+        return MemoryStateStore()
+    store = SQLiteStateStore()
+    try:
+        store.warm()
+    except Exception:
+        pass
+    return store
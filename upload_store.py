@@ -0,0 +1,145 @@
+import hashlib
+import itertools
+import os
+import time
+
+from database import db_write, run_blocking
+
+# ---------------------------------------------------------------------------
+# Content-addressed upload store
+# Uploaded files used to land flat in uploads/ under per-upload names, so the
+# same receipt sent twice was stored twice and cleanup had to stat or walk
+# the directory. Files now live at uploads/<aa>/<bb>/<sha256>.<ext>, so
+# identical content is stored once. Every stored file has a row in the blobs
+# table, and triggers on the columns that hold upload paths
+# (database.BLOB_REFERENCES) keep blobs.refcount equal to the number of rows
+# pointing at it. That covers inserts, updates and every DELETE in the code,
+# with no bookkeeping at the call sites.
+#
+# A blob whose refcount drops to 0 can be collected at once. A freshly stored
+# one that nothing references yet (a poster waiting for the admin's confirm,
+# a flow that failed half way) gets GRACE_SECONDS first, and keeps them even if
+# an older reference to the same content goes meanwhile; an explicit purge
+# skips the wait with expire_now(). collect_unreferenced() deletes such blobs
+# a batch at a time, found through a partial index instead of scanning the
+# file system. A file that can't be removed is retried after RETRY_SECONDS.
+# Callers must never os.remove a stored path themselves: another row may
+# share it.
+#
+# Puts and collection both run on the database writer thread, so a file can't
+# be collected between being stored again and being referenced.
+# ---------------------------------------------------------------------------
+UPLOAD_ROOT = 'uploads'
+INCOMING_DIR = os.path.join(UPLOAD_ROOT, '.incoming')
+GRACE_SECONDS = 24 * 3600
+COLLECT_BATCH = 200
+RETRY_SECONDS = 3600
+
+_incoming_ids = itertools.count(1)
+
+
+def blob_path(digest, ext):
+    return os.path.join(UPLOAD_ROOT, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+
+def incoming_path(ext='dat'):
+    """A fresh temporary path on the store's file system for a file about to be put()."""
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    return os.path.join(INCOMING_DIR, f"{os.getpid()}_{next(_incoming_ids)}_{int(time.time())}.{ext}.part")
+
+
+def _normalize_ext(ext):
+    ext = (ext or '').lower().lstrip('.')
+    return ext if ext.isalnum() and len(ext) <= 8 else 'dat'
+
+
+def _digest(src):
+    h = hashlib.sha256()
+    size = 0
+    with open(src, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+def _commit(conn, src, digest, size, ext):
+    path = blob_path(digest, ext)
+    if os.path.exists(path):
+        os.remove(src)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src, path)
+        try:
+            os.chmod(path, 0o600)
+        except Exception:
+            pass
+    conn.execute("""
+        INSERT INTO blobs (path, digest, size, refcount, collect_after) VALUES (?, ?, ?, 0, ?)
+        ON CONFLICT(path) DO UPDATE SET collect_after = MAX(COALESCE(collect_after, 0), excluded.collect_after)
+    """, (path, digest, size, int(time.time()) + GRACE_SECONDS))
+    return path
+
+
+async def put_file(src, ext):
+    """Move the file at src into the store and return its stored path (src is consumed)."""
+    digest, size = await run_blocking(_digest, src)
+    return await db_write(_commit, src, digest, size, _normalize_ext(ext))
+
+
+async def save_media(message, ext):
+    """Download a message's media straight into the store; returns the stored path."""
+    ext = _normalize_ext(ext)
+    part = incoming_path(ext)
+    try:
+        await message.download_media(file=part)
+        return await put_file(part, ext)
+    except Exception:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+
+
+def _collect(conn, limit):
+    rows = conn.execute("SELECT path, size FROM blobs WHERE refcount <= 0 AND collect_after <= ? LIMIT ?",
+                        (int(time.time()), limit)).fetchall()
+    removed = reclaimed = dropped = 0
+    for path, size in rows:
+        try:
+            os.remove(path)
+            removed += 1
+            reclaimed += size or 0
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # a directory, EACCES, EBUSY: move it out of the way so the next batch moves on
+            conn.execute("UPDATE blobs SET collect_after = ? WHERE path = ?", (int(time.time()) + RETRY_SECONDS, path))
+            continue
+        conn.execute("DELETE FROM blobs WHERE path = ?", (path,))
+        dropped += 1
+    return removed, reclaimed, dropped > 0 and len(rows) == limit
+
+
+def expire_now(conn, paths):
+    """Make unreferenced blobs among paths collectable now, skipping their grace period."""
+    now = int(time.time())
+    conn.executemany("UPDATE blobs SET collect_after = ? WHERE path = ? AND refcount <= 0",
+                     [(now, p) for p in set(paths) if p])
+
+
+async def collect_unreferenced(limit=COLLECT_BATCH):
+    """Delete up to `limit` collectable blobs; returns (files removed, bytes reclaimed, more left)."""
+    return await db_write(_collect, limit)
+
+
+async def collect_all(batch=COLLECT_BATCH):
+    """Collect batch by batch until nothing is collectable; returns (files removed, bytes reclaimed)."""
+    removed = reclaimed = 0
+    more = True
+    while more:
+        n, size, more = await collect_unreferenced(batch)
+        removed += n
+        reclaimed += size
+    return removed, reclaimed
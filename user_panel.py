@@ -1,22 +1,31 @@
 
-from telethon import events, Button
+from telethon import Button
+from router import get_router
+from media_cache import send_media
+from upload_store import save_media
 from utils import (
     is_user_member, get_main_menu_buttons, CANCEL_BUTTON, BACK_BUTTON,
     paginate_buttons, ABOUT_TEXT, set_user_state, get_user_state, get_user_data, clear_user_state,
-    CHANNEL_JOIN_MESSAGE, get_channel_join_buttons, get_setting, get_admin_ids, is_safe_upload_path
+    CHANNEL_JOIN_MESSAGE, get_channel_join_buttons, get_setting, get_admin_ids, is_safe_upload_path,
+    is_admin as utils_is_admin
 )
 from utils import rate_limit_check, sanitize_text, notify_admins_about
-from database import DB_NAME
-import sqlite3
-import os
-import time
-import random
+from database import DB_NAME, fetch_one, fetch_all, fetch_page, execute, insert, db_read, db_write
 
 # map user_id -> (chat_id, message_id) for last poster sent to that user
 last_poster_msgs = {}
 
+def upsert_user_fields(conn, user_id, fields):
+    """Create the users row if needed and set the given columns (runs on the DB writer)."""
+    cols = list(fields)
+    values = [fields[k] for k in cols]
+    conn.execute(f"INSERT OR IGNORE INTO users (user_id, {', '.join(cols)}) VALUES ({', '.join(['?'] * (len(cols) + 1))})", [user_id] + values)
+    conn.execute(f"UPDATE users SET {', '.join(k + ' = ?' for k in cols)} WHERE user_id = ?", values + [user_id])
+
 def setup_user_handlers(client, user_states):
-    @client.on(events.NewMessage(pattern='/help'))
+    router = get_router(client, user_states)
+
+    @router.message(commands=("/help",))
     async def help_command_handler(event):
         user_id = event.sender_id
         if not await is_user_member(client, user_id):
@@ -24,7 +33,7 @@ def setup_user_handlers(client, user_states):
         help_text = get_setting('user_help_text', 'راهنمای جامع ربات هنوز توسط ادمین تنظیم نشده است.')
         await event.reply(help_text, buttons=[[Button.inline("🏠 بازگشت به منو", b"main_menu")]])
 
-    @client.on(events.NewMessage(pattern='/start'))
+    @router.message(commands=("/start",))
     async def start_handler(event):
         user_id = event.sender_id
         # rate limit welcome/start requests
@@ -34,18 +43,12 @@ def setup_user_handlers(client, user_states):
         if not await is_user_member(client, user_id):
             await event.reply(CHANNEL_JOIN_MESSAGE, buttons=get_channel_join_buttons())
             return
-        is_admin = False
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-        if c.fetchone():
-            is_admin = True
-        conn.close()
+        is_admin = utils_is_admin(DB_NAME, user_id)
         menu_text = "👑 خوش آمدید به پنل ادمین — مدیریت سریع خدمات" if is_admin else "👋 خوش آمدید — منوی کاربر"
         subtitle = "برای راهنمایی، دکمهٔ 'راهنمای جامع ربات' را بزنید." if not is_admin else "برای تنظیمات بیشتر، از منوی ادمین استفاده کنید."
         await event.reply(f"{menu_text}\n\n{subtitle}", buttons=get_main_menu_buttons(is_admin))
 
-    @client.on(events.NewMessage)
+    @router.message(default=True)
     async def fallback_message_handler(event):
         user_id = event.sender_id
         # sanitize free-text to avoid accidental HTML/XSS and collapse whitespace
@@ -60,7 +63,17 @@ def setup_user_handlers(client, user_states):
         except:
             pass
 
-    @client.on(events.CallbackQuery)
+    @router.callback(
+        "ask_ticket", "cancel", "check_membership", "donate_confirm", "donate_paid",
+        "edit_profile_all", "edit_profile_name", "edit_profile_phone", "main_menu",
+        "profile_student_no", "profile_student_yes", "receive_certs", "track_cert", "user_about",
+        "user_donate", "user_events", "user_faq", "user_help", "user_membership", "user_my_certs",
+        "user_my_regs", "user_profile", "user_request_collab", "user_send_idea", "user_tickets",
+        prefixes=(
+            "archive_event_", "event_", "events_active_", "events_archive_", "faq_", "myreg_",
+            "notify_after_register_", "send_cert_", "start_register_", "toggle_reminder_", "view_ticket_",
+        ),
+    )
     async def callback_handler(event):
         data = event.data.decode('utf-8')
         user_id = event.sender_id
@@ -102,14 +115,8 @@ def setup_user_handlers(client, user_states):
                     pass
 
         if data == "check_membership":
-            if await is_user_member(client, user_id):
-                is_admin = False
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-                if c.fetchone():
-                    is_admin = True
-                conn.close()
+            if await is_user_member(client, user_id, force=True):
+                is_admin = utils_is_admin(DB_NAME, user_id)
                 menu_text = "👑 به پنل ادمین خوش آمدید:" if is_admin else "👤 به پنل کاربر خوش آمدید:"
                 await edit_or_send(menu_text, buttons=get_main_menu_buttons(is_admin))
             else:
@@ -119,25 +126,13 @@ def setup_user_handlers(client, user_states):
 
         if data == "cancel":
             clear_user_state(user_states, user_id)
-            is_admin = False
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-            if c.fetchone():
-                is_admin = True
-            conn.close()
+            is_admin = utils_is_admin(DB_NAME, user_id)
             await edit_or_send("✅ عملیات لغو شد.", buttons=get_main_menu_buttons(is_admin))
             return
 
         if data == "main_menu":
             clear_user_state(user_states, user_id)
-            is_admin = False
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-            if c.fetchone():
-                is_admin = True
-            conn.close()
+            is_admin = utils_is_admin(DB_NAME, user_id)
             await edit_or_send("منوی اصلی:", buttons=get_main_menu_buttons(is_admin))
             return
 
@@ -150,29 +145,19 @@ def setup_user_handlers(client, user_states):
             await edit_or_send("لطفا دسته‌بندی مورد نظر را انتخاب کنید:", buttons=buttons)
 
         elif data.startswith("events_active_"):
-            page = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events WHERE is_active = 1")
-            events_list = c.fetchall()
-            conn.close()
-            if not events_list:
+            page = await fetch_page("SELECT id, title FROM events", "is_active = 1", cursor=data.split("_")[-1])
+            if not page.rows:
                 await event.edit("📭 هیچ رویداد فعالی وجود ندارد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 return
-            buttons = paginate_buttons(events_list, "event", page, per_page=5)
+            buttons = paginate_buttons(page, "event")
             await edit_or_send("📅 رویدادهای فعال:", buttons=buttons)
 
         elif data.startswith("events_archive_"):
-            page = int(data.split("_")[-1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, title FROM events WHERE is_active = 0")
-            events_list = c.fetchall()
-            conn.close()
-            if not events_list:
+            page = await fetch_page("SELECT id, title FROM events", "is_active = 0", cursor=data.split("_")[-1])
+            if not page.rows:
                 await event.edit("📭 هیچ رویداد آرشیو شده‌ای وجود ندارد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 return
-            buttons = paginate_buttons(events_list, "archive_event", page, per_page=5)
+            buttons = paginate_buttons(page, "archive_event")
             await edit_or_send("🗃 آرشیو رویدادها:", buttons=buttons)
 
         elif data.startswith("event_"):
@@ -201,6 +186,24 @@ def setup_user_handlers(client, user_states):
 
 
 
+        elif data.startswith("toggle_reminder_"):
+            event_id = int(data.split("_")[-1])
+            def _apply(conn):
+                c = conn.cursor()
+                c.execute("UPDATE registrations SET reminder_opt_in = 1 - COALESCE(reminder_opt_in, 1) WHERE user_id = ? AND event_id = ?",
+                          (user_id, event_id))
+                row = c.execute("SELECT reminder_opt_in FROM registrations WHERE user_id = ? AND event_id = ?",
+                                (user_id, event_id)).fetchone()
+                return row[0] if row else None
+            opt_in = await db_write(_apply)
+            if opt_in is None:
+                await event.answer("❌ ابتدا در این رویداد ثبت‌نام کنید.", alert=True)
+                return
+            await event.answer("🔔 یادآوری‌های این رویداد برای شما ارسال می‌شود." if opt_in else "🔕 یادآوری‌های این رویداد برای شما ارسال نمی‌شود.", alert=True)
+
+        elif data.startswith("notify_after_register_"):
+            await event.answer("🔔 پس از ثبت‌نام در این رویداد، یادآوری‌ها پیش از پایان مهلت برای شما ارسال می‌شود.", alert=True)
+
         elif data.startswith("start_register_"):
             event_id = int(data.split("_")[2])
             clear_user_state(user_states, user_id)
@@ -212,16 +215,12 @@ def setup_user_handlers(client, user_states):
             await event.edit("برای ثبت‌نام می‌خواهید از اطلاعات پروفایل خود استفاده کنید یا دستی وارد کنید؟", buttons=buttons)
 
         elif data == "user_my_regs":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
+            regs = await fetch_all("""
                 SELECT r.id, e.title, r.status 
                 FROM registrations r
                 JOIN events e ON r.event_id = e.id
                 WHERE r.user_id = ?
             """, (user_id,))
-            regs = c.fetchall()
-            conn.close()
             if not regs:
                 await event.edit("📭 شما در هیچ رویدادی ثبت‌نام نکرده‌اید.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 return
@@ -234,17 +233,13 @@ def setup_user_handlers(client, user_states):
 
         elif data.startswith("myreg_"):
             reg_id = int(data.split("_")[1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
+            result = await fetch_one("""
                 SELECT e.title, r.status, r.register_date, u.reason_if_rejected
                 FROM registrations r
                 JOIN events e ON r.event_id = e.id
                 JOIN users u ON r.user_id = u.user_id
                 WHERE r.id = ?
             """, (reg_id,))
-            result = c.fetchone()
-            conn.close()
             if not result:
                 await event.answer("❌ ثبت‌نام یافت نشد!", alert=True)
                 return
@@ -260,29 +255,22 @@ def setup_user_handlers(client, user_states):
                 [Button.inline("🏠 منوی اصلی", b"main_menu")]
             ])
 
-        elif data == "user_faq":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, question FROM faqs")
-            faqs = c.fetchall()
-            conn.close()
-            if not faqs:
+        elif data == "user_faq" or data.startswith("faq_page_"):
+            cursor = data.split("_")[-1] if data.startswith("faq_page_") else None
+            faqs = await fetch_page("SELECT id, question FROM faqs", cursor=cursor)
+            if not faqs.rows:
                 buttons = [
                     [Button.inline("📬 ارسال سوال جدید", b"ask_ticket")],
                     [Button.inline("🏠 منوی اصلی", b"main_menu")]
                 ]
                 await event.edit("📭 هیچ سوال متداولی وجود ندارد.", buttons=buttons)
                 return
-            buttons = paginate_buttons(faqs, "faq", 0, per_page=5)
+            buttons = paginate_buttons(faqs, "faq")
             buttons.append([Button.inline("📬 ارسال سوال جدید", b"ask_ticket")])
             await event.edit("❓ سوالات متداول:", buttons=buttons)
 
         elif data == "user_profile":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT full_name, phone, national_id, is_student, student_id, language FROM users WHERE user_id = ?", (user_id,))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT full_name, phone, national_id, is_student, student_id, language FROM users WHERE user_id = ?", (user_id,))
             full_name = row[0] if row else "—"
             phone = row[1] if row else "—"
             national_id = row[2] if row and len(row) > 2 else "—"
@@ -325,23 +313,14 @@ def setup_user_handlers(client, user_states):
                 set_user_state(user_states, user_id, "edit_profile_student_id")
                 await event.edit("🎓 لطفاً شماره دانشجویی خود را ارسال کنید:", buttons=CANCEL_BUTTON)
             else:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("INSERT OR IGNORE INTO users (user_id, is_student) VALUES (?, 0)", (user_id,))
-                c.execute("UPDATE users SET is_student = ? WHERE user_id = ?", (0, user_id))
-                conn.commit()
-                conn.close()
+                await db_write(upsert_user_fields, user_id, {"is_student": 0})
                 clear_user_state(user_states, user_id)
                 await event.edit("✅ پروفایل شما با موفقیت به‌روزرسانی شد.", buttons=get_main_menu_buttons(False))
 
 
         elif data.startswith("faq_"):
             faq_id = int(data.split("_")[1])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT question, answer FROM faqs WHERE id = ?", (faq_id,))
-            faq = c.fetchone()
-            conn.close()
+            faq = await fetch_one("SELECT question, answer FROM faqs WHERE id = ?", (faq_id,))
             if not faq:
                 await event.answer("❌ سوال یافت نشد!", alert=True)
                 return
@@ -397,11 +376,7 @@ def setup_user_handlers(client, user_states):
             return
 
         elif data == "user_tickets":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT id, message, status, created_at FROM tickets WHERE user_id = ? ORDER BY id DESC", (user_id,))
-            rows = c.fetchall()
-            conn.close()
+            rows = await fetch_all("SELECT id, message, status, created_at FROM tickets WHERE user_id = ? ORDER BY id DESC", (user_id,))
             if not rows:
                 await event.edit("📭 تیکتی برای پیگیری وجود ندارد.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 return
@@ -415,11 +390,7 @@ def setup_user_handlers(client, user_states):
 
         elif data.startswith("view_ticket_"):
             tid = int(data.split("_")[2])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT message, admin_reply, status, created_at, replied_at FROM tickets WHERE id = ? AND user_id = ?", (tid, user_id))
-            row = c.fetchone()
-            conn.close()
+            row = await fetch_one("SELECT message, admin_reply, status, created_at, replied_at FROM tickets WHERE id = ? AND user_id = ?", (tid, user_id))
             if not row:
                 await event.answer("❌ تیکت یافت نشد!", alert=True)
                 return
@@ -440,25 +411,17 @@ def setup_user_handlers(client, user_states):
             await event.edit("📜 بخش گواهی‌ها:", buttons=buttons)
 
         elif data == "track_cert":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT INTO tickets (user_id, message, status) VALUES (?, ?, ?)",
+            await execute("INSERT INTO tickets (user_id, message, status) VALUES (?, ?, ?)",
                       (user_id, "درخواست پیگیری گواهی", "open"))
-            conn.commit()
-            conn.close()
             await event.edit("✅ درخواست پیگیری گواهی ثبت شد. ادمین‌ها به زودی پاسخ می‌دهند.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
 
         elif data == "receive_certs":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
+            certs = await fetch_all("""
                 SELECT c.id, e.title 
                 FROM certificates c
                 JOIN events e ON c.event_id = e.id
                 WHERE c.user_id = ?
             """, (user_id,))
-            certs = c.fetchall()
-            conn.close()
             if not certs:
                 await event.edit("📭 شما هنوز هیچ گواهی‌ای دریافت نکرده‌اید.", buttons=[[Button.inline("🏠 منوی اصلی", b"main_menu")]])
                 return
@@ -470,17 +433,13 @@ def setup_user_handlers(client, user_states):
 
         elif data.startswith("send_cert_"):
             cert_id = int(data.split("_")[2])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT file_id FROM certificates WHERE id = ? AND user_id = ?", (cert_id, user_id))
-            result = c.fetchone()
-            conn.close()
+            result = await fetch_one("SELECT file_id FROM certificates WHERE id = ? AND user_id = ?", (cert_id, user_id))
             if not result:
                 await event.answer("❌ گواهی یافت نشد!", alert=True)
                 return
             file_id = result[0]
             try:
-                await client.send_file(event.chat_id, file_id, caption="📜 گواهی شما:")
+                await send_media(client, event.chat_id, file_id, caption="📜 گواهی شما:")
                 await event.answer("✅ گواهی ارسال شد.", alert=True)
             except Exception as e:
                 await event.answer("❌ خطایی در ارسال گواهی رخ داد!", alert=True)
@@ -507,21 +466,22 @@ def setup_user_handlers(client, user_states):
             await event.edit(text, buttons=buttons)
 
 
-    @client.on(events.NewMessage)
+    @router.message(
+        "collab_step_org", "collab_step_proposal", "donate_awaiting_paid", "donate_step_amount",
+        "donate_waiting_receipt", "edit_profile_name", "edit_profile_national",
+        "edit_profile_phone", "edit_profile_student_id", "idea_step_description", "idea_step_title",
+        "waiting_edit_lang", "waiting_edit_name", "waiting_edit_phone",
+        "waiting_for_ticket_message",
+    )
     async def message_handler(event):
         user_id = event.sender_id
         state = get_user_state(user_states, user_id)
         if not await is_user_member(client, user_id):
             return
         if state == "waiting_for_ticket_message":
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
             msg_text = event.message.text or "پیام رسانه‌ای (عکس/فایل)"
-            c.execute("INSERT INTO tickets (user_id, message, status) VALUES (?, ?, ?)",
-                      (user_id, msg_text, "open"))
-            ticket_id = c.lastrowid
-            conn.commit()
-            conn.close()
+            ticket_id = await insert("INSERT INTO tickets (user_id, message, status) VALUES (?, ?, ?)",
+                                     (user_id, msg_text, "open"))
             if event.message.file:
                 file_id = event.message.file.id
             clear_user_state(user_states, user_id)
@@ -556,20 +516,12 @@ def setup_user_handlers(client, user_states):
             file_path = None
             if event.message.file:
                 ext = getattr(event.message.file, 'ext', '') or 'dat'
-                unique_name = f"idea_{user_id}_{int(time.time())}.{ext}"
-                save_path = os.path.join('uploads', unique_name)
                 try:
-                    await event.message.download_media(file=save_path)
-                    file_path = save_path
+                    file_path = await save_media(event.message, ext)
                 except Exception:
                     file_path = None
             try:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("INSERT INTO ideas (user_id, title, description, file_path) VALUES (?, ?, ?, ?)", (user_id, data.get('title'), data.get('description'), file_path))
-                idea_id = c.lastrowid
-                conn.commit()
-                conn.close()
+                idea_id = await insert("INSERT INTO ideas (user_id, title, description, file_path) VALUES (?, ?, ?, ?)", (user_id, data.get('title'), data.get('description'), file_path))
             except Exception:
                 idea_id = None
             clear_user_state(user_states, user_id)
@@ -600,20 +552,12 @@ def setup_user_handlers(client, user_states):
             file_path = None
             if event.message.file:
                 ext = getattr(event.message.file, 'ext', '') or 'dat'
-                unique_name = f"collab_{user_id}_{int(time.time())}.{ext}"
-                save_path = os.path.join('uploads', unique_name)
                 try:
-                    await event.message.download_media(file=save_path)
-                    file_path = save_path
+                    file_path = await save_media(event.message, ext)
                 except Exception:
                     file_path = None
             try:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("INSERT INTO collaborations (user_id, full_name, organization, proposal, file_path) VALUES (?, ?, ?, ?, ?)", (user_id, data.get('full_name'), data.get('organization'), proposal, file_path))
-                collab_id = c.lastrowid
-                conn.commit()
-                conn.close()
+                collab_id = await insert("INSERT INTO collaborations (user_id, full_name, organization, proposal, file_path) VALUES (?, ?, ?, ?, ?)", (user_id, data.get('full_name'), data.get('organization'), proposal, file_path))
             except Exception:
                 collab_id = None
             clear_user_state(user_states, user_id)
@@ -669,21 +613,14 @@ def setup_user_handlers(client, user_states):
             try:
                 f = event.message.file or event.message.photo
                 ext = getattr(f, 'ext', '') or 'jpg'
-                unique_name = f"donation_{user_id}_{int(time.time())}_{random.randint(1000,9999)}.{ext}"
-                save_path = os.path.join('uploads', unique_name)
-                await event.message.download_media(file=save_path)
+                save_path = await save_media(event.message, ext)
             except Exception:
                 await event.reply("❌ خطا در ذخیره فایل رسید. مجددا تلاش کنید:", buttons=CANCEL_BUTTON)
                 return
             # insert into donations table
             try:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("INSERT INTO donations (user_id, amount, currency, receipt_file, status) VALUES (?, ?, ?, ?, ?)",
+                did = await insert("INSERT INTO donations (user_id, amount, currency, receipt_file, status) VALUES (?, ?, ?, ?, ?)",
                           (user_id, amount or None, 'IRR', save_path, 'pending'))
-                did = c.lastrowid
-                conn.commit()
-                conn.close()
             except Exception:
                 await event.reply("⚠️ خطا در ثبت اطلاعات پرداخت. لطفا با ادمین تماس بگیرید.", buttons=get_main_menu_buttons(False))
                 clear_user_state(user_states, user_id)
@@ -714,12 +651,7 @@ def setup_user_handlers(client, user_states):
 
         elif state == "waiting_edit_name":
             name = event.message.text.strip()
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, full_name) VALUES (?, ?)", (user_id, name))
-            c.execute("UPDATE users SET full_name = ? WHERE user_id = ?", (name, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"full_name": name})
             clear_user_state(user_states, user_id)
             await event.reply("✅ نام به‌روزرسانی شد.", buttons=get_main_menu_buttons(False))
 
@@ -728,12 +660,7 @@ def setup_user_handlers(client, user_states):
             if len(name) < 3:
                 await event.reply("❌ نام باید حداقل 3 کاراکتر باشد. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, full_name) VALUES (?, ?)", (user_id, name))
-            c.execute("UPDATE users SET full_name = ? WHERE user_id = ?", (name, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"full_name": name})
             set_user_state(user_states, user_id, "edit_profile_national")
             await event.reply("🆔 لطفا کد ملی خود را ارسال کنید (10 رقمی):", buttons=CANCEL_BUTTON)
 
@@ -742,12 +669,7 @@ def setup_user_handlers(client, user_states):
             if not national_id.isdigit() or len(national_id) != 10:
                 await event.reply("❌ کد ملی باید 10 رقمی و عددی باشد. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, national_id) VALUES (?, ?)", (user_id, national_id))
-            c.execute("UPDATE users SET national_id = ? WHERE user_id = ?", (national_id, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"national_id": national_id})
             set_user_state(user_states, user_id, "edit_profile_phone")
             await event.reply("📞 لطفاً شماره تماس خود را ارسال کنید:", buttons=CANCEL_BUTTON)
 
@@ -759,12 +681,7 @@ def setup_user_handlers(client, user_states):
             if not clean.isdigit() or len(clean) != 10:
                 await event.reply("❌ شماره معتبر نیست. مثال: 09123456789", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, phone) VALUES (?, ?)", (user_id, clean))
-            c.execute("UPDATE users SET phone = ? WHERE user_id = ?", (clean, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"phone": clean})
             set_user_state(user_states, user_id, "edit_profile_student_choice")
             buttons = [[Button.inline("🎓 من دانشجو هستم", b"profile_student_yes")], [Button.inline("🧑‍💼 دانشجو نیستم", b"profile_student_no")], [Button.inline("❌ لغو", b"cancel")]]
             await event.reply("❓ آیا شما دانشجو هستید؟", buttons=buttons)
@@ -774,12 +691,7 @@ def setup_user_handlers(client, user_states):
             if not student_id.isdigit():
                 await event.reply("❌ شماره دانشجویی باید عددی باشد. لطفا دوباره ارسال کنید:", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, student_id, is_student) VALUES (?, ?, ?)", (user_id, student_id, 1))
-            c.execute("UPDATE users SET student_id = ?, is_student = ? WHERE user_id = ?", (student_id, 1, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"student_id": student_id, "is_student": 1})
             clear_user_state(user_states, user_id)
             await event.reply("✅ پروفایل شما با موفقیت به‌روزرسانی شد.", buttons=get_main_menu_buttons(False))
 
@@ -791,12 +703,7 @@ def setup_user_handlers(client, user_states):
             if not clean.isdigit() or len(clean) != 10:
                 await event.reply("❌ شماره معتبر نیست. مثال: 09123456789", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, phone) VALUES (?, ?)", (user_id, clean))
-            c.execute("UPDATE users SET phone = ? WHERE user_id = ?", (clean, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"phone": clean})
             clear_user_state(user_states, user_id)
             await event.reply("✅ شماره تماس به‌روزرسانی شد.", buttons=get_main_menu_buttons(False))
 
@@ -805,62 +712,52 @@ def setup_user_handlers(client, user_states):
             if lang not in ("fa", "en"):
                 await event.reply("❌ فقط fa یا en مجاز است.", buttons=CANCEL_BUTTON)
                 return
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("INSERT OR IGNORE INTO users (user_id, language) VALUES (?, ?)", (user_id, lang))
-            c.execute("UPDATE users SET language = ? WHERE user_id = ?", (lang, user_id))
-            conn.commit()
-            conn.close()
+            await db_write(upsert_user_fields, user_id, {"language": lang})
             clear_user_state(user_states, user_id)
             await event.reply("✅ زبان به‌روزرسانی شد.", buttons=get_main_menu_buttons(False))
 
     async def show_event_details(client, event, event_id, is_archive=False):
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("""
-            SELECT title, description, cost_type, fixed_cost, student_cost, non_student_cost, card_number,
-                   poster_file_id, is_active, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder
-            FROM events WHERE id = ?
-        """, (event_id,))
-        result = c.fetchone()
-        conn.close()
+        # everything this screen needs is read up front in a single DB round-trip
+        def _load(conn):
+            is_approved = False
+            rrow = None
+            c = conn.cursor()
+            c.execute("""
+                SELECT title, description, cost_type, fixed_cost, student_cost, non_student_cost, card_number,
+                       poster_file_id, is_active, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder,
+                       report_message_ids, report_payloads, reminders_enabled
+                FROM events WHERE id = ?
+            """, (event_id,))
+            result = c.fetchone()
+            if result and not is_archive:
+                c.execute("SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? AND status = 'approved'", (event.sender_id, event_id))
+                is_approved = c.fetchone() is not None
+                try:
+                    c.execute("SELECT reminder_opt_in FROM registrations WHERE user_id = ? AND event_id = ?", (event.sender_id, event_id))
+                    rrow = c.fetchone()
+                except Exception:
+                    pass
+            return result, is_approved, rrow
+        result, is_approved, rrow = await db_read(_load)
         if not result:
             await event.answer("❌ رویداد یافت نشد!", alert=True)
             return
         (title, desc, cost_type, fixed, student_cost, non_student_cost, card,
-         poster_file_id, is_active, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder) = result
+         poster_file_id, is_active, cert_fee, cert_fee_student, cert_fee_non_student, cert_card_number, cert_card_holder,
+         report_ids, report_payloads, rem) = result
         # Only show title and description in the event preview for users.
         msg = f"*{title}*\n{desc or '---'}"
         buttons = []
         if is_archive:
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT report_message_ids, report_payloads FROM events WHERE id = ?", (event_id,))
-            row = c.fetchone()
-            conn.close()
-            report_ids = row[0] if row else None
-            report_payloads = row[1] if row else None
             if report_ids or report_payloads:
                 buttons.append([Button.inline("📑 دریافت گزارش کار", f"forward_reports_{event_id}")])
             buttons.append([Button.inline("🔙 بازگشت به آرشیو", b"events_archive_0")])
         else:
             buttons.append([Button.inline("📝 شروع ثبت‌نام", f"start_register_{event_id}")])
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? AND status = 'approved'", (event.sender_id, event_id))
-            is_approved = c.fetchone() is not None
-            conn.close()
             if is_approved:
                 buttons.append([Button.inline("📚 منابع رویداد", f"event_resources_{event_id}")])
             try:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                c.execute("SELECT reminders_enabled FROM events WHERE id = ?", (event_id,))
-                rem = c.fetchone()
-                reminders_enabled = bool(rem[0]) if rem and rem[0] else False
-                c.execute("SELECT reminder_opt_in FROM registrations WHERE user_id = ? AND event_id = ?", (event.sender_id, event_id))
-                rrow = c.fetchone()
-                conn.close()
+                reminders_enabled = bool(rem)
                 if reminders_enabled and rrow is not None:
                     user_opt = 1 if (rrow[0] is None) else int(rrow[0])
                     label = "🔔 یادآوری: روشن" if user_opt == 1 else "🔕 یادآوری: خاموش"
@@ -875,9 +772,10 @@ def setup_user_handlers(client, user_states):
             # همیشه پیام جدید ارسال شود و هیچ وقت پیام قبلی ویرایش یا حذف نشود
             back_buttons = {b[0].text for b in buttons if b and hasattr(b[0], 'text')}
             if poster_file_id and is_safe_upload_path(poster_file_id) and not (back_buttons == {"🔙 بازگشت به رویدادها"} or back_buttons == {"🏠 منوی اصلی"} or back_buttons == {"🔙 بازگشت به آرشیو"}):
-                sent = await client.send_file(
+                sent = await send_media(
+                    client,
                     event.chat_id,
-                    file=poster_file_id,
+                    poster_file_id,
                     caption=msg,
                     buttons=buttons,
                     parse_mode="markdown"
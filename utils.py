@@ -2,6 +2,7 @@ def get_admin_main_menu():
     return get_main_menu_buttons(is_admin=True)
 
 from telethon import Button
+from callback_codec import cb
 import os
 import time
 from telethon.tl.functions.channels import GetParticipantRequest
@@ -9,120 +10,160 @@ from telethon.errors import UserNotParticipantError
 import asyncio
 import html
 import threading
+import itertools
 import base64
 from typing import Optional
-try:
-    from cryptography.fernet import Fernet  # type: ignore[reportMissingImports]
-except Exception:
-    Fernet = None
 
 CHANNEL_USERNAME = os.getenv('CHANNEL_USERNAME', '@mnd_portal')
 OWNER_ID = 7702648742
 
-async def is_user_member(client, user_id):
+# Channel membership is checked by several handlers for every update, each one a
+# GetParticipantRequest RPC. Results are cached per user (members for longer than
+# non-members, so someone who just joined is let in quickly) and concurrent
+# lookups for the same user share one request. check_membership forces a refresh:
+# a new request whose result wins over any older one still in flight.
+try:
+    MEMBER_TTL = float(os.getenv('JURISLAW_MEMBER_TTL', '600'))
+    NON_MEMBER_TTL = float(os.getenv('JURISLAW_NON_MEMBER_TTL', '30'))
+except Exception:
+    MEMBER_TTL = 600.0
+    NON_MEMBER_TTL = 30.0
+MEMBER_CACHE_MAX = 20000
+
+_member_cache = {}     # user_id -> (is_member, expires_at)
+_member_inflight = {}  # user_id -> task running the newest RPC
+_member_lookups = itertools.count(1)
+_member_latest = {}    # user_id -> id of the newest lookup; older results are dropped
+
+async def _fetch_membership(client, user_id):
     try:
         await client(GetParticipantRequest(channel=CHANNEL_USERNAME, participant=user_id))
-        return True
+        return True, MEMBER_TTL
     except UserNotParticipantError:
-        return False
+        return False, NON_MEMBER_TTL
     except Exception:
-        return True
+        # fail open as before, but don't remember it
+        return True, 0
+
+def _store_membership(user_id, lookup, task):
+    if _member_latest.get(user_id) != lookup:
+        # superseded by a forced lookup started after this one
+        return
+    del _member_latest[user_id]
+    _member_inflight.pop(user_id, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    is_member, ttl = task.result()
+    if ttl <= 0:
+        return
+    now = time.monotonic()
+    if len(_member_cache) >= MEMBER_CACHE_MAX:
+        for uid in [u for u, (_, exp) in _member_cache.items() if exp <= now]:
+            del _member_cache[uid]
+        if len(_member_cache) >= MEMBER_CACHE_MAX:
+            _member_cache.clear()
+    _member_cache[user_id] = (is_member, now + ttl)
+
+def invalidate_membership(user_id=None):
+    """Forget the cached membership of one user (or everyone)."""
+    if user_id is None:
+        _member_cache.clear()
+    else:
+        _member_cache.pop(user_id, None)
+
+async def is_user_member(client, user_id, force=False):
+    if force:
+        # a lookup already in flight may predate the user joining; don't reuse it
+        invalidate_membership(user_id)
+        task = None
+    else:
+        hit = _member_cache.get(user_id)
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
+        task = _member_inflight.get(user_id)
+    if task is None:
+        lookup = next(_member_lookups)
+        _member_latest[user_id] = lookup
+        task = asyncio.ensure_future(_fetch_membership(client, user_id))
+        _member_inflight[user_id] = task
+        task.add_done_callback(lambda t, uid=user_id, n=lookup: _store_membership(uid, n, t))
+    # shield: one cancelled handler must not cancel the lookup others are waiting on
+    is_member, _ = await asyncio.shield(task)
+    return is_member
+
+def get_badge_counts():
+    """Pending-item counts for the admin menu badges, held in memory by menu_cache."""
+    from menu_cache import badge_counts
+    return badge_counts()
 
 def get_main_menu_buttons(is_admin=False):
+    """Main menu keyboard. Rendered once per distinct input and then served from menu_cache."""
+    from menu_cache import cached_keyboard
     if is_admin:
-        # show current console log language setting and provide a toggle button
-        try:
-            en_on = get_setting('console_logs_english', '1') == '1'
-        except Exception:
-            en_on = True
-        en_label = "✅ EN" if en_on else "❌ EN"
-        # Improved admin menu layout (cleaner labels, diagnostics button)
         # fetch counts for pending items so we can show badges like "تیکت‌ها (3)"
-        try:
-            import sqlite3
-            from database import DB_NAME
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT COUNT(*) FROM registrations WHERE status = 'pending'")
-            pending_regs = c.fetchone()[0] or 0
-            c.execute("SELECT COUNT(*) FROM memberships WHERE LOWER(TRIM(status)) = 'pending'")
-            membership_pending = c.fetchone()[0] or 0
-            c.execute("SELECT COUNT(*) FROM ideas WHERE LOWER(TRIM(status)) = 'pending'")
-            ideas_pending = c.fetchone()[0] or 0
-            c.execute("SELECT COUNT(*) FROM collaborations WHERE LOWER(TRIM(status)) = 'pending'")
-            collabs_pending = c.fetchone()[0] or 0
-            c.execute("SELECT COUNT(*) FROM donations WHERE LOWER(TRIM(status)) = 'pending'")
-            donations_pending = c.fetchone()[0] or 0
-            c.execute("SELECT COUNT(*) FROM tickets WHERE status = 'open'")
-            tickets_open = c.fetchone()[0] or 0
-            conn.close()
-        except Exception:
-            pending_regs = membership_pending = ideas_pending = collabs_pending = donations_pending = tickets_open = 0
-
-        return [
-            [Button.inline(f"📅 مدیریت رویدادها", b"admin_events"), Button.inline(f"⏳ ثبت‌نام‌های در انتظار ({pending_regs})", b"admin_pending_regs")],
-            [Button.inline(f"👥 درخواست‌های عضویت ({membership_pending})", b"admin_membership_requests"), Button.inline("📤 ارسال همگانی", b"admin_broadcast")],
-            [Button.inline(f"💡 ایده‌ها ({ideas_pending})", b"admin_ideas"), Button.inline(f"🤝 همکاری‌ها ({collabs_pending})", b"admin_collaborations")],
-            [Button.inline(f"💰 حمایت‌ها ({donations_pending})", b"admin_donations"), Button.inline(f"🎟️ تیکت‌ها ({tickets_open})", b"admin_tickets")],
-            [Button.inline("🧏‍♂️ مدیریت ادمین‌ها", b"admin_manage_admins"), Button.inline("❓ FAQ", b"admin_faq")],
-            [Button.inline("🧹 نگهداری/پاکسازی", b"admin_maintenance"), Button.inline("📜 ارسال گواهی", b"admin_send_cert")],
-            [Button.inline("📥 اکسل تاییدشدگان", b"admin_export_excel"), Button.inline("🎯 ظرفیت رویداد", b"admin_capacity")],
-            [Button.inline("⚙️ تنظیمات", b"admin_settings")],
-            [Button.inline("✏️ ویرایش", b"admin_edit_menu" )]
-        ]
-    else:
-        import sqlite3
-        from database import DB_NAME
-        buttons = []
-        try:
-            main_ids_raw = get_setting('main_events', '')
-            main_ids = [int(x) for x in main_ids_raw.split(',') if x.strip().isdigit()]
-            if main_ids:
-                conn = sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-                q = f"SELECT id, title FROM events WHERE id IN ({','.join(['?']*len(main_ids))}) AND is_active = 1"
-                c.execute(q, tuple(main_ids))
-                mains = c.fetchall()
-                conn.close()
-                for mid, mtitle in mains:
-                    buttons.append([Button.inline(f"⭐ {mtitle}", f"event_{mid}")])
-        except Exception:
-            pass
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT 1 FROM events WHERE is_active = 1 LIMIT 1")
-            has_events = c.fetchone() is not None
-            c.execute("SELECT 1 FROM faqs LIMIT 1")
-            has_faq = c.fetchone() is not None
-            c.execute("SELECT 1 FROM certificates LIMIT 1")
-            has_any_cert = c.fetchone() is not None
-            conn.close()
-        except Exception:
-            has_events = True
-            has_faq = True
-            has_any_cert = False
-        flat = []
-        # Primary actions
-        flat.append(Button.inline("📅 رویدادها", b"user_events"))
-        flat.append(Button.inline("👥 عضویت در انجمن", b"user_membership"))
-        flat.append(Button.inline("🧑‍💼 پروفایل من", b"user_profile"))
-        flat.append(Button.inline("📊 ثبت‌نام‌های من", b"user_my_regs"))
-        if has_any_cert:
-            flat.append(Button.inline("📜 گواهی‌های من", b"user_my_certs"))
-
-        # Support & contact
-        flat.append(Button.inline("📬 ارسال تیکت / تماس با ادمین", b"ask_ticket"))
-
-        # Contributions and ideas
-        flat.append(Button.inline("💡 ارسال ایده", b"user_send_idea"))
-        flat.append(Button.inline("🤝 درخواست همکاری", b"user_request_collab"))
-        flat.append(Button.inline("💳 حمایت مالی", b"user_donate"))
-
-        # External channel link and FAQ
-        flat.append(Button.url("📢 کانال انجمن", f"https://t.me/{CHANNEL_USERNAME.lstrip('@')}"))
-        if has_faq:
-            flat.append(Button.inline("❓ سوالات متداول", b"user_faq"))
+        counts = get_badge_counts()
+        return cached_keyboard(('admin',) + tuple(sorted(counts.items())), lambda: _build_admin_menu(counts))
+    return cached_keyboard(('user',), _build_user_menu)
+
+def _build_admin_menu(counts):
+    # show current console log language setting and provide a toggle button
+    try:
+        en_on = get_setting('console_logs_english', '1') == '1'
+    except Exception:
+        en_on = True
+    en_label = "✅ EN" if en_on else "❌ EN"
+    # Improved admin menu layout (cleaner labels, diagnostics button)
+    pending_regs = counts.get('registrations_pending', 0)
+    membership_pending = counts.get('memberships_pending', 0)
+    ideas_pending = counts.get('ideas_pending', 0)
+    collabs_pending = counts.get('collaborations_pending', 0)
+    donations_pending = counts.get('donations_pending', 0)
+    tickets_open = counts.get('tickets_open', 0)
+
+    return [
+        [Button.inline(f"📅 مدیریت رویدادها", b"admin_events"), Button.inline(f"⏳ ثبت‌نام‌های در انتظار ({pending_regs})", cb("pending_regs"))],
+        [Button.inline(f"👥 درخواست‌های عضویت ({membership_pending})", b"admin_membership_requests"), Button.inline("📤 ارسال همگانی", b"admin_broadcast")],
+        [Button.inline(f"💡 ایده‌ها ({ideas_pending})", b"admin_ideas"), Button.inline(f"🤝 همکاری‌ها ({collabs_pending})", b"admin_collaborations")],
+        [Button.inline(f"💰 حمایت‌ها ({donations_pending})", b"admin_donations"), Button.inline(f"🎟️ تیکت‌ها ({tickets_open})", b"admin_tickets")],
+        [Button.inline("🧏‍♂️ مدیریت ادمین‌ها", b"admin_manage_admins"), Button.inline("❓ FAQ", b"admin_faq")],
+        [Button.inline("🧹 نگهداری/پاکسازی", b"admin_maintenance"), Button.inline("📜 ارسال گواهی", cb("cert_events"))],
+        [Button.inline("📥 اکسل تاییدشدگان", b"admin_export_excel"), Button.inline("🎯 ظرفیت رویداد", cb("capacity"))],
+        [Button.inline("⚙️ تنظیمات", b"admin_settings")],
+        [Button.inline("✏️ ویرایش", b"admin_edit_menu" )]
+    ]
+
+def _build_user_menu():
+    from menu_cache import user_menu_inputs
+    buttons = []
+    inputs = user_menu_inputs()
+    if inputs is None:
+        # not loaded yet; same fallback as when the probes failed
+        inputs = {'mains': [], 'has_events': True, 'has_faq': True, 'has_any_cert': False}
+    for mid, mtitle in inputs['mains']:
+        buttons.append([Button.inline(f"⭐ {mtitle}", f"event_{mid}")])
+    has_faq = inputs['has_faq']
+    has_any_cert = inputs['has_any_cert']
+    flat = []
+    # Primary actions
+    flat.append(Button.inline("📅 رویدادها", b"user_events"))
+    flat.append(Button.inline("👥 عضویت در انجمن", b"user_membership"))
+    flat.append(Button.inline("🧑‍💼 پروفایل من", b"user_profile"))
+    flat.append(Button.inline("📊 ثبت‌نام‌های من", b"user_my_regs"))
+    if has_any_cert:
+        flat.append(Button.inline("📜 گواهی‌های من", b"user_my_certs"))
+
+    # Support & contact
+    flat.append(Button.inline("📬 ارسال تیکت / تماس با ادمین", b"ask_ticket"))
+
+    # Contributions and ideas
+    flat.append(Button.inline("💡 ارسال ایده", b"user_send_idea"))
+    flat.append(Button.inline("🤝 درخواست همکاری", b"user_request_collab"))
+    flat.append(Button.inline("💳 حمایت مالی", b"user_donate"))
+
+    # External channel link and FAQ
+    flat.append(Button.url("📢 کانال انجمن", f"https://t.me/{CHANNEL_USERNAME.lstrip('@')}"))
+    if has_faq:
+        flat.append(Button.inline("❓ سوالات متداول", b"user_faq"))
     flat.append(Button.inline("📖 راهنمای جامع ربات", b"user_help"))
     flat.append(Button.inline("ℹ️ درباره ما", b"user_about"))
     row = []
@@ -151,15 +192,24 @@ ABOUT_TEXT = f"""
 🌐 کانال رسمی: https://t.me/{CHANNEL_USERNAME.lstrip('@')}
 """
 
-def paginate_buttons(data_list, data_type, page=0, per_page=5):
-    if not data_list:
-        return [[Button.inline("❌ موردی یافت نشد", b"dummy")], [Button.inline("🏠 منوی اصلی", b"main_menu")]]
+def paginate_buttons(page, data_type, render=None, nav_prefix=None, footer=None, nav=None):
+    """Buttons for one database.fetch_page() result.
+
+    One row per item (render(item) -> Button, default "• title" -> "{data_type}_{id}"),
+    then ⬅️/➡️ carrying the page cursors as nav(cursor) (default
+    "{nav_prefix}{cursor}", nav_prefix defaulting to "{data_type}_page_"),
+    then the footer rows (default: back to menu).
+    """
+    if footer is None:
+        footer = [[Button.inline("🏠 بازگشت به منو", b"main_menu")]]
+    if not page.rows:
+        return [[Button.inline("❌ موردی یافت نشد", b"dummy")]] + footer
 
     buttons = []
-    start = page * per_page
-    end = start + per_page
-    slice_data = data_list[start:end]
-    for item in slice_data:
+    for item in page.rows:
+        if render is not None:
+            buttons.append([render(item)])
+            continue
         # item expected to be a sequence like (id, title, ...)
         try:
             label = item[1] if len(item) > 1 else str(item[0])
@@ -167,19 +217,26 @@ def paginate_buttons(data_list, data_type, page=0, per_page=5):
             label = str(item)
         buttons.append([Button.inline(f"• {label}", f"{data_type}_{item[0]}")])
 
+    if nav is None:
+        if nav_prefix is None:
+            nav_prefix = f"{data_type}_page_"
+        nav = lambda cursor: f"{nav_prefix}{cursor}"
     nav_buttons = []
-    if page > 0:
-        nav_buttons.append(Button.inline("⬅️ قبلی", f"{data_type}_page_{page-1}"))
-    if end < len(data_list):
-        nav_buttons.append(Button.inline("➡️ بعدی", f"{data_type}_page_{page+1}"))
+    if page.prev:
+        nav_buttons.append(Button.inline("⬅️ قبلی", nav(page.prev)))
+    if page.next:
+        nav_buttons.append(Button.inline("➡️ بعدی", nav(page.next)))
 
     if nav_buttons:
         buttons.append(nav_buttons)
 
-    buttons.append([Button.inline("🏠 بازگشت به منو", b"main_menu")])
-    return buttons
+    return buttons + footer
 
 def set_user_state(user_states, user_id, state, data=None):
+    # user_states is either a plain dict or a store from state_store.py
+    if not isinstance(user_states, dict):
+        user_states.save(user_id, state, data)
+        return
     if user_id not in user_states:
         user_states[user_id] = {}
     user_states[user_id]['state'] = state
@@ -189,12 +246,21 @@ def set_user_state(user_states, user_id, state, data=None):
         user_states[user_id]['data'].update(data)
 
 def get_user_state(user_states, user_id):
+    if not isinstance(user_states, dict):
+        entry = user_states.load(user_id)
+        return entry.get('state') if entry else None
     return user_states.get(user_id, {}).get('state', None)
 
 def get_user_data(user_states, user_id):
+    if not isinstance(user_states, dict):
+        entry = user_states.load(user_id)
+        return entry.setdefault('data', {}) if entry else {}
     return user_states.get(user_id, {}).get('data', {})
 
 def clear_user_state(user_states, user_id):
+    if not isinstance(user_states, dict):
+        user_states.delete(user_id)
+        return
     if user_id in user_states:
         del user_states[user_id]
 
@@ -206,8 +272,11 @@ async def get_message_text(event):
     return event.message.text.strip() if event.message.text else ""
 
 def is_admin(db_path, user_id):
-    import sqlite3
-    conn = sqlite3.connect(db_path)
+    from database import DB_NAME, get_connection
+    if not db_path or db_path == DB_NAME:
+        from admin_cache import is_cached_admin
+        return is_cached_admin(user_id)
+    conn = get_connection(db_path)
     c = conn.cursor()
     c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
     result = c.fetchone()
@@ -223,15 +292,9 @@ def get_channel_join_buttons():
 CHANNEL_JOIN_MESSAGE = "🔐 برای استفاده از ربات، باید عضو کانال «انجمن X دانشگاه Y» شوید."
 
 def get_setting(key, default="0"):
-    import sqlite3
-    from database import DB_NAME
+    from settings_cache import get_cached_setting
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT value FROM settings WHERE key = ?", (key,))
-        row = c.fetchone()
-        conn.close()
-        return row[0] if row and row[0] is not None else default
+        return get_cached_setting(key, default)
     except Exception:
         return default
 
@@ -304,24 +367,17 @@ async def send_with_rate_limit(client, user_id, text=None, file=None, buttons=No
             attempt += 1
     return None
 
-def set_setting(key, value):
-    import sqlite3
-    from database import DB_NAME
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (key, str(value)))
-    conn.commit()
-    conn.close()
+async def set_setting(key, value):
+    from settings_cache import store_setting
+    await store_setting(key, value)
 
 def get_admin_ids():
-    import sqlite3
-    from database import DB_NAME
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT user_id FROM admins")
-    ids = [row[0] for row in c.fetchall()]
-    conn.close()
-    return ids
+    from admin_cache import cached_admin_ids
+    return cached_admin_ids()
+
+def get_admin_role(user_id):
+    from admin_cache import get_admin_role as _cached_role
+    return _cached_role(user_id)
 
 def parse_jalali_to_epoch(jalali_datetime_str):
     """
@@ -482,21 +538,36 @@ def sanitize_text(text: Optional[str], max_len: int = 2000) -> str:
 
 # Optional encryption helpers (Fernet). Set environment variable ENCRYPTION_KEY
 # to a valid Fernet key (44 url-safe base64-encoded bytes) to enable encryption.
+# cryptography is only imported once a key is actually configured.
 _ENCRYPTOR = None
+_FERNET = None  # cryptography's Fernet class once imported, False if it is not installed
+
+
+def _fernet_class():
+    global _FERNET
+    if _FERNET is None:
+        try:
+            from cryptography.fernet import Fernet  # type: ignore[reportMissingImports]
+            _FERNET = Fernet
+        except Exception:
+            _FERNET = False
+    return _FERNET or None
+
 
 def init_encryption(key: Optional[str] = None):
     """Initialize Fernet encryptor from given key or `ENCRYPTION_KEY` env var.
     If cryptography is not installed or key is missing/invalid, encryption stays disabled.
     """
     global _ENCRYPTOR
-    if Fernet is None:
-        _ENCRYPTOR = None
-        return None
     try:
         k = key or os.getenv('ENCRYPTION_KEY')
         if not k:
             _ENCRYPTOR = None
             return None
+        Fernet = _fernet_class()
+        if Fernet is None:
+            _ENCRYPTOR = None
+            return None
         if isinstance(k, str) and len(k) != 44:
             # user may provide plain passphrase; do not attempt derivation here to avoid complexity
             # require a proper Fernet key
@@ -525,8 +596,6 @@ def encrypt_string(plaintext: str) -> str:
     """
     if not plaintext:
         return plaintext
-    if Fernet is None:
-        return plaintext
     if _ENCRYPTOR is None:
         init_encryption()
     try:
@@ -541,8 +610,6 @@ def decrypt_string(token: str) -> str:
     """Decrypt a Fernet token if possible; otherwise return the token unchanged."""
     if not token:
         return token
-    if Fernet is None:
-        return token
     if _ENCRYPTOR is None:
         init_encryption()
     try: